@@ -0,0 +1,221 @@
+"""End-to-end benchmarks for parc-ferme.
+
+Runs ``cli.main`` against fake ``gh`` and ``claude`` executables (see
+``benchmarks/stubs``) with synthetic diffs, and measures wall-clock latency,
+peak RSS and the bytes moved through subprocess pipes. Results are compared
+against ``benchmarks/baselines.json``; any metric that exceeds its baseline by
+more than the threshold is reported as a regression and the run exits 1.
+
+Usage:
+    python benchmarks/run.py                       # all scenarios
+    python benchmarks/run.py -s small,large -n 5   # subset, 5 repeats
+    python benchmarks/run.py --update-baselines    # record new baselines
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+STUBS_DIR = BENCH_DIR / "stubs"
+DEFAULT_BASELINES = BENCH_DIR / "baselines.json"
+
+sys.path.insert(0, str(BENCH_DIR))
+
+from synth import generate_diff  # noqa: E402
+
+
+@dataclass
+class Scenario:
+    diff_lines: int
+    gh_latency: float = 0.0
+    claude_latency: float = 0.0
+    claude_output_bytes: int = 2000
+
+
+SCENARIOS: dict[str, Scenario] = {
+    "tiny": Scenario(diff_lines=10),
+    "small": Scenario(diff_lines=1_000),
+    "medium": Scenario(diff_lines=20_000),
+    "large": Scenario(diff_lines=100_000),
+    "huge": Scenario(diff_lines=500_000, claude_output_bytes=20_000),
+}
+
+# Metrics compared against the baseline, lower is better for all of them.
+METRICS = ("latency_s", "peak_rss_mb", "bytes_copied")
+
+
+@dataclass
+class Result:
+    latency_s: float
+    peak_rss_mb: float
+    bytes_copied: int
+
+
+def _worker(argv: list[str]) -> int:
+    """Run cli.main once in this process and report latency and peak RSS."""
+    import resource
+
+    from parc_ferme.cli import main
+
+    with open(os.devnull, "w") as devnull:
+        stdout = sys.stdout
+        sys.stdout = devnull
+        try:
+            start = time.perf_counter()
+            code = main(argv)
+            latency = time.perf_counter() - start
+        finally:
+            sys.stdout = stdout
+
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    rss_bytes = max_rss if sys.platform == "darwin" else max_rss * 1024
+    print(json.dumps({"exit_code": code, "latency_s": latency, "peak_rss_bytes": rss_bytes}))
+    return 0
+
+
+def run_scenario(name: str, scenario: Scenario, workdir: Path) -> Result:
+    diff_path = workdir / f"{name}.diff"
+    if not diff_path.exists():
+        diff_path.write_text(generate_diff(scenario.diff_lines, seed=scenario.diff_lines))
+    log_path = workdir / f"{name}.log"
+    log_path.unlink(missing_ok=True)
+    config_path = workdir / "empty.yml"
+    config_path.write_text("")
+
+    env = {
+        **os.environ,
+        "PATH": f"{STUBS_DIR}{os.pathsep}{os.environ.get('PATH', '')}",
+        "PARC_BENCH_DIFF": str(diff_path),
+        "PARC_BENCH_LOG": str(log_path),
+        "PARC_BENCH_GH_LATENCY": str(scenario.gh_latency),
+        "PARC_BENCH_CLAUDE_LATENCY": str(scenario.claude_latency),
+        "PARC_BENCH_CLAUDE_OUTPUT_BYTES": str(scenario.claude_output_bytes),
+        # A fresh cache per run: repeats must not be answered by the review caches
+        "XDG_CACHE_HOME": tempfile.mkdtemp(prefix="cache-", dir=workdir),
+    }
+    cli_args = ["1", "--no-color", "--comment", "--config", str(config_path)]
+    proc = subprocess.run(
+        [sys.executable, __file__, "--worker", "--", *cli_args],
+        capture_output=True, text=True, env=env, cwd=workdir,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"worker failed for {name}: {proc.stderr.strip()}")
+    report = json.loads(proc.stdout.strip().splitlines()[-1])
+    if report["exit_code"] != 0:
+        raise RuntimeError(f"parc-ferme exited {report['exit_code']} for {name}")
+
+    bytes_copied = 0
+    for line in log_path.read_text().splitlines():
+        record = json.loads(line)
+        bytes_copied += record["stdin_bytes"] + record["stdout_bytes"]
+
+    return Result(
+        latency_s=report["latency_s"],
+        peak_rss_mb=report["peak_rss_bytes"] / (1024 * 1024),
+        bytes_copied=bytes_copied,
+    )
+
+
+def _median(results: list[Result]) -> Result:
+    return Result(
+        latency_s=statistics.median(r.latency_s for r in results),
+        peak_rss_mb=statistics.median(r.peak_rss_mb for r in results),
+        bytes_copied=int(statistics.median(r.bytes_copied for r in results)),
+    )
+
+
+def compare(
+    name: str, result: Result, baseline: dict[str, float] | None, threshold: float,
+) -> list[str]:
+    """Return a message for each metric that regressed beyond threshold."""
+    if not baseline:
+        return []
+    regressions = []
+    for metric in METRICS:
+        base = baseline.get(metric)
+        current = getattr(result, metric)
+        if base and current > base * (1 + threshold):
+            regressions.append(
+                f"{name}.{metric}: {current:.3f} vs baseline {base:.3f} "
+                f"(+{(current / base - 1) * 100:.0f}%)"
+            )
+    return regressions
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="parc-ferme end-to-end benchmarks")
+    parser.add_argument(
+        "-s", "--scenarios",
+        default=",".join(SCENARIOS),
+        help=f"Comma-separated scenarios (default: {','.join(SCENARIOS)})",
+    )
+    parser.add_argument("-n", "--repeat", type=int, default=3, help="Runs per scenario")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.25,
+        help="Allowed fractional regression over baseline (default: 0.25)",
+    )
+    parser.add_argument("--baselines", default=str(DEFAULT_BASELINES))
+    parser.add_argument(
+        "--update-baselines",
+        action="store_true",
+        help="Write the measured results as the new baselines",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = parse_args(argv)
+    names = [n.strip() for n in args.scenarios.split(",") if n.strip()]
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        print(f"Unknown scenarios: {', '.join(unknown)}", file=sys.stderr)
+        return 2
+
+    baselines_path = Path(args.baselines)
+    baselines = json.loads(baselines_path.read_text()) if baselines_path.exists() else {}
+
+    results: dict[str, Result] = {}
+    regressions: list[str] = []
+    print(f"{'scenario':10s} {'lines':>8s} {'latency':>10s} {'peak RSS':>10s} {'bytes':>14s}")
+    with tempfile.TemporaryDirectory(prefix="parc-ferme-bench-") as tmp:
+        workdir = Path(tmp)
+        for name in names:
+            scenario = SCENARIOS[name]
+            result = _median([run_scenario(name, scenario, workdir) for _ in range(args.repeat)])
+            results[name] = result
+            print(
+                f"{name:10s} {scenario.diff_lines:8,d} {result.latency_s * 1000:8.1f}ms "
+                f"{result.peak_rss_mb:8.1f}MB {result.bytes_copied:14,d}"
+            )
+            regressions.extend(compare(name, result, baselines.get(name), args.threshold))
+
+    if args.update_baselines:
+        baselines.update({name: asdict(r) for name, r in results.items()})
+        baselines_path.write_text(json.dumps(baselines, indent=2, sort_keys=True) + "\n")
+        print(f"\nBaselines written to {baselines_path}")
+        return 0
+
+    if regressions:
+        print("\nRegressions:")
+        for r in regressions:
+            print(f"  {r}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--worker":
+        sys.exit(_worker(sys.argv[3:] if sys.argv[2:3] == ["--"] else sys.argv[2:]))
+    sys.exit(main())
@@ -0,0 +1,154 @@
+"""Synthetic unified diff generator for benchmarks.
+
+Produces deterministic diffs of a requested size with a file mix that looks
+like a real PR: mostly source files, some tests, docs, config and the odd
+lockfile.
+"""
+from __future__ import annotations
+
+import random
+
+# (weight, path template, line generator name)
+FILE_MIX = [
+    (35, "src/app/module_{n}/service_{n}.py", "python"),
+    (20, "src/web/components/widget-{n}.component.ts", "typescript"),
+    (15, "tests/test_module_{n}.py", "python"),
+    (8, "internal/handler/handler_{n}.go", "go"),
+    (8, "docs/guide/section-{n}.md", "markdown"),
+    (6, "config/service-{n}.yml", "yaml"),
+    (5, "src/auth/token_{n}.py", "python"),
+    (3, "package-lock-{n}.json", "json"),
+]
+
+_IDENTS = [
+    "user", "order", "session", "token", "config", "payload", "result",
+    "cache", "request", "response", "item", "value", "count", "index",
+]
+
+
+def _python_line(rng: random.Random) -> str:
+    a, b = rng.choice(_IDENTS), rng.choice(_IDENTS)
+    return rng.choice([
+        f"    {a} = self.get_{b}({rng.randint(0, 99)})",
+        f"    if {a} is None:",
+        f"        return {b}.{a}",
+        f"    for {a} in {b}_list:",
+        f"def handle_{a}_{b}(self, {a}):",
+        f"    # TODO: validate {a} before using {b}",
+        f"    logger.debug(\"{a}=%s {b}=%s\", {a}, {b})",
+    ])
+
+
+def _typescript_line(rng: random.Random) -> str:
+    a, b = rng.choice(_IDENTS), rng.choice(_IDENTS)
+    return rng.choice([
+        f"  private {a}$ = this.{b}Service.get{b.title()}();",
+        f"  ngOnInit(): void {{ this.{a}.subscribe(v => this.{b} = v); }}",
+        f"  @Input() {a}: {b.title()} | null = null;",
+        f"  const {a} = {b}.map(x => x.{a}).filter(Boolean);",
+        "}",
+    ])
+
+
+def _go_line(rng: random.Random) -> str:
+    a, b = rng.choice(_IDENTS), rng.choice(_IDENTS)
+    return rng.choice([
+        f"\t{a}, err := h.{b}Store.Get(ctx, id)",
+        "\tif err != nil {",
+        f"\t\treturn nil, fmt.Errorf(\"{a}: %w\", err)",
+        f"func (h *Handler) {a.title()}{b.title()}(ctx context.Context) error {{",
+    ])
+
+
+def _markdown_line(rng: random.Random) -> str:
+    a, b = rng.choice(_IDENTS), rng.choice(_IDENTS)
+    return rng.choice([
+        f"The `{a}` option controls how {b} values are cached.",
+        f"## Configuring {a}",
+        f"- `{a}`: the {b} to use",
+        "",
+    ])
+
+
+def _yaml_line(rng: random.Random) -> str:
+    a, b = rng.choice(_IDENTS), rng.choice(_IDENTS)
+    return rng.choice([
+        f"{a}:",
+        f"  {b}: {rng.randint(1, 1000)}",
+        f"  enabled: {rng.choice(['true', 'false'])}",
+    ])
+
+
+def _json_line(rng: random.Random) -> str:
+    a = rng.choice(_IDENTS)
+    return (
+        f'    "node_modules/{a}-{rng.randint(0, 9999)}": '
+        f'{{"version": "{rng.randint(0, 9)}.{rng.randint(0, 20)}.{rng.randint(0, 50)}"}},'
+    )
+
+
+_GENERATORS = {
+    "python": _python_line,
+    "typescript": _typescript_line,
+    "go": _go_line,
+    "markdown": _markdown_line,
+    "yaml": _yaml_line,
+    "json": _json_line,
+}
+
+
+def _hunk(rng: random.Random, kind: str, start: int, size: int) -> list[str]:
+    gen = _GENERATORS[kind]
+    body: list[str] = []
+    old_count = new_count = 0
+    for _ in range(size):
+        roll = rng.random()
+        line = gen(rng)
+        if roll < 0.45:
+            body.append(f"+{line}")
+            new_count += 1
+        elif roll < 0.65:
+            body.append(f"-{line}")
+            old_count += 1
+        else:
+            body.append(f" {line}")
+            old_count += 1
+            new_count += 1
+    header = f"@@ -{start},{old_count} +{start},{new_count} @@"
+    return [header, *body]
+
+
+def generate_diff(total_lines: int, seed: int = 0) -> str:
+    """Return a unified diff with roughly total_lines lines."""
+    rng = random.Random(seed)
+    weights = [w for w, _, _ in FILE_MIX]
+    lines: list[str] = []
+    n = 0
+    while len(lines) < total_lines:
+        _, template, kind = rng.choices(FILE_MIX, weights=weights)[0]
+        n += 1
+        path = template.format(n=n)
+        remaining = total_lines - len(lines)
+        lines.extend([
+            f"diff --git a/{path} b/{path}",
+            f"index {rng.getrandbits(28):07x}..{rng.getrandbits(28):07x} 100644",
+            f"--- a/{path}",
+            f"+++ b/{path}",
+        ])
+        start = rng.randint(1, 400)
+        for _ in range(rng.randint(1, 4)):
+            size = max(1, min(remaining, rng.randint(3, 60)))
+            lines.extend(_hunk(rng, kind, start, size))
+            start += size + rng.randint(5, 80)
+            remaining = total_lines - len(lines)
+            if remaining <= 0:
+                break
+    return "\n".join(lines) + "\n"
+
+
+def changed_files(diff: str) -> list[str]:
+    return [
+        line[len("+++ b/"):]
+        for line in diff.splitlines()
+        if line.startswith("+++ b/")
+    ]
@@ -1 +1,13 @@
 __version__ = "0.1.0"
+
+__all__ = ["ReviewResult", "ReviewSession", "__version__", "review_pr"]
+
+
+def __getattr__(name: str):
+    # Importing the package (e.g. for __version__) does not load the session
+    # and everything it imports; the API is loaded on first use.
+    if name in ("ReviewResult", "ReviewSession", "review_pr"):
+        from . import session
+
+        return getattr(session, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,29 +1,43 @@
 from __future__ import annotations
 
 import argparse
-import re
+import contextvars
+import json
+import os
+import socket
 import sys
+import threading
+import time
+from collections.abc import Callable
+from dataclasses import asdict
+from datetime import datetime
+from functools import partial
 
 from . import __version__
-from .config import load_config
+from .config import SNAPSHOT_FILENAME, load_config, write_config_snapshot
 from .errors import ParcFermeError, GitHubError
 from .formatter import (
     format_changed_files,
-    format_comment,
+    format_estimate,
     format_header,
+    format_history_stats,
+    format_job_counts,
+    format_job_table,
     format_review_end,
     format_review_start,
     get_colors,
 )
-from .github import (
-    check_gh_available,
-    get_changed_files,
-    get_pr_diff,
-    get_pr_info,
-    post_comment,
-)
-from .profiles import get_profile, list_profiles
-from .reviewer import MAX_DIFF_CHARS, build_prompt, check_claude_available, run_review
+from .github import get_current_repo, get_pr_info, split_pr_ref
+from .history import fit_latency_model, history_path, load_history, summarize_history
+from .jobs import FAILED, PENDING, STATES, JobStore, StoredJob, default_store_path, drain
+from .limiter import DEFAULT_INITIAL_LIMIT, AIMDLimiter
+from .profiles import list_profiles
+from .scheduling import SCHEDULING_ORDERS, Scheduler, estimate_size
+from .session import ReviewResult, ReviewSession
+from .singleflight import CONCURRENT
+from .timing import Tracer, span, use_tracer
+from .usage import DEFAULT_DOWNGRADE_AT, BatchBudget
+from .watch import DEFAULT_INTERVAL, DEFAULT_MAX_INTERVAL, PRWatcher
 
 
 def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
@@ -39,7 +53,9 @@ def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
     parser.add_argument(
         "-p", "--profile",
         default=None,
-        help="Review profile to use (default/security/performance/angular)",
+        help="Review profile to use (default/security/performance/angular); "
+             "comma-separate several to run them all, e.g. security,performance, "
+             "or 'auto' to pick them per file from the auto_profiles rules",
     )
     parser.add_argument(
         "-c", "--comment",
@@ -52,16 +68,30 @@ def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
         default=None,
         help="Comment mode: 'create' new or 'update' last (default: create)",
     )
-    parser.add_argument(
+    config_group = parser.add_mutually_exclusive_group()
+    config_group.add_argument(
         "--config",
         default=None,
         help="Path to config file (overrides auto-discovery)",
     )
+    config_group.add_argument(
+        "--config-snapshot",
+        default=None,
+        metavar="FILE",
+        help="Load a snapshot written by 'parc-ferme config compile' "
+             "(no discovery or YAML parsing)",
+    )
     parser.add_argument(
         "-R", "--repo",
         default=None,
         help="Repository in OWNER/REPO format (passed to gh)",
     )
+    parser.add_argument(
+        "--stacked",
+        action="store_true",
+        help="If the PR is stacked on another open PR, review only the changes it adds "
+             "over that PR (default: the stacked_prs config)",
+    )
     parser.add_argument(
         "--list-profiles",
         action="store_true",
@@ -72,11 +102,17 @@ def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
         action="store_true",
         help="Show the prompt that would be sent without calling Claude",
     )
+    parser.add_argument(
+        "--estimate",
+        action="store_true",
+        help="Fetch the diff and print token, shard, model and latency "
+             "estimates without calling Claude",
+    )
     parser.add_argument(
         "-o", "--output",
         default=None,
         metavar="FILE",
-        help="Save review output to a file",
+        help="Save review output (or the --estimate JSON) to a file",
     )
     parser.add_argument(
         "--timeout",
@@ -85,10 +121,30 @@ def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
         metavar="SECONDS",
         help="Review timeout in seconds (default: 300)",
     )
+    parser.add_argument(
+        "--max-tokens-per-pr",
+        type=int,
+        default=None,
+        metavar="TOKENS",
+        help="Token budget of the review, all Claude calls together; a larger diff is "
+             "packed to fit or skipped (default: budgets.max_tokens_per_pr from config)",
+    )
     parser.add_argument(
         "--strict",
         action="store_true",
-        help="Exit with code 1 if CRITICAL issues are found in the review",
+        help="Exit with code 1 if CRITICAL issues are found in the review "
+             "(with --estimate: if the diff would be truncated)",
+    )
+    parser.add_argument(
+        "--timings",
+        action="store_true",
+        help="Print a per-phase timing summary to stderr",
+    )
+    parser.add_argument(
+        "--trace",
+        default=None,
+        metavar="FILE",
+        help="Write a Chrome trace-event JSON file of every phase",
     )
     parser.add_argument(
         "--no-color",
@@ -108,9 +164,680 @@ def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
     return parser.parse_args(argv)
 
 
-def _has_critical_issues(review: str) -> bool:
-    """Check if the review text contains CRITICAL severity markers."""
-    return bool(re.search(r'\bCRITICAL\b', review))
+def parse_config_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="parc-ferme config",
+        description="Manage parc-ferme configuration",
+    )
+    sub = parser.add_subparsers(dest="action", required=True)
+    compile_parser = sub.add_parser(
+        "compile",
+        help="Resolve config into a frozen snapshot for --config-snapshot",
+    )
+    compile_parser.add_argument(
+        "--config",
+        default=None,
+        help="Path to config file (overrides auto-discovery)",
+    )
+    compile_parser.add_argument(
+        "-o", "--output",
+        default=SNAPSHOT_FILENAME,
+        metavar="FILE",
+        help=f"Snapshot file to write (default: {SNAPSHOT_FILENAME})",
+    )
+    compile_parser.add_argument(
+        "--no-color",
+        action="store_true",
+        help="Disable colored terminal output",
+    )
+    return parser.parse_args(argv)
+
+
+def config_main(argv: list[str]) -> int:
+    args = parse_config_args(argv)
+    c = get_colors(args.no_color)
+
+    try:
+        snapshot = write_config_snapshot(args.output, args.config)
+    except ParcFermeError as e:
+        _print_err(str(e), no_color=args.no_color)
+        return 1
+
+    sources = snapshot["sources"]
+    print(f"{c.GREEN}Config snapshot written to {args.output}{c.NC}")
+    if sources:
+        for source in sources:
+            print(f"   {source['path']}")
+    else:
+        print("   (no config files found, built-in defaults only)")
+    return 0
+
+
+def parse_serve_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="parc-ferme serve",
+        description="Review PRs from GitHub pull_request webhooks",
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="Address to bind (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8080, help="Port to listen on (default: 8080)")
+    parser.add_argument(
+        "-j", "--workers",
+        type=int,
+        default=2,
+        help="Number of concurrent reviews (default: 2)",
+    )
+    parser.add_argument(
+        "--secret",
+        default=os.environ.get("PARC_FERME_WEBHOOK_SECRET"),
+        help="Webhook secret for X-Hub-Signature-256 checks "
+             "(default: $PARC_FERME_WEBHOOK_SECRET)",
+    )
+    parser.add_argument(
+        "-p", "--profile", default=None,
+        help="Review profile to use; comma-separate several to run them all",
+    )
+    parser.add_argument("-c", "--comment", action="store_true", help="Post reviews as PR comments")
+    parser.add_argument(
+        "--comment-mode",
+        choices=["create", "update"],
+        default=None,
+        help="Comment mode: 'create' new or 'update' last (default: create)",
+    )
+    config_group = parser.add_mutually_exclusive_group()
+    config_group.add_argument("--config", default=None, help="Path to config file")
+    config_group.add_argument("--config-snapshot", default=None, metavar="FILE",
+                              help="Load a compiled config snapshot")
+    parser.add_argument("--timeout", type=int, default=None, metavar="SECONDS",
+                        help="Review timeout in seconds (default: 300)")
+    parser.add_argument(
+        "--store",
+        default=None,
+        metavar="PATH",
+        help="SQLite job store to record and resume jobs (default: in the cache dir)",
+    )
+    parser.add_argument(
+        "--no-store",
+        action="store_true",
+        help="Keep jobs in memory only; unfinished reviews are lost on restart",
+    )
+    parser.add_argument("--order", choices=SCHEDULING_ORDERS, default=None,
+                        help="Start the smallest PR first (sjf) or in arrival order (fifo) "
+                             "(default: scheduling.order)")
+    parser.add_argument("--no-color", action="store_true", help="Disable colored terminal output")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Log every HTTP request")
+    return parser.parse_args(argv)
+
+
+def serve_main(argv: list[str]) -> int:
+    # http.server pulls in ssl and email; only serve and batch need it
+    from .server import ReviewServer, make_pr_reviewer
+
+    args = parse_serve_args(argv)
+    c = get_colors(args.no_color)
+
+    try:
+        session = ReviewSession(
+            config_path=args.config,
+            config_snapshot=args.config_snapshot,
+            max_concurrency=args.workers,
+        )
+        session.check_tools()
+        profile_name = ",".join(session.profile_names(args.profile))
+        scheduler = _scheduler(session, args.order)
+        store = None if args.no_store else JobStore(args.store, scheduler)
+    except (ParcFermeError, ValueError) as e:
+        _print_err(str(e), no_color=args.no_color)
+        return 1
+
+    reviewer = make_pr_reviewer(
+        session,
+        profile_name,
+        timeout=args.timeout,
+        comment=args.comment or session.comment_enabled,
+        comment_mode=args.comment_mode,
+    )
+    try:
+        server = ReviewServer(
+            reviewer,
+            host=args.host,
+            port=args.port,
+            workers=args.workers,
+            secret=args.secret,
+            verbose=args.verbose,
+            store=store,
+            profile_name=profile_name,
+            scheduler=scheduler,
+        )
+    except OSError as e:
+        _print_err(f"Could not listen on {args.host}:{args.port}: {e}", no_color=args.no_color)
+        return 1
+
+    host, port = server.address
+    print(f"{c.BLUE}🔍 parc-ferme listening on http://{host}:{port} "
+          f"({args.workers} workers, profile: {profile_name}){c.NC}", file=sys.stderr)
+    if not args.secret:
+        print(f"{c.YELLOW}\u26a0\ufe0f  No webhook secret set; deliveries are not verified{c.NC}",
+              file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\n{c.YELLOW}Shutting down...{c.NC}", file=sys.stderr)
+    finally:
+        server.shutdown()
+    return 0
+
+
+def parse_batch_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="parc-ferme batch",
+        description="Review many PRs through the persistent job store. "
+                    "Re-running resumes where an interrupted run stopped.",
+    )
+    parser.add_argument(
+        "prs",
+        nargs="*",
+        metavar="PR",
+        help="PR numbers or URLs to enqueue (none: resume the existing queue)",
+    )
+    parser.add_argument(
+        "--from-file",
+        default=None,
+        metavar="FILE",
+        help="Read PR numbers or URLs from FILE, one per line ('-' for stdin)",
+    )
+    parser.add_argument("-R", "--repo", default=None,
+                        help="Repository in OWNER/REPO format for PR numbers")
+    parser.add_argument(
+        "-p", "--profile", default=None,
+        help="Review profile to use; comma-separate several to run them all",
+    )
+    parser.add_argument(
+        "-j", "--workers",
+        type=int,
+        default=None,
+        help="Most concurrent reviews; the level adapts below this "
+             "(default: max_concurrent_reviews from config)",
+    )
+    parser.add_argument(
+        "--fixed-workers",
+        action="store_true",
+        help="Always run exactly -j reviews at once instead of adapting",
+    )
+    parser.add_argument("-c", "--comment", action="store_true", help="Post reviews as PR comments")
+    parser.add_argument(
+        "--comment-mode",
+        choices=["create", "update"],
+        default=None,
+        help="Comment mode: 'create' new or 'update' last (default: create)",
+    )
+    config_group = parser.add_mutually_exclusive_group()
+    config_group.add_argument("--config", default=None, help="Path to config file")
+    config_group.add_argument("--config-snapshot", default=None, metavar="FILE",
+                              help="Load a compiled config snapshot")
+    parser.add_argument("--timeout", type=int, default=None, metavar="SECONDS",
+                        help="Review timeout in seconds (default: 300)")
+    parser.add_argument("--max-tokens-per-pr", type=int, default=None, metavar="TOKENS",
+                        help="Token budget of each review (default: budgets.max_tokens_per_pr)")
+    parser.add_argument("--max-tokens", type=int, default=None, metavar="TOKENS",
+                        help="Stop starting reviews once the batch has used this many tokens "
+                             "(default: budgets.max_tokens_per_batch)")
+    parser.add_argument("--max-cost", type=float, default=None, metavar="USD",
+                        help="Stop starting reviews once the batch has cost this much "
+                             "(default: budgets.max_cost_per_batch)")
+    parser.add_argument("--cheaper-model", default=None, metavar="MODEL",
+                        help="Model for the rest of the batch once budgets.downgrade_at of a "
+                             "budget is spent (default: budgets.cheaper_model)")
+    parser.add_argument("--order", choices=SCHEDULING_ORDERS, default=None,
+                        help="Review the smallest PR first (sjf) or in queue order (fifo) "
+                             "(default: scheduling.order)")
+    parser.add_argument("--store", default=None, metavar="PATH",
+                        help="SQLite job store (default: in the cache dir)")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="Give jobs that used up their attempts another try")
+    parser.add_argument("--timings", action="store_true",
+                        help="Print a timing summary, including the concurrency level, to stderr")
+    parser.add_argument("--trace", default=None, metavar="FILE",
+                        help="Write a Chrome trace-event JSON file of every job")
+    parser.add_argument("--no-color", action="store_true", help="Disable colored terminal output")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Show every job event")
+    return parser.parse_args(argv)
+
+
+def batch_main(argv: list[str]) -> int:
+    args = parse_batch_args(argv)
+    tracer = Tracer()
+    tracer.metadata["command"] = "batch"
+    exit_code = 1
+    try:
+        with use_tracer(tracer):
+            exit_code = _run_batch(args, tracer)
+        return exit_code
+    finally:
+        tracer.metadata["exit_code"] = exit_code
+        _report_timings(args, tracer)
+
+
+def _run_batch(args: argparse.Namespace, tracer: Tracer) -> int:
+    from .server import ReviewJob, make_pr_reviewer
+
+    c = get_colors(args.no_color)
+
+    try:
+        refs = list(args.prs)
+        if args.from_file:
+            refs.extend(_read_pr_refs(args.from_file))
+        session = ReviewSession(
+            config_path=args.config,
+            config_snapshot=args.config_snapshot,
+        )
+        session.check_tools()
+        profile_name = ",".join(session.profile_names(args.profile))
+        scheduler = _scheduler(session, args.order)
+        store = JobStore(args.store, scheduler)
+    except (OSError, ParcFermeError, ValueError) as e:
+        _print_err(str(e), no_color=args.no_color)
+        return 1
+
+    with store:
+        try:
+            if args.retry_failed:
+                print(f"{c.BLUE}Retrying {store.retry_failed()} failed jobs{c.NC}")
+            created = _enqueue_prs(store, refs, args.repo, profile_name, scheduler)
+        except ParcFermeError as e:
+            _print_err(str(e), no_color=args.no_color)
+            return 1
+        if refs:
+            print(f"{c.BLUE}Queued {created} new jobs "
+                  f"({len(refs) - created} already recorded){c.NC}")
+
+        comment = args.comment or session.comment_enabled
+        budgets = session.budgets
+        budget = BatchBudget(
+            max_tokens=args.max_tokens or budgets.get("max_tokens_per_batch"),
+            max_cost=args.max_cost or budgets.get("max_cost_per_batch"),
+            cheaper_model=args.cheaper_model or budgets.get("cheaper_model"),
+            downgrade_at=budgets.get("downgrade_at", DEFAULT_DOWNGRADE_AT),
+        )
+
+        def review(job: StoredJob) -> str:
+            reviewer = make_pr_reviewer(
+                session, job.profile, timeout=args.timeout,
+                comment=comment, comment_mode=args.comment_mode,
+                max_tokens=args.max_tokens_per_pr, budget=budget,
+            )
+            return reviewer(ReviewJob(
+                job.repo, job.pr, job.head_sha, save_result=partial(store.save_result, job),
+            ))
+
+        lock = threading.Lock()
+
+        def on_event(event: str, job: StoredJob, detail: str) -> None:
+            if event == "started" and not args.verbose:
+                return
+            color = {"done": c.GREEN, "recovered": c.GREEN, "failed": c.RED}.get(event, c.YELLOW)
+            with lock:
+                print(f"{color}{event:9s}{c.NC} {job.describe()}"
+                      f"{f': {detail}' if detail else ''}", file=sys.stderr)
+
+        workers = max(1, args.workers or session.max_concurrent_reviews)
+        limiter = None
+        if not args.fixed_workers and workers > 1:
+            limiter = AIMDLimiter(
+                initial=min(DEFAULT_INITIAL_LIMIT, workers), maximum=workers,
+                name="batch.concurrency",
+            )
+        owner = f"batch@{socket.gethostname()}:{os.getpid()}"
+        # Each worker gets its own copy of the context so spans reach the tracer
+        threads = [
+            threading.Thread(
+                target=contextvars.copy_context().run,
+                args=(drain, store, _safe_review(review), f"{owner}/{i}"),
+                kwargs={"on_event": on_event, "limiter": limiter, "stop": budget.exhausted},
+                daemon=True,
+            )
+            for i in range(workers)
+        ]
+        try:
+            for t in threads:
+                t.start()
+            for t in threads:
+                while t.is_alive():
+                    t.join(0.5)
+        except KeyboardInterrupt:
+            print(f"\n{c.YELLOW}Interrupted; re-run 'parc-ferme batch' to resume{c.NC}",
+                  file=sys.stderr)
+            return 130
+        finally:
+            if limiter is not None:
+                levels = [level for _, level in limiter.history]
+                tracer.metadata["concurrency"] = {
+                    "max": workers, "final": limiter.limit, "peak": max(levels),
+                }
+
+        if limiter is not None and args.verbose:
+            print(f"[verbose] Concurrency ended at {limiter.limit} "
+                  f"(peak {max(level for _, level in limiter.history)}, max {workers})",
+                  file=sys.stderr)
+        counts = store.counts()
+        print(format_job_counts(counts, no_color=args.no_color))
+        if budget.usage.calls:
+            tracer.metadata["usage"] = asdict(budget.usage)
+            print(f"Used {budget.usage.describe()} in {budget.usage.calls} Claude calls")
+        if budget.exhausted.is_set() and counts[PENDING]:
+            print(f"{c.YELLOW}Batch budget reached; {counts[PENDING]} jobs left queued. "
+                  f"Re-run 'parc-ferme batch' to continue.{c.NC}")
+        return 1 if counts[FAILED] else 0
+
+
+def _safe_review(review: Callable[[StoredJob], str]) -> Callable[[StoredJob], str]:
+    """Turn unexpected errors into failed attempts instead of killing the worker."""
+    def wrapper(job: StoredJob) -> str:
+        try:
+            return review(job)
+        except (ParcFermeError, KeyboardInterrupt):
+            raise
+        except Exception as e:
+            raise ParcFermeError(f"unexpected error: {e!r}") from e
+    return wrapper
+
+
+def _read_pr_refs(path: str) -> list[str]:
+    f = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    try:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def _scheduler(session: ReviewSession, order: str | None) -> Scheduler:
+    scheduler = session.scheduler
+    if order:
+        scheduler.order = order
+    return scheduler
+
+
+def _enqueue_prs(
+    store: JobStore,
+    refs: list[str],
+    repo: str | None,
+    profile_name: str,
+    scheduler: Scheduler,
+) -> int:
+    """Record a job per PR at its current head. Returns how many were new.
+
+    The size and label priority the scheduler orders by come from the same
+    `gh pr view` call, before any diff is fetched.
+    """
+    created = 0
+    default_repo = repo
+    for ref in refs:
+        ref_repo, number = split_pr_ref(ref)
+        if ref_repo is None and default_repo is None:
+            default_repo = get_current_repo()
+        job_repo = ref_repo or default_repo
+        pr_info = get_pr_info(str(number), repo=job_repo)
+        _, is_new = store.add(
+            job_repo, number, pr_info.head_sha, profile_name,
+            size=estimate_size(pr_info.additions, pr_info.deletions, pr_info.changed_files),
+            priority=scheduler.priority(pr_info.labels),
+        )
+        created += is_new
+    return created
+
+
+def parse_jobs_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="parc-ferme jobs",
+        description="Show progress of the persistent review job store",
+    )
+    parser.add_argument("--store", default=None, metavar="PATH",
+                        help=f"SQLite job store (default: {default_store_path()})")
+    parser.add_argument("--state", choices=STATES, default=None, help="Only list jobs in STATE")
+    parser.add_argument("-n", "--limit", type=int, default=50, help="Jobs to list (default: 50)")
+    parser.add_argument("--show", type=int, default=None, metavar="ID",
+                        help="Print the saved review of job ID")
+    parser.add_argument("--no-color", action="store_true", help="Disable colored terminal output")
+    return parser.parse_args(argv)
+
+
+def jobs_main(argv: list[str]) -> int:
+    args = parse_jobs_args(argv)
+    try:
+        store = JobStore(args.store)
+    except ParcFermeError as e:
+        _print_err(str(e), no_color=args.no_color)
+        return 1
+
+    with store:
+        if args.show is not None:
+            job = store.get(args.show)
+            if job is None:
+                _print_err(f"No job with id {args.show}", no_color=args.no_color)
+                return 1
+            if not job.result_path or not os.path.exists(job.result_path):
+                _print_err(f"Job {job.id} has no saved review (state: {job.state})",
+                           no_color=args.no_color)
+                return 1
+            with open(job.result_path, encoding="utf-8") as f:
+                print(f.read())
+            return 0
+
+        print(format_job_counts(store.counts(), no_color=args.no_color))
+        jobs = store.list_jobs(args.state, args.limit)
+        if jobs:
+            print()
+            print(format_job_table(jobs, no_color=args.no_color))
+    return 0
+
+
+def parse_stats_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="parc-ferme stats",
+        description="Show review latency distributions and the fitted latency model",
+    )
+    parser.add_argument("-m", "--model", default=None, help="Only show reviews with MODEL")
+    parser.add_argument("-p", "--profile", default=None, help="Only show reviews with PROFILE")
+    parser.add_argument("--config", default=None, help="Path to config file")
+    parser.add_argument("--json", action="store_true", help="Print the statistics as JSON")
+    parser.add_argument("--no-color", action="store_true", help="Disable colored terminal output")
+    return parser.parse_args(argv)
+
+
+def stats_main(argv: list[str]) -> int:
+    args = parse_stats_args(argv)
+    try:
+        settings = load_config(args.config)["latency_model"]
+    except ParcFermeError as e:
+        _print_err(str(e), no_color=args.no_color)
+        return 1
+
+    records = [
+        r for r in load_history()
+        if (args.model is None or r.model == args.model)
+        and (args.profile is None or r.profile == args.profile)
+    ]
+    if not records:
+        print(f"No review history yet ({history_path()})")
+        return 0
+    stats = summarize_history(records)
+    models = [
+        fitted for fitted in (
+            fit_latency_model(name, records) for name in dict.fromkeys(s.model for s in stats)
+        )
+        if fitted is not None
+    ]
+    if args.json:
+        print(json.dumps({
+            "groups": [asdict(s) for s in stats],
+            "models": [{k: v for k, v in asdict(m).items() if k != "ratios"} for m in models],
+        }, indent=2))
+    else:
+        print(format_history_stats(stats, models, settings, no_color=args.no_color))
+    return 0
+
+
+def parse_index_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="parc-ferme index",
+        description="Build or update the symbol index of a local clone",
+    )
+    parser.add_argument("--repo-path", default=None, metavar="PATH",
+                        help="Clone to index (default: code_context.repo_path, else the "
+                             "working directory)")
+    parser.add_argument("--rev", default="HEAD", help="Commit to index (default: HEAD)")
+    parser.add_argument("--lookup", action="append", default=[], metavar="NAME",
+                        help="Print the definitions of NAME (repeatable)")
+    parser.add_argument("--config", default=None, help="Path to config file")
+    parser.add_argument("--no-color", action="store_true", help="Disable colored terminal output")
+    return parser.parse_args(argv)
+
+
+def index_main(argv: list[str]) -> int:
+    args = parse_index_args(argv)
+    c = get_colors(args.no_color)
+    try:
+        with ReviewSession(config_path=args.config) as session:
+            if args.repo_path:
+                session.config["code_context"] = {
+                    **session.code_context, "repo_path": args.repo_path,
+                }
+            work_tree = session.work_tree()
+            if work_tree is None:
+                _print_err(f"Not a git clone: {args.repo_path or os.getcwd()}",
+                           no_color=args.no_color)
+                return 1
+            started = time.perf_counter()
+            index, parsed = session.update_symbol_index(work_tree, args.rev)
+            elapsed = time.perf_counter() - started
+            files, symbols = index.stats()
+            print(f"{c.GREEN}Symbol index of {work_tree} at {(index.commit or '')[:12]}:{c.NC} "
+                  f"{files:,} files, {symbols:,} symbols "
+                  f"({parsed:,} files parsed in {elapsed:.2f}s)")
+            print(f"   {index.path}")
+            if args.lookup:
+                started = time.perf_counter()
+                found = index.lookup(args.lookup)
+                elapsed = (time.perf_counter() - started) * 1000
+                print(f"\n{c.BLUE}Lookup of {len(args.lookup)} names: {elapsed:.1f}ms{c.NC}")
+                for name in args.lookup:
+                    for symbol in found.get(name, []):
+                        print(f"   {symbol.text()}")
+                    if name not in found:
+                        print(f"   {c.YELLOW}{name}: not found{c.NC}")
+    except ParcFermeError as e:
+        _print_err(str(e), no_color=args.no_color)
+        return 1
+    return 0
+
+
+def parse_watch_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="parc-ferme watch",
+        description="Keep a PR's review current: poll it and review each new push",
+    )
+    parser.add_argument("pr", help="PR number or URL")
+    parser.add_argument("-R", "--repo", default=None,
+                        help="Repository in OWNER/REPO format for a PR number")
+    parser.add_argument(
+        "-p", "--profile", default=None,
+        help="Review profile to use; comma-separate several to run them all",
+    )
+    parser.add_argument("-c", "--comment", action="store_true",
+                        help="Post the first review as a PR comment and update it in place")
+    parser.add_argument(
+        "--comment-mode",
+        choices=["create", "update"],
+        default=None,
+        help="How the first review is posted: 'create' new or 'update' last (default: create)",
+    )
+    parser.add_argument("--interval", type=int, default=None, metavar="SECONDS",
+                        help="Seconds between polls after a push (default: watch.interval)")
+    parser.add_argument("--max-interval", type=int, default=None, metavar="SECONDS",
+                        help="Longest wait between polls of a quiet PR "
+                             "(default: watch.max_interval)")
+    parser.add_argument("--timeout", type=int, default=None, metavar="SECONDS",
+                        help="Review timeout in seconds (default: 300)")
+    parser.add_argument("--config", default=None, help="Path to config file")
+    parser.add_argument("--no-color", action="store_true", help="Disable colored terminal output")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Show every poll")
+    return parser.parse_args(argv)
+
+
+def watch_main(argv: list[str]) -> int:
+    args = parse_watch_args(argv)
+    c = get_colors(args.no_color)
+    try:
+        session = ReviewSession(config_path=args.config)
+        session.check_tools()
+        profile_name = ",".join(session.profile_names(args.profile))
+        pr_repo, number = split_pr_ref(args.pr)
+        repo = pr_repo or args.repo or get_current_repo()
+    except (ParcFermeError, ValueError) as e:
+        _print_err(str(e), no_color=args.no_color)
+        return 1
+
+    settings = session.watch
+    interval = args.interval or settings.get("interval", DEFAULT_INTERVAL)
+    max_interval = args.max_interval or settings.get("max_interval", DEFAULT_MAX_INTERVAL)
+
+    def on_event(event: str, detail: str) -> None:
+        stamp = datetime.now().strftime("%H:%M:%S")
+        if event == "pushed":
+            print(f"{c.BLUE}[{stamp}] New head {detail[:7]}; reviewing...{c.NC}", file=sys.stderr)
+        elif event == "rebased":
+            print(f"{c.YELLOW}[{stamp}] {detail[:7]} is no longer in the PR (force push?); "
+                  f"reviewing the whole PR{c.NC}", file=sys.stderr)
+        elif event == "error":
+            print(f"{c.YELLOW}[{stamp}] {detail}; retrying{c.NC}", file=sys.stderr)
+        elif event == "closed":
+            print(f"{c.GREEN}[{stamp}] PR is {detail}; stopped watching{c.NC}", file=sys.stderr)
+
+    def on_review(result: ReviewResult) -> None:
+        if result.since:
+            print(f"\n{c.GREEN}Changes since {result.since[:7]}:{c.NC}")
+        else:
+            print(format_header(result.pr_info, no_color=args.no_color))
+        print(result.review)
+        print(format_review_end(no_color=args.no_color))
+        if result.comment_posted:
+            action = "updated" if result.since else "posted"
+            print(f"{c.GREEN}\U0001f4ac Review {action} as PR comment{c.NC}")
+        if args.verbose and result.usage.calls:
+            print(f"{c.YELLOW}[verbose] Usage: {result.usage.describe()}{c.NC}")
+
+    watcher = PRWatcher(
+        session, repo, number,
+        profile=profile_name,
+        timeout=args.timeout,
+        comment=args.comment or session.comment_enabled,
+        comment_mode=args.comment_mode,
+        interval=interval,
+        max_interval=max_interval,
+        on_event=on_event,
+        on_review=on_review,
+    )
+    print(f"{c.BLUE}👀 Watching {repo}#{number} (polling every {interval}s, "
+          f"up to {max_interval}s while idle; Ctrl-C to stop){c.NC}", file=sys.stderr)
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        print(f"\n{c.YELLOW}Stopped watching{c.NC}", file=sys.stderr)
+        return 130
+    finally:
+        session.close()
+    return 0
+
+
+_COMMANDS = {
+    "batch": batch_main,
+    "config": config_main,
+    "index": index_main,
+    "jobs": jobs_main,
+    "serve": serve_main,
+    "stats": stats_main,
+    "watch": watch_main,
+}
 
 
 def _print_err(msg: str, no_color: bool = False) -> None:
@@ -119,20 +846,50 @@ def _print_err(msg: str, no_color: bool = False) -> None:
 
 
 def main(argv: list[str] | None = None) -> int:
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv and argv[0] in _COMMANDS:
+        return _COMMANDS[argv[0]](argv[1:])
+
     args = parse_args(argv)
+    tracer = Tracer()
+    tracer.metadata["pr"] = args.pr
+    exit_code = 1
+    try:
+        with use_tracer(tracer), tracer.span("main"):
+            exit_code = _run(args)
+        return exit_code
+    finally:
+        tracer.metadata["exit_code"] = exit_code
+        _report_timings(args, tracer)
+
+
+def _report_timings(args: argparse.Namespace, tracer: Tracer) -> None:
+    if args.timings:
+        print(tracer.format_summary(), file=sys.stderr)
+    if args.trace:
+        try:
+            tracer.write_trace(args.trace)
+        except OSError as e:
+            c = get_colors(args.no_color)
+            print(
+                f"{c.YELLOW}Could not write trace to {args.trace}: {e}{c.NC}",
+                file=sys.stderr,
+            )
+
+
+def _run(args: argparse.Namespace) -> int:
     c = get_colors(args.no_color)
 
     try:
-        config = load_config(args.config)
+        session = ReviewSession(config_path=args.config, config_snapshot=args.config_snapshot)
     except ParcFermeError as e:
         _print_err(str(e), no_color=args.no_color)
         return 1
 
-    custom_profiles = config.get("custom_profiles")
-
     # --list-profiles
     if args.list_profiles:
-        all_profiles = list_profiles(custom_profiles)
+        all_profiles = list_profiles(session.config.get("custom_profiles"))
         print("Available profiles:\n")
         for name, profile in sorted(all_profiles.items()):
             print(f"  {name:15s}  {profile.description}")
@@ -144,73 +901,115 @@ def main(argv: list[str] | None = None) -> int:
         return 1
 
     try:
-        check_gh_available()
-        if not args.dry_run:
-            check_claude_available()
+        session.check_tools(claude=not (args.dry_run or args.estimate))
     except ParcFermeError as e:
         _print_err(str(e), no_color=args.no_color)
         return 1
 
-    # Resolve profile
-    profile_name = args.profile or config.get("default_profile", "default")
+    if args.estimate:
+        return _run_estimate(args, session)
 
+    # Resolve profiles
     try:
-        profile = get_profile(profile_name, custom_profiles)
+        profile_names = session.profile_names(args.profile)
     except ValueError as e:
         _print_err(str(e), no_color=args.no_color)
         return 1
 
     try:
-        # Fetch PR info
-        pr_info = get_pr_info(args.pr, repo=args.repo)
-        print(format_header(pr_info, no_color=args.no_color))
+        prepared_list = session.prepare_profiles(
+            args.pr, repo=args.repo, profile=",".join(profile_names),
+            stacked=args.stacked or None, max_tokens=args.max_tokens_per_pr,
+        )
+        prepared = prepared_list[0]
+        print(format_header(prepared.pr_info, no_color=args.no_color))
+        if prepared.parent is not None:
+            print(f"{c.GREEN}Stacked on:{c.NC} #{prepared.parent.number} "
+                  f"{prepared.parent.title} (reviewing only the changes this PR adds)")
 
-        # Changed files
-        changed_files = get_changed_files(args.pr, repo=args.repo)
-        changed_files_output = format_changed_files(changed_files, no_color=args.no_color)
+        changed_files_output = format_changed_files(
+            prepared.changed_files, no_color=args.no_color,
+        )
         if changed_files_output:
             print(changed_files_output)
 
-        # Build prompt
-        prompt = build_prompt(pr_info, profile)
-
         if args.verbose:
-            print(f"\n{c.YELLOW}[verbose] Profile: {profile_name}{c.NC}")
-            print(f"{c.YELLOW}[verbose] Model: {config.get('claude_model', 'default')}{c.NC}")
+            print(f"\n{c.YELLOW}[verbose] Profile: {', '.join(profile_names)}{c.NC}")
+            for one in prepared_list:
+                if one.routed_files:
+                    print(f"{c.YELLOW}[verbose] {one.profile_name} reviews "
+                          f"{len(one.routed_files)} files: {', '.join(one.routed_files)}{c.NC}")
+            print(f"{c.YELLOW}[verbose] Model: {session.model_name}{c.NC}")
 
         # Dry run
         if args.dry_run:
-            print(f"\n{c.YELLOW}--- DRY RUN: Prompt that would be sent ---{c.NC}\n")
-            print(prompt)
-            print(f"\n{c.YELLOW}--- End of prompt (diff would follow via stdin) ---{c.NC}")
+            for one in prepared_list:
+                which = f" ({one.profile_name})" if len(prepared_list) > 1 else ""
+                print(f"\n{c.YELLOW}--- DRY RUN: Prompt that would be sent{which} ---{c.NC}\n")
+                print(one.prompt)
+                print(f"\n{c.YELLOW}--- End of prompt (diff would follow via stdin) ---{c.NC}")
             return 0
 
         # Run review
         print(format_review_start(no_color=args.no_color))
 
-        diff = get_pr_diff(args.pr, repo=args.repo)
-
-        if len(diff) > MAX_DIFF_CHARS:
+        packed = session.fetch_diff(prepared)
+        if args.verbose and prepared.context_bytes:
+            print(f"{c.YELLOW}[verbose] Added {prepared.context_bytes:,} bytes of enclosing "
+                  f"code from the local clone{c.NC}")
+        if prepared.over_budget:
+            print(f"\n{c.YELLOW}Review would need ~{prepared.over_budget:,} tokens, over its "
+                  f"{prepared.max_tokens:,}-token budget; packing the diff to fit.{c.NC}")
+        if len(prepared.shards) > 1:
+            print(f"\n{c.YELLOW}Diff is ~{prepared.diff_tokens:,} tokens; reviewing it in "
+                  f"{len(prepared.shards)} parts of up to {prepared.shard_tokens:,} tokens.{c.NC}")
+        if packed.truncated:
+            left_out = len(packed.omitted_files) + len(packed.partial_files)
+            budget = prepared.shard_tokens * len(prepared.shards)
             print(
-                f"\n{c.YELLOW}\u26a0\ufe0f  Diff is {len(diff):,} chars, exceeding "
-                f"{MAX_DIFF_CHARS:,} limit. It will be truncated.{c.NC}"
+                f"\n{c.YELLOW}\u26a0\ufe0f  Diff is ~{prepared.diff_tokens:,} tokens, exceeding "
+                f"the {budget:,}-token budget. Lower-priority hunks "
+                f"will be left out ({left_out} files affected).{c.NC}"
             )
+            if args.verbose:
+                for path in packed.omitted_files:
+                    print(f"{c.YELLOW}[verbose] Left out: {path}{c.NC}")
+                for path in packed.partial_files:
+                    print(f"{c.YELLOW}[verbose] Partially included: {path}{c.NC}")
 
-        timeout = args.timeout or config.get("review_timeout", 300)
-        review = run_review(
-            prompt,
-            diff,
-            model=config.get("claude_model"),
-            timeout=timeout,
-        )
-        print(review)
+        result = session.run_profiles(prepared_list, timeout=args.timeout)
+        if args.verbose and result.duplicates:
+            print(f"{c.YELLOW}[verbose] Dropped {result.duplicates} findings reported by "
+                  f"more than one profile{c.NC}")
+        if args.verbose and result.cached_hunks:
+            print(f"{c.YELLOW}[verbose] Reused findings for {result.cached_hunks} hunks "
+                  f"reviewed before{c.NC}")
+        if args.verbose and result.fast_path:
+            print(f"{c.YELLOW}[verbose] Skipped Claude: {result.fast_path}{c.NC}")
+        if result.shared_from == CONCURRENT:
+            print(f"{c.YELLOW}Reusing the review from a concurrent run of this PR head{c.NC}")
+        elif result.shared:
+            print(f"{c.YELLOW}Reusing an earlier review of this diff and prompt "
+                  f"(single_flight.ttl){c.NC}")
+        if args.verbose:
+            print(f"{c.YELLOW}[verbose] Claude timeout: {result.timeout}s per call{c.NC}")
+        if args.verbose and result.usage.calls:
+            print(f"{c.YELLOW}[verbose] Usage: {result.usage.describe()} "
+                  f"in {result.usage.calls} Claude calls{c.NC}")
+        if args.verbose and result.slot_wait >= 0.1:
+            print(f"{c.YELLOW}[verbose] Waited {result.slot_wait:.1f}s for a Claude slot "
+                  f"({session.max_concurrent_reviews} per host){c.NC}")
+        print(result.review)
         print(format_review_end(no_color=args.no_color))
+        if result.partial:
+            print(f"{c.YELLOW}\u26a0\ufe0f  This review is partial; re-run it or raise "
+                  f"--timeout for a complete one.{c.NC}", file=sys.stderr)
 
         # Save to file
         if args.output:
             try:
-                with open(args.output, "w", encoding="utf-8") as f:
-                    f.write(review)
+                with span("output.write"), open(args.output, "w", encoding="utf-8") as f:
+                    f.write(result.review)
                     f.write("\n")
                 print(f"\n{c.GREEN}\U0001f4c4 Review saved to {args.output}{c.NC}")
             except OSError as e:
@@ -220,23 +1019,15 @@ def main(argv: list[str] | None = None) -> int:
                 )
 
         # Auto-comment
-        should_comment = args.comment or config.get("comment", {}).get("enabled", False)
-        if should_comment:
-            comment_mode = args.comment_mode or config.get("comment", {}).get("mode", "create")
-            comment_body = format_comment(pr_info, review, profile_name)
+        if args.comment or session.comment_enabled:
             try:
-                post_comment(
-                    args.pr,
-                    comment_body,
-                    repo=args.repo,
-                    edit_last=(comment_mode == "update"),
-                )
+                session.post(result, args.comment_mode)
                 print(f"\n{c.GREEN}\U0001f4ac Review posted as PR comment{c.NC}")
             except GitHubError as e:
                 print(f"\n{c.YELLOW}\u26a0\ufe0f  Could not post comment: {e}{c.NC}", file=sys.stderr)
 
         # Strict mode
-        if args.strict and _has_critical_issues(review):
+        if args.strict and result.has_critical_issues:
             print(f"\n{c.RED}Strict mode: CRITICAL issues found, exiting with code 1{c.NC}")
             return 1
 
@@ -250,5 +1041,35 @@ def main(argv: list[str] | None = None) -> int:
     return 0
 
 
+def _run_estimate(args: argparse.Namespace, session: ReviewSession) -> int:
+    c = get_colors(args.no_color)
+    try:
+        estimate = session.estimate(
+            args.pr, repo=args.repo, profile=args.profile,
+            stacked=args.stacked or None, max_tokens=args.max_tokens_per_pr,
+        )
+    except ParcFermeError as e:
+        _print_err(str(e), no_color=args.no_color)
+        return 1
+
+    print(format_estimate(args.pr, estimate, no_color=args.no_color))
+
+    if args.output:
+        try:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump({"pr": args.pr, **asdict(estimate)}, f, indent=2)
+                f.write("\n")
+        except OSError as e:
+            print(
+                f"\n{c.YELLOW}Could not write to {args.output}: {e}{c.NC}",
+                file=sys.stderr,
+            )
+
+    if args.strict and estimate.truncated:
+        print(f"\n{c.RED}Strict mode: diff exceeds the review budget, exiting with code 1{c.NC}")
+        return 1
+    return 0
+
+
 if __name__ == "__main__":
     sys.exit(main())
@@ -1,23 +1,60 @@
 from __future__ import annotations
 
+import hashlib
+import json
+import os
 import re
 import subprocess
+import tempfile
+from dataclasses import asdict
 from pathlib import Path
 from typing import Any
 
 import yaml
 
+from . import __version__
+from .context import DEFAULT_CONTEXT_BYTES, MAX_CONTEXT_BYTES
+from .diff import CHARS_PER_TOKEN
 from .errors import ConfigError
+from .fastpath import FAST_PATH_CHECKS
 from .profiles import (
     BUILTIN_PROFILES,
     DEFAULT_SEVERITY_LEVELS,
     Profile,
+    SeverityLevel,
     merge_profile,
     parse_severity_levels,
 )
+from .scheduling import DEFAULT_AGING_SECONDS, SCHEDULING_ORDERS
+from .usage import DEFAULT_DOWNGRADE_AT, PR_BUDGET_ACTIONS
 
 CONFIG_FILENAME = ".reviewrc.yml"
 USER_CONFIG_DIR = Path.home() / ".config" / "parc-ferme"
+SNAPSHOT_FILENAME = ".reviewrc.snapshot.json"
+SNAPSHOT_VERSION = 2
+MAX_SYMBOL_TOKENS = MAX_CONTEXT_BYTES // CHARS_PER_TOKEN
+
+
+def get_cache_dir() -> Path:
+    """Directory for local state (history, caches). Honours XDG_CACHE_HOME."""
+    base = os.environ.get("XDG_CACHE_HOME") or str(Path.home() / ".cache")
+    return Path(base) / "parc-ferme"
+
+
+def get_runtime_dir() -> Path:
+    """Directory for host-wide coordination files (lock slots).
+
+    PARC_FERME_RUNTIME_DIR wins, so runners under different users can share
+    one directory; otherwise XDG_RUNTIME_DIR or a per-user temp directory.
+    """
+    explicit = os.environ.get("PARC_FERME_RUNTIME_DIR")
+    if explicit:
+        return Path(explicit)
+    xdg = os.environ.get("XDG_RUNTIME_DIR")
+    if xdg:
+        return Path(xdg) / "parc-ferme"
+    uid = os.getuid() if hasattr(os, "getuid") else "user"
+    return Path(tempfile.gettempdir()) / f"parc-ferme-{uid}"
 
 
 def _find_git_root() -> Path | None:
@@ -35,23 +72,22 @@ def _find_git_root() -> Path | None:
     return None
 
 
-def _discover_config_files() -> list[Path]:
-    """Find config files in order of precedence (lowest first)."""
-    paths: list[Path] = []
+def _config_root() -> Path:
+    """Directory the project-level config lives in: the git root, else cwd."""
+    return _find_git_root() or Path.cwd()
+
 
-    # User-level config
-    user_config = USER_CONFIG_DIR / CONFIG_FILENAME
-    if user_config.exists():
-        paths.append(user_config)
+def _config_candidates() -> list[Path]:
+    """Every path discovery looks at, present or not, lowest precedence first."""
+    return [
+        USER_CONFIG_DIR / CONFIG_FILENAME,  # user-level config
+        _config_root() / CONFIG_FILENAME,  # project-level config
+    ]
 
-    # Project-level config (git root or cwd)
-    git_root = _find_git_root()
-    search_dir = git_root or Path.cwd()
-    project_config = search_dir / CONFIG_FILENAME
-    if project_config.exists():
-        paths.append(project_config)
 
-    return paths
+def _discover_config_files() -> list[Path]:
+    """Find config files in order of precedence (lowest first)."""
+    return [path for path in _config_candidates() if path.exists()]
 
 
 def _parse_yaml(path: Path) -> dict[str, Any]:
@@ -127,34 +163,316 @@ def _build_custom_profiles(raw_profiles: dict[str, Any]) -> dict[str, Profile]:
     return custom
 
 
-def load_config(explicit_path: str | None = None) -> dict[str, Any]:
-    """Load and merge configuration from all sources.
-
-    Returns a dict with keys:
-        - default_profile: str
-        - claude_model: str | None
-        - review_timeout: int
-        - comment: dict (enabled, mode)
-        - custom_profiles: dict[str, Profile] | None
-    """
-    merged: dict[str, Any] = {
+def _default_config() -> dict[str, Any]:
+    return {
         "default_profile": "default",
         "claude_model": None,
         "review_timeout": 300,
+        "max_concurrent_reviews": 4,
+        "max_shards": 1,
+        "retry": {"attempts": 3, "backoff": 2.0, "max_backoff": 30.0},
+        "latency_model": {
+            "enabled": True,
+            "percentile": 95,
+            "headroom": 1.5,
+            "min_samples": 10,
+            "target_seconds": 120,
+        },
         "comment": {"enabled": False, "mode": "create"},
+        "single_flight": {"enabled": True, "ttl": 3600, "ignore_whitespace": False},
+        "fast_path": {"enabled": True, "checks": list(FAST_PATH_CHECKS)},
+        "hunk_cache": {"enabled": True, "ttl_days": 30},
+        "stacked_prs": {"enabled": False},
+        "code_context": {"enabled": False, "repo_path": None, "max_bytes": DEFAULT_CONTEXT_BYTES},
+        "symbol_index": {"enabled": False, "max_tokens": 1500},
+        "conventions": {"enabled": False, "max_bytes": 3000},
+        "budgets": {
+            "max_tokens_per_pr": None,
+            "on_pr_exceeded": "degrade",
+            "max_tokens_per_batch": None,
+            "max_cost_per_batch": None,
+            "cheaper_model": None,
+            "downgrade_at": DEFAULT_DOWNGRADE_AT,
+        },
+        "scheduling": {
+            "order": "sjf",
+            "aging_seconds": DEFAULT_AGING_SECONDS,
+            "label_priority": {},
+        },
+        "watch": {"interval": 15, "max_interval": 300},
+        "auto_profiles": None,
         "custom_profiles": None,
     }
 
-    # Determine config files to load
+
+def _resolve_config_files(explicit_path: str | None) -> list[Path]:
     if explicit_path:
         path = Path(explicit_path)
         if not path.exists():
             raise ConfigError(f"Config file not found: {explicit_path}")
-        config_files = [path]
-    else:
-        config_files = _discover_config_files()
+        return [path]
+    return _discover_config_files()
+
+
+def _positive_int(key: str, value: Any) -> int:
+    try:
+        number = int(value)
+    except (ValueError, TypeError):
+        raise ConfigError(f"Invalid {key} value: '{value}' (must be a positive integer)")
+    if number <= 0:
+        raise ConfigError(f"Invalid {key} value: {number} (must be a positive integer)")
+    return number
+
+
+def _non_negative_number(key: str, value: Any) -> float:
+    try:
+        number = float(value)
+    except (ValueError, TypeError):
+        raise ConfigError(f"Invalid {key} value: '{value}' (must be a non-negative number)")
+    if number < 0:
+        raise ConfigError(f"Invalid {key} value: {value} (must be a non-negative number)")
+    return number
+
+
+def _parse_retry(raw: dict[str, Any], merged: dict[str, Any]) -> dict[str, Any]:
+    retry = dict(merged)
+    if "attempts" in raw:
+        retry["attempts"] = _positive_int("retry.attempts", raw["attempts"])
+    for key in ("backoff", "max_backoff"):
+        if key in raw:
+            retry[key] = _non_negative_number(f"retry.{key}", raw[key])
+    return retry
+
+
+def _parse_latency_model(raw: dict[str, Any], merged: dict[str, Any]) -> dict[str, Any]:
+    latency = dict(merged)
+    if "enabled" in raw:
+        latency["enabled"] = bool(raw["enabled"])
+    if "percentile" in raw:
+        pct = _non_negative_number("latency_model.percentile", raw["percentile"])
+        if pct > 100:
+            raise ConfigError(
+                f"Invalid latency_model.percentile value: {raw['percentile']} "
+                "(must be between 0 and 100)"
+            )
+        latency["percentile"] = pct
+    if "headroom" in raw:
+        latency["headroom"] = _non_negative_number("latency_model.headroom", raw["headroom"])
+    for key in ("min_samples", "target_seconds"):
+        if key in raw:
+            latency[key] = _positive_int(f"latency_model.{key}", raw[key])
+    return latency
+
+
+def _string_list(key: str, value: Any) -> list[str]:
+    if isinstance(value, str):
+        value = [value]
+    if not isinstance(value, list) or not all(isinstance(v, str) and v for v in value):
+        raise ConfigError(f"Invalid {key} value: {value!r} (must be a list of names)")
+    return value
+
+
+def _parse_single_flight(raw: dict[str, Any], merged: dict[str, Any]) -> dict[str, Any]:
+    single_flight = dict(merged)
+    for key in ("enabled", "ignore_whitespace"):
+        if key in raw:
+            single_flight[key] = bool(raw[key])
+    if "ttl" in raw:
+        single_flight["ttl"] = _non_negative_number("single_flight.ttl", raw["ttl"])
+    return single_flight
+
+
+def _parse_fast_path(raw: dict[str, Any], merged: dict[str, Any]) -> dict[str, Any]:
+    fast_path = dict(merged)
+    if "enabled" in raw:
+        fast_path["enabled"] = bool(raw["enabled"])
+    if "checks" in raw:
+        checks = _string_list("fast_path.checks", raw["checks"] or [])
+        unknown = [check for check in checks if check not in FAST_PATH_CHECKS]
+        if unknown:
+            raise ConfigError(
+                f"Invalid fast_path.checks value: {', '.join(unknown)} "
+                f"(choose from {', '.join(FAST_PATH_CHECKS)})"
+            )
+        fast_path["checks"] = checks
+    return fast_path
+
+
+def _parse_hunk_cache(raw: dict[str, Any], merged: dict[str, Any]) -> dict[str, Any]:
+    hunk_cache = dict(merged)
+    if "enabled" in raw:
+        hunk_cache["enabled"] = bool(raw["enabled"])
+    if "ttl_days" in raw:
+        hunk_cache["ttl_days"] = _non_negative_number("hunk_cache.ttl_days", raw["ttl_days"])
+    return hunk_cache
+
+
+def _parse_code_context(raw: dict[str, Any], merged: dict[str, Any]) -> dict[str, Any]:
+    context = dict(merged)
+    if "enabled" in raw:
+        context["enabled"] = bool(raw["enabled"])
+    if "repo_path" in raw:
+        context["repo_path"] = str(raw["repo_path"]) if raw["repo_path"] else None
+    if "max_bytes" in raw:
+        max_bytes = int(_non_negative_number("code_context.max_bytes", raw["max_bytes"]))
+        if max_bytes > MAX_CONTEXT_BYTES:
+            raise ConfigError(
+                f"Invalid code_context.max_bytes value: {max_bytes} "
+                f"(at most {MAX_CONTEXT_BYTES}; the prompt is a single command-line argument)"
+            )
+        context["max_bytes"] = max_bytes
+    return context
+
+
+def _parse_symbol_index(raw: dict[str, Any], merged: dict[str, Any]) -> dict[str, Any]:
+    index = dict(merged)
+    if "enabled" in raw:
+        index["enabled"] = bool(raw["enabled"])
+    if "max_tokens" in raw:
+        max_tokens = int(_non_negative_number("symbol_index.max_tokens", raw["max_tokens"]))
+        if max_tokens > MAX_SYMBOL_TOKENS:
+            raise ConfigError(
+                f"Invalid symbol_index.max_tokens value: {max_tokens} "
+                f"(at most {MAX_SYMBOL_TOKENS}; the prompt is a single command-line argument)"
+            )
+        index["max_tokens"] = max_tokens
+    return index
+
+
+def _parse_conventions(raw: dict[str, Any], merged: dict[str, Any]) -> dict[str, Any]:
+    conventions = dict(merged)
+    if "enabled" in raw:
+        conventions["enabled"] = bool(raw["enabled"])
+    if "max_bytes" in raw:
+        max_bytes = int(_non_negative_number("conventions.max_bytes", raw["max_bytes"]))
+        if max_bytes > MAX_CONTEXT_BYTES:
+            raise ConfigError(
+                f"Invalid conventions.max_bytes value: {max_bytes} "
+                f"(at most {MAX_CONTEXT_BYTES}; the prompt is a single command-line argument)"
+            )
+        conventions["max_bytes"] = max_bytes
+    return conventions
+
+
+def _model_name(key: str, value: Any) -> str | None:
+    if value is None:
+        return None
+    model = str(value)
+    if not re.match(r'^[a-zA-Z0-9][a-zA-Z0-9._-]*$', model):
+        raise ConfigError(
+            f"Invalid {key}: '{model}' "
+            "(only alphanumeric, dots, hyphens, and underscores allowed)"
+        )
+    return model
+
+
+def _parse_budgets(raw: dict[str, Any], merged: dict[str, Any]) -> dict[str, Any]:
+    budgets = dict(merged)
+    for key in ("max_tokens_per_pr", "max_tokens_per_batch"):
+        if key in raw:
+            value = raw[key]
+            budgets[key] = _positive_int(f"budgets.{key}", value) if value is not None else None
+    if "max_cost_per_batch" in raw:
+        value = raw["max_cost_per_batch"]
+        budgets["max_cost_per_batch"] = (
+            _non_negative_number("budgets.max_cost_per_batch", value) if value is not None
+            else None
+        )
+    if "on_pr_exceeded" in raw:
+        if raw["on_pr_exceeded"] not in PR_BUDGET_ACTIONS:
+            raise ConfigError(
+                f"Invalid budgets.on_pr_exceeded value: {raw['on_pr_exceeded']!r} "
+                f"(choose from {', '.join(PR_BUDGET_ACTIONS)})"
+            )
+        budgets["on_pr_exceeded"] = raw["on_pr_exceeded"]
+    if "cheaper_model" in raw:
+        budgets["cheaper_model"] = _model_name("budgets.cheaper_model", raw["cheaper_model"])
+    if "downgrade_at" in raw:
+        fraction = _non_negative_number("budgets.downgrade_at", raw["downgrade_at"])
+        if fraction > 1:
+            raise ConfigError(
+                f"Invalid budgets.downgrade_at value: {raw['downgrade_at']} "
+                "(must be between 0 and 1)"
+            )
+        budgets["downgrade_at"] = fraction
+    return budgets
+
+
+def _parse_scheduling(raw: dict[str, Any], merged: dict[str, Any]) -> dict[str, Any]:
+    scheduling = dict(merged)
+    if "order" in raw:
+        if raw["order"] not in SCHEDULING_ORDERS:
+            raise ConfigError(
+                f"Invalid scheduling.order value: {raw['order']!r} "
+                f"(choose from {', '.join(SCHEDULING_ORDERS)})"
+            )
+        scheduling["order"] = raw["order"]
+    if "aging_seconds" in raw:
+        scheduling["aging_seconds"] = _non_negative_number(
+            "scheduling.aging_seconds", raw["aging_seconds"],
+        )
+    if "label_priority" in raw:
+        labels = raw["label_priority"] or {}
+        if not isinstance(labels, dict):
+            raise ConfigError(
+                "Invalid scheduling.label_priority value: must be a mapping of label to priority"
+            )
+        priorities = {}
+        for label, value in labels.items():
+            if isinstance(value, bool) or not isinstance(value, int):
+                raise ConfigError(
+                    f"Invalid scheduling.label_priority.{label} value: {value!r} "
+                    "(must be an integer)"
+                )
+            priorities[str(label)] = value
+        scheduling["label_priority"] = {**scheduling["label_priority"], **priorities}
+    return scheduling
+
+
+def _parse_watch(raw: dict[str, Any], merged: dict[str, Any]) -> dict[str, Any]:
+    watch = dict(merged)
+    for key in ("interval", "max_interval"):
+        if key in raw:
+            watch[key] = _positive_int(f"watch.{key}", raw[key])
+    if watch["max_interval"] < watch["interval"]:
+        raise ConfigError(
+            f"Invalid watch.max_interval value: {watch['max_interval']} "
+            f"(must be at least watch.interval, {watch['interval']})"
+        )
+    return watch
 
-    # Merge all config files
+
+def _parse_auto_profiles(raw: dict[str, Any]) -> dict[str, Any]:
+    """Validate the rules of profile: auto. Profile names are checked on use."""
+    rules = raw.get("rules") or []
+    if not isinstance(rules, list):
+        raise ConfigError("Invalid auto_profiles.rules value: must be a list")
+    parsed: list[dict[str, Any]] = []
+    for i, rule in enumerate(rules):
+        key = f"auto_profiles.rules[{i}]"
+        if not isinstance(rule, dict) or "profiles" not in rule:
+            raise ConfigError(f"Invalid {key}: must be a mapping with 'profiles'")
+        extensions = _string_list(f"{key}.extensions", rule.get("extensions") or [])
+        content = rule.get("content")
+        if content is not None:
+            try:
+                re.compile(str(content))
+            except re.error as e:
+                raise ConfigError(f"Invalid {key}.content regex: {e}")
+            content = str(content)
+        parsed.append({
+            "extensions": [f".{e.lower().lstrip('.')}" for e in extensions],
+            "content": content,
+            "profiles": _string_list(f"{key}.profiles", rule["profiles"]),
+        })
+    result: dict[str, Any] = {"rules": parsed}
+    if "fallback" in raw:
+        result["fallback"] = _string_list("auto_profiles.fallback", raw["fallback"])
+    return result
+
+
+def _merge_config_files(config_files: list[Path]) -> dict[str, Any]:
+    merged = _default_config()
     all_raw_profiles: dict[str, Any] = {}
 
     for config_file in config_files:
@@ -163,15 +481,7 @@ def load_config(explicit_path: str | None = None) -> dict[str, Any]:
         if "default_profile" in data:
             merged["default_profile"] = data["default_profile"]
         if "claude_model" in data:
-            model = data["claude_model"]
-            if model is not None:
-                model = str(model)
-                if not re.match(r'^[a-zA-Z0-9][a-zA-Z0-9._-]*$', model):
-                    raise ConfigError(
-                        f"Invalid claude_model: '{model}' "
-                        "(only alphanumeric, dots, hyphens, and underscores allowed)"
-                    )
-            merged["claude_model"] = model
+            merged["claude_model"] = _model_name("claude_model", data["claude_model"])
         if "review_timeout" in data:
             try:
                 timeout = int(data["review_timeout"])
@@ -186,8 +496,51 @@ def load_config(explicit_path: str | None = None) -> dict[str, Any]:
                     "(must be a positive integer)"
                 )
             merged["review_timeout"] = timeout
+        if "max_concurrent_reviews" in data:
+            merged["max_concurrent_reviews"] = _positive_int(
+                "max_concurrent_reviews", data["max_concurrent_reviews"],
+            )
+        if "max_shards" in data:
+            merged["max_shards"] = _positive_int("max_shards", data["max_shards"])
+        if "retry" in data and isinstance(data["retry"], dict):
+            merged["retry"] = _parse_retry(data["retry"], merged["retry"])
+        if "latency_model" in data and isinstance(data["latency_model"], dict):
+            merged["latency_model"] = _parse_latency_model(
+                data["latency_model"], merged["latency_model"],
+            )
         if "comment" in data and isinstance(data["comment"], dict):
             merged["comment"].update(data["comment"])
+        if "single_flight" in data and isinstance(data["single_flight"], dict):
+            merged["single_flight"] = _parse_single_flight(
+                data["single_flight"], merged["single_flight"],
+            )
+        if "fast_path" in data and isinstance(data["fast_path"], dict):
+            merged["fast_path"] = _parse_fast_path(data["fast_path"], merged["fast_path"])
+        if "hunk_cache" in data and isinstance(data["hunk_cache"], dict):
+            merged["hunk_cache"] = _parse_hunk_cache(data["hunk_cache"], merged["hunk_cache"])
+        if "stacked_prs" in data and isinstance(data["stacked_prs"], dict):
+            if "enabled" in data["stacked_prs"]:
+                merged["stacked_prs"] = {"enabled": bool(data["stacked_prs"]["enabled"])}
+        if "code_context" in data and isinstance(data["code_context"], dict):
+            merged["code_context"] = _parse_code_context(
+                data["code_context"], merged["code_context"],
+            )
+        if "symbol_index" in data and isinstance(data["symbol_index"], dict):
+            merged["symbol_index"] = _parse_symbol_index(
+                data["symbol_index"], merged["symbol_index"],
+            )
+        if "conventions" in data and isinstance(data["conventions"], dict):
+            merged["conventions"] = _parse_conventions(
+                data["conventions"], merged["conventions"],
+            )
+        if "budgets" in data and isinstance(data["budgets"], dict):
+            merged["budgets"] = _parse_budgets(data["budgets"], merged["budgets"])
+        if "scheduling" in data and isinstance(data["scheduling"], dict):
+            merged["scheduling"] = _parse_scheduling(data["scheduling"], merged["scheduling"])
+        if "watch" in data and isinstance(data["watch"], dict):
+            merged["watch"] = _parse_watch(data["watch"], merged["watch"])
+        if "auto_profiles" in data and isinstance(data["auto_profiles"], dict):
+            merged["auto_profiles"] = _parse_auto_profiles(data["auto_profiles"])
         if "profiles" in data and isinstance(data["profiles"], dict):
             all_raw_profiles.update(data["profiles"])
 
@@ -196,3 +549,161 @@ def load_config(explicit_path: str | None = None) -> dict[str, Any]:
         merged["custom_profiles"] = _build_custom_profiles(all_raw_profiles)
 
     return merged
+
+
+def load_config(explicit_path: str | None = None) -> dict[str, Any]:
+    """Load and merge configuration from all sources.
+
+    Returns a dict with keys:
+        - default_profile: str
+        - claude_model: str | None
+        - review_timeout: int
+        - max_concurrent_reviews: int (claude processes per host)
+        - max_shards: int (claude calls a large diff may be split into)
+        - retry: dict (attempts, backoff, max_backoff)
+        - latency_model: dict (enabled, percentile, headroom, min_samples, target_seconds)
+        - comment: dict (enabled, mode)
+        - single_flight: dict (enabled, ttl, ignore_whitespace)
+        - fast_path: dict (enabled, checks)
+        - hunk_cache: dict (enabled, ttl_days)
+        - stacked_prs: dict (enabled)
+        - code_context: dict (enabled, repo_path, max_bytes)
+        - symbol_index: dict (enabled, max_tokens)
+        - conventions: dict (enabled, max_bytes)
+        - budgets: dict (max_tokens_per_pr, on_pr_exceeded, max_tokens_per_batch,
+          max_cost_per_batch, cheaper_model, downgrade_at)
+        - scheduling: dict (order, aging_seconds, label_priority)
+        - watch: dict (interval, max_interval)
+        - auto_profiles: dict (rules, fallback) | None
+        - custom_profiles: dict[str, Profile] | None
+    """
+    return _merge_config_files(_resolve_config_files(explicit_path))
+
+
+def _hash_file(path: Path) -> str | None:
+    """SHA-256 of a config file, or None when it does not exist."""
+    if not path.exists():
+        return None
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def _snapshot_path(path: Path, root: Path) -> str:
+    """Record a source path so the snapshot still matches in another checkout.
+
+    Paths inside the repo are stored relative to its root, paths under the
+    home directory as ~/..., anything else as is.
+    """
+    resolved = path.resolve()
+    for base, prefix in ((root.resolve(), ""), (Path.home().resolve(), "~/")):
+        try:
+            return prefix + resolved.relative_to(base).as_posix()
+        except ValueError:
+            continue
+    return str(resolved)
+
+
+def _resolve_snapshot_path(recorded: str, root: Path) -> Path:
+    if recorded.startswith("~/"):
+        return Path.home() / recorded[2:]
+    return root / recorded  # an absolute recorded path stays absolute
+
+
+def compile_config(explicit_path: str | None = None) -> dict[str, Any]:
+    """Resolve the configuration once into a JSON-serializable snapshot.
+
+    The snapshot records the SHA-256 of every source file so that
+    load_config_snapshot() can detect when it has gone stale. Without an
+    explicit path, discovery candidates that do not exist are recorded too
+    (sha256 null), so a config file added later also makes it stale.
+    """
+    config_files = _resolve_config_files(explicit_path)
+    config = _merge_config_files(config_files)
+    candidates = config_files if explicit_path else _config_candidates()
+    root = _config_root()
+
+    serialized = dict(config)
+    if config["custom_profiles"]:
+        serialized["custom_profiles"] = {
+            name: asdict(profile)
+            for name, profile in config["custom_profiles"].items()
+        }
+
+    return {
+        "snapshot_version": SNAPSHOT_VERSION,
+        "parc_ferme_version": __version__,
+        "sources": [
+            {"path": _snapshot_path(path, root), "sha256": _hash_file(path)}
+            for path in candidates
+        ],
+        "config": serialized,
+    }
+
+
+def write_config_snapshot(
+    output_path: str, explicit_path: str | None = None,
+) -> dict[str, Any]:
+    snapshot = compile_config(explicit_path)
+    try:
+        with open(output_path, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f, ensure_ascii=False, indent=2)
+            f.write("\n")
+    except OSError as e:
+        raise ConfigError(f"Could not write config snapshot {output_path}: {e}")
+    return snapshot
+
+
+def _deserialize_profile(data: dict[str, Any]) -> Profile:
+    return Profile(**{
+        **data,
+        "severity_levels": [
+            SeverityLevel(**level) for level in data.get("severity_levels", [])
+        ],
+    })
+
+
+def load_config_snapshot(path: str) -> dict[str, Any]:
+    """Load a snapshot written by write_config_snapshot().
+
+    No discovery or YAML parsing happens here. Each recorded source file is
+    re-hashed (relative paths against the current repo root) and a
+    ConfigError is raised if any of them changed, disappeared or appeared
+    since the snapshot was compiled.
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            snapshot = json.load(f)
+    except FileNotFoundError:
+        raise ConfigError(f"Config snapshot not found: {path}")
+    except (OSError, json.JSONDecodeError) as e:
+        raise ConfigError(f"Invalid config snapshot {path}: {e}")
+
+    if not isinstance(snapshot, dict) or "config" not in snapshot:
+        raise ConfigError(f"Invalid config snapshot {path}: missing 'config'")
+    if snapshot.get("snapshot_version") != SNAPSHOT_VERSION:
+        raise ConfigError(
+            f"Config snapshot {path} has unsupported format version "
+            f"{snapshot.get('snapshot_version')!r}. Re-run 'parc-ferme config compile'."
+        )
+    if snapshot.get("parc_ferme_version") != __version__:
+        raise ConfigError(
+            f"Config snapshot {path} was compiled by parc-ferme "
+            f"{snapshot.get('parc_ferme_version')}, running {__version__}. "
+            "Re-run 'parc-ferme config compile'."
+        )
+
+    root = _config_root()
+    for source in snapshot.get("sources", []):
+        source_path = _resolve_snapshot_path(source["path"], root)
+        if _hash_file(source_path) != source["sha256"]:
+            raise ConfigError(
+                f"Config snapshot {path} is stale: {source_path} has changed. "
+                "Re-run 'parc-ferme config compile'."
+            )
+
+    config = {**_default_config(), **snapshot["config"]}
+    if config["custom_profiles"]:
+        config["custom_profiles"] = {
+            name: _deserialize_profile(data)
+            for name, data in config["custom_profiles"].items()
+        }
+    return config
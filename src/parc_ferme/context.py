@@ -0,0 +1,306 @@
+from __future__ import annotations
+
+import re
+import subprocess
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+
+from .diff import FileDiff, Hunk
+
+DEFAULT_CONTEXT_BYTES = 16_000
+# The prompt is passed to claude as one argument, which Linux caps at 128 KiB:
+# conventions, code context and symbols together stay within this
+MAX_CONTEXT_BYTES = 100_000
+_GIT_TIMEOUT = 30  # seconds
+
+_CONTROL_WORDS = {
+    "if", "else", "elif", "for", "foreach", "while", "do", "switch", "case", "catch",
+    "except", "try", "return", "with", "new", "throw", "raise", "assert", "await",
+    "yield", "sizeof", "typeof", "defer", "go", "delete",
+}
+_COMMENT_PREFIXES = ("#", "//", "/*", "*", "--", '"', "'")
+_MODIFIERS = (
+    r"(?:(?:export|default|public|private|protected|internal|static|async|abstract|final|"
+    r"sealed|open|override|data|pub(?:\([\w:]+\))?|unsafe|extern|partial|declare|inline|"
+    r"virtual)\s+)*"
+)
+# def foo(, class Foo, func (r *T) Foo(, fn foo(, interface Foo ...
+_KEYWORD_DEF_RE = re.compile(
+    rf"^\s*{_MODIFIERS}(?:def|class|function|func|fn|interface|struct|enum|impl|trait|"
+    r"module|namespace|object)\s"
+)
+# int foo(int a) {, public List<T> foo(, async foo(x) {
+_CALL_DEF_RE = re.compile(r"^\s*(?:[\w$<>\[\],.*&:?]+\s+)+\**[\w$]+\s*\([^;]*(?:\{|\)|,)\s*$")
+_METHOD_DEF_RE = re.compile(r"^\s*[\w$]+\s*\([^;]*\)\s*(?::\s*[^{;=]+)?\{\s*$")
+# const foo = (a) => {, foo: async x =>
+_ARROW_DEF_RE = re.compile(
+    r"^\s*(?:[\w$]+\s+)*[\w$]+\s*[=:]\s*(?:async\s*)?(?:\([^)]*\)|[\w$]+)\s*=>"
+)
+_CLOSERS = ("}", ")", "]", "end")
+
+CONTEXT_HEADER = (
+    "CODE CONTEXT (the definitions enclosing the changed lines, for reference only; "
+    "review the diff, not this):"
+)
+
+
+class CatFile:
+    """One long-lived `git cat-file --batch` process reading objects of a clone.
+
+    Every read goes through the same process, so pulling blobs for a whole
+    PR costs one process instead of one per file. Thread-safe.
+    """
+
+    def __init__(self, repo_dir: Path) -> None:
+        self.repo_dir = repo_dir
+        self._proc: subprocess.Popen[bytes] | None = None
+        self._lock = threading.Lock()
+        self._failed = False
+
+    def _process(self) -> subprocess.Popen[bytes] | None:
+        if self._proc is not None and self._proc.poll() is None:
+            return self._proc
+        if self._failed:
+            return None
+        try:
+            self._proc = subprocess.Popen(
+                ["git", "-C", str(self.repo_dir), "cat-file", "--batch"],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+            )
+        except OSError:
+            self._failed = True  # no git: do not try again for every file
+            return None
+        return self._proc
+
+    def read(self, rev: str) -> bytes | None:
+        """Contents of rev (e.g. "<sha>:path/to/file"), or None if it does not exist."""
+        found = self._object(rev)
+        return found[1] if found else None
+
+    def resolve(self, rev: str) -> str | None:
+        """The object id rev names (e.g. the commit of "HEAD"), or None."""
+        found = self._object(rev)
+        return found[0] if found else None
+
+    def _object(self, rev: str) -> tuple[str, bytes] | None:
+        if "\n" in rev:
+            return None
+        with self._lock:
+            proc = self._process()
+            if proc is None:
+                return None
+            assert proc.stdin is not None and proc.stdout is not None
+            try:
+                proc.stdin.write(rev.encode() + b"\n")
+                proc.stdin.flush()
+                header = proc.stdout.readline().split()
+                if len(header) != 3 or not header[2].isdigit():
+                    return None  # "<rev> missing" or "<rev> ambiguous"
+                size = int(header[2])
+                data = proc.stdout.read(size + 1)  # the object plus a newline
+            except OSError:
+                self._stop()
+                return None
+            return header[0].decode(), data[:size]
+
+    def _stop(self) -> None:
+        proc, self._proc = self._proc, None
+        if proc is None:
+            return
+        if proc.stdin is not None:
+            try:
+                proc.stdin.close()
+            except OSError:
+                pass
+        try:
+            proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+        if proc.stdout is not None:
+            proc.stdout.close()
+
+    def close(self) -> None:
+        with self._lock:
+            self._stop()
+
+
+def find_work_tree(start: Path) -> Path | None:
+    """The git work tree containing start, if any."""
+    start = start.resolve()
+    for directory in (start, *start.parents):
+        if (directory / ".git").exists():
+            return directory
+    return None
+
+
+def merge_base(repo_dir: Path, a: str, b: str) -> str | None:
+    """git merge-base of a and b, or None if either is not in the clone."""
+    try:
+        result = subprocess.run(
+            ["git", "-C", str(repo_dir), "merge-base", a, b],
+            capture_output=True, text=True, timeout=_GIT_TIMEOUT,
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    if result.returncode != 0:
+        return None
+    return result.stdout.strip() or None
+
+
+def _indent(line: str) -> int:
+    return len(line) - len(line.lstrip())
+
+
+def is_definition(line: str) -> bool:
+    """Whether line looks like the start of a function, method or class."""
+    stripped = line.strip()
+    words = line.split("(", 1)[0].split()
+    if not words or stripped.startswith(_COMMENT_PREFIXES):
+        return False
+    if words[0].lstrip("}") in _CONTROL_WORDS or (len(words) > 1 and words[1] in _CONTROL_WORDS):
+        return False
+    return any(
+        regex.match(line)
+        for regex in (_KEYWORD_DEF_RE, _CALL_DEF_RE, _METHOD_DEF_RE, _ARROW_DEF_RE)
+    )
+
+
+def enclosing_block(lines: list[str], index: int) -> tuple[int, int] | None:
+    """[start, end) of the innermost definition around lines[index], or None.
+
+    Works by indentation, so it needs no parser per language: walk up to
+    less-indented lines until one looks like a definition, then take every
+    line up to the next one indented as little as it (a closing brace or
+    `end` on that line is included). Decorators above it are included too.
+    """
+    if not 0 <= index < len(lines):
+        return None
+    header = index if is_definition(lines[index]) else None
+    level = _indent(lines[index]) if lines[index].strip() else len(lines[index]) + 1
+    for i in range(index - 1, -1, -1):
+        if header is not None or level == 0:
+            break
+        line = lines[i]
+        stripped = line.strip()
+        if not stripped or _indent(line) >= level:
+            continue
+        if stripped == "{" or stripped.startswith(_CLOSERS):
+            continue  # the end of a signature or of a sibling block
+        if is_definition(line):
+            header = i
+        level = _indent(line)
+    if header is None:
+        return None
+    start = header
+    while start > 0 and lines[start - 1].lstrip().startswith("@") \
+            and _indent(lines[start - 1]) == _indent(lines[header]):
+        start -= 1
+    base = _indent(lines[header])
+    end = header + 1
+    while end < len(lines):
+        line = lines[end]
+        stripped = line.strip()
+        if stripped and _indent(line) <= base:
+            opens = stripped.endswith((":", "{"))
+            if stripped == "{" or (stripped.startswith(_CLOSERS) and opens):
+                end += 1  # the rest of the signature, e.g. "{" or "):" on their own line
+                continue
+            if stripped.startswith(_CLOSERS):
+                end += 1
+            break
+        end += 1
+    while end > header + 1 and not lines[end - 1].strip():
+        end -= 1
+    return start, end
+
+
+def _first_changed(hunk: Hunk, marker: str) -> int | None:
+    """Line number, on the side marker ("+" or "-") belongs to, of the first change."""
+    old, new = hunk.old_start, hunk.new_start
+    for line in hunk.lines:
+        if line.startswith(("+", "-")):
+            return new if marker == "+" else old
+        if line.startswith("\\"):
+            continue
+        old += 1
+        new += 1
+    return None
+
+
+@dataclass
+class _Block:
+    side: str  # "head" or "base"
+    path: str
+    start: int  # 1-based, inclusive
+    lines: list[str]
+
+    def text(self) -> str:
+        end = self.start + len(self.lines) - 1
+        width = len(str(end))
+        body = "\n".join(f"{n:>{width}} | {line}" for n, line in enumerate(self.lines, self.start))
+        return f"{self.path}:{self.start}-{end} ({self.side})\n{body}\n"
+
+
+def _blocks(
+    files: list[FileDiff], cat: CatFile, rev: str, side: str,
+) -> list[_Block]:
+    marker = "+" if side == "head" else "-"
+    blocks: list[_Block] = []
+    seen: set[tuple[str, int]] = set()
+    for f in files:
+        path = f.path if side == "head" else (f.old_path or f.path)
+        anchors = [
+            n for n in (_first_changed(h, marker) for h in f.hunks
+                        if marker == "+" or h.deletions)
+            if n is not None
+        ]
+        if not anchors:
+            continue
+        blob = cat.read(f"{rev}:{path}")
+        if blob is None or b"\0" in blob[:8000]:
+            continue  # not in the clone, or binary
+        lines = blob.decode("utf-8", errors="replace").splitlines()
+        for anchor in anchors:
+            span_ = enclosing_block(lines, anchor - 1)
+            if span_ is None or (path, span_[0]) in seen:
+                continue
+            seen.add((path, span_[0]))
+            blocks.append(_Block(side, path, span_[0] + 1, lines[span_[0]:span_[1]]))
+    return blocks
+
+
+def build_context(
+    files: list[FileDiff],
+    cat: CatFile,
+    head_rev: str,
+    base_rev: str | None = None,
+    max_bytes: int = DEFAULT_CONTEXT_BYTES,
+) -> str:
+    """The enclosing definitions of each hunk, within max_bytes.
+
+    Head blocks come first; base blocks (the code as it was before the PR)
+    follow for hunks that remove lines, when they differ from the head.
+    Blocks that do not fit the remaining budget are left out whole.
+    Returns "" when nothing was found.
+    """
+    if max_bytes <= 0:
+        return ""
+    head = _blocks(files, cat, head_rev, "head")
+    base = _blocks(files, cat, base_rev, "base") if base_rev else []
+    head_text = {(b.path, "\n".join(b.lines)) for b in head}
+    parts: list[str] = []
+    used = len(CONTEXT_HEADER.encode()) + 2
+    for block in [*head, *(b for b in base if (b.path, "\n".join(b.lines)) not in head_text)]:
+        text = block.text()
+        size = len(text.encode()) + 1
+        if used + size > max_bytes:
+            continue
+        parts.append(text)
+        used += size
+    if not parts:
+        return ""
+    return CONTEXT_HEADER + "\n\n" + "\n".join(parts)
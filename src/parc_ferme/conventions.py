@@ -0,0 +1,331 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+import tempfile
+from pathlib import Path
+from typing import Any
+
+import yaml
+
+from .config import get_cache_dir
+from .context import CatFile
+
+CONVENTIONS_DIRNAME = "conventions"
+DEFAULT_DIGEST_BYTES = 3_000
+DIGEST_VERSION = 1  # bump when extraction changes, so old digests are not reused
+_MAX_ITEMS_PER_SECTION = 12
+
+CONVENTIONS_HEADER = (
+    "REPOSITORY CONVENTIONS (from the repo's own lint configs, CODEOWNERS and docs on the "
+    "base branch; flag changes that break them):"
+)
+
+# Looked up at the root of the base commit, in this order (it is also the
+# order of the digest, so the most specific settings survive the budget).
+SOURCE_FILES = (
+    ".editorconfig",
+    "pyproject.toml",
+    "ruff.toml",
+    ".ruff.toml",
+    "setup.cfg",
+    "tox.ini",
+    ".flake8",
+    ".prettierrc",
+    ".prettierrc.json",
+    ".prettierrc.yml",
+    ".prettierrc.yaml",
+    ".eslintrc",
+    ".eslintrc.json",
+    ".eslintrc.yml",
+    ".eslintrc.yaml",
+    "tsconfig.json",
+    ".golangci.yml",
+    ".golangci.yaml",
+    "CODEOWNERS",
+    ".github/CODEOWNERS",
+    "docs/CODEOWNERS",
+    "CONTRIBUTING.md",
+    ".github/CONTRIBUTING.md",
+    "docs/CONTRIBUTING.md",
+    "ARCHITECTURE.md",
+    "docs/ARCHITECTURE.md",
+    "docs/architecture.md",
+    "STYLEGUIDE.md",
+    "docs/STYLEGUIDE.md",
+)
+
+# Sections of INI/TOML lint configs that hold conventions
+_LINT_SECTIONS = re.compile(
+    r"^(?:tool\.)?(?:ruff|black|isort|mypy|flake8|pycodestyle|pylint|lint|format)(?:\.|$)"
+    r"|^$"
+)
+# Keys naming files rather than conventions
+_SKIPPED_KEYS = re.compile(r"exclude|include|cache|files|paths|^src$|per-file", re.IGNORECASE)
+_EDITORCONFIG_KEYS = {
+    "indent_style", "indent_size", "tab_width", "max_line_length", "end_of_line",
+    "charset", "trim_trailing_whitespace", "insert_final_newline",
+}
+
+
+def _ini_sections(text: str) -> dict[str, dict[str, str]]:
+    """Scalar keys of an INI/TOML/editorconfig file by section ("" before the first).
+
+    Line-based, so one reader covers all three formats (and Python 3.10,
+    which has no tomllib); values continued over several lines are skipped.
+    """
+    sections: dict[str, dict[str, str]] = {"": {}}
+    current = ""
+    for raw in text.splitlines():
+        line = raw.strip()
+        if not line or line.startswith(("#", ";")):
+            continue
+        if line.startswith("[") and line.endswith("]"):
+            current = line.strip("[]").strip().strip('"')
+            sections.setdefault(current, {})
+            continue
+        key, sep, value = line.partition("=") if "=" in line else line.partition(":")
+        value = value.split(" #", 1)[0].strip()
+        if not sep or not value or value in ("[", "{", '"""') or raw[:1].isspace():
+            continue
+        sections[current][key.strip().strip('"')] = value.strip('"').strip("'")
+    return sections
+
+
+def _editorconfig(text: str) -> list[str]:
+    items = []
+    for glob, keys in _ini_sections(text).items():
+        settings = [f"{k}={v}" for k, v in keys.items() if k in _EDITORCONFIG_KEYS]
+        if glob and settings:
+            items.append(f"{glob}: {', '.join(settings)}")
+    return items
+
+
+def _lint_config(text: str, toml: bool) -> list[str]:
+    items = []
+    for name, keys in _ini_sections(text).items():
+        if toml and not name.startswith("tool."):
+            continue
+        section = name.removeprefix("tool.")
+        if not _LINT_SECTIONS.match(section):
+            continue
+        settings = [f"{k}={v}" for k, v in keys.items() if not _SKIPPED_KEYS.search(k)]
+        if settings:
+            shown = ", ".join(settings[:_MAX_ITEMS_PER_SECTION])
+            items.append(f"{section}: {shown}" if section else shown)
+    return items
+
+
+def _structured(text: str) -> Any:
+    """A JSON or YAML file (YAML reads both), or None when it does not parse."""
+    try:
+        return yaml.safe_load(text)
+    except yaml.YAMLError:
+        return None
+
+
+def _scalars(data: dict[str, Any]) -> str:
+    return ", ".join(
+        f"{k}={json.dumps(v)}" for k, v in list(data.items())[:_MAX_ITEMS_PER_SECTION]
+        if isinstance(v, (str, int, float, bool))
+    )
+
+
+def _prettier(text: str) -> list[str]:
+    data = _structured(text)
+    if not isinstance(data, dict):
+        return []
+    settings = _scalars(data)
+    return [settings] if settings else []
+
+
+def _eslint(text: str) -> list[str]:
+    data = _structured(text)
+    if not isinstance(data, dict):
+        return []
+    items = []
+    extends = data.get("extends")
+    if extends:
+        items.append("extends: " + ", ".join([extends] if isinstance(extends, str) else extends))
+    rules = data.get("rules")
+    if isinstance(rules, dict):
+        enabled = []
+        for rule, setting in rules.items():
+            level = setting[0] if isinstance(setting, list) and setting else setting
+            if level not in ("off", 0):
+                enabled.append(f"{rule} ({level})")
+        if enabled:
+            items.append("rules: " + ", ".join(enabled[:_MAX_ITEMS_PER_SECTION * 2]))
+    return items
+
+
+def _tsconfig(text: str) -> list[str]:
+    data = _structured(text)
+    options = data.get("compilerOptions") if isinstance(data, dict) else None
+    if not isinstance(options, dict):
+        return []
+    checks = [
+        k for k, v in options.items()
+        if v is True and (k.startswith(("strict", "no")) or k == "exactOptionalPropertyTypes")
+    ]
+    return [f"compilerOptions: {', '.join(checks)}"] if checks else []
+
+
+def _golangci(text: str) -> list[str]:
+    data = _structured(text)
+    linters = data.get("linters") if isinstance(data, dict) else None
+    if not isinstance(linters, dict):
+        return []
+    enabled = linters.get("enable")
+    if isinstance(enabled, list) and enabled:
+        return ["linters: " + ", ".join(str(name) for name in enabled)]
+    return []
+
+
+def _codeowners(text: str) -> list[str]:
+    return [
+        " ".join(line.split())
+        for line in text.splitlines()
+        if line.strip() and not line.lstrip().startswith("#")
+    ]
+
+
+def _markdown(text: str) -> list[str]:
+    """Headings and list items: the rules a contributing or architecture doc states."""
+    items = []
+    fenced = False
+    for raw in text.splitlines():
+        line = raw.strip()
+        if line.startswith("```"):
+            fenced = not fenced
+            continue
+        if fenced or not line:
+            continue
+        if line.startswith("#") or re.match(r"^(?:[-*+]|\d+\.)\s", line):
+            items.append(line)
+    return items
+
+
+def extract_conventions(path: str, text: str) -> list[str]:
+    """The conventions one source file states, as short lines."""
+    name = path.rsplit("/", 1)[-1]
+    if name == ".editorconfig":
+        return _editorconfig(text)
+    if name in ("pyproject.toml", "ruff.toml", ".ruff.toml", "setup.cfg", "tox.ini", ".flake8"):
+        return _lint_config(text, toml=name == "pyproject.toml")
+    if name.startswith(".prettierrc"):
+        return _prettier(text)
+    if name.startswith(".eslintrc"):
+        return _eslint(text)
+    if name == "tsconfig.json":
+        return _tsconfig(text)
+    if name.startswith(".golangci"):
+        return _golangci(text)
+    if name == "CODEOWNERS":
+        return _codeowners(text)
+    if name.endswith(".md"):
+        return _markdown(text)
+    return []
+
+
+def build_digest(sources: dict[str, str], max_bytes: int = DEFAULT_DIGEST_BYTES) -> str:
+    """A compact digest of sources (path -> text), within max_bytes.
+
+    Sources are taken in the order given; the first line of a source that
+    does not fit the remaining budget ends that source. Returns "" when no
+    source states anything.
+    """
+    lines = [CONVENTIONS_HEADER]
+    used = len(CONVENTIONS_HEADER.encode()) + 1
+    for path, text in sources.items():
+        title = f"{path}:"
+        for item in extract_conventions(path, text):
+            block = f"{title}\n- {item}" if title else f"- {item}"
+            size = len(block.encode()) + 1
+            if used + size > max_bytes:
+                break
+            lines.append(block)
+            used += size
+            title = ""
+    return "\n".join(lines) if len(lines) > 1 else ""
+
+
+class ConventionCache:
+    """Digests stored as one text file per key under the cache dir.
+
+    The key is the set of source blob ids (plus the budget), so a digest is
+    reused for every base commit until one of its source files changes.
+    """
+
+    def __init__(self, directory: Path | None = None) -> None:
+        self.directory = directory or get_cache_dir() / CONVENTIONS_DIRNAME
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.txt"
+
+    def get(self, key: str) -> str | None:
+        try:
+            return self._path(key).read_text(encoding="utf-8")
+        except OSError:
+            return None
+
+    def put(self, key: str, digest: str) -> None:
+        """Save a digest. Never raises: a cache that cannot be written is skipped."""
+        path = self._path(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{key[:8]}-")
+        except OSError:
+            return
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(digest)
+            os.replace(tmp, path)
+        except OSError:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+
+
+def source_blobs(cat: CatFile, rev: str) -> dict[str, str]:
+    """Blob id of each source file present at rev."""
+    blobs = {}
+    for path in SOURCE_FILES:
+        blob = cat.resolve(f"{rev}:{path}")
+        if blob is not None:
+            blobs[path] = blob
+    return blobs
+
+
+def digest_key(blobs: dict[str, str], max_bytes: int) -> str:
+    return hashlib.sha256(
+        json.dumps([DIGEST_VERSION, max_bytes, sorted(blobs.items())]).encode(),
+    ).hexdigest()
+
+
+def convention_digest(
+    cat: CatFile,
+    rev: str,
+    cache: ConventionCache,
+    max_bytes: int = DEFAULT_DIGEST_BYTES,
+) -> tuple[str, bool]:
+    """The digest of rev's source files, from cache when they have not changed.
+
+    Returns the digest ("" when rev has none) and whether it was built now.
+    """
+    blobs = source_blobs(cat, rev)
+    if not blobs:
+        return "", False
+    key = digest_key(blobs, max_bytes)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached, False
+    sources = {}
+    for path, blob in blobs.items():
+        data = cat.read(blob)
+        if data is not None and b"\0" not in data[:8000]:
+            sources[path] = data.decode("utf-8", errors="replace")
+    digest = build_digest(sources, max_bytes)
+    cache.put(key, digest)
+    return digest, True
@@ -0,0 +1,383 @@
+from __future__ import annotations
+
+import hashlib
+import re
+from dataclasses import dataclass, field
+
+# Rough characters-per-token ratio for code and diffs. Cheap to compute and
+# close enough to size budgets without a real tokenizer.
+CHARS_PER_TOKEN = 4
+
+_HUNK_HEADER_RE = re.compile(r"@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+_DIFF_GIT_RE = re.compile(r"^diff --git a/(.*) b/(.*)$")
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the token count of text without a tokenizer."""
+    return tokens_for_chars(len(text))
+
+
+def tokens_for_chars(chars: int) -> int:
+    return (chars + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+@dataclass
+class Hunk:
+    header: str
+    body: str
+    old_start: int
+    old_count: int
+    new_start: int
+    new_count: int
+
+    @property
+    def lines(self) -> list[str]:
+        return self.body.split("\n") if self.body else []
+
+    @property
+    def additions(self) -> int:
+        return self.body.count("\n+") + self.body.startswith("+")
+
+    @property
+    def deletions(self) -> int:
+        return self.body.count("\n-") + self.body.startswith("-")
+
+    @property
+    def size(self) -> int:
+        """Length of text() in characters, without building it."""
+        return len(self.header) + (len(self.body) + 1 if self.body else 0)
+
+    def text(self) -> str:
+        return f"{self.header}\n{self.body}" if self.body else self.header
+
+
+@dataclass
+class FileDiff:
+    path: str
+    header: list[str]
+    hunks: list[Hunk] = field(default_factory=list)
+    old_path: str = ""
+
+    @property
+    def additions(self) -> int:
+        return sum(h.additions for h in self.hunks)
+
+    @property
+    def deletions(self) -> int:
+        return sum(h.deletions for h in self.hunks)
+
+    def text(self, hunks: list[Hunk] | None = None) -> str:
+        hunks = self.hunks if hunks is None else hunks
+        return "\n".join([*self.header, *(h.text() for h in hunks)])
+
+
+def _line_starts(text: str, prefix: str, start: int = 0, end: int | None = None) -> list[int]:
+    """Offsets of every line in text[start:end] that starts with prefix.
+
+    str.find() runs in C and is much faster than a MULTILINE regex here.
+    """
+    end = len(text) if end is None else end
+    positions = [start] if text.startswith(prefix, start, end) else []
+    needle = "\n" + prefix
+    i = text.find(needle, start, end)
+    while i >= 0:
+        positions.append(i + 1)
+        i = text.find(needle, i + 1, end)
+    return positions
+
+
+def _parse_hunk(diff: str, start: int, end: int) -> Hunk | None:
+    newline = diff.find("\n", start, end)
+    header_end = end if newline < 0 else newline
+    m = _HUNK_HEADER_RE.match(diff, start, header_end)
+    if not m:
+        return None
+    return Hunk(
+        header=diff[start:header_end],
+        body="" if newline < 0 else diff[newline + 1:end],
+        old_start=int(m.group(1)),
+        old_count=int(m.group(2)) if m.group(2) is not None else 1,
+        new_start=int(m.group(3)),
+        new_count=int(m.group(4)) if m.group(4) is not None else 1,
+    )
+
+
+def _parse_file(diff: str, start: int, end: int) -> FileDiff:
+    hunk_starts = _line_starts(diff, "@@ -", start, end)
+    header_end = hunk_starts[0] - 1 if hunk_starts else end
+    header = diff[start:header_end].split("\n")
+
+    m = _DIFF_GIT_RE.match(header[0])
+    f = FileDiff(
+        path=m.group(2) if m else "",
+        old_path=m.group(1) if m else "",
+        header=header,
+    )
+    for line in header[1:]:
+        if line.startswith("+++ ") and line != "+++ /dev/null":
+            f.path = line[len("+++ b/"):] if line.startswith("+++ b/") else line[4:]
+        elif line.startswith("--- ") and line != "--- /dev/null":
+            f.old_path = line[len("--- a/"):] if line.startswith("--- a/") else line[4:]
+
+    bounds = [*hunk_starts, end + 1]
+    for hunk_start, hunk_end in zip(bounds, bounds[1:]):
+        hunk = _parse_hunk(diff, hunk_start, hunk_end - 1)
+        if hunk is not None:
+            f.hunks.append(hunk)
+    return f
+
+
+def parse_diff(diff: str) -> list[FileDiff]:
+    """Split a unified diff (as printed by `gh pr diff`) into files and hunks.
+
+    Works with offsets into the whole text rather than line by line, so each
+    hunk body is copied once and large diffs parse quickly. Returns an empty
+    list if the text contains no `diff --git` sections.
+    """
+    end = len(diff) - 1 if diff.endswith("\n") else len(diff)
+    bounds = [*_line_starts(diff, "diff --git ", 0, end), end + 1]
+    return [_parse_file(diff, start, stop - 1) for start, stop in zip(bounds, bounds[1:])]
+
+
+def diff_fingerprint(files: list[FileDiff], ignore_whitespace: bool = False) -> str:
+    """Hash of what a diff changes, stable across rebases.
+
+    Covers file paths and the added and removed lines only, so new hunk
+    offsets, context lines, index SHAs and head SHAs after a rebase or a
+    no-op force-push give the same fingerprint. With ignore_whitespace,
+    whitespace inside changed lines is left out too. Files without hunks
+    (binary, mode-only) hash their header.
+    """
+    h = hashlib.sha256()
+    for f in files:
+        h.update(f"\0file\0{f.old_path}\0{f.path}\n".encode())
+        if not f.hunks:
+            h.update("\n".join(f.header[1:]).encode())
+        for hunk in f.hunks:
+            h.update(b"\0hunk\n")
+            for line in hunk.lines:
+                if not line.startswith(("+", "-", "\\")):
+                    continue
+                if ignore_whitespace:
+                    line = line[0] + "".join(line[1:].split())
+                h.update(line.encode())
+                h.update(b"\n")
+    return h.hexdigest()
+
+
+def hunk_anchors(files: list[FileDiff]) -> dict[str, list[int]]:
+    """New-file start line of every hunk, by path."""
+    return {f.path: [h.new_start for h in f.hunks] for f in files if f.hunks}
+
+
+# Matched against the lower-cased path; re.IGNORECASE is markedly slower
+_SECURITY_PATH_RE = re.compile(
+    r"auth|security|crypt|passw|secret|token|credential|permission|acl|"
+    r"session|oauth|jwt|login|sanitiz|(^|/)\.env"
+)
+_TEST_PATH_RE = re.compile(
+    r"(^|/)(tests?|__tests__|spec|specs|e2e)/|(^|/)test_[^/]*$|"
+    r"[._-](test|spec)\.[^/]+$"
+)
+_DOC_PATH_RE = re.compile(r"\.(md|rst|txt|adoc)$|(^|/)docs?/")
+_GENERATED_PATH_RE = re.compile(
+    r"(^|/)(package-lock\.json|yarn\.lock|pnpm-lock\.yaml|poetry\.lock|"
+    r"Cargo\.lock|go\.sum|composer\.lock|Gemfile\.lock)$|"
+    r"\.min\.(js|css)$|\.snap$|\.map$|(^|/)(dist|vendor|generated)/"
+)
+
+
+def path_rank(path: str) -> tuple[int, int]:
+    """Rank a file for review priority: (security-sensitive, category).
+
+    Higher sorts first. Categories: source 3, tests 2, docs 1, generated 0.
+    """
+    lower = path.lower()
+    if _GENERATED_PATH_RE.search(path):
+        category = 0
+    elif _DOC_PATH_RE.search(lower):
+        category = 1
+    elif _TEST_PATH_RE.search(path):
+        category = 2
+    else:
+        category = 3
+    security = 1 if category > 0 and _SECURITY_PATH_RE.search(lower) else 0
+    return security, category
+
+
+@dataclass
+class PackedDiff:
+    text: str
+    tokens: int
+    omitted_files: list[str] = field(default_factory=list)
+    partial_files: list[str] = field(default_factory=list)
+    cut_mid_text: bool = False  # not a unified diff, truncated by characters
+
+    @property
+    def truncated(self) -> bool:
+        return bool(self.omitted_files or self.partial_files or self.cut_mid_text)
+
+
+def _split_hunk(hunk: Hunk, max_chars: int) -> list[Hunk]:
+    """hunk as consecutive hunks whose bodies are at most max_chars, split between lines.
+
+    A line longer than max_chars gets a hunk of its own, and a "\\ No newline"
+    marker stays with the line before it.
+    """
+    m = _HUNK_HEADER_RE.match(hunk.header)
+    section = hunk.header[m.end():] if m else ""
+    pieces: list[Hunk] = []
+    lines: list[str] = []
+    size = 0
+    old, new = hunk.old_start, hunk.new_start
+    old_count = new_count = 0
+
+    def flush() -> None:
+        pieces.append(Hunk(
+            header=f"@@ -{old},{old_count} +{new},{new_count} @@{section}",
+            body="\n".join(lines),
+            old_start=old, old_count=old_count, new_start=new, new_count=new_count,
+        ))
+
+    for line in hunk.lines:
+        if lines and size + len(line) + 1 > max_chars and not line.startswith("\\"):
+            flush()
+            old, new = old + old_count, new + new_count
+            lines, size, old_count, new_count = [], 0, 0, 0
+        lines.append(line)
+        size += len(line) + 1
+        if line.startswith("+"):
+            new_count += 1
+        elif line.startswith("-"):
+            old_count += 1
+        elif not line.startswith("\\"):
+            old_count += 1
+            new_count += 1
+    if lines:
+        flush()
+    return pieces
+
+
+def _split_oversized(files: list[FileDiff], token_budget: int) -> list[FileDiff]:
+    """files, with every hunk too large for token_budget split between lines.
+
+    Otherwise such a hunk (e.g. all of a large new file) could only be left
+    out whole.
+    """
+    split: list[FileDiff] = []
+    for f in files:
+        header_tokens = estimate_tokens("\n".join(f.header)) + 1
+        hunks: list[Hunk] = []
+        for h in f.hunks:
+            if tokens_for_chars(h.size) + 1 + header_tokens <= token_budget:
+                hunks.append(h)
+                continue
+            # Room for the body once the file header, a new hunk header and
+            # the separating newlines are paid for
+            max_chars = (token_budget - header_tokens - 2) * CHARS_PER_TOKEN - len(h.header) - 24
+            hunks.extend(_split_hunk(h, max_chars) if max_chars > 0 else [h])
+        if len(hunks) == len(f.hunks):
+            split.append(f)
+        else:
+            split.append(FileDiff(path=f.path, header=f.header, hunks=hunks, old_path=f.old_path))
+    return split
+
+
+def _select_hunks(files: list[FileDiff], token_budget: int) -> tuple[dict[int, set[int]], int]:
+    """Pick whole hunks for token_budget by priority. Returns ({file: hunks}, tokens)."""
+    items: list[tuple[tuple[int, int, int], int, int | None, int]] = []
+    for fi, f in enumerate(files):
+        rank = path_rank(f.path)
+        if not f.hunks:
+            items.append(((*rank, 0), fi, None, 0))
+        for hi, h in enumerate(f.hunks):
+            churn = h.additions + h.deletions
+            items.append(((*rank, churn), fi, hi, tokens_for_chars(h.size) + 1))
+    # sort() is stable, so ties keep their position in the diff
+    items.sort(key=lambda item: item[0], reverse=True)
+
+    header_tokens = [estimate_tokens("\n".join(f.header)) + 1 for f in files]
+    selected: dict[int, set[int]] = {}
+    used = 0
+    for _, fi, hi, hunk_tokens in items:
+        cost = hunk_tokens
+        if fi not in selected:
+            cost += header_tokens[fi]
+        if used + cost > token_budget:
+            continue
+        used += cost
+        chosen = selected.setdefault(fi, set())
+        if hi is not None:
+            chosen.add(hi)
+    return selected, used
+
+
+def _selected_text(files: list[FileDiff], selected: dict[int, set[int]]) -> str:
+    parts = [
+        f.text([h for hi, h in enumerate(f.hunks) if hi in selected[fi]])
+        for fi, f in enumerate(files)
+        if fi in selected
+    ]
+    return "\n".join(parts) + "\n" if parts else ""
+
+
+def pack_diff(files: list[FileDiff], token_budget: int) -> PackedDiff:
+    """Fill token_budget with hunks, highest priority first.
+
+    Hunks are ranked by path_rank() and then by churn (lines added plus
+    removed). A hunk that does not fit is skipped and smaller ones are tried,
+    so the budget is used as fully as possible; a hunk larger than the whole
+    budget is first split between lines. Selected hunks are emitted in their
+    original order with their file headers.
+    """
+    files = _split_oversized(files, token_budget)
+    selected, used = _select_hunks(files, token_budget)
+    omitted: list[str] = []
+    partial: list[str] = []
+    for fi, f in enumerate(files):
+        if fi not in selected:
+            omitted.append(f.path)
+        elif len(selected[fi]) < len(f.hunks):
+            partial.append(f.path)
+    return PackedDiff(
+        text=_selected_text(files, selected), tokens=used,
+        omitted_files=omitted, partial_files=partial,
+    )
+
+
+def shard_diff(
+    files: list[FileDiff], token_budget: int, max_shards: int,
+) -> tuple[list[PackedDiff], PackedDiff]:
+    """Split files into at most max_shards packs of token_budget each.
+
+    Each shard is packed like pack_diff() from the hunks the earlier shards
+    did not take, so the highest-priority code lands in the first shard and
+    whatever is left after the last one is reported as omitted. Returns the
+    shards and a combined PackedDiff that describes the whole review.
+    """
+    remaining = _split_oversized(files, token_budget)
+    taken: set[str] = set()
+    shards: list[PackedDiff] = []
+    while remaining and len(shards) < max_shards:
+        selected, used = _select_hunks(remaining, token_budget)
+        if not selected:
+            break  # nothing left fits on its own (e.g. one huge hunk)
+        shards.append(PackedDiff(text=_selected_text(remaining, selected), tokens=used))
+        rest: list[FileDiff] = []
+        for fi, f in enumerate(remaining):
+            chosen = selected.get(fi)
+            if chosen is not None:
+                taken.add(f.path)
+                if len(chosen) == len(f.hunks):
+                    continue
+            hunks = [h for hi, h in enumerate(f.hunks) if chosen is None or hi not in chosen]
+            rest.append(FileDiff(path=f.path, header=f.header, hunks=hunks, old_path=f.old_path))
+        remaining = rest
+
+    combined = PackedDiff(
+        text="".join(shard.text for shard in shards),
+        tokens=sum(shard.tokens for shard in shards),
+        omitted_files=[f.path for f in remaining if f.path not in taken],
+        partial_files=[f.path for f in remaining if f.path in taken],
+    )
+    return shards, combined
@@ -20,3 +20,27 @@ class ConfigError(ParcFermeError):
 
 class ReviewError(ParcFermeError):
     """Raised when the Claude review process fails."""
+
+
+class ReviewCancelledError(ReviewError):
+    """Raised when a running review is cancelled (e.g. superseded by a newer push)."""
+
+
+class ReviewTimeoutError(ReviewError):
+    """Raised when Claude produced no output before the review timeout."""
+
+
+class RateLimitError(ReviewError):
+    """Raised when Claude rejects a review because of rate limiting or overload."""
+
+
+class JobStoreError(ParcFermeError):
+    """Raised when the persistent job store cannot be read or written."""
+
+
+class SymbolIndexError(ParcFermeError):
+    """Raised when the symbol index cannot be built, read or written."""
+
+
+class BudgetExceededError(ParcFermeError):
+    """Raised when a review would go over its token budget and is skipped."""
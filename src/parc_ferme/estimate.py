@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+
+from .diff import estimate_tokens, parse_diff
+from .history import expected_latency
+from .reviewer import MAX_DIFF_TOKENS, PackedDiff, split_for_review
+
+
+@dataclass
+class Estimate:
+    diff_chars: int
+    file_count: int
+    tokens: int
+    token_budget: int
+    shards: int
+    model: str
+    expected_seconds: float | None
+    history_samples: int
+    truncated: bool
+    omitted_files: list[str] = field(default_factory=list)
+    partial_files: list[str] = field(default_factory=list)
+    profiles: list[str] = field(default_factory=list)
+    over_budget: int = 0  # tokens the review would need, over budgets.max_tokens_per_pr
+    skipped: str | None = None  # why the review would be skipped, if it would be
+
+
+@dataclass
+class PlannedReview:
+    """How one profile's review sends its diff to Claude (see ReviewSession.fetch_diff)."""
+
+    diff: str
+    shard_tokens: int
+    shards: list[PackedDiff]  # one claude call each; empty when Claude is not needed
+    packed: PackedDiff  # every shard together
+    profile: str = ""
+    over_budget: int = 0
+
+
+def estimate_review(
+    diff: str,
+    model: str,
+    token_budget: int = MAX_DIFF_TOKENS,
+    max_shards: int = 1,
+) -> Estimate:
+    """Size up a review of diff without calling Claude.
+
+    The diff is split by split_for_review(), as a review with no profile
+    routing, hunk cache or token budget would split it.
+    """
+    shards, packed = split_for_review(diff, token_budget, max_shards)
+    return estimate_plans([PlannedReview(diff, token_budget, shards, packed)], model)
+
+
+def estimate_plans(
+    plans: list[PlannedReview],
+    model: str,
+    skipped: str | None = None,
+) -> Estimate:
+    """Estimate of a review that runs plans, one per profile, concurrently.
+
+    Profiles that share a diff count it once. A profile's shards run one
+    after another, so the expected latency is that of the largest profile.
+    """
+    diffs = list({id(plan.diff): plan.diff for plan in plans}.values())
+    busiest = max((plan.packed.tokens for plan in plans if plan.shards), default=0)
+    latency = expected_latency(busiest, model) if busiest else None
+    omitted = [path for plan in plans for path in plan.packed.omitted_files]
+    partial = [path for plan in plans for path in plan.packed.partial_files]
+    return Estimate(
+        diff_chars=sum(len(diff) for diff in diffs),
+        file_count=sum(len(parse_diff(diff)) for diff in diffs),
+        tokens=sum(estimate_tokens(diff) for diff in diffs),
+        token_budget=min(plan.shard_tokens for plan in plans),
+        shards=sum(len(plan.shards) for plan in plans),
+        model=model,
+        expected_seconds=latency[0] if latency else None,
+        history_samples=latency[1] if latency else 0,
+        truncated=any(plan.packed.truncated for plan in plans),
+        omitted_files=list(dict.fromkeys(omitted)),
+        partial_files=list(dict.fromkeys(partial)),
+        profiles=[plan.profile for plan in plans if plan.profile],
+        over_budget=max((plan.over_budget for plan in plans), default=0),
+        skipped=skipped,
+    )
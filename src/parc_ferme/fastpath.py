@@ -0,0 +1,269 @@
+from __future__ import annotations
+
+import re
+from pathlib import PurePosixPath
+
+from .diff import FileDiff, Hunk
+from .profiles import Profile
+
+FAST_PATH_CHECKS = ("docs", "whitespace", "comments", "version_bump")
+
+_DESCRIPTIONS = {
+    "docs": "documentation",
+    "whitespace": "whitespace",
+    "comments": "comment",
+    "version_bump": "version bump",
+}
+
+# Line comment markers by file extension. Only languages where a line that
+# starts with the marker cannot be code are listed. In the /* */ languages a
+# line that starts with "*" is only a comment inside a block comment (Go and C
+# continue an expression with "* quantity").
+_HASH = ("#",)
+_SLASH = ("//", "/*")
+_COMMENT_MARKERS: dict[str, tuple[str, ...]] = {
+    **dict.fromkeys((".py", ".sh", ".bash", ".rb", ".pl", ".r", ".toml", ".yml", ".yaml",
+                     ".cfg", ".ini", ".conf", ".dockerfile", ".mk", ".tf"), _HASH),
+    **dict.fromkeys((".js", ".jsx", ".ts", ".tsx", ".mjs", ".cjs", ".java", ".kt", ".go",
+                     ".c", ".h", ".cc", ".cpp", ".hpp", ".cs", ".rs", ".swift", ".scala",
+                     ".php", ".dart"), _SLASH),
+    **dict.fromkeys((".sql", ".lua", ".hs"), ("--",)),
+    **dict.fromkeys((".html", ".htm", ".xml", ".vue", ".svg"), ("<!--", "-->")),
+}
+
+# Delimiters of strings that can span lines, where a line that starts with a
+# comment marker is text, not a comment.
+_PY_QUOTES = ('"""', "'''")
+_MULTILINE_QUOTES: dict[str, tuple[str, ...]] = {
+    **dict.fromkeys((".py", ".dart"), _PY_QUOTES),
+    **dict.fromkeys((".java", ".kt", ".scala", ".swift"), ('"""',)),
+    **dict.fromkeys((".js", ".jsx", ".ts", ".tsx", ".mjs", ".cjs", ".go"), ("`",)),
+}
+
+# Comments that tell a tool what to do: lint, type and security suppressions
+# and directives such as the encoding cookie, a shebang or //go:build.
+# Turning one off is a real change.
+_DIRECTIVE_RE = re.compile(
+    r"^(#!|//go:|//\s*\+build|///\s*<reference)"
+    r"|\b(noqa|nosec|nolint\w*|nosonar|type:|pyright:|mypy:|pylint:|ruff:|flake8:|fmt:|isort:"
+    r"|pragma|coding[:=]|frozen_string_literal:|rubocop:|shellcheck\s|eslint-|tslint:"
+    r"|prettier-ignore|istanbul\s+ignore|c8\s+ignore|checkov:|tfsec:)"
+    r"|@ts-|lgtm\[",
+    re.IGNORECASE,
+)
+
+_DOC_SUFFIXES = {".md", ".markdown", ".rst", ".adoc"}
+# Leading whitespace is syntax here, so re-indenting is a real change
+_INDENT_SENSITIVE = {".py", ".yml", ".yaml", ".mk", ".coffee", ".pug", ".haml", ".sass", ".nim"}
+
+# String literals are single tokens, so whitespace inside them is never ignored
+_TOKEN_RE = re.compile(r"""'(?:\\.|[^'\\\n])*'|"(?:\\.|[^"\\\n])*"|`(?:\\.|[^`\\])*`|\w+|\S""")
+
+# Only the project's own version counts, not a dependency's: __version__ in
+# Python, version in pyproject.toml's or Cargo.toml's own table, and the
+# top-level version of package.json.
+_VERSION = r"""["']v?\d+(\.\d+)+([-.+]?[0-9A-Za-z.]+)?["']"""
+_PY_VERSION_RE = re.compile(rf"^__version__\s*=\s*{_VERSION}\s*$")
+_TOML_VERSION_RE = re.compile(rf"^version\s*=\s*{_VERSION}\s*$")
+_JSON_VERSION_RE = re.compile(rf"""^(  |\t)"version"\s*:\s*{_VERSION},?\s*$""")
+_TOML_TABLE_RE = re.compile(r"^\s*\[([^\[\]]+)\]\s*$")
+_TOML_VERSION_FILES = {"pyproject.toml", "Cargo.toml"}
+_PROJECT_TABLES = {"project", "tool.poetry", "package", "workspace.package"}
+_LGTM_RULE_RE = re.compile(r"If no issues (?:are )?found, just say:\s*(.+)$")
+
+
+def _changed_lines(hunk: Hunk) -> tuple[list[str], list[str]]:
+    removed: list[str] = []
+    added: list[str] = []
+    for line in hunk.lines:
+        if line.startswith("-"):
+            removed.append(line[1:])
+        elif line.startswith("+"):
+            added.append(line[1:])
+    return removed, added
+
+
+def _suffix(path: str) -> str:
+    p = PurePosixPath(path)
+    if p.name == "Makefile":
+        return ".mk"
+    if p.name == "Dockerfile":
+        return ".dockerfile"
+    return p.suffix.lower()
+
+
+def _tokens(text: str) -> list[str]:
+    return _TOKEN_RE.findall(text)
+
+
+def _indented(lines: list[str]) -> list[tuple[str, list[str]]]:
+    """(indentation, tokens) of each non-blank line."""
+    return [
+        (line[:len(line) - len(line.lstrip())], _tokens(line))
+        for line in lines if line.strip()
+    ]
+
+
+def _is_whitespace_only(f: FileDiff) -> bool:
+    suffix = _suffix(f.path)
+    for hunk in f.hunks:
+        removed, added = _changed_lines(hunk)
+        if suffix in _INDENT_SENSITIVE:
+            # Only trailing and inner whitespace may change, line by line
+            if _indented(removed) != _indented(added):
+                return False
+        elif _tokens("\n".join(removed)) != _tokens("\n".join(added)):
+            return False
+    return bool(f.hunks)
+
+
+def _block_comment(text: str, in_block: bool) -> tuple[bool, bool]:
+    """Whether a stripped line is a comment, and whether a /* */ block is open after it."""
+    if in_block:
+        end = text.find("*/")
+        if end == -1:
+            return True, True
+        return end + 2 == len(text), False
+    if text.startswith("//"):
+        return True, False
+    if text.startswith("/*"):
+        end = text.find("*/", 2)
+        if end == -1:
+            return True, True
+        return end + 2 == len(text), False
+    return False, False
+
+
+def _open_quote(text: str, quote: str | None, quotes: tuple[str, ...]) -> str | None:
+    """The delimiter of the multi-line string still open after a line of code, or None."""
+    i = 0
+    while True:
+        if quote is None:
+            found = [(text.find(q, i), q) for q in quotes if q in text[i:]]
+            if not found:
+                return None
+            i, quote = min(found)
+            i += len(quote)
+        else:
+            end = text.find(quote, i)
+            if end == -1:
+                return quote
+            i, quote = end + len(quote), None
+
+
+def _side_is_comments(
+    hunk: Hunk, sign: str, markers: tuple[str, ...], quotes: tuple[str, ...],
+) -> bool:
+    """Whether every line the hunk changes on one side ("-" or "+") is a comment or blank.
+
+    Block comments and multi-line strings are followed through the context
+    lines, so a comment opened above the change counts only if the hunk
+    shows where it opens, and a hunk that shows only one end of a string is
+    not comments-only. Lines inside a string and tool directives such as
+    "# noqa" count as code.
+    """
+    in_block = False
+    quote = None  # the delimiter of the multi-line string the line is in
+    for line in hunk.lines:
+        if not line or line[0] not in (" ", sign):
+            continue
+        text = line[1:].strip()
+        if quote is not None:
+            comment = False
+        elif markers is _SLASH:
+            comment, in_block = _block_comment(text, in_block)
+        else:
+            comment = text.startswith(markers)
+        if not comment:
+            quote = _open_quote(text, quote, quotes)
+        if line[0] == sign and text and (not comment or _DIRECTIVE_RE.search(text)):
+            return False
+    return quote is None
+
+
+def _is_comments_only(f: FileDiff) -> bool:
+    suffix = _suffix(f.path)
+    markers = _COMMENT_MARKERS.get(suffix)
+    if not markers or not f.hunks:
+        return False
+    quotes = _MULTILINE_QUOTES.get(suffix, ())
+    return all(
+        _side_is_comments(hunk, sign, markers, quotes) for hunk in f.hunks for sign in "-+"
+    )
+
+
+def _is_version_bump(f: FileDiff) -> bool:
+    name = PurePosixPath(f.path).name
+    toml = name in _TOML_VERSION_FILES
+    if toml:
+        pattern = _TOML_VERSION_RE
+    elif name == "package.json":
+        pattern = _JSON_VERSION_RE
+    elif _suffix(f.path) == ".py":
+        pattern = _PY_VERSION_RE
+    else:
+        return False
+    seen = False
+    for hunk in f.hunks:
+        table = None  # the TOML table, once the hunk shows its header
+        for line in hunk.lines:
+            if not line or line[0] not in " +-":
+                continue
+            text = line[1:]
+            header = _TOML_TABLE_RE.match(text)
+            if header:
+                table = header.group(1).strip()
+            if line[0] == " " or not text.strip():
+                continue
+            if not pattern.match(text) or (toml and table not in _PROJECT_TABLES):
+                return False
+            seen = True
+    return seen
+
+
+def _file_check(f: FileDiff, checks: tuple[str, ...] | list[str]) -> str | None:
+    """The first of checks that f passes, or None."""
+    for check in checks:
+        if check == "docs" and _suffix(f.path) in _DOC_SUFFIXES:
+            return check
+        if check == "whitespace" and _is_whitespace_only(f):
+            return check
+        if check == "comments" and _is_comments_only(f):
+            return check
+        if check == "version_bump" and _is_version_bump(f):
+            return check
+    return None
+
+
+def classify_trivial(
+    files: list[FileDiff], checks: tuple[str, ...] | list[str] = FAST_PATH_CHECKS,
+) -> str | None:
+    """Why the diff needs no Claude review, or None if it does.
+
+    Every file must pass one of checks: docs (Markdown, reST or AsciiDoc),
+    whitespace (hunks have the same tokens; string literals must not
+    change), comments (only comment or blank lines change, outside string
+    literals; directives such as "# noqa" are code) or version_bump (only
+    the project's own version changes). A PR that mixes, say, docs and a
+    version bump still qualifies.
+    """
+    if not files:
+        return None
+    found: list[str] = []
+    for f in files:
+        check = _file_check(f, checks)
+        if check is None:
+            return None
+        if check not in found:
+            found.append(check)
+    kinds = " and ".join(_DESCRIPTIONS[check] for check in found)
+    return f"{kinds} changes only ({len(files)} file{'s' if len(files) != 1 else ''})"
+
+
+def lgtm_review(profile: Profile) -> str:
+    """The "no issues" answer the profile asks Claude for, e.g. "✅ LGTM"."""
+    for rule in profile.rules:
+        m = _LGTM_RULE_RE.search(rule)
+        if m:
+            return m.group(1).strip()
+    return "✅ LGTM"
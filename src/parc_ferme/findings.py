@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import re
+from bisect import bisect_right
+from dataclasses import dataclass
+
+# "🟡 WARNING - src/app.py:12 — message" or "[CRITICAL] src/app.py:12-14 — message"
+_FINDING_RE = re.compile(
+    r"(?<![\w.:/@+-])(?P<file>[\w.@+-]*[A-Za-z][\w.@+-]*(?:/[\w.@+-]+)*)"
+    r":(?P<line>\d+)(?:[-–](?P<end>\d+))?[`*]*\s*(?:[—–:]|-\s)\s*(?P<message>\S.*)$"
+)
+_SEVERITY_RE = re.compile(r"\b([A-Z]{3,})\b")
+
+
+@dataclass(frozen=True)
+class Finding:
+    """One issue line of a review, located at file:line."""
+
+    severity: str  # e.g. CRITICAL, or "" if the line has no label
+    file: str
+    line: int
+    message: str
+    text: str  # the line as Claude wrote it
+
+    @property
+    def key(self) -> tuple[str, int, str]:
+        """What makes two findings the same issue, whatever the wording around it."""
+        message = re.sub(r"\s+", " ", self.message).strip().rstrip(".").lower()
+        return self.file, self.line, message
+
+
+def parse_finding(line: str) -> Finding | None:
+    m = _FINDING_RE.search(line)
+    if not m:
+        return None
+    severity = _SEVERITY_RE.search(line, 0, m.start())
+    return Finding(
+        severity=severity.group(1) if severity else "",
+        file=m.group("file"),
+        line=int(m.group("line")),
+        message=m.group("message").strip(),
+        text=line.strip(),
+    )
+
+
+def parse_findings(review: str) -> list[Finding]:
+    """Every line of review that reads as a file:line finding."""
+    return [f for f in map(parse_finding, review.splitlines()) if f is not None]
+
+
+def merge_sections(sections: list[tuple[str, str]]) -> tuple[list[tuple[str, str]], int]:
+    """Drop findings already reported by an earlier section.
+
+    sections are (profile, review) pairs in priority order. Lines that are
+    not findings are kept as they are. Returns the deduplicated sections and
+    how many duplicate findings were dropped.
+    """
+    seen: set[tuple[str, int, str]] = set()
+    merged: list[tuple[str, str]] = []
+    dropped = 0
+    for name, review in sections:
+        kept: list[str] = []
+        for line in review.splitlines():
+            finding = parse_finding(line)
+            if finding is not None:
+                if finding.key in seen:
+                    dropped += 1
+                    continue
+                seen.add(finding.key)
+            kept.append(line)
+        merged.append((name, "\n".join(kept).strip() or "No additional findings."))
+    return merged, dropped
+
+
+def shift_lines(
+    review: str, old: dict[str, list[int]], new: dict[str, list[int]],
+) -> str:
+    """Move finding line numbers from one set of hunk positions to another.
+
+    old and new map paths to hunk start lines (diff.hunk_anchors) of two
+    diffs with the same changes, e.g. before and after a rebase. A finding
+    moves by as much as the hunk it falls in; files whose hunks do not line
+    up are left alone.
+    """
+    def shift(line: str) -> str:
+        m = _FINDING_RE.search(line)
+        if not m:
+            return line
+        before, after = old.get(m.group("file")), new.get(m.group("file"))
+        if not before or not after or len(before) != len(after):
+            return line
+        i = max(bisect_right(before, int(m.group("line"))) - 1, 0)
+        delta = after[i] - before[i]
+        if delta == 0:
+            return line
+        for group in ("end", "line"):  # right to left, so offsets stay valid
+            if m.group(group) is not None:
+                number = str(int(m.group(group)) + delta)
+                line = line[:m.start(group)] + number + line[m.end(group):]
+        return line
+
+    return "\n".join(shift(line) for line in review.split("\n"))
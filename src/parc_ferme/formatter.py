@@ -2,9 +2,13 @@ from __future__ import annotations
 
 import re
 from dataclasses import dataclass, fields
-from datetime import date
+from datetime import date, datetime
+from typing import Any
 
+from .estimate import Estimate
 from .github import PRInfo
+from .history import HistoryStats, LatencyModel
+from .jobs import STATES, StoredJob
 
 
 @dataclass
@@ -73,16 +77,166 @@ def format_review_end(no_color: bool = False) -> str:
     return f"\n{sep}\n{c.GREEN}✅ Review complete{c.NC}"
 
 
+def format_estimate(pr: str, estimate: Estimate, no_color: bool = False) -> str:
+    c = get_colors(no_color)
+    if estimate.expected_seconds is None:
+        latency = "unknown (no review history yet)"
+    else:
+        latency = (
+            f"~{estimate.expected_seconds:.0f}s "
+            f"(from {estimate.history_samples} past reviews)"
+        )
+    if estimate.truncated:
+        over = estimate.tokens - estimate.token_budget * max(estimate.shards, 1)
+        truncation = f"{c.YELLOW}yes, ~{over:,} tokens over budget"
+        if estimate.omitted_files or estimate.partial_files:
+            truncation += (
+                f" ({len(estimate.omitted_files)} files left out, "
+                f"{len(estimate.partial_files)} partial)"
+            )
+        truncation += c.NC
+    else:
+        truncation = f"{c.GREEN}no{c.NC}"
+    lines = [
+        f"{c.BLUE}📏 Review estimate for PR {pr}{c.NC}",
+        f"{c.GREEN}Diff:{c.NC}       {estimate.diff_chars:,} chars, {estimate.file_count} files",
+        f"{c.GREEN}Tokens:{c.NC}     ~{estimate.tokens:,} (budget {estimate.token_budget:,})",
+        f"{c.GREEN}Shards:{c.NC}     {estimate.shards}",
+        f"{c.GREEN}Model:{c.NC}      {estimate.model}",
+        f"{c.GREEN}Latency:{c.NC}    {latency}",
+        f"{c.GREEN}Truncation:{c.NC} {truncation}",
+    ]
+    if len(estimate.profiles) > 1:
+        lines.insert(5, f"{c.GREEN}Profiles:{c.NC}   {', '.join(estimate.profiles)}")
+    if estimate.skipped:
+        lines.append(f"{c.GREEN}Budget:{c.NC}     {c.RED}skipped: {estimate.skipped}{c.NC}")
+    elif estimate.over_budget:
+        lines.append(
+            f"{c.GREEN}Budget:{c.NC}     {c.YELLOW}needs ~{estimate.over_budget:,} tokens, "
+            f"over the per-PR budget; packed into one shard{c.NC}"
+        )
+    return "\n".join(lines)
+
+
+def format_job_counts(counts: dict[str, int], no_color: bool = False) -> str:
+    c = get_colors(no_color)
+    total = sum(counts.values())
+    parts = [f"{state} {counts[state]}" for state in STATES if counts.get(state)]
+    summary = f" ({', '.join(parts)})" if parts else ""
+    return f"{c.BLUE}Jobs: {total} total{c.NC}{summary}"
+
+
+def format_job_table(jobs: list[StoredJob], no_color: bool = False) -> str:
+    c = get_colors(no_color)
+    lines = [f"{'ID':>5s}  {'STATE':9s}  {'TRY':3s}  {'PR':30s}  {'PROFILE':12s}  UPDATED"]
+    for job in jobs:
+        updated = datetime.fromtimestamp(job.updated_at).strftime("%Y-%m-%d %H:%M")
+        pr = f"{job.repo}#{job.pr}@{job.head_sha[:7]}"
+        line = (
+            f"{job.id:5d}  {job.state:9s}  {job.attempts}/{job.max_attempts}  "
+            f"{pr:30s}  {job.profile:12s}  {updated}"
+        )
+        if job.error and job.state != "done":
+            line += f"  {c.YELLOW}{job.error}{c.NC}"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def format_history_stats(
+    stats: list[HistoryStats],
+    models: list[LatencyModel],
+    latency_settings: dict[str, Any],
+    no_color: bool = False,
+) -> str:
+    c = get_colors(no_color)
+    total = sum(s.reviews for s in stats)
+    lines = [
+        f"{c.BLUE}📊 Review history: {total} reviews{c.NC}",
+        "",
+        f"{'MODEL':12s}  {'PROFILE':12s}  {'N':>4s}  {'p50':>7s}  {'p90':>7s}  {'p95':>7s}  "
+        f"{'max':>7s}  {'tokens p50/p95':>16s}  {'files p50':>9s}",
+    ]
+    for s in stats:
+        d = s.duration
+        tokens = f"{s.tokens['p50']:,.0f}/{s.tokens['p95']:,.0f}"
+        lines.append(
+            f"{s.model:12s}  {s.profile:12s}  {s.reviews:4d}  {d['p50']:6.1f}s  {d['p90']:6.1f}s  "
+            f"{d['p95']:6.1f}s  {d['max']:6.1f}s  {tokens:>16s}  {s.files['p50']:9.0f}"
+        )
+        if s.partial:
+            lines[-1] += f"  {c.YELLOW}{s.partial} partial{c.NC}"
+
+    pct = latency_settings.get("percentile", 95)
+    headroom = latency_settings.get("headroom", 1.5)
+    target = latency_settings.get("target_seconds", 120)
+    min_samples = latency_settings.get("min_samples", 10)
+    for m in models:
+        lines += [
+            "",
+            f"{c.GREEN}Latency model ({m.model}, {m.samples} calls):{c.NC} "
+            f"{m.intercept:.1f}s + {m.seconds_per_token * 1000:.2f}s per 1k tokens",
+        ]
+        if m.samples < min_samples:
+            lines.append(f"  {c.YELLOW}Needs {min_samples} reviews before it sets timeouts "
+                         f"(review_timeout is used until then){c.NC}")
+            continue
+        timeouts = ", ".join(
+            f"{tokens // 1000}k tokens {m.percentile(tokens, pct) * headroom:.0f}s"
+            for tokens in (1_000, 10_000, 25_000)
+        )
+        lines.append(f"  Timeout (p{pct:g} x {headroom:g}): {timeouts}")
+        lines.append(f"  Shard size for a {target}s call: ~{m.tokens_for(target):,} tokens")
+    return "\n".join(lines)
+
+
+def join_sections(sections: list[tuple[str, str]]) -> str:
+    """One "### `profile`" block per (profile, review) pair."""
+    return "\n\n".join(f"### `{name}`\n\n{text}" for name, text in sections)
+
+
 def format_comment(
     pr_info: PRInfo,
     review: str,
     profile_name: str,
+    sections: list[tuple[str, str]] | None = None,
+    parent: PRInfo | None = None,
+    since: str = "",
+    earlier: str = "",
 ) -> str:
+    """Markdown PR comment. With sections, one block per (profile, review).
+
+    For a stacked PR, parent is the PR it builds on: the comment links to it
+    for the parent's findings instead of repeating them. For a review of the
+    commits pushed after since, earlier holds the previous reviews, shown
+    collapsed below this one.
+    """
     today = date.today().isoformat()
     safe_title = _escape_md(pr_info.title)
+    if sections:
+        label = "Profiles" if len(sections) > 1 else "Profile"
+        profiles = ", ".join(f"`{name}`" for name, _ in sections)
+        review = join_sections(sections)
+    else:
+        label, profiles = "Profile", f"`{profile_name}`"
+    stacked = ""
+    if parent is not None:
+        stacked = (
+            f"**Stacked on**: [#{parent.number}]({parent.url}) — only the changes this PR "
+            f"adds were reviewed; see #{parent.number} for findings in the rest\n\n"
+        )
+    if since:
+        stacked += (
+            f"**New commits**: `{since[:7]}..{pr_info.head_sha[:7]}` — only the changes "
+            f"pushed since the last review were reviewed\n\n"
+        )
+    if earlier:
+        review += (
+            f"\n\n<details><summary>Earlier reviews</summary>\n\n{earlier}\n\n</details>"
+        )
     return (
         f"## 🔍 Parc Fermé PR Review — PR #{pr_info.number}: {safe_title}\n\n"
-        f"**Profile**: `{profile_name}` | **Reviewed**: {today}\n\n"
+        f"**{label}**: {profiles} | **Reviewed**: {today}\n\n"
+        f"{stacked}"
         f"---\n\n"
         f"{review}\n\n"
         f"---\n"
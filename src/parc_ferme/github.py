@@ -7,15 +7,21 @@ import shutil
 import subprocess
 import sys
 import tempfile
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 from .errors import GitHubError, PRNotFoundError, ToolNotFoundError
+from .timing import span
 
 _GH_TIMEOUT = 30  # seconds
 
 _PR_NUMBER_RE = re.compile(r"^\d+$")
 _PR_URL_RE = re.compile(r"^https://github\.com/[\w.\-]+/[\w.\-]+/pull/\d+$")
 _REPO_FORMAT_RE = re.compile(r"^[\w.\-]+/[\w.\-]+$")
+_COMMENT_ID_RE = re.compile(r"#issuecomment-(\d+)$")
+_PR_FIELDS = (
+    "title,number,url,author,baseRefName,baseRefOid,headRefName,headRefOid,"
+    "additions,deletions,changedFiles,labels"
+)
 
 
 def _validate_pr_input(pr_input: str) -> None:
@@ -45,14 +51,19 @@ def _add_repo_flag(cmd: list[str], repo: str | None) -> None:
 
 def _run_gh(cmd: list[str]) -> subprocess.CompletedProcess[str]:
     """Run a gh CLI command with timeout."""
-    try:
-        return subprocess.run(
-            cmd, capture_output=True, text=True, timeout=_GH_TIMEOUT,
-        )
-    except subprocess.TimeoutExpired:
-        raise GitHubError(
-            f"Timed out after {_GH_TIMEOUT}s waiting for: {' '.join(cmd[:4])}"
-        )
+    with span(" ".join(cmd[:3])) as span_args:
+        try:
+            result = subprocess.run(
+                cmd, capture_output=True, text=True, timeout=_GH_TIMEOUT,
+            )
+        except subprocess.TimeoutExpired:
+            span_args["timed_out"] = True
+            raise GitHubError(
+                f"Timed out after {_GH_TIMEOUT}s waiting for: {' '.join(cmd[:4])}"
+            )
+        span_args["returncode"] = result.returncode
+        span_args["stdout_chars"] = len(result.stdout or "")
+        return result
 
 
 @dataclass
@@ -62,6 +73,13 @@ class PRInfo:
     url: str
     author: str
     base_branch: str
+    head_sha: str = ""
+    head_branch: str = ""
+    base_sha: str = ""  # tip of the base branch
+    additions: int = 0
+    deletions: int = 0
+    changed_files: int = 0
+    labels: list[str] = field(default_factory=list)
 
 
 def check_gh_available() -> None:
@@ -71,11 +89,30 @@ def check_gh_available() -> None:
         )
 
 
+def split_pr_ref(pr_input: str) -> tuple[str | None, int]:
+    """Split a PR number or URL into (OWNER/REPO or None, number)."""
+    _validate_pr_input(pr_input)
+    if _PR_NUMBER_RE.match(pr_input):
+        return None, int(pr_input)
+    owner, repo, _, number = pr_input.rstrip("/").split("/")[-4:]
+    return f"{owner}/{repo}", int(number)
+
+
+def get_current_repo() -> str:
+    """Return OWNER/REPO of the repository gh resolves from the working directory."""
+    result = _run_gh(["gh", "repo", "view", "--json", "nameWithOwner"])
+    if result.returncode != 0:
+        raise GitHubError(
+            f"Could not determine the current repository: {result.stderr.strip()}"
+        )
+    return json.loads(result.stdout)["nameWithOwner"]
+
+
 def get_pr_info(pr_input: str, repo: str | None = None) -> PRInfo:
     _validate_pr_input(pr_input)
     cmd = [
         "gh", "pr", "view", pr_input,
-        "--json", "title,number,url,author,baseRefName",
+        "--json", _PR_FIELDS,
     ]
     _add_repo_flag(cmd, repo)
 
@@ -85,13 +122,23 @@ def get_pr_info(pr_input: str, repo: str | None = None) -> PRInfo:
             f"Could not find PR '{pr_input}': {result.stderr.strip()}"
         )
 
-    data = json.loads(result.stdout)
+    return _pr_info(json.loads(result.stdout))
+
+
+def _pr_info(data: dict) -> PRInfo:
     return PRInfo(
         title=data["title"],
         number=data["number"],
         url=data["url"],
-        author=data["author"]["login"],
+        author=(data.get("author") or {}).get("login", ""),
         base_branch=data["baseRefName"],
+        head_sha=data.get("headRefOid", ""),
+        head_branch=data.get("headRefName", ""),
+        base_sha=data.get("baseRefOid", ""),
+        additions=int(data.get("additions") or 0),
+        deletions=int(data.get("deletions") or 0),
+        changed_files=int(data.get("changedFiles") or 0),
+        labels=[label["name"] for label in data.get("labels") or [] if label.get("name")],
     )
 
 
@@ -108,6 +155,140 @@ def get_pr_diff(pr_input: str, repo: str | None = None) -> str:
     return result.stdout
 
 
+def list_open_prs(repo: str | None = None, limit: int = 100) -> list[PRInfo]:
+    """Open PRs of repo (default: the current one), newest first."""
+    cmd = [
+        "gh", "pr", "list", "--state", "open", "--limit", str(limit),
+        "--json", _PR_FIELDS,
+    ]
+    _add_repo_flag(cmd, repo)
+
+    result = _run_gh(cmd)
+    if result.returncode != 0:
+        raise GitHubError(f"Could not list open PRs: {result.stderr.strip()}")
+    return [_pr_info(data) for data in json.loads(result.stdout or "[]")]
+
+
+def get_pr_commits(pr_input: str, repo: str | None = None) -> list[str]:
+    """SHAs of the PR's commits, oldest first."""
+    _validate_pr_input(pr_input)
+    cmd = ["gh", "pr", "view", pr_input, "--json", "commits"]
+    _add_repo_flag(cmd, repo)
+
+    result = _run_gh(cmd)
+    if result.returncode != 0:
+        raise GitHubError(f"Could not list commits of PR '{pr_input}': {result.stderr.strip()}")
+    return [c["oid"] for c in json.loads(result.stdout).get("commits", [])]
+
+
+def stack_parent(
+    pr_info: PRInfo, open_prs: list[PRInfo], commits: list[str] | None = None,
+) -> PRInfo | None:
+    """The open PR that pr_info is stacked on, if any.
+
+    Either the PR whose head branch is pr_info's base branch, or (given
+    pr_info's commits) the PR targeting the same base whose head commit is
+    one of pr_info's commits, the nearest one if several are.
+    """
+    others = [p for p in open_prs if p.number != pr_info.number]
+    for other in others:
+        if other.head_branch and other.head_branch == pr_info.base_branch:
+            return other
+    if not commits:
+        return None
+    position = {sha: i for i, sha in enumerate(commits)}
+    below = [
+        p for p in others
+        if p.base_branch == pr_info.base_branch and p.head_sha in position
+    ]
+    return max(below, key=lambda p: position[p.head_sha], default=None)
+
+
+def get_compare_diff(repo: str, base: str, head: str) -> str:
+    """Unified diff of what head adds over base (GitHub compare base...head)."""
+    _validate_repo(repo)
+    cmd = [
+        "gh", "api", f"repos/{repo}/compare/{base}...{head}",
+        "-H", "Accept: application/vnd.github.diff",
+    ]
+    result = _run_gh(cmd)
+    if result.returncode != 0:
+        raise GitHubError(
+            f"Could not compare {base[:7]}...{head[:7]} in {repo}: {result.stderr.strip()}"
+        )
+    return result.stdout
+
+
+def get_compare_status(repo: str, base: str, head: str) -> str:
+    """How head relates to base: "ahead", "behind", "identical" or "diverged".
+
+    Only "ahead" means base is an ancestor of head, so that the compare diff
+    is exactly the commits pushed on top of base.
+    """
+    _validate_repo(repo)
+    cmd = ["gh", "api", f"repos/{repo}/compare/{base}...{head}", "--jq", ".status"]
+    result = _run_gh(cmd)
+    if result.returncode != 0:
+        raise GitHubError(
+            f"Could not compare {base[:7]}...{head[:7]} in {repo}: {result.stderr.strip()}"
+        )
+    return result.stdout.strip()
+
+
+@dataclass
+class PRPoll:
+    """What a conditional poll of a PR returned when it had changed."""
+
+    etag: str
+    head_sha: str
+    state: str  # "open" or "closed"
+
+
+def _split_http_response(output: str) -> tuple[int, dict[str, str], str]:
+    """Status, headers (lowercased names) and body of `gh api -i` output."""
+    head, _, body = output.replace("\r\n", "\n").partition("\n\n")
+    lines = head.split("\n")
+    parts = lines[0].split()
+    status = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 0
+    headers = {}
+    for line in lines[1:]:
+        name, sep, value = line.partition(":")
+        if sep:
+            headers[name.strip().lower()] = value.strip()
+    return status, headers, body
+
+
+def poll_pr(repo: str, number: int, etag: str | None = None) -> PRPoll | None:
+    """The PR's head and state, or None if unchanged since etag.
+
+    Sends If-None-Match, so an unchanged PR costs a 304 reply, which GitHub
+    does not count against the rate limit.
+    """
+    _validate_repo(repo)
+    cmd = ["gh", "api", "-i", f"repos/{repo}/pulls/{number}"]
+    if etag:
+        cmd.extend(["-H", f"If-None-Match: {etag}"])
+    result = _run_gh(cmd)
+    # gh exits non-zero on a 304, but still prints the response
+    status, headers, body = _split_http_response(result.stdout or "")
+    if status == 304:
+        return None
+    if result.returncode != 0 or status != 200:
+        raise GitHubError(
+            f"Could not poll PR #{number} in {repo}: "
+            f"{result.stderr.strip() or f'HTTP {status}'}"
+        )
+    try:
+        data = json.loads(body)
+        return PRPoll(
+            etag=headers.get("etag", ""),
+            head_sha=data["head"]["sha"],
+            state=data.get("state", "open"),
+        )
+    except (json.JSONDecodeError, KeyError, TypeError) as e:
+        raise GitHubError(f"Unexpected reply polling PR #{number} in {repo}: {e}")
+
+
 def get_changed_files(pr_input: str, repo: str | None = None) -> list[str]:
     _validate_pr_input(pr_input)
     cmd = ["gh", "pr", "diff", pr_input, "--name-only"]
@@ -128,7 +309,11 @@ def post_comment(
     body: str,
     repo: str | None = None,
     edit_last: bool = False,
-) -> None:
+) -> str:
+    """Comment on the PR; edit_last edits the gh user's last comment instead.
+
+    Returns the comment's URL as gh prints it (see comment_id_from_url()).
+    """
     _validate_pr_input(pr_input)
 
     fd, body_path = tempfile.mkstemp(suffix=".md", prefix="parc-ferme-")
@@ -148,3 +333,30 @@ def post_comment(
             )
     finally:
         os.unlink(body_path)
+    return result.stdout.strip()
+
+
+def comment_id_from_url(url: str) -> int | None:
+    """The id of the comment at url (.../pull/N#issuecomment-ID), or None."""
+    m = _COMMENT_ID_RE.search(url)
+    return int(m.group(1)) if m else None
+
+
+def update_comment(repo: str, comment_id: int, body: str) -> None:
+    """Replace the body of one PR comment, found by id rather than by author."""
+    _validate_repo(repo)
+    fd, body_path = tempfile.mkstemp(suffix=".md", prefix="parc-ferme-")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(body)
+        cmd = [
+            "gh", "api", "-X", "PATCH", f"repos/{repo}/issues/comments/{comment_id}",
+            "-F", f"body=@{body_path}",
+        ]
+        result = _run_gh(cmd)
+        if result.returncode != 0:
+            raise GitHubError(
+                f"Failed to update comment {comment_id}: {result.stderr.strip()}"
+            )
+    finally:
+        os.unlink(body_path)
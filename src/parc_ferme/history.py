@@ -0,0 +1,227 @@
+from __future__ import annotations
+
+import json
+import math
+import statistics
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+from .config import get_cache_dir
+
+HISTORY_FILENAME = "history.jsonl"
+
+
+@dataclass
+class ReviewRecord:
+    timestamp: float
+    model: str
+    profile: str
+    diff_chars: int
+    diff_tokens: int
+    file_count: int
+    duration: float  # seconds in claude calls, excluding the wait for a slot
+    shards: int = 1
+    partial: bool = False  # timed out or some shards failed
+    # Usage claude reported (0 in records written before it was recorded)
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cache_read_tokens: int = 0
+    cache_creation_tokens: int = 0
+    cost_usd: float = 0.0
+
+
+def history_path() -> Path:
+    return get_cache_dir() / HISTORY_FILENAME
+
+
+def record_review(record: ReviewRecord) -> None:
+    """Append a completed review to the local history. Never raises."""
+    path = history_path()
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(asdict(record)) + "\n")
+    except OSError:
+        pass
+
+
+def load_history() -> list[ReviewRecord]:
+    path = history_path()
+    if not path.exists():
+        return []
+    records: list[ReviewRecord] = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                records.append(ReviewRecord(**json.loads(line)))
+            except (json.JSONDecodeError, TypeError):
+                continue
+    return records
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """Linear-interpolated percentile (0-100) of a non-empty list."""
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    low = math.floor(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def expected_latency(
+    tokens: int,
+    model: str,
+    records: list[ReviewRecord] | None = None,
+) -> tuple[float, int] | None:
+    """Estimate review duration in seconds from past reviews.
+
+    Uses the median seconds-per-token of past reviews with the same model,
+    falling back to all models. Returns (seconds, sample_count), or None when
+    there is no usable history.
+    """
+    if records is None:
+        records = load_history()
+    usable = [r for r in records if r.diff_tokens > 0 and r.duration > 0]
+    same_model = [r for r in usable if r.model == model]
+    sample = same_model or usable
+    if not sample:
+        return None
+    rate = statistics.median(r.duration / r.diff_tokens for r in sample)
+    return rate * tokens, len(sample)
+
+
+# Bounds for timeouts picked from history
+MIN_AUTO_TIMEOUT = 60
+MAX_AUTO_TIMEOUT = 3600
+
+
+@dataclass
+class LatencyModel:
+    """Latency of one claude call: intercept + seconds_per_token * tokens.
+
+    ratios holds actual/predicted for every sample, so percentiles of the
+    prediction error give timeouts that past reviews rarely exceeded.
+    """
+
+    model: str
+    intercept: float
+    seconds_per_token: float
+    samples: int
+    ratios: list[float] = field(default_factory=list)
+
+    def predict(self, tokens: int) -> float:
+        return self.intercept + self.seconds_per_token * tokens
+
+    def percentile(self, tokens: int, pct: float) -> float:
+        """Seconds that pct% of past calls of this size finished within."""
+        ratio = percentile(self.ratios, pct) if self.ratios else 1.0
+        return self.predict(tokens) * ratio
+
+    def tokens_for(self, seconds: float) -> int:
+        """Largest diff a call is expected to finish in seconds."""
+        if self.seconds_per_token <= 0:
+            return 0
+        return max(0, int((seconds - self.intercept) / self.seconds_per_token))
+
+
+def _call_samples(records: list[ReviewRecord]) -> list[tuple[float, float]]:
+    """(tokens, seconds) per claude call of the complete reviews in records."""
+    return [
+        (r.diff_tokens / max(r.shards, 1), r.duration / max(r.shards, 1))
+        for r in records
+        if r.diff_tokens > 0 and r.duration > 0 and not r.partial
+    ]
+
+
+def fit_latency_model(
+    model: str,
+    records: list[ReviewRecord] | None = None,
+) -> LatencyModel | None:
+    """Fit a LatencyModel by least squares on past reviews.
+
+    Uses reviews with the same model, falling back to all models, like
+    expected_latency(). Falls back to a line through the origin (median
+    seconds-per-token) when the fit is degenerate or has a negative term.
+    Returns None when there is no usable history.
+    """
+    if records is None:
+        records = load_history()
+    samples = _call_samples([r for r in records if r.model == model]) or _call_samples(records)
+    if not samples:
+        return None
+
+    xs = [x for x, _ in samples]
+    ys = [y for _, y in samples]
+    intercept, slope = 0.0, statistics.median(y / x for x, y in samples)
+    if len(samples) >= 3 and len(set(xs)) > 1:
+        fit_slope, fit_intercept = statistics.linear_regression(xs, ys)
+        if fit_slope > 0 and fit_intercept >= 0:
+            intercept, slope = fit_intercept, fit_slope
+
+    ratios = [y / (intercept + slope * x) for x, y in samples if intercept + slope * x > 0]
+    return LatencyModel(
+        model=model,
+        intercept=intercept,
+        seconds_per_token=slope,
+        samples=len(samples),
+        ratios=sorted(ratios),
+    )
+
+
+def auto_timeout(
+    tokens: int,
+    model: str,
+    pct: float = 95,
+    headroom: float = 1.5,
+    min_samples: int = 10,
+    records: list[ReviewRecord] | None = None,
+) -> int | None:
+    """Timeout for a call of tokens: the pct-th percentile latency times headroom.
+
+    None until there are min_samples past reviews to base it on.
+    """
+    fitted = fit_latency_model(model, records)
+    if fitted is None or fitted.samples < min_samples:
+        return None
+    seconds = fitted.percentile(tokens, pct) * headroom
+    return int(min(max(seconds, MIN_AUTO_TIMEOUT), MAX_AUTO_TIMEOUT))
+
+
+@dataclass
+class HistoryStats:
+    """Distribution of past reviews for one model and profile."""
+
+    model: str
+    profile: str
+    reviews: int
+    partial: int
+    duration: dict[str, float]  # p50, p90, p95, max (seconds)
+    tokens: dict[str, float]  # p50, p95, max
+    files: dict[str, float]  # p50, p95, max
+
+
+def _distribution(values: list[float], pcts: tuple[int, ...]) -> dict[str, float]:
+    summary = {f"p{p}": round(percentile(values, p), 1) for p in pcts}
+    summary["max"] = round(max(values), 1)
+    return summary
+
+
+def summarize_history(records: list[ReviewRecord]) -> list[HistoryStats]:
+    """Group records by (model, profile), busiest first."""
+    groups: dict[tuple[str, str], list[ReviewRecord]] = {}
+    for r in records:
+        groups.setdefault((r.model, r.profile), []).append(r)
+    stats = [
+        HistoryStats(
+            model=model,
+            profile=profile,
+            reviews=len(group),
+            partial=sum(r.partial for r in group),
+            duration=_distribution([r.duration for r in group], (50, 90, 95)),
+            tokens=_distribution([r.diff_tokens for r in group], (50, 95)),
+            files=_distribution([r.file_count for r in group], (50, 95)),
+        )
+        for (model, profile), group in groups.items()
+    ]
+    stats.sort(key=lambda s: s.reviews, reverse=True)
+    return stats
@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+from .config import get_cache_dir
+from .diff import FileDiff, Hunk
+from .findings import parse_finding, shift_lines
+from .profiles import Profile
+
+HUNK_CACHE_DIRNAME = "hunks"
+DEFAULT_TTL_DAYS = 30
+
+
+def profile_digest(profile: Profile) -> str:
+    """Hash of a profile's contents, so editing a profile invalidates its entries."""
+    return hashlib.sha256(json.dumps(asdict(profile), sort_keys=True).encode()).hexdigest()
+
+
+def hunk_key(digest: str, model: str, path: str, hunk: Hunk) -> str:
+    """Content address of a hunk: path plus added and removed lines.
+
+    Offsets and context lines are left out, so the same change cherry-picked
+    onto another branch has the same key.
+    """
+    h = hashlib.sha256(json.dumps([digest, model, path]).encode())
+    for line in hunk.lines:
+        if line.startswith(("+", "-", "\\")):
+            h.update(line.encode())
+            h.update(b"\n")
+    return h.hexdigest()
+
+
+@dataclass
+class CachedHunk:
+    """Findings Claude reported for one hunk, at the line numbers it had then."""
+
+    new_start: int
+    findings: list[str] = field(default_factory=list)
+    created: float = 0.0
+
+    def findings_at(self, path: str, new_start: int) -> list[str]:
+        """The findings moved to a hunk starting at new_start."""
+        if not self.findings:
+            return []
+        text = "\n".join(self.findings)
+        return shift_lines(text, {path: [self.new_start]}, {path: [new_start]}).split("\n")
+
+
+class HunkCache:
+    """Per-hunk findings stored as one JSON file per key under the cache dir."""
+
+    def __init__(self, directory: Path | None = None, ttl_days: float = DEFAULT_TTL_DAYS) -> None:
+        self.directory = directory or get_cache_dir() / HUNK_CACHE_DIRNAME
+        self.ttl = ttl_days * 86400
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> CachedHunk | None:
+        try:
+            data = json.loads(self._path(key).read_text(encoding="utf-8"))
+            entry = CachedHunk(**data)
+        except (OSError, json.JSONDecodeError, TypeError):
+            return None
+        if time.time() - entry.created > self.ttl:
+            return None
+        return entry
+
+    def put(self, key: str, entry: CachedHunk) -> None:
+        """Save an entry. Never raises: a cache that cannot be written is skipped."""
+        path = self._path(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{key[:8]}-")
+        except OSError:
+            return
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(asdict(entry), f)
+            os.replace(tmp, path)
+        except OSError:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+
+    def prune(self) -> int:
+        """Delete entries older than the TTL. Returns files removed."""
+        if not self.directory.is_dir():
+            return 0
+        removed = 0
+        cutoff = time.time() - self.ttl
+        for path in self.directory.glob("*/*.json"):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+                    removed += 1
+            except OSError:
+                continue
+        return removed
+
+
+def split_cached(
+    files: list[FileDiff], cache: HunkCache, digest: str, model: str,
+) -> tuple[list[FileDiff], list[str], int, list[tuple[str, str, Hunk]]]:
+    """Separate hunks reviewed before from the ones Claude still has to see.
+
+    Returns the files with cached hunks removed (files left without hunks
+    are dropped), the cached findings at their new line numbers, how many
+    hunks were cached, and (key, path, hunk) for every uncached hunk so its
+    findings can be stored afterwards.
+    """
+    remaining: list[FileDiff] = []
+    findings: list[str] = []
+    hits = 0
+    misses: list[tuple[str, str, Hunk]] = []
+    for f in files:
+        if not f.hunks:
+            remaining.append(f)
+            continue
+        kept: list[Hunk] = []
+        for hunk in f.hunks:
+            key = hunk_key(digest, model, f.path, hunk)
+            entry = cache.get(key)
+            if entry is None:
+                kept.append(hunk)
+                misses.append((key, f.path, hunk))
+            else:
+                hits += 1
+                findings.extend(entry.findings_at(f.path, hunk.new_start))
+        if kept:
+            remaining.append(
+                FileDiff(path=f.path, header=f.header, hunks=kept, old_path=f.old_path),
+            )
+    return remaining, findings, hits, misses
+
+
+def store_findings(
+    cache: HunkCache, review: str, reviewed: list[tuple[str, str, Hunk]],
+) -> int:
+    """Save each reviewed hunk with the findings of review that fall inside it.
+
+    A hunk with no findings is saved too: it was reviewed and found clean.
+    Returns the number of hunks saved.
+    """
+    by_hunk: dict[str, list[str]] = {key: [] for key, _, _ in reviewed}
+    for line in review.splitlines():
+        finding = parse_finding(line)
+        if finding is None:
+            continue
+        for key, path, hunk in reviewed:
+            end = hunk.new_start + max(hunk.new_count, 1)
+            if path == finding.file and hunk.new_start <= finding.line < end:
+                by_hunk[key].append(finding.text)
+                break
+    now = time.time()
+    for key, _, hunk in reviewed:
+        cache.put(key, CachedHunk(new_start=hunk.new_start, findings=by_hunk[key], created=now))
+    return len(reviewed)
@@ -0,0 +1,584 @@
+from __future__ import annotations
+
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+
+from .config import get_cache_dir
+from .errors import (
+    BudgetExceededError,
+    JobStoreError,
+    ParcFermeError,
+    RateLimitError,
+    ReviewCancelledError,
+)
+from .limiter import AIMDLimiter, Permit
+from .scheduling import Scheduler
+from .timing import span
+
+JOBS_FILENAME = "jobs.sqlite3"
+RESULTS_DIRNAME = "results"
+DEFAULT_MAX_ATTEMPTS = 3
+# Leases are short and renewed while a review runs, so a crashed worker's job
+# becomes claimable again within a minute.
+LEASE_SECONDS = 60.0
+_POLL_SECONDS = 2.0
+
+# Job states. pending -> running -> done | failed | cancelled; a running job
+# whose lease expires (the worker died) is claimable again.
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+STATES = (PENDING, RUNNING, DONE, FAILED, CANCELLED)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id            INTEGER PRIMARY KEY AUTOINCREMENT,
+    repo          TEXT    NOT NULL,
+    pr            INTEGER NOT NULL,
+    head_sha      TEXT    NOT NULL,
+    profile       TEXT    NOT NULL,
+    state         TEXT    NOT NULL DEFAULT 'pending',
+    attempts      INTEGER NOT NULL DEFAULT 0,
+    max_attempts  INTEGER NOT NULL DEFAULT 3,
+    lease_owner   TEXT,
+    lease_expires REAL,
+    result_path   TEXT,
+    error         TEXT,
+    created_at    REAL    NOT NULL,
+    updated_at    REAL    NOT NULL,
+    size          INTEGER,
+    priority      INTEGER NOT NULL DEFAULT 0,
+    UNIQUE (repo, pr, head_sha, profile)
+);
+CREATE INDEX IF NOT EXISTS jobs_dequeue ON jobs (state, id);
+CREATE INDEX IF NOT EXISTS jobs_lease ON jobs (state, lease_expires);
+CREATE INDEX IF NOT EXISTS jobs_pr ON jobs (repo, pr);
+"""
+
+# Columns added since the first release; older stores get them on open
+_ADDED_COLUMNS = {"size": "INTEGER", "priority": "INTEGER NOT NULL DEFAULT 0"}
+
+_COLUMNS = (
+    "id, repo, pr, head_sha, profile, state, attempts, max_attempts, "
+    "lease_owner, lease_expires, result_path, error, created_at, updated_at, size, priority"
+)
+
+
+def default_store_path() -> Path:
+    return get_cache_dir() / JOBS_FILENAME
+
+
+@dataclass
+class StoredJob:
+    id: int
+    repo: str
+    pr: int
+    head_sha: str
+    profile: str
+    state: str
+    attempts: int
+    max_attempts: int
+    lease_owner: str | None
+    lease_expires: float | None
+    result_path: str | None
+    error: str | None
+    created_at: float
+    updated_at: float
+    size: int | None = None  # estimated from the PR's stats, see scheduling
+    priority: int = 0
+
+    def describe(self) -> str:
+        return f"{self.repo}#{self.pr}@{self.head_sha[:7]} ({self.profile})"
+
+
+class JobStore:
+    """SQLite-backed review job queue that survives crashes and restarts.
+
+    Every state change is a single conditional UPDATE, so a job is only ever
+    completed once: a worker whose lease was taken over by another worker
+    cannot mark the job done. Results are written to a file next to the
+    database before the job is marked done, and a re-claimed job whose result
+    file already exists is completed without running the review again.
+
+    Jobs are claimed in the order scheduler picks (smallest first, by default).
+    """
+
+    def __init__(
+        self, path: str | Path | None = None, scheduler: Scheduler | None = None,
+    ) -> None:
+        self.path = Path(path) if path else default_store_path()
+        self.results_dir = self.path.parent / RESULTS_DIRNAME
+        self.scheduler = scheduler or Scheduler()
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(
+                self.path, timeout=30, isolation_level=None, check_same_thread=False,
+            )
+            self._lock = threading.RLock()
+            self._changed = threading.Condition(self._lock)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+            self._migrate()
+        except (OSError, sqlite3.Error) as e:
+            raise JobStoreError(f"Could not open job store {self.path}: {e}")
+
+    def _migrate(self) -> None:
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        for name, declaration in _ADDED_COLUMNS.items():
+            if name in columns:
+                continue
+            try:
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {name} {declaration}")
+            except sqlite3.OperationalError as e:
+                if "duplicate column" not in str(e):  # another process added it first
+                    raise
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def __enter__(self) -> JobStore:
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        # BEGIN IMMEDIATE takes the write lock up front so two processes
+        # cannot both select the same job before either updates it
+        try:
+            with self._lock:
+                self._conn.execute("BEGIN IMMEDIATE")
+                try:
+                    yield self._conn
+                except BaseException:
+                    self._conn.execute("ROLLBACK")
+                    raise
+                self._conn.execute("COMMIT")
+                self._changed.notify_all()
+        except sqlite3.Error as e:
+            raise JobStoreError(f"Job store error: {e}")
+
+    def wait_for_change(self, timeout: float) -> None:
+        """Block until another thread commits a change, or timeout.
+
+        Only sees changes made through this JobStore; other processes are
+        picked up when the timeout expires.
+        """
+        with self._changed:
+            self._changed.wait(timeout)
+
+    def _fetch(self, where: str, params: tuple = ()) -> list[StoredJob]:
+        try:
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT {_COLUMNS} FROM jobs {where}", params,
+                ).fetchall()
+        except sqlite3.Error as e:
+            raise JobStoreError(f"Job store error: {e}")
+        return [StoredJob(*row) for row in rows]
+
+    def get(self, job_id: int) -> StoredJob | None:
+        jobs = self._fetch("WHERE id = ?", (job_id,))
+        return jobs[0] if jobs else None
+
+    def add(
+        self,
+        repo: str,
+        pr: int,
+        head_sha: str,
+        profile: str,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        size: int | None = None,
+        priority: int = 0,
+        requeue: bool = False,
+    ) -> tuple[StoredJob, bool]:
+        """Record a job unless the same (repo, pr, head_sha, profile) exists.
+
+        A pending job that already exists takes the new size and priority
+        (e.g. a label added since it was queued). With requeue, an existing
+        cancelled or failed job is first reset to pending with a fresh
+        attempt budget, e.g. a head that was superseded and then force-pushed
+        back. Returns (job, created).
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO jobs (repo, pr, head_sha, profile, max_attempts, "
+                "created_at, updated_at, size, priority) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (repo, pr, head_sha, profile, max_attempts, now, now, size, priority),
+            )
+            created = cursor.rowcount == 1
+            if not created and requeue:
+                conn.execute(
+                    "UPDATE jobs SET state = ?, attempts = 0, max_attempts = ?, error = NULL, "
+                    "lease_owner = NULL, lease_expires = NULL, updated_at = ? "
+                    "WHERE repo = ? AND pr = ? AND head_sha = ? AND profile = ? "
+                    "AND state IN (?, ?)",
+                    (PENDING, max_attempts, now, repo, pr, head_sha, profile,
+                     CANCELLED, FAILED),
+                )
+            if not created and size is not None:
+                conn.execute(
+                    "UPDATE jobs SET size = ?, priority = ? WHERE repo = ? AND pr = ? "
+                    "AND head_sha = ? AND profile = ? AND state = ?",
+                    (size, priority, repo, pr, head_sha, profile, PENDING),
+                )
+        job = self._fetch(
+            "WHERE repo = ? AND pr = ? AND head_sha = ? AND profile = ?",
+            (repo, pr, head_sha, profile),
+        )[0]
+        return job, created
+
+    def claim(self, owner: str, lease_seconds: float = LEASE_SECONDS) -> StoredJob | None:
+        """Lease the claimable job the scheduler ranks first to owner, or return None.
+
+        Claimable means pending, or running with an expired lease and
+        attempts left.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            # Workers that died on their last attempt leave the job running
+            conn.execute(
+                "UPDATE jobs SET state = ?, lease_owner = NULL, lease_expires = NULL, "
+                "error = COALESCE(error, 'lease expired'), updated_at = ? "
+                "WHERE state = ? AND lease_expires < ? AND attempts >= max_attempts",
+                (FAILED, now, RUNNING, now),
+            )
+            rows = conn.execute(
+                "SELECT id, size, priority, created_at FROM jobs WHERE state = ? "
+                "OR (state = ? AND lease_expires < ? AND attempts < max_attempts)",
+                (PENDING, RUNNING, now),
+            ).fetchall()
+            if not rows:
+                return None
+            job_id = min(
+                rows, key=lambda r: (*self.scheduler.rank(r[1], r[2], now - r[3]), r[0]),
+            )[0]
+            self._lease(conn, job_id, owner, lease_seconds, now)
+        return self.get(job_id)
+
+    def acquire(
+        self, job_id: int, owner: str, lease_seconds: float = LEASE_SECONDS,
+    ) -> StoredJob | None:
+        """Lease a specific job if it is claimable.
+
+        A job still leased to owner itself is claimable too, so a restarted
+        server with a stable owner name picks its own jobs straight back up.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET state = ?, attempts = attempts + 1, lease_owner = ?, "
+                "lease_expires = ?, updated_at = ? WHERE id = ? AND attempts < max_attempts "
+                "AND (state = ? OR (state = ? AND (lease_expires < ? OR lease_owner = ?)))",
+                (RUNNING, owner, now + lease_seconds, now, job_id, PENDING, RUNNING, now, owner),
+            )
+            if cursor.rowcount != 1:
+                return None
+        return self.get(job_id)
+
+    def _lease(
+        self, conn: sqlite3.Connection, job_id: int, owner: str,
+        lease_seconds: float, now: float,
+    ) -> None:
+        conn.execute(
+            "UPDATE jobs SET state = ?, attempts = attempts + 1, lease_owner = ?, "
+            "lease_expires = ?, updated_at = ? WHERE id = ?",
+            (RUNNING, owner, now + lease_seconds, now, job_id),
+        )
+
+    def renew(self, job: StoredJob, lease_seconds: float = LEASE_SECONDS) -> bool:
+        """Extend a lease. Returns False if job.lease_owner no longer holds it."""
+        now = time.time()
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET lease_expires = ?, updated_at = ? "
+                "WHERE id = ? AND state = ? AND lease_owner = ?",
+                (now + lease_seconds, now, job.id, RUNNING, job.lease_owner),
+            )
+            return cursor.rowcount == 1
+
+    def next_lease_expiry(self) -> float | None:
+        """Earliest lease expiry among running jobs, or None if none are running."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MIN(lease_expires) FROM jobs WHERE state = ?", (RUNNING,),
+            ).fetchone()
+        return row[0] if row else None
+
+    def _finish(
+        self,
+        job: StoredJob,
+        state: str,
+        before_commit: Callable[[], None] | None = None,
+        **fields: object,
+    ) -> bool:
+        """Move a leased job to state, only if job.lease_owner still holds it.
+
+        before_commit runs inside the transaction once the update succeeded.
+        """
+        assignments = "".join(f", {name} = ?" for name in fields)
+        now = time.time()
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                f"UPDATE jobs SET state = ?, lease_owner = NULL, lease_expires = NULL, "
+                f"updated_at = ?{assignments} WHERE id = ? AND state = ? AND lease_owner = ?",
+                (state, now, *fields.values(), job.id, RUNNING, job.lease_owner),
+            )
+            if cursor.rowcount != 1:
+                return False
+            if before_commit is not None:
+                before_commit()
+            return True
+
+    def result_file(self, job: StoredJob) -> Path:
+        return self.results_dir / f"{job.id}.md"
+
+    def _write_tmp(self, job: StoredJob, result: str) -> str:
+        path = self.result_file(job)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{job.id}-")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(result)
+        except OSError as e:
+            raise JobStoreError(f"Could not write result for job {job.id}: {e}")
+        return tmp
+
+    def complete(self, job: StoredJob, result: str) -> bool:
+        """Save result and mark the job done.
+
+        Returns False, leaving any earlier result untouched, if the lease was
+        lost. The result file is moved into place while the row is locked; a
+        crash between the two leaves a result that recover() picks up.
+        """
+        path = self.result_file(job)
+        tmp = self._write_tmp(job, result)
+        try:
+            return self._finish(
+                job, DONE, before_commit=lambda: os.replace(tmp, path),
+                result_path=str(path), error=None,
+            )
+        finally:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+
+    def save_result(self, job: StoredJob, result: str) -> bool:
+        """Save result without finishing the job, before acting on it.
+
+        Call it before a side effect that must not be repeated (posting the
+        review as a comment): if the worker dies before complete(), the job is
+        re-claimed and recover() completes it instead of reviewing and posting
+        again. Returns False, saving nothing, if the lease was lost.
+        """
+        path = self.result_file(job)
+        tmp = self._write_tmp(job, result)
+        try:
+            with self._transaction() as conn:
+                held = conn.execute(
+                    "SELECT 1 FROM jobs WHERE id = ? AND state = ? AND lease_owner = ?",
+                    (job.id, RUNNING, job.lease_owner),
+                ).fetchone()
+                if held is not None:
+                    os.replace(tmp, path)
+            return held is not None
+        finally:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+
+    def recover(self, job: StoredJob) -> bool:
+        """Complete a re-claimed job whose result was saved before a crash."""
+        path = self.result_file(job)
+        if not path.exists():
+            return False
+        return self._finish(job, DONE, result_path=str(path), error=None)
+
+    def fail(self, job: StoredJob, error: str) -> bool:
+        """Record a failed attempt; the job goes back to pending if attempts remain."""
+        state = FAILED if job.attempts >= job.max_attempts else PENDING
+        return self._finish(job, state, error=error)
+
+    def release(self, job: StoredJob) -> bool:
+        """Hand a leased job back without using up an attempt (e.g. on shutdown)."""
+        now = time.time()
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET state = ?, attempts = MAX(attempts - 1, 0), "
+                "lease_owner = NULL, lease_expires = NULL, updated_at = ? "
+                "WHERE id = ? AND state = ? AND lease_owner = ?",
+                (PENDING, now, job.id, RUNNING, job.lease_owner),
+            )
+            return cursor.rowcount == 1
+
+    def cancel(self, job: StoredJob, reason: str) -> bool:
+        return self._finish(job, CANCELLED, error=reason)
+
+    def supersede(self, repo: str, pr: int, head_sha: str) -> int:
+        """Cancel pending jobs for a PR whose head is no longer head_sha."""
+        now = time.time()
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET state = ?, error = ?, updated_at = ? "
+                "WHERE repo = ? AND pr = ? AND head_sha != ? AND state = ?",
+                (CANCELLED, f"superseded by {head_sha[:7]}", now, repo, pr, head_sha, PENDING),
+            )
+            return cursor.rowcount
+
+    def retry_failed(self) -> int:
+        """Put failed jobs back in the queue with a fresh attempt budget."""
+        now = time.time()
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET state = ?, attempts = 0, updated_at = ? WHERE state = ?",
+                (PENDING, now, FAILED),
+            )
+            return cursor.rowcount
+
+    def counts(self) -> dict[str, int]:
+        try:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT state, COUNT(*) FROM jobs GROUP BY state",
+                ).fetchall()
+        except sqlite3.Error as e:
+            raise JobStoreError(f"Job store error: {e}")
+        counts = {state: 0 for state in STATES}
+        counts.update(dict(rows))
+        return counts
+
+    def list_jobs(self, state: str | None = None, limit: int = 50) -> list[StoredJob]:
+        if state:
+            return self._fetch("WHERE state = ? ORDER BY id LIMIT ?", (state, limit))
+        return self._fetch("ORDER BY id LIMIT ?", (limit,))
+
+    def unfinished(self) -> list[StoredJob]:
+        return self._fetch("WHERE state IN (?, ?) ORDER BY id", (PENDING, RUNNING))
+
+
+@contextmanager
+def heartbeat(store: JobStore, job: StoredJob, lease_seconds: float = LEASE_SECONDS) -> Iterator[None]:
+    """Renew job's lease in a background thread for the duration of the block."""
+    stop = threading.Event()
+
+    def beat() -> None:
+        while not stop.wait(lease_seconds / 3):
+            try:
+                if not store.renew(job, lease_seconds):
+                    return
+            except JobStoreError:
+                continue
+
+    thread = threading.Thread(target=beat, name=f"parc-ferme-lease-{job.id}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def drain(
+    store: JobStore,
+    review_fn: Callable[[StoredJob], str],
+    owner: str,
+    lease_seconds: float = LEASE_SECONDS,
+    on_event: Callable[[str, StoredJob, str], None] | None = None,
+    limiter: AIMDLimiter | None = None,
+    stop: threading.Event | None = None,
+) -> int:
+    """Claim and review jobs until every job is finished. Returns jobs completed.
+
+    review_fn returns the review text or raises; ReviewCancelledError cancels
+    the job, BudgetExceededError cancels it as skipped, and any other
+    ParcFermeError counts as a failed attempt. Once stop is set (e.g. a batch
+    budget ran out) no further job is claimed; they stay pending. When nothing
+    is claimable but other workers still hold leases, waits for them: either
+    they finish or their lease expires and the job is claimed here.
+
+    With a limiter shared between workers, a job is only claimed while the
+    limiter allows another review. Review latency feeds its additive
+    increase; a RateLimitError cuts it and returns the job to the queue
+    without using up an attempt.
+    """
+    def notify(event: str, job: StoredJob, detail: str = "") -> None:
+        if on_event is not None:
+            on_event(event, job, detail)
+
+    completed = 0
+    while True:
+        if stop is not None and stop.is_set():
+            return completed
+        permit = limiter.acquire() if limiter is not None else None
+        try:
+            job = store.claim(owner, lease_seconds)
+            if job is not None:
+                completed += _review_job(store, job, review_fn, lease_seconds, notify, permit)
+                continue
+        finally:
+            if permit is not None:
+                limiter.release(permit)
+        expiry = store.next_lease_expiry()
+        if expiry is None:
+            return completed
+        store.wait_for_change(min(max(expiry - time.time(), 0.0) + 0.05, _POLL_SECONDS))
+
+
+def _review_job(
+    store: JobStore,
+    job: StoredJob,
+    review_fn: Callable[[StoredJob], str],
+    lease_seconds: float,
+    notify: Callable[..., None],
+    permit: Permit | None,
+) -> bool:
+    """Run one claimed job to an outcome. Returns True if it completed here."""
+    if store.recover(job):
+        notify("recovered", job)
+        return True
+    notify("started", job)
+    span_args: dict[str, object] = {
+        "job": job.describe(), "queued_seconds": round(time.time() - job.created_at, 3),
+    }
+    if job.size is not None:
+        span_args["size"] = job.size
+    if permit is not None:
+        span_args["concurrency"] = permit.limit
+    started = time.perf_counter()
+    try:
+        with span("job", **span_args), heartbeat(store, job, lease_seconds):
+            result = review_fn(job)
+    except ReviewCancelledError as e:
+        store.cancel(job, str(e))
+        notify("cancelled", job, str(e))
+        return False
+    except BudgetExceededError as e:
+        store.cancel(job, str(e))
+        notify("skipped", job, str(e))
+        return False
+    except ParcFermeError as e:
+        if isinstance(e, RateLimitError) and permit is not None:
+            permit.overloaded()
+            store.release(job)
+            notify("throttled", job, str(e))
+            return False
+        store.fail(job, str(e))
+        notify("failed", job, str(e))
+        return False
+    if permit is not None:
+        permit.succeeded(time.perf_counter() - started)
+    if store.complete(job, result):
+        notify("done", job)
+        return True
+    notify("lost", job, "lease taken over by another worker")
+    return False
@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import statistics
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+
+from .timing import counter
+
+DEFAULT_INITIAL_LIMIT = 2
+DEFAULT_BACKOFF = 0.5  # multiplicative decrease on overload
+DEFAULT_LATENCY_TOLERANCE = 2.0  # healthy: within this factor of the recent median
+LATENCY_WINDOW = 20  # recent successful latencies the median is taken over
+_MIN_SAMPLES = 3
+DEFAULT_COOLDOWN = 1.0  # seconds to pause after an overload, doubled per repeat
+_COOLDOWN_MAX = 60.0
+
+
+@dataclass
+class Permit:
+    """One unit of concurrency. Report how the work went before it is released."""
+
+    limit: int  # level when granted
+    epoch: int  # decreases seen when granted
+    outcome: str | None = None  # "success", "overload" or None (neutral)
+    latency: float | None = None
+
+    def succeeded(self, latency: float) -> None:
+        self.outcome = "success"
+        self.latency = latency
+
+    def overloaded(self) -> None:
+        self.outcome = "overload"
+
+
+class AIMDLimiter:
+    """Concurrency limit that finds the highest sustainable level on its own.
+
+    Additive increase: every healthy success adds 1/limit, so the limit grows
+    by one per full window of reviews while latency stays within
+    latency_tolerance of the recent median. Multiplicative decrease: an
+    overload (rate limit) cuts the limit by backoff and pauses new work
+    briefly. Overloads from permits granted before the last cut do not cut
+    again, since they were caused by the level that was already reduced.
+    """
+
+    def __init__(
+        self,
+        initial: int,
+        maximum: int,
+        minimum: int = 1,
+        backoff: float = DEFAULT_BACKOFF,
+        latency_tolerance: float = DEFAULT_LATENCY_TOLERANCE,
+        cooldown: float = DEFAULT_COOLDOWN,
+        name: str = "concurrency",
+    ) -> None:
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.cooldown = cooldown
+        self.name = name
+        self._limit = float(min(max(initial, self.minimum), self.maximum))
+        self._in_flight = 0
+        self._epoch = 0
+        self._overloads = 0  # consecutive, for the cooldown
+        self._resume_at = 0.0
+        self._latencies: deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self._cond = threading.Condition()
+        self.history: list[tuple[float, int]] = [(time.time(), self.limit)]
+        counter(self.name, value=self.limit)
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def acquire(self, timeout: float | None = None) -> Permit | None:
+        """Wait until the limit allows another unit. None if timeout runs out."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                if self._in_flight < self.limit and now >= self._resume_at:
+                    self._in_flight += 1
+                    return Permit(limit=self.limit, epoch=self._epoch)
+                if deadline is not None and now >= deadline:
+                    return None
+                # Wake up when the cooldown ends, the deadline passes or a
+                # permit is released, whichever comes first
+                wait = self._resume_at - now if self._resume_at > now else None
+                if deadline is not None:
+                    wait = deadline - now if wait is None else min(wait, deadline - now)
+                self._cond.wait(wait)
+
+    def release(self, permit: Permit) -> None:
+        """Return a permit and adjust the limit by its outcome."""
+        with self._cond:
+            self._in_flight -= 1
+            if permit.outcome == "success" and permit.latency is not None:
+                self._on_success(permit.latency)
+            elif permit.outcome == "overload":
+                self._on_overload(permit)
+            self._cond.notify_all()
+
+    def _healthy(self, latency: float) -> bool:
+        if len(self._latencies) < _MIN_SAMPLES:
+            return True
+        return latency <= statistics.median(self._latencies) * self.latency_tolerance
+
+    def _on_success(self, latency: float) -> None:
+        self._overloads = 0
+        healthy = self._healthy(latency)
+        self._latencies.append(latency)
+        if healthy and self._limit < self.maximum:
+            self._set_limit(min(self.maximum, self._limit + 1 / self.limit))
+
+    def _on_overload(self, permit: Permit) -> None:
+        self._overloads += 1
+        cooldown = min(self.cooldown * 2 ** (self._overloads - 1), _COOLDOWN_MAX)
+        self._resume_at = max(self._resume_at, time.monotonic() + cooldown)
+        if permit.epoch < self._epoch:
+            return
+        self._epoch += 1
+        self._set_limit(max(float(self.minimum), self._limit * self.backoff))
+
+    def _set_limit(self, value: float) -> None:
+        before = self.limit
+        self._limit = value
+        if self.limit != before:
+            self.history.append((time.time(), self.limit))
+            counter(self.name, value=self.limit)
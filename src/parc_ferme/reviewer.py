@@ -1,13 +1,47 @@
 from __future__ import annotations
 
+import random
+import re
 import shutil
 import subprocess
+import threading
+import time
+from dataclasses import dataclass
 
-from .errors import ReviewError, ToolNotFoundError
+from .diff import CHARS_PER_TOKEN, PackedDiff, estimate_tokens, pack_diff, parse_diff, shard_diff
+from .errors import (
+    RateLimitError,
+    ReviewCancelledError,
+    ReviewError,
+    ReviewTimeoutError,
+    ToolNotFoundError,
+)
 from .github import PRInfo
 from .profiles import Profile
+from .timing import span
+from .usage import CLAUDE_OUTPUT_ARGS, Usage, parse_claude_output
+
+MAX_DIFF_TOKENS = 25_000
+MAX_DIFF_CHARS = MAX_DIFF_TOKENS * CHARS_PER_TOKEN  # ~100KB
+
+_CANCEL_POLL_INTERVAL = 0.2  # seconds
+# What the claude CLI prints when the API throttles (429) or is overloaded (529)
+_RATE_LIMIT_PATTERN = re.compile(
+    r"rate.?limit|too many requests|overloaded|\b(?:429|529)\b", re.IGNORECASE,
+)
+
+PARTIAL_REVIEW_MARKER = "\u26a0\ufe0f PARTIAL REVIEW"
+
+_BUDGET_NOTICE = "{count} of {total} parts were not reviewed: the {limit:,}-token budget was spent"
+
+_SHARD_NOTICE = (
+    "\n\nNOTE: The diff was split into {total} parts that are reviewed separately. "
+    "This is part {index} of {total}; only report on the code in this part."
+)
 
-MAX_DIFF_CHARS = 100_000  # ~100KB
+# Files named in the omitted-files notice; past this a PR with thousands of
+# files (e.g. vendored code) would spend the prompt on the list of paths
+MAX_LISTED_FILES = 100
 
 _TRUNCATION_NOTICE = (
     "\n\n... [DIFF TRUNCATED: exceeded {limit:,} characters. "
@@ -15,6 +49,52 @@ _TRUNCATION_NOTICE = (
 )
 
 
+def fit_diff(diff: str, max_diff_tokens: int = MAX_DIFF_TOKENS) -> PackedDiff:
+    """Fit diff into the token budget by packing whole hunks.
+
+    Input that is not a unified diff, or of which no hunk fits (e.g. a file
+    header alone is over the budget), falls back to character truncation.
+    """
+    tokens = estimate_tokens(diff)
+    if tokens <= max_diff_tokens:
+        return PackedDiff(text=diff, tokens=tokens)
+
+    files = parse_diff(diff)
+    if files:
+        packed = pack_diff(files, max_diff_tokens)
+        if packed.text:
+            return packed
+    limit = max_diff_tokens * CHARS_PER_TOKEN
+    text = diff[:limit] + _TRUNCATION_NOTICE.format(limit=limit)
+    return PackedDiff(text=text, tokens=max_diff_tokens, cut_mid_text=True)
+
+
+def _listed_files(paths: list[str]) -> list[str]:
+    lines = [f"- {path}" for path in paths[:MAX_LISTED_FILES]]
+    if len(paths) > MAX_LISTED_FILES:
+        lines.append(f"- ... and {len(paths) - MAX_LISTED_FILES:,} more files")
+    return lines
+
+
+def format_omitted_notice(packed: PackedDiff, max_diff_tokens: int = MAX_DIFF_TOKENS) -> str:
+    """Prompt section listing the files left out of a packed diff."""
+    if not (packed.omitted_files or packed.partial_files):
+        return ""
+    lines = [
+        "",
+        f"NOTE: The diff exceeded the {max_diff_tokens:,}-token review budget "
+        "and was packed by priority, hunk by hunk.",
+    ]
+    if packed.omitted_files:
+        lines.append("These files were left out entirely and were NOT reviewed:")
+        lines.extend(_listed_files(packed.omitted_files))
+    if packed.partial_files:
+        lines.append("These files were only partially included (some hunks left out):")
+        lines.extend(_listed_files(packed.partial_files))
+    lines.append("Do not report on code that is not in the diff you were given.")
+    return "\n".join(lines)
+
+
 def check_claude_available() -> None:
     if shutil.which("claude") is None:
         raise ToolNotFoundError(
@@ -22,10 +102,17 @@ def check_claude_available() -> None:
         )
 
 
-def build_prompt(pr_info: PRInfo, profile: Profile) -> str:
-    lines = [
-        f"You are a {profile.system_role}. Review this PR diff.",
-        "",
+def build_prompt(pr_info: PRInfo, profile: Profile, conventions: str = "") -> str:
+    """The review instructions for pr_info, sent ahead of the diff.
+
+    conventions (the repository's convention digest) goes right after the
+    role line, ahead of anything specific to the PR, so prompts of PRs on
+    the same base share it as a prefix.
+    """
+    lines = [f"You are a {profile.system_role}. Review this PR diff.", ""]
+    if conventions:
+        lines += [conventions, ""]
+    lines += [
         f"PR: #{pr_info.number} - {pr_info.title}",
         f"Author: {pr_info.author}",
         f"Base branch: {pr_info.base_branch}",
@@ -55,33 +142,250 @@ def build_prompt(pr_info: PRInfo, profile: Profile) -> str:
     return "\n".join(lines)
 
 
+def _run_claude(
+    cmd: list[str],
+    stdin_text: str,
+    timeout: int,
+    cancel: threading.Event | None = None,
+) -> subprocess.CompletedProcess[str]:
+    """Run claude, killing it on timeout or when cancel is set.
+
+    Raises subprocess.TimeoutExpired (with any output produced so far) on
+    timeout, ReviewCancelledError on cancellation and ReviewError if claude
+    cannot be started (e.g. E2BIG: the prompt is over the OS's argument limit).
+    """
+    try:
+        proc = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+    except OSError as e:
+        raise ReviewError(f"Could not run claude: {e}") from e
+    try:
+        if cancel is None:
+            stdout, stderr = proc.communicate(input=stdin_text, timeout=timeout)
+        else:
+            deadline = time.monotonic() + timeout
+            pending_input: str | None = stdin_text
+            while True:
+                if cancel.is_set():
+                    raise ReviewCancelledError("Claude review cancelled")
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise subprocess.TimeoutExpired(cmd, timeout)
+                try:
+                    stdout, stderr = proc.communicate(
+                        input=pending_input,
+                        timeout=min(_CANCEL_POLL_INTERVAL, remaining),
+                    )
+                    break
+                except subprocess.TimeoutExpired:
+                    # communicate() keeps feeding the remaining input on retry
+                    pending_input = None
+    except (subprocess.TimeoutExpired, ReviewCancelledError) as e:
+        proc.kill()
+        stdout, stderr = proc.communicate()
+        if isinstance(e, subprocess.TimeoutExpired):
+            raise subprocess.TimeoutExpired(cmd, timeout, output=stdout, stderr=stderr)
+        raise
+    return subprocess.CompletedProcess(cmd, proc.returncode, stdout, stderr)
+
+
+@dataclass
+class RetryPolicy:
+    """Retries for failed claude calls, with full-jitter exponential backoff."""
+
+    attempts: int = 3  # calls in total, 1 = no retries
+    backoff: float = 2.0  # seconds, doubled per retry
+    max_backoff: float = 30.0
+
+    def delay(self, retry: int) -> float:
+        """Seconds to wait before the retry-th retry (0-based)."""
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** retry))
+
+
+def is_partial_review(review: str) -> bool:
+    """Check if the review was marked incomplete (timeout or failed parts)."""
+    return PARTIAL_REVIEW_MARKER in review
+
+
+def format_partial_review(review: str, reason: str) -> str:
+    return f"{PARTIAL_REVIEW_MARKER}: {reason}. The findings below are incomplete.\n\n{review}"
+
+
+def split_for_review(
+    diff: str,
+    max_diff_tokens: int = MAX_DIFF_TOKENS,
+    max_shards: int = 1,
+) -> tuple[list[PackedDiff], PackedDiff]:
+    """Shards to review diff in, plus a PackedDiff describing all of them.
+
+    A diff within the budget, or max_shards of 1, gives one shard packed by
+    fit_diff(). Larger unified diffs are split by shard_diff().
+    """
+    if max_shards > 1 and estimate_tokens(diff) > max_diff_tokens:
+        files = parse_diff(diff)
+        if files:
+            shards, combined = shard_diff(files, max_diff_tokens, max_shards)
+            if shards:
+                return shards, combined
+    packed = fit_diff(diff, max_diff_tokens)
+    return [packed], packed
+
+
+def _call_claude(
+    cmd: list[str],
+    diff: str,
+    model: str | None,
+    timeout: int,
+    cancel: threading.Event | None,
+    attempt: int,
+    usage: Usage | None = None,
+) -> str:
+    with span("claude", model=model or "default", input_chars=len(diff), attempt=attempt) as span_args:
+        try:
+            result = _run_claude(cmd, diff, timeout, cancel=cancel)
+        except subprocess.TimeoutExpired as e:
+            span_args["timed_out"] = True
+            output, used = parse_claude_output(e.output or "")
+            _charge(usage, used, span_args)
+            if output:
+                span_args["partial"] = True
+                return format_partial_review(output, f"Claude timed out after {timeout}s")
+            raise ReviewTimeoutError(
+                f"Claude review timed out after {timeout}s. "
+                "Try increasing --timeout or review_timeout in config."
+            )
+        except ReviewCancelledError:
+            span_args["cancelled"] = True
+            raise
+        span_args["returncode"] = result.returncode
+        if result.returncode != 0:
+            message = result.stderr.strip() or result.stdout.strip()
+            if _RATE_LIMIT_PATTERN.search(message):
+                span_args["rate_limited"] = True
+                raise RateLimitError(f"Claude is rate limited or overloaded: {message}")
+            raise ReviewError(f"Claude review failed: {result.stderr.strip()}")
+        review, used = parse_claude_output(result.stdout)
+        _charge(usage, used, span_args)
+    return review
+
+
+def _charge(usage: Usage | None, used: Usage | None, span_args: dict[str, object]) -> None:
+    if used is None:
+        return
+    span_args.update(used.span_args())
+    if usage is not None:
+        usage.add(used)
+
+
+def _wait_to_retry(delay: float, attempt: int, cancel: threading.Event | None) -> None:
+    with span("claude.backoff", attempt=attempt, delay=round(delay, 3)):
+        if cancel is None:
+            time.sleep(delay)
+        elif cancel.wait(delay):
+            raise ReviewCancelledError("Claude review cancelled")
+
+
 def run_review(
     prompt: str,
     diff: str,
     model: str | None = None,
     timeout: int = 300,
-    max_diff_chars: int = MAX_DIFF_CHARS,
+    max_diff_tokens: int = MAX_DIFF_TOKENS,
+    cancel: threading.Event | None = None,
+    retry: RetryPolicy | None = None,
+    usage: Usage | None = None,
 ) -> str:
-    if len(diff) > max_diff_chars:
-        diff = diff[:max_diff_chars] + _TRUNCATION_NOTICE.format(limit=max_diff_chars)
+    """Review diff with one claude call, retried per retry on failure.
+
+    Failed calls and rate limits are retried; cancellation is not, and
+    neither is a timeout: output produced before it is returned as a marked
+    partial review, and ReviewTimeoutError is raised if there was none.
+    The tokens, cost and duration claude reports are added to usage.
+    """
+    packed = fit_diff(diff, max_diff_tokens)
+    prompt += format_omitted_notice(packed, max_diff_tokens)
+    diff = packed.text
 
-    cmd = ["claude", "-p", prompt]
+    cmd = ["claude", "-p", prompt, *CLAUDE_OUTPUT_ARGS]
     if model:
         cmd.extend(["--model", model])
 
-    try:
-        result = subprocess.run(
-            cmd,
-            input=diff,
-            capture_output=True,
-            text=True,
-            timeout=timeout,
-        )
-    except subprocess.TimeoutExpired:
-        raise ReviewError(
-            f"Claude review timed out after {timeout}s. "
-            "Try increasing --timeout or review_timeout in config."
+    attempts = max(1, retry.attempts) if retry is not None else 1
+    attempt = 1
+    while True:
+        try:
+            return _call_claude(cmd, diff, model, timeout, cancel, attempt, usage)
+        except (ReviewCancelledError, ReviewTimeoutError):
+            raise
+        except ReviewError:
+            if retry is None or attempt >= attempts:
+                raise
+        _wait_to_retry(retry.delay(attempt - 1), attempt, cancel)
+        attempt += 1
+
+
+def review_shards(
+    prompt: str,
+    shards: list[PackedDiff],
+    combined: PackedDiff,
+    model: str | None = None,
+    timeout: int = 300,
+    max_diff_tokens: int = MAX_DIFF_TOKENS,
+    cancel: threading.Event | None = None,
+    retry: RetryPolicy | None = None,
+    usage: Usage | None = None,
+    max_tokens: int | None = None,
+) -> str:
+    """Review each shard with its own claude call and join the results.
+
+    Every shard is retried on its own, so a flaky call only repeats that
+    shard. A shard that still fails is noted in the review, which is then
+    marked partial; if every shard fails the last error is raised. A
+    RateLimitError is raised at once rather than noted, so that callers
+    (the concurrency limiter, job retries) see the overload. Once the
+    calls have used max_tokens in total, the shards left are not reviewed
+    and the review is marked partial.
+    """
+    prompt += format_omitted_notice(combined, max_diff_tokens * len(shards))
+    usage = usage if usage is not None else Usage()
+    if len(shards) == 1:
+        return run_review(
+            prompt, shards[0].text, model, timeout, max_diff_tokens, cancel, retry, usage,
         )
-    if result.returncode != 0:
-        raise ReviewError(f"Claude review failed: {result.stderr.strip()}")
-    return result.stdout.strip()
+
+    total = len(shards)
+    parts: list[str] = []
+    failed: list[ReviewError] = []
+    unreviewed = ""
+    for index, shard in enumerate(shards, 1):
+        if max_tokens and usage.total_tokens >= max_tokens:
+            unreviewed = _BUDGET_NOTICE.format(
+                count=total - index + 1, total=total, limit=max_tokens,
+            )
+            break
+        with span("review.shard", index=index, total=total, tokens=shard.tokens):
+            try:
+                review = run_review(
+                    prompt + _SHARD_NOTICE.format(index=index, total=total),
+                    shard.text, model, timeout, max_diff_tokens, cancel, retry, usage,
+                )
+            except (ReviewCancelledError, RateLimitError):
+                raise
+            except ReviewError as e:
+                failed.append(e)
+                review = f"This part could not be reviewed: {e}"
+        parts.append(f"### Part {index}/{total}\n\n{review}")
+    if failed and len(failed) == len(parts):
+        raise failed[-1]
+    text = "\n\n".join(parts)
+    if failed:
+        reason = f"{len(failed)} of {total} parts could not be reviewed"
+        return format_partial_review(text, f"{reason}; {unreviewed}" if unreviewed else reason)
+    if unreviewed:
+        return format_partial_review(text, unreviewed)
+    return text
@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass, field
+from pathlib import PurePosixPath
+from typing import Any
+
+from .diff import FileDiff, parse_diff
+
+AUTO_PROFILE = "auto"
+
+# Used when .reviewrc.yml has no auto_profiles
+DEFAULT_AUTO_PROFILES: dict[str, Any] = {
+    "rules": [
+        {
+            "extensions": [".ts", ".html", ".scss", ".css"],
+            "content": r"@angular/|@(Component|Directive|Injectable|NgModule|Pipe)\(|\bngOn\w+\(",
+            "profiles": ["angular"],
+        },
+    ],
+    "fallback": ["default"],
+}
+
+
+@dataclass
+class RoutingRule:
+    """Send files with one of extensions (and content matching, if given) to profiles."""
+
+    profiles: list[str]
+    extensions: list[str] = field(default_factory=list)  # empty matches any file
+    content: str | None = None  # regex searched in the file's hunks
+
+    def __post_init__(self) -> None:
+        self._content = re.compile(self.content) if self.content else None
+
+    def matches(self, f: FileDiff, suffix: str) -> bool:
+        if self.extensions and suffix not in self.extensions:
+            return False
+        if self._content is None:
+            return True
+        return any(self._content.search(h.body) for h in f.hunks)
+
+
+@dataclass
+class FileGroup:
+    profiles: tuple[str, ...]
+    files: list[FileDiff] = field(default_factory=list)
+
+    @property
+    def paths(self) -> list[str]:
+        return [f.path for f in self.files]
+
+
+def build_rules(settings: dict[str, Any]) -> tuple[list[RoutingRule], list[str]]:
+    """Rules and fallback profiles from an auto_profiles config mapping."""
+    rules = [
+        RoutingRule(
+            profiles=list(rule["profiles"]),
+            extensions=list(rule.get("extensions") or []),
+            content=rule.get("content"),
+        )
+        for rule in settings.get("rules") or []
+    ]
+    return rules, list(settings.get("fallback") or DEFAULT_AUTO_PROFILES["fallback"])
+
+
+def classify_files(
+    files: list[FileDiff], rules: list[RoutingRule], fallback: list[str],
+) -> list[FileGroup]:
+    """Group files by the profiles that should review them, in one pass.
+
+    A file goes to the profiles of every rule it matches, in rule order, or
+    to fallback if it matches none. Groups keep the order files appear in.
+    """
+    groups: dict[tuple[str, ...], FileGroup] = {}
+    for f in files:
+        suffix = PurePosixPath(f.path).suffix.lower()
+        profiles: list[str] = []
+        for rule in rules:
+            if rule.matches(f, suffix):
+                profiles.extend(p for p in rule.profiles if p not in profiles)
+        key = tuple(profiles or fallback)
+        groups.setdefault(key, FileGroup(key)).files.append(f)
+    return list(groups.values())
+
+
+def route_diff(
+    diff: str, rules: list[RoutingRule], fallback: list[str],
+) -> dict[str, tuple[list[str], str]]:
+    """Split diff by profile: {profile: (paths, diff text of just those files)}.
+
+    A diff that cannot be parsed goes to the fallback profiles whole.
+    """
+    files = parse_diff(diff)
+    if not files:
+        return {name: ([], diff) for name in fallback}
+    routed: dict[str, list[FileDiff]] = {}
+    for group in classify_files(files, rules, fallback):
+        for name in group.profiles:
+            routed.setdefault(name, []).extend(group.files)
+    order = {id(f): i for i, f in enumerate(files)}
+    result: dict[str, tuple[list[str], str]] = {}
+    for name, routed_files in routed.items():
+        routed_files.sort(key=lambda f: order[id(f)])
+        text = "\n".join(f.text() for f in routed_files) + "\n"
+        result[name] = ([f.path for f in routed_files], text)
+    return result
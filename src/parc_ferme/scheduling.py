@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+from collections.abc import Iterable
+from dataclasses import dataclass, field
+
+SCHEDULING_ORDERS = ("sjf", "fifo")
+DEFAULT_AGING_SECONDS = 600.0
+# Besides its changed lines, every file adds a diff header, context lines and
+# its own part of the prompt: about this many lines' worth of review time.
+LINES_PER_FILE = 20
+
+
+def estimate_size(additions: int, deletions: int, changed_files: int) -> int:
+    """Rough size of a review in diff lines, from a PR's stats alone.
+
+    The stats come with `gh pr view` and webhook payloads, so jobs can be
+    ordered before any diff is fetched.
+    """
+    return max(additions, 0) + max(deletions, 0) + LINES_PER_FILE * max(changed_files, 0)
+
+
+@dataclass
+class Scheduler:
+    """The order in which queued reviews start.
+
+    "sjf" starts the smallest job first, which minimizes the mean wait of a
+    queue; "fifo" keeps arrival order. With sjf, a job's effective size halves
+    for every aging_seconds it has waited, so large PRs are not starved by a
+    stream of small ones. A job's priority (the highest label_priority among
+    its labels, 0 without one) ranks above its size. Ties go to the older job.
+    """
+
+    order: str = "sjf"
+    aging_seconds: float = DEFAULT_AGING_SECONDS
+    label_priority: dict[str, int] = field(default_factory=dict)
+
+    def priority(self, labels: Iterable[str]) -> int:
+        matched = [self.label_priority[label] for label in labels if label in self.label_priority]
+        return max(matched, default=0)
+
+    def rank(self, size: int | None, priority: int, waited: float) -> tuple[int, float]:
+        """Sort key of a job that has waited `waited` seconds; lowest starts first.
+
+        A job with no size estimate ranks as the smallest.
+        """
+        if self.order == "fifo" or not size:
+            return -priority, 0.0
+        if not self.aging_seconds:
+            return -priority, float(size)
+        return -priority, size * 0.5 ** (max(waited, 0.0) / self.aging_seconds)
@@ -0,0 +1,428 @@
+from __future__ import annotations
+
+import hashlib
+import hmac
+import json
+import socket
+import sys
+import threading
+import time
+from collections import deque
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from datetime import datetime
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+from .errors import ParcFermeError, ReviewCancelledError
+from .jobs import DONE, JobStore, heartbeat
+from .scheduling import Scheduler, estimate_size
+from .session import ReviewSession
+from .usage import BatchBudget
+
+REVIEW_ACTIONS = frozenset({"opened", "synchronize", "reopened", "ready_for_review"})
+MAX_PAYLOAD_BYTES = 25 * 1024 * 1024  # GitHub caps webhook payloads at 25MB
+
+JobKey = tuple[str, int]
+
+
+def _log(msg: str) -> None:
+    stamp = datetime.now().strftime("%H:%M:%S")
+    print(f"[{stamp}] {msg}", file=sys.stderr, flush=True)
+
+
+@dataclass
+class ReviewJob:
+    repo: str
+    pr: int
+    head_sha: str
+    enqueued_at: float = field(default_factory=time.time)
+    stored_id: int | None = None
+    size: int | None = None
+    priority: int = 0
+    cancel: threading.Event = field(default_factory=threading.Event, repr=False, compare=False)
+    # Saves the review in the job store before it is posted (see JobStore.save_result)
+    save_result: Callable[[str], bool] | None = field(default=None, repr=False, compare=False)
+
+    @property
+    def key(self) -> JobKey:
+        return (self.repo, self.pr)
+
+    def describe(self) -> str:
+        return f"{self.repo}#{self.pr}@{self.head_sha[:7]}"
+
+
+class ReviewQueue:
+    """In-process work queue that keeps only the newest head SHA per PR.
+
+    A push that supersedes a pending job replaces it in place (keeping its
+    position in the queue and its time waited). A push that supersedes a
+    running job sets that job's cancel event. At most one job per PR runs at
+    a time, and jobs start in the order scheduler picks.
+    """
+
+    def __init__(self, scheduler: Scheduler | None = None) -> None:
+        self.scheduler = scheduler or Scheduler()
+        self._cond = threading.Condition()
+        self._order: deque[JobKey] = deque()
+        self._pending: dict[JobKey, ReviewJob] = {}
+        self._running: dict[JobKey, ReviewJob] = {}
+        self._closed = False
+        self.cancelled = 0
+
+    def put(self, job: ReviewJob) -> str:
+        """Enqueue job. Returns 'queued', 'coalesced' or 'duplicate'."""
+        with self._cond:
+            running = self._running.get(job.key)
+            if running is not None:
+                if running.head_sha == job.head_sha:
+                    return "duplicate"
+                if not running.cancel.is_set():
+                    running.cancel.set()
+                    self.cancelled += 1
+
+            pending = self._pending.get(job.key)
+            if pending is not None:
+                if pending.head_sha == job.head_sha:
+                    return "duplicate"
+                job.enqueued_at = pending.enqueued_at
+                self._pending[job.key] = job
+                return "coalesced"
+
+            self._pending[job.key] = job
+            self._order.append(job.key)
+            self._cond.notify()
+            return "queued"
+
+    def get(self, timeout: float | None = None) -> ReviewJob | None:
+        """Take the first-ranked job whose PR is not already being reviewed.
+
+        Returns None when the queue is closed or timeout expires.
+        """
+        with self._cond:
+            while True:
+                now = time.time()
+                best: tuple[tuple[int, float], int] | None = None
+                for i, key in enumerate(self._order):
+                    if key in self._running:
+                        continue
+                    job = self._pending[key]
+                    rank = self.scheduler.rank(job.size, job.priority, now - job.enqueued_at)
+                    if best is None or rank < best[0]:
+                        best = (rank, i)
+                if best is not None:
+                    key = self._order[best[1]]
+                    del self._order[best[1]]
+                    job = self._pending.pop(key)
+                    self._running[key] = job
+                    return job
+                if self._closed:
+                    return None
+                if not self._cond.wait(timeout):
+                    return None
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def done(self, job: ReviewJob) -> None:
+        with self._cond:
+            if self._running.get(job.key) is job:
+                del self._running[job.key]
+            self._cond.notify_all()
+
+    def close(self) -> None:
+        """Stop handing out jobs and cancel everything in flight."""
+        with self._cond:
+            self._closed = True
+            for job in self._running.values():
+                job.cancel.set()
+            self._cond.notify_all()
+
+    def stats(self) -> dict[str, int]:
+        with self._cond:
+            return {
+                "pending": len(self._pending),
+                "running": len(self._running),
+                "cancelled": self.cancelled,
+            }
+
+
+def verify_signature(secret: str, body: bytes, signature: str | None) -> bool:
+    """Check an X-Hub-Signature-256 header against the payload."""
+    if not signature or not signature.startswith("sha256="):
+        return False
+    expected = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature[len("sha256="):])
+
+
+def parse_pull_request_event(
+    payload: dict[str, Any], scheduler: Scheduler | None = None,
+) -> ReviewJob | None:
+    """Build a job from a pull_request webhook payload, or None to ignore it.
+
+    The job's size comes from the payload's diff stats and its priority
+    from its labels, as scheduler rates them.
+    """
+    if payload.get("action") not in REVIEW_ACTIONS:
+        return None
+    pr = payload.get("pull_request") or {}
+    if pr.get("draft"):
+        return None
+    try:
+        job = ReviewJob(
+            repo=payload["repository"]["full_name"],
+            pr=int(pr["number"]),
+            head_sha=pr["head"]["sha"],
+        )
+    except (KeyError, TypeError, ValueError):
+        return None
+    stats = [pr.get(key) for key in ("additions", "deletions", "changed_files")]
+    if all(isinstance(value, int) for value in stats):
+        job.size = estimate_size(*stats)
+    if scheduler is not None:
+        labels = [label.get("name") for label in pr.get("labels") or [] if isinstance(label, dict)]
+        job.priority = scheduler.priority(label for label in labels if label)
+    return job
+
+
+class _WebhookHandler(BaseHTTPRequestHandler):
+    server: _HTTPServer
+
+    def _reply(self, status: int, body: dict[str, Any]) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self) -> None:  # noqa: N802
+        if self.path == "/healthz":
+            self._reply(200, {"status": "ok", **self.server.review_server.queue.stats()})
+        else:
+            self._reply(404, {"error": "not found"})
+
+    def do_POST(self) -> None:  # noqa: N802
+        try:
+            length = int(self.headers.get("Content-Length", "0"))
+        except ValueError:
+            length = -1
+        if length < 0 or length > MAX_PAYLOAD_BYTES:
+            self._reply(413, {"error": "payload too large"})
+            return
+        body = self.rfile.read(length)
+        status, reply = self.server.review_server.handle_delivery(
+            self.headers.get("X-GitHub-Event", ""),
+            body,
+            self.headers.get("X-Hub-Signature-256"),
+        )
+        self._reply(status, reply)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        if self.server.review_server.verbose:
+            _log(f"{self.address_string()} {format % args}")
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    review_server: ReviewServer
+
+
+class ReviewServer:
+    """HTTP listener for pull_request webhooks feeding a pool of review workers."""
+
+    def __init__(
+        self,
+        review_fn: Callable[[ReviewJob], Any],
+        host: str = "127.0.0.1",
+        port: int = 8080,
+        workers: int = 2,
+        secret: str | None = None,
+        verbose: bool = False,
+        store: JobStore | None = None,
+        profile_name: str = "default",
+        scheduler: Scheduler | None = None,
+    ) -> None:
+        self.review_fn = review_fn
+        self.secret = secret
+        self.verbose = verbose
+        self.store = store
+        self.profile_name = profile_name
+        self.scheduler = scheduler or Scheduler()
+        self.queue = ReviewQueue(self.scheduler)
+        self.httpd = _HTTPServer((host, port), _WebhookHandler)
+        self.httpd.review_server = self
+        self._workers = [
+            threading.Thread(target=self._work, name=f"parc-ferme-worker-{i}", daemon=True)
+            for i in range(max(1, workers))
+        ]
+        self._http_thread: threading.Thread | None = None
+        # Stable across restarts so jobs leased before a crash are re-acquired
+        self.owner = f"serve@{socket.gethostname()}:{self.address[1]}"
+
+    @property
+    def address(self) -> tuple[str, int]:
+        host, port = self.httpd.server_address[:2]
+        return str(host), int(port)
+
+    def handle_delivery(
+        self, event: str, body: bytes, signature: str | None,
+    ) -> tuple[int, dict[str, Any]]:
+        if self.secret and not verify_signature(self.secret, body, signature):
+            return 401, {"error": "invalid signature"}
+        if event == "ping":
+            return 200, {"status": "pong"}
+        if event != "pull_request":
+            return 202, {"status": "ignored", "reason": f"event '{event}'"}
+        try:
+            payload = json.loads(body)
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return 400, {"error": "invalid JSON"}
+        job = (
+            parse_pull_request_event(payload, self.scheduler) if isinstance(payload, dict)
+            else None
+        )
+        if job is None:
+            return 202, {"status": "ignored", "reason": "action or draft state"}
+        if self.store is not None:
+            # A new delivery for a cancelled or failed head reviews it again
+            stored, _ = self.store.add(
+                job.repo, job.pr, job.head_sha, self.profile_name,
+                size=job.size, priority=job.priority, requeue=True,
+            )
+            if stored.state == DONE:
+                return 200, {"status": "already reviewed", "job": job.describe()}
+            self.store.supersede(job.repo, job.pr, job.head_sha)
+            job.stored_id = stored.id
+        status = self.queue.put(job)
+        _log(f"{status}: {job.describe()}")
+        return 202, {"status": status, "job": job.describe()}
+
+    def resume(self) -> int:
+        """Re-queue unfinished jobs from the store. Returns how many."""
+        if self.store is None:
+            return 0
+        resumed = 0
+        for stored in self.store.unfinished():
+            if stored.profile != self.profile_name:
+                continue
+            job = ReviewJob(
+                stored.repo, stored.pr, stored.head_sha, enqueued_at=stored.created_at,
+                stored_id=stored.id, size=stored.size, priority=stored.priority,
+            )
+            if self.queue.put(job) != "duplicate":
+                resumed += 1
+        return resumed
+
+    def _run_job(self, job: ReviewJob) -> None:
+        if self.store is None or job.stored_id is None:
+            self.review_fn(job)
+            return
+        stored = self.store.acquire(job.stored_id, self.owner)
+        if stored is None:
+            _log(f"skipped: {job.describe()} (finished or claimed elsewhere)")
+            return
+        if self.store.recover(stored):
+            return
+        job.save_result = partial(self.store.save_result, stored)
+        try:
+            with heartbeat(self.store, stored):
+                result = self.review_fn(job)
+        except ReviewCancelledError as e:
+            if self.queue.closed:
+                # Shutting down, not superseded: leave it for the next start
+                self.store.release(stored)
+            else:
+                self.store.cancel(stored, str(e))
+            raise
+        except Exception as e:
+            self.store.fail(stored, str(e))
+            raise
+        self.store.complete(stored, result if isinstance(result, str) else "")
+
+    def _work(self) -> None:
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+            started = time.monotonic()
+            try:
+                self._run_job(job)
+                _log(f"reviewed: {job.describe()} in {time.monotonic() - started:.1f}s")
+            except ReviewCancelledError:
+                _log(f"superseded: {job.describe()}")
+            except ParcFermeError as e:
+                _log(f"failed: {job.describe()}: {e}")
+            except Exception as e:  # keep the worker alive
+                _log(f"crashed: {job.describe()}: {e!r}")
+            finally:
+                self.queue.done(job)
+
+    def start(self) -> None:
+        """Start workers and the HTTP listener in background threads."""
+        self.resume()
+        for worker in self._workers:
+            worker.start()
+        self._http_thread = threading.Thread(
+            target=self.httpd.serve_forever, name="parc-ferme-http", daemon=True,
+        )
+        self._http_thread.start()
+
+    def serve_forever(self) -> None:
+        resumed = self.resume()
+        if resumed:
+            _log(f"resumed {resumed} unfinished jobs from {self.store.path}")
+        for worker in self._workers:
+            worker.start()
+        self.httpd.serve_forever()
+
+    def shutdown(self, timeout: float = 10.0) -> None:
+        if self._http_thread is not None:
+            self.httpd.shutdown()
+        self.httpd.server_close()
+        self.queue.close()
+        for worker in self._workers:
+            if worker.is_alive():
+                worker.join(timeout)
+
+
+def make_pr_reviewer(
+    session: ReviewSession,
+    profile_name: str | None = None,
+    timeout: int | None = None,
+    comment: bool = False,
+    comment_mode: str | None = None,
+    max_tokens: int | None = None,
+    budget: BatchBudget | None = None,
+) -> Callable[[ReviewJob], str]:
+    """Return a review_fn that fetches, reviews and optionally comments on a job.
+
+    A job with save_result gets its review saved before the comment is
+    posted, so a worker that dies in between does not post it twice. With a
+    budget, each review is charged to it and runs on the model it picks (its
+    cheaper model once most of it is spent).
+    """
+
+    def review(job: ReviewJob) -> str:
+        prepared = session.prepare_profiles(
+            str(job.pr), repo=job.repo, profile=profile_name, max_tokens=max_tokens,
+        )
+        head_sha = prepared[0].pr_info.head_sha
+        if head_sha and head_sha != job.head_sha:
+            # A newer push exists; its own webhook will trigger a review
+            raise ReviewCancelledError(f"head moved to {head_sha[:7]}")
+        model = budget.model_for(session.model) if budget is not None else None
+        result = session.run_profiles(prepared, model, timeout=timeout, cancel=job.cancel)
+        if budget is not None:
+            budget.charge(result.usage)
+        if job.cancel.is_set():
+            raise ReviewCancelledError("superseded while reviewing")
+        if comment:
+            if job.save_result is not None and not job.save_result(result.review):
+                raise ReviewCancelledError("lease lost before posting the comment")
+            session.post(result, comment_mode)
+        return result.review
+
+    return review
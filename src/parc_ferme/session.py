@@ -0,0 +1,1230 @@
+from __future__ import annotations
+
+import contextvars
+import hashlib
+import json
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+from pathlib import Path
+from typing import Any
+
+from .config import load_config, load_config_snapshot
+from .context import (
+    DEFAULT_CONTEXT_BYTES,
+    MAX_CONTEXT_BYTES,
+    CatFile,
+    build_context,
+    find_work_tree,
+    merge_base,
+)
+from .conventions import DEFAULT_DIGEST_BYTES, ConventionCache, convention_digest
+from .diff import (
+    CHARS_PER_TOKEN,
+    FileDiff,
+    Hunk,
+    PackedDiff,
+    diff_fingerprint,
+    estimate_tokens,
+    hunk_anchors,
+    parse_diff,
+)
+from .errors import (
+    BudgetExceededError,
+    GitHubError,
+    RateLimitError,
+    ReviewCancelledError,
+    ReviewError,
+    SymbolIndexError,
+)
+from .estimate import Estimate, PlannedReview, estimate_plans
+from .fastpath import FAST_PATH_CHECKS, classify_trivial, lgtm_review
+from .findings import merge_sections, shift_lines
+from .formatter import format_comment, join_sections
+from .github import (
+    PRInfo,
+    check_gh_available,
+    get_changed_files,
+    get_compare_diff,
+    get_pr_commits,
+    get_pr_diff,
+    get_pr_info,
+    list_open_prs,
+    post_comment,
+    split_pr_ref,
+    stack_parent,
+    update_comment,
+)
+from .history import ReviewRecord, auto_timeout, fit_latency_model, record_review
+from .hunkcache import HunkCache, profile_digest, split_cached, store_findings
+from .profiles import Profile, get_profile
+from .reviewer import (
+    MAX_DIFF_TOKENS,
+    PARTIAL_REVIEW_MARKER,
+    RetryPolicy,
+    build_prompt,
+    check_claude_available,
+    is_partial_review,
+    review_shards,
+    split_for_review,
+)
+from .routing import AUTO_PROFILE, DEFAULT_AUTO_PROFILES, build_rules, route_diff
+from .scheduling import Scheduler
+from .singleflight import CONCURRENT, DEFAULT_TTL, EARLIER, flight_key, single_flight
+from .slots import claude_slot
+from .symbols import DEFAULT_SYMBOL_TOKENS, SymbolIndex, render_symbols
+from .timing import span
+from .usage import Usage
+
+DEFAULT_MAX_CONCURRENCY = 8
+MIN_SHARD_TOKENS = 2_000
+OUTPUT_RESERVE_TOKENS = 2_000  # room left in a token budget for the review itself
+
+_ROUTED_NOTICE = (
+    "\n\nNOTE: This diff holds only the files of the PR that are relevant to this "
+    "review; the other files are reviewed separately."
+)
+_STACKED_NOTICE = (
+    "\n\nNOTE: This PR is stacked on PR #{number} ({title}). The diff holds only the "
+    "changes this PR adds on top of it; PR #{number} is reviewed on its own."
+)
+_SINCE_NOTICE = (
+    "\n\nNOTE: This PR was already reviewed at commit {sha}. The diff holds only the "
+    "changes pushed since then; review those."
+)
+
+
+def has_critical_issues(review: str) -> bool:
+    """Check if the review text contains CRITICAL severity markers."""
+    return bool(re.search(r"\bCRITICAL\b", review))
+
+
+@dataclass
+class PreparedReview:
+    """A PR that has been looked up and has a prompt, but no review yet."""
+
+    pr: str
+    repo: str | None
+    pr_info: PRInfo
+    profile_name: str
+    profile: Profile
+    prompt: str
+    changed_files: list[str] = field(default_factory=list)
+    diff_tokens: int = 0
+    packed: PackedDiff | None = None  # every shard together
+    shards: list[PackedDiff] = field(default_factory=list)
+    shard_tokens: int = MAX_DIFF_TOKENS  # token budget of each shard
+    diff: str | None = None  # fetched on first use, or preset to a part of the PR (auto profiles)
+    routed_files: list[str] = field(default_factory=list)  # files in diff
+    fast_path: str | None = None  # why Claude is not needed, if it is not
+    fingerprint: str = ""  # diff_fingerprint() of diff, the single-flight key
+    anchors: dict[str, list[int]] = field(default_factory=dict)  # hunk_anchors() of diff
+    cached_hunks: int = 0  # hunks reviewed before, left out of shards
+    cached_findings: list[str] = field(default_factory=list)  # their findings, at today's lines
+    uncached_hunks: list[tuple[str, str, Hunk]] = field(default_factory=list)  # to cache
+    parent: PRInfo | None = None  # the open PR this one is stacked on
+    since: str = ""  # head commit of an earlier review; only what came after it is reviewed
+    context_bytes: int = 0  # enclosing code added to the prompt
+    symbols_added: bool = False  # referenced signatures from the symbol index added
+    max_tokens: int | None = None  # token budget of the review, all claude calls together
+    over_budget: int = 0  # tokens the whole diff would have needed, if packed to max_tokens
+
+    @property
+    def cached_only(self) -> bool:
+        """Every hunk was found in the hunk cache; Claude has nothing to review."""
+        return bool(self.cached_hunks) and self.packed is not None and not self.packed.text
+
+
+@dataclass
+class ReviewResult:
+    pr_info: PRInfo
+    repo: str | None
+    profile_name: str
+    model: str
+    review: str
+    changed_files: list[str]
+    diff_tokens: int
+    packed: PackedDiff
+    duration: float
+    shared: bool = False  # reused from an identical review (see shared_from)
+    shared_from: str = ""  # singleflight.CONCURRENT or EARLIER when shared
+    slot_wait: float = 0.0  # seconds queued for a host-wide Claude slot
+    shards: int = 1  # claude calls the diff was split into
+    timeout: int = 0  # seconds allowed per claude call
+    sections: list[tuple[str, str]] = field(default_factory=list)  # (profile, review)
+    duplicates: int = 0  # findings dropped because an earlier profile reported them
+    fast_path: str | None = None  # why Claude was skipped, if it was
+    cached_hunks: int = 0  # hunks whose findings came from the hunk cache
+    parent: PRInfo | None = None  # reviewed as its delta over this stacked-on PR
+    since: str = ""  # reviewed as the changes pushed after this commit
+    usage: Usage = field(default_factory=Usage)  # what claude reported for this run
+    comment_posted: bool = False
+    comment_url: str = ""  # as gh printed it, when comment_posted
+    comment_error: str | None = None
+
+    @property
+    def has_critical_issues(self) -> bool:
+        return has_critical_issues(self.review)
+
+    @property
+    def partial(self) -> bool:
+        """Claude timed out mid-review or some shards failed."""
+        return is_partial_review(self.review)
+
+    @property
+    def truncated(self) -> bool:
+        return self.packed.truncated
+
+
+class ReviewSession:
+    """Reusable review context for long-lived processes.
+
+    Loads config once, resolves each profile once and checks for the gh and
+    claude CLIs once. The blocking methods (prepare, run, review) are what the
+    CLI, server and batch use; review_pr is the asyncio entry point and runs
+    them on a private thread pool of max_concurrency workers.
+    """
+
+    def __init__(
+        self,
+        config: dict[str, Any] | None = None,
+        *,
+        config_path: str | None = None,
+        config_snapshot: str | None = None,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    ) -> None:
+        if config is None:
+            with span("config.load"):
+                if config_snapshot:
+                    config = load_config_snapshot(config_snapshot)
+                else:
+                    config = load_config(config_path)
+        self.config = config
+        self.max_concurrency = max(1, max_concurrency)
+        self._profiles: dict[str, Profile] = {}
+        self._tools_checked: set[str] = set()
+        self._lock = threading.Lock()
+        self._executor: ThreadPoolExecutor | None = None
+        self._hunk_cache: HunkCache | None = None
+        self._cat_files: dict[Path, CatFile] = {}
+        self._symbol_indexes: dict[Path, SymbolIndex] = {}
+        self._conventions: dict[str, str] = {}  # base commit -> digest
+
+    # --- config defaults ---
+
+    @property
+    def default_profile(self) -> str:
+        return self.config.get("default_profile", "default")
+
+    @property
+    def model(self) -> str | None:
+        return self.config.get("claude_model")
+
+    @property
+    def model_name(self) -> str:
+        return self.model or "default"
+
+    @property
+    def timeout(self) -> int:
+        return self.config.get("review_timeout", 300)
+
+    @property
+    def max_concurrent_reviews(self) -> int:
+        return self.config.get("max_concurrent_reviews", 4)
+
+    @property
+    def max_shards(self) -> int:
+        return self.config.get("max_shards", 1)
+
+    @property
+    def retry(self) -> RetryPolicy:
+        return RetryPolicy(**(self.config.get("retry") or {}))
+
+    @property
+    def latency_model(self) -> dict[str, Any]:
+        return self.config.get("latency_model") or {}
+
+    def review_timeout(self, tokens: int, model: str | None = None) -> int:
+        """Timeout for one claude call of tokens.
+
+        With latency_model enabled and enough history, a high percentile of
+        past latency for this size; otherwise the fixed review_timeout.
+        """
+        settings = self.latency_model
+        if settings.get("enabled", True):
+            seconds = auto_timeout(
+                tokens,
+                model or self.model_name,
+                pct=settings.get("percentile", 95),
+                headroom=settings.get("headroom", 1.5),
+                min_samples=settings.get("min_samples", 10),
+            )
+            if seconds is not None:
+                return seconds
+        return self.timeout
+
+    def shard_budget(self, diff_tokens: int, model: str | None = None) -> int:
+        """Token budget per shard that should take about target_seconds.
+
+        Never smaller than needed to fit the diff into max_shards shards and
+        never larger than the prompt allows.
+        """
+        settings = self.latency_model
+        if self.max_shards <= 1 or not settings.get("enabled", True):
+            return MAX_DIFF_TOKENS
+        fitted = fit_latency_model(model or self.model_name)
+        if fitted is None or fitted.samples < settings.get("min_samples", 10):
+            return MAX_DIFF_TOKENS
+        target = fitted.tokens_for(settings.get("target_seconds", 120))
+        needed = -(-diff_tokens // self.max_shards)
+        return min(MAX_DIFF_TOKENS, max(target, needed, MIN_SHARD_TOKENS))
+
+    @property
+    def fast_path(self) -> dict[str, Any]:
+        return self.config.get("fast_path") or {}
+
+    @property
+    def hunk_cache(self) -> dict[str, Any]:
+        return self.config.get("hunk_cache") or {}
+
+    def _get_hunk_cache(self) -> HunkCache:
+        with self._lock:
+            if self._hunk_cache is None:
+                self._hunk_cache = HunkCache(ttl_days=self.hunk_cache.get("ttl_days", 30))
+            return self._hunk_cache
+
+    @property
+    def code_context(self) -> dict[str, Any]:
+        return self.config.get("code_context") or {}
+
+    @property
+    def symbol_index(self) -> dict[str, Any]:
+        return self.config.get("symbol_index") or {}
+
+    def work_tree(self) -> Path | None:
+        """The local clone named by code_context.repo_path (default: the working directory)."""
+        return find_work_tree(Path(self.code_context.get("repo_path") or ".").expanduser())
+
+    def _get_cat_file(self, work_tree: Path) -> CatFile:
+        with self._lock:
+            if work_tree not in self._cat_files:
+                self._cat_files[work_tree] = CatFile(work_tree)
+            return self._cat_files[work_tree]
+
+    def get_symbol_index(self, work_tree: Path) -> SymbolIndex:
+        """The symbol index of work_tree, opened once per session."""
+        with self._lock:
+            if work_tree not in self._symbol_indexes:
+                self._symbol_indexes[work_tree] = SymbolIndex(work_tree)
+            return self._symbol_indexes[work_tree]
+
+    def update_symbol_index(self, work_tree: Path, rev: str = "HEAD") -> tuple[SymbolIndex, int]:
+        """Bring work_tree's index to rev. Returns it and the number of files re-parsed."""
+        cat = self._get_cat_file(work_tree)
+        commit = cat.resolve(rev)
+        if commit is None:
+            raise SymbolIndexError(f"{rev} is not a commit in {work_tree}")
+        index = self.get_symbol_index(work_tree)
+        with span("symbols.update") as span_args:
+            span_args["files"] = index.update(commit, cat)
+        return index, span_args["files"]
+
+    @property
+    def budgets(self) -> dict[str, Any]:
+        return self.config.get("budgets") or {}
+
+    @property
+    def watch(self) -> dict[str, Any]:
+        return self.config.get("watch") or {}
+
+    @property
+    def scheduler(self) -> Scheduler:
+        return Scheduler(**(self.config.get("scheduling") or {}))
+
+    @property
+    def conventions(self) -> dict[str, Any]:
+        return self.config.get("conventions") or {}
+
+    def repo_conventions(self, pr_info: PRInfo) -> str:
+        """The convention digest of the PR's base commit, or "".
+
+        Built from the lint configs, CODEOWNERS and docs at the tip of the
+        base branch, which must be in the local clone (see code_context).
+        Digests are cached on disk by their source files' blob ids, so one
+        is only built again when a source file changes, and kept per base
+        commit for the life of the session.
+        """
+        settings = self.conventions
+        max_bytes = settings.get("max_bytes", DEFAULT_DIGEST_BYTES)
+        base = pr_info.base_sha
+        if not settings.get("enabled", False) or not max_bytes or not base:
+            return ""
+        with self._lock:
+            if base in self._conventions:
+                return self._conventions[base]
+        work_tree = self.work_tree()
+        if work_tree is None:
+            return ""
+        with span("conventions.digest") as span_args:
+            cat = self._get_cat_file(work_tree)
+            if cat.read(base) is None:
+                span_args["missing"] = True
+                return ""
+            digest, span_args["built"] = convention_digest(
+                cat, base, ConventionCache(), max_bytes,
+            )
+            span_args["bytes"] = len(digest.encode())
+        with self._lock:
+            self._conventions[base] = digest
+        return digest
+
+    @property
+    def auto_profiles(self) -> dict[str, Any]:
+        return self.config.get("auto_profiles") or DEFAULT_AUTO_PROFILES
+
+    @property
+    def single_flight(self) -> dict[str, Any]:
+        return self.config.get("single_flight") or {}
+
+    @property
+    def stacked_prs(self) -> bool:
+        return self.config.get("stacked_prs", {}).get("enabled", False)
+
+    @property
+    def comment_enabled(self) -> bool:
+        return self.config.get("comment", {}).get("enabled", False)
+
+    @property
+    def comment_mode(self) -> str:
+        return self.config.get("comment", {}).get("mode", "create")
+
+    def profile_names(self, spec: str | None = None) -> list[str]:
+        """Split "security,performance" into profile names, checking each.
+
+        Order is kept and repeats are dropped. "auto" stands alone and checks
+        every profile its rules can pick. Raises ValueError for an unknown
+        profile.
+        """
+        names = [name.strip() for name in (spec or self.default_profile).split(",")]
+        names = list(dict.fromkeys(name for name in names if name))
+        if not names:
+            raise ValueError(f"No profile given in {spec!r}")
+        if AUTO_PROFILE in names:
+            if len(names) > 1:
+                raise ValueError(f"'{AUTO_PROFILE}' cannot be combined with other profiles")
+            rules, fallback = build_rules(self.auto_profiles)
+            for name in [*fallback, *(p for rule in rules for p in rule.profiles)]:
+                self.profile(name)
+            return names
+        for name in names:
+            self.profile(name)
+        return names
+
+    def profile(self, name: str | None = None) -> Profile:
+        """Resolve a profile by name (default: the configured one). Cached."""
+        name = name or self.default_profile
+        with self._lock:
+            if name not in self._profiles:
+                self._profiles[name] = get_profile(name, self.config.get("custom_profiles"))
+            return self._profiles[name]
+
+    def check_tools(self, claude: bool = True) -> None:
+        """Raise ToolNotFoundError if gh (or claude) is missing. Checked once."""
+        needed = ["gh", "claude"] if claude else ["gh"]
+        missing = [tool for tool in needed if tool not in self._tools_checked]
+        if not missing:
+            return
+        with span("tools.check"):
+            if "gh" in missing:
+                check_gh_available()
+            if "claude" in missing:
+                check_claude_available()
+        self._tools_checked.update(missing)
+
+    # --- blocking API ---
+
+    def prepare(
+        self,
+        pr: str,
+        repo: str | None = None,
+        profile: str | None = None,
+        stacked: bool | None = None,
+        max_tokens: int | None = None,
+        since: str = "",
+    ) -> PreparedReview:
+        """Look up the PR and its changed files and build the prompt.
+
+        With stacked (default: the stacked_prs config), a PR built on top of
+        another open PR gets prepared.parent set and is reviewed as the
+        changes it adds over that PR. With since (the head commit of an
+        earlier review), only the changes pushed after it are reviewed.
+        max_tokens (default: the budgets.max_tokens_per_pr config) caps the
+        review's tokens; see fetch_diff().
+        """
+        profile_name = profile or self.default_profile
+        resolved = self.profile(profile_name)
+        pr_info = get_pr_info(pr, repo=repo)
+        changed_files = get_changed_files(pr, repo=repo)
+        parent = (
+            self.find_parent(pr, repo, pr_info) if self._stacked(stacked) and not since
+            else None
+        )
+        return PreparedReview(
+            pr=pr,
+            repo=repo,
+            pr_info=pr_info,
+            profile_name=profile_name,
+            profile=resolved,
+            prompt=self._build_prompt(pr_info, resolved, parent, since),
+            changed_files=changed_files,
+            parent=parent,
+            since=since,
+            max_tokens=self._max_tokens(max_tokens),
+        )
+
+    def prepare_profiles(
+        self,
+        pr: str,
+        repo: str | None = None,
+        profile: str | None = None,
+        stacked: bool | None = None,
+        max_tokens: int | None = None,
+        since: str = "",
+    ) -> list[PreparedReview]:
+        """prepare() for each profile in a comma-separated spec.
+
+        The PR is looked up once and the prompts differ only in the profile.
+        With "auto", the profiles come from the auto_profiles rules.
+        """
+        names = self.profile_names(profile)
+        if names == [AUTO_PROFILE]:
+            return self._prepare_auto(pr, repo, stacked, max_tokens, since)
+        first = self.prepare(pr, repo, names[0], stacked, max_tokens, since)
+        prepared = [first]
+        for name in names[1:]:
+            resolved = self.profile(name)
+            prepared.append(PreparedReview(
+                pr=pr,
+                repo=repo,
+                pr_info=first.pr_info,
+                profile_name=name,
+                profile=resolved,
+                prompt=self._build_prompt(first.pr_info, resolved, first.parent, since),
+                changed_files=first.changed_files,
+                parent=first.parent,
+                since=since,
+                max_tokens=first.max_tokens,
+            ))
+        return prepared
+
+    def _prepare_auto(
+        self,
+        pr: str,
+        repo: str | None,
+        stacked: bool | None = None,
+        max_tokens: int | None = None,
+        since: str = "",
+    ) -> list[PreparedReview]:
+        """Classify the diff's files and prepare one review per chosen profile.
+
+        Each profile gets only the files routed to it, so prompts stay small
+        and no tokens go to checks that do not apply.
+        """
+        pr_info = get_pr_info(pr, repo=repo)
+        changed_files = get_changed_files(pr, repo=repo)
+        parent = (
+            self.find_parent(pr, repo, pr_info) if self._stacked(stacked) and not since
+            else None
+        )
+        diff = self._pr_diff(pr, repo, pr_info, parent, since)
+        rules, fallback = build_rules(self.auto_profiles)
+        with span("profiles.route") as span_args:
+            routes = route_diff(diff, rules, fallback)
+            span_args["profiles"] = ",".join(routes)
+        prepared: list[PreparedReview] = []
+        for name, (paths, text) in routes.items():
+            resolved = self.profile(name)
+            prompt = self._build_prompt(pr_info, resolved, parent, since)
+            if len(routes) > 1:
+                prompt += _ROUTED_NOTICE
+            prepared.append(PreparedReview(
+                pr=pr,
+                repo=repo,
+                pr_info=pr_info,
+                profile_name=name,
+                profile=resolved,
+                prompt=prompt,
+                changed_files=changed_files,
+                diff=text,
+                routed_files=paths,
+                parent=parent,
+                since=since,
+                max_tokens=self._max_tokens(max_tokens),
+            ))
+        return prepared
+
+    def _stacked(self, stacked: bool | None) -> bool:
+        return self.stacked_prs if stacked is None else stacked
+
+    def _max_tokens(self, max_tokens: int | None) -> int | None:
+        return max_tokens or self.budgets.get("max_tokens_per_pr") or None
+
+    def _build_prompt(
+        self, pr_info: PRInfo, profile: Profile, parent: PRInfo | None, since: str = "",
+    ) -> str:
+        conventions = self.repo_conventions(pr_info)
+        with span("prompt.build"):
+            prompt = build_prompt(pr_info, profile, conventions)
+        if parent is not None:
+            prompt += _STACKED_NOTICE.format(number=parent.number, title=parent.title)
+        if since:
+            prompt += _SINCE_NOTICE.format(sha=since[:12])
+        return prompt
+
+    def find_parent(self, pr: str, repo: str | None, pr_info: PRInfo) -> PRInfo | None:
+        """The open PR that pr is stacked on, or None.
+
+        A PR whose base branch is another open PR's head branch is stacked on
+        it. A PR that targets the trunk but contains another open PR's head
+        commit (a stack whose lower PR has not merged yet) is too; its commits
+        are only fetched when some other open PR shares its base. Lookup
+        failures are treated as "not stacked", so the PR is reviewed whole.
+        """
+        with span("stack.detect") as span_args:
+            try:
+                open_prs = list_open_prs(repo)
+                parent = stack_parent(pr_info, open_prs)
+                if parent is None and any(
+                    p.number != pr_info.number and p.base_branch == pr_info.base_branch
+                    for p in open_prs
+                ):
+                    parent = stack_parent(pr_info, open_prs, get_pr_commits(pr, repo))
+            except GitHubError as e:
+                span_args["error"] = str(e)
+                return None
+            span_args["parent"] = parent.number if parent else None
+        return parent
+
+    def _pr_diff(
+        self, pr: str, repo: str | None, pr_info: PRInfo, parent: PRInfo | None,
+        since: str = "",
+    ) -> str:
+        """The PR's diff, or only what it adds over since or a stacked-on parent."""
+        base = since or (parent.head_sha if parent is not None else "")
+        if not base or not pr_info.head_sha:
+            return get_pr_diff(pr, repo=repo)
+        compare_repo = split_pr_ref(pr_info.url)[0] or repo
+        return get_compare_diff(compare_repo, base, pr_info.head_sha)
+
+    def fetch_diff(self, prepared: PreparedReview, model: str | None = None) -> PackedDiff:
+        """Fetch the diff and pack it into the token budget (once).
+
+        An empty diff, or one the fast_path checks find trivial, gets
+        prepared.fast_path set. Hunks found in the hunk cache are left out
+        and their earlier findings kept in prepared.cached_findings. The code
+        enclosing the remaining hunks is added to the prompt (see
+        code_context). What is left is split
+        into up to max_shards shards, sized by shard_budget(), each reviewed
+        by its own claude call. Returns all shards together.
+
+        When the shards would need more than prepared.max_tokens, the diff is
+        packed into one shard that fits (budgets.on_pr_exceeded: degrade) or
+        BudgetExceededError is raised (skip, or when not even a small shard
+        would fit).
+        """
+        if prepared.packed is None:
+            if prepared.diff is None:
+                prepared.diff = self._pr_diff(
+                    prepared.pr, prepared.repo, prepared.pr_info, prepared.parent,
+                    prepared.since,
+                )
+            diff = prepared.diff
+            files = parse_diff(diff)
+            with span("diff.fingerprint"):
+                prepared.fingerprint = (
+                    diff_fingerprint(files, self.single_flight.get("ignore_whitespace", False))
+                    if files else hashlib.sha256(diff.encode()).hexdigest()
+                )
+                prepared.anchors = hunk_anchors(files)
+            if not diff.strip():
+                # e.g. a stacked PR that adds nothing over its parent
+                prepared.fast_path = "no changes to review"
+            elif self.fast_path.get("enabled", True):
+                with span("fast_path.check") as span_args:
+                    prepared.fast_path = classify_trivial(
+                        files, self.fast_path.get("checks", FAST_PATH_CHECKS),
+                    )
+                    span_args["skip"] = prepared.fast_path is not None
+            review_diff = diff
+            remaining = files
+            if prepared.fast_path is None and files and self.hunk_cache.get("enabled", True):
+                with span("hunk_cache.lookup") as span_args:
+                    remaining, prepared.cached_findings, prepared.cached_hunks, \
+                        prepared.uncached_hunks = split_cached(
+                            files, self._get_hunk_cache(),
+                            profile_digest(prepared.profile), model or "default",
+                        )
+                    span_args["hits"] = prepared.cached_hunks
+                if prepared.cached_hunks:
+                    review_diff = "".join(f"{f.text()}\n" for f in remaining)
+            if prepared.fast_path is None and remaining:
+                # The prompt is one argv entry: what the conventions digest
+                # left of MAX_CONTEXT_BYTES is all the context and symbols get
+                room = MAX_CONTEXT_BYTES - len(self.repo_conventions(prepared.pr_info).encode())
+                context = self._code_context(prepared, remaining, room)
+                if context:
+                    prepared.prompt += f"\n\n{context}"
+                    prepared.context_bytes = len(context.encode())
+                    room -= prepared.context_bytes
+                symbols = self._symbol_context(prepared, remaining, room)
+                if symbols:
+                    prepared.prompt += f"\n\n{symbols}"
+                    prepared.symbols_added = True
+            prepared.diff_tokens = estimate_tokens(diff)
+            shard_tokens = self.shard_budget(estimate_tokens(review_diff), model)
+            shards, packed = split_for_review(review_diff, shard_tokens, self.max_shards)
+            if prepared.max_tokens and prepared.fast_path is None and packed.text:
+                shard_tokens, shards, packed = self._fit_budget(
+                    prepared, review_diff, shard_tokens, shards, packed,
+                )
+            prepared.shard_tokens, prepared.shards, prepared.packed = shard_tokens, shards, packed
+        return prepared.packed
+
+    def _fit_budget(
+        self,
+        prepared: PreparedReview,
+        review_diff: str,
+        shard_tokens: int,
+        shards: list[PackedDiff],
+        packed: PackedDiff,
+    ) -> tuple[int, list[PackedDiff], PackedDiff]:
+        """shards, or one shard packed to fit prepared.max_tokens if they do not."""
+        assert prepared.max_tokens is not None
+        prompt_tokens = estimate_tokens(prepared.prompt)
+        needed = sum(prompt_tokens + shard.tokens + OUTPUT_RESERVE_TOKENS for shard in shards)
+        if needed <= prepared.max_tokens:
+            return shard_tokens, shards, packed
+        with span("budget.pr", needed=needed, budget=prepared.max_tokens) as span_args:
+            allowance = prepared.max_tokens - prompt_tokens - OUTPUT_RESERVE_TOKENS
+            action = self.budgets.get("on_pr_exceeded", "degrade")
+            span_args["action"] = action
+            if action == "skip" or allowance < MIN_SHARD_TOKENS:
+                raise BudgetExceededError(
+                    f"PR #{prepared.pr_info.number} needs ~{needed:,} tokens, over its "
+                    f"{prepared.max_tokens:,}-token budget; skipped"
+                )
+            prepared.over_budget = needed
+            shards, packed = split_for_review(review_diff, allowance, 1)
+        return allowance, shards, packed
+
+    def _code_context(
+        self, prepared: PreparedReview, files: list[FileDiff], room: int = MAX_CONTEXT_BYTES,
+    ) -> str:
+        """The definitions enclosing files' hunks, within room bytes, read from a local clone.
+
+        Needs code_context.repo_path (default: the working directory) to be
+        in a clone that has the PR's head commit; otherwise returns "".
+        Blobs are read through one `git cat-file --batch` process per clone,
+        kept for the life of the session.
+        """
+        settings = self.code_context
+        max_bytes = min(settings.get("max_bytes", DEFAULT_CONTEXT_BYTES), room)
+        head = prepared.pr_info.head_sha
+        if not settings.get("enabled", False) or not max_bytes or not head:
+            return ""
+        work_tree = self.work_tree()
+        if work_tree is None:
+            return ""
+        with span("context.build") as span_args:
+            cat = self._get_cat_file(work_tree)
+            if cat.read(head) is None:
+                span_args["missing"] = True  # the PR is not fetched into this clone
+                return ""
+            base = prepared.since or (
+                prepared.parent.head_sha if prepared.parent else prepared.pr_info.base_sha
+            )
+            base_rev = merge_base(work_tree, base, head) if base else None
+            context = build_context(files, cat, head, base_rev, max_bytes)
+            span_args["bytes"] = len(context.encode())
+        return context
+
+    def _symbol_context(
+        self, prepared: PreparedReview, files: list[FileDiff], room: int = MAX_CONTEXT_BYTES,
+    ) -> str:
+        """Signatures of the symbols files reference, within room bytes, from the symbol index.
+
+        Needs the PR's head commit in the clone, like code context (a clone
+        of another repository must not answer for this one); the index is
+        brought to that commit first. Index errors leave the prompt as it is.
+        """
+        settings = self.symbol_index
+        max_tokens = settings.get("max_tokens", DEFAULT_SYMBOL_TOKENS)
+        max_tokens = min(max_tokens, room // CHARS_PER_TOKEN)
+        if not settings.get("enabled", False) or max_tokens <= 0:
+            return ""
+        work_tree = self.work_tree()
+        if work_tree is None:
+            return ""
+        head = prepared.pr_info.head_sha
+        if not head or self._get_cat_file(work_tree).resolve(head) is None:
+            return ""
+        try:
+            index, _ = self.update_symbol_index(work_tree, head)
+            with span("symbols.lookup") as span_args:
+                text = render_symbols(index, files, max_tokens)
+                span_args["tokens"] = estimate_tokens(text)
+        except SymbolIndexError:
+            return ""
+        return text if len(text.encode()) <= room else ""
+
+    def run(
+        self,
+        prepared: PreparedReview,
+        model: str | None = None,
+        timeout: int | None = None,
+        cancel: threading.Event | None = None,
+    ) -> ReviewResult:
+        """Review a prepared PR with Claude and record it in the history.
+
+        Identical concurrent reviews (same PR, diff fingerprint, profile and
+        model) on this machine share one Claude run unless single_flight is
+        disabled; a rebase that changes no lines reuses the earlier review
+        with its line numbers moved to the new hunk positions. Partial,
+        truncated or budget-cut reviews are not kept for reuse.
+        Failed claude calls are retried per the retry config, shard by shard.
+        Without an explicit timeout, each call gets review_timeout(). A
+        trivial diff (see fast_path) gets the profile's LGTM without Claude.
+        """
+        model = model or self.model
+        packed = self.fetch_diff(prepared, model)
+        if prepared.fast_path is not None:
+            return ReviewResult(
+                pr_info=prepared.pr_info,
+                repo=prepared.repo,
+                profile_name=prepared.profile_name,
+                model=model or "default",
+                review=lgtm_review(prepared.profile),
+                changed_files=prepared.changed_files,
+                diff_tokens=prepared.diff_tokens,
+                packed=packed,
+                duration=0.0,
+                shards=0,
+                fast_path=prepared.fast_path,
+                parent=prepared.parent,
+                since=prepared.since,
+            )
+        if prepared.cached_only:
+            return ReviewResult(
+                pr_info=prepared.pr_info,
+                repo=prepared.repo,
+                profile_name=prepared.profile_name,
+                model=model or "default",
+                review=self._with_cached_findings(prepared, None),
+                changed_files=prepared.changed_files,
+                diff_tokens=prepared.diff_tokens,
+                packed=packed,
+                duration=0.0,
+                shards=0,
+                cached_hunks=prepared.cached_hunks,
+                parent=prepared.parent,
+                since=prepared.since,
+            )
+        if not packed.text:
+            raise ReviewError(
+                f"PR #{prepared.pr_info.number} has nothing to send to Claude: its diff is "
+                f"empty or none of it fits the {prepared.shard_tokens:,}-token review budget"
+            )
+        timeout = timeout or self.review_timeout(
+            max(shard.tokens for shard in prepared.shards), model,
+        )
+
+        slot_wait = 0.0
+        claude_seconds = 0.0
+        usage = Usage()
+
+        def review_once() -> str:
+            nonlocal slot_wait, claude_seconds
+            with claude_slot(self.max_concurrent_reviews, timeout, cancel) as slot:
+                slot_wait = slot.waited
+                call_started = time.perf_counter()
+                try:
+                    review = review_shards(
+                        prepared.prompt,
+                        prepared.shards,
+                        packed,
+                        model=model,
+                        timeout=timeout,
+                        max_diff_tokens=prepared.shard_tokens,
+                        cancel=cancel,
+                        retry=self.retry,
+                        usage=usage,
+                        max_tokens=prepared.max_tokens,
+                    )
+                finally:
+                    claude_seconds = time.perf_counter() - call_started
+            # Keep the hunk positions so a reuse after a rebase can move lines
+            return json.dumps({"review": review, "anchors": prepared.anchors})
+
+        started = time.perf_counter()
+        shared_from = ""
+        with span("review", profile=prepared.profile_name, timeout=timeout) as span_args:
+            if self.single_flight.get("enabled", True):
+                key = flight_key(
+                    prepared.pr_info.url, prepared.fingerprint,
+                    prepared.prompt, model or "default",
+                )
+                raw, shared_from = single_flight(
+                    key,
+                    review_once,
+                    wait_timeout=timeout * len(prepared.shards) + 60,
+                    ttl=self.single_flight.get("ttl", DEFAULT_TTL),
+                    # A rerun (e.g. with a longer timeout) must not get it back
+                    keep=lambda raw: self._complete_review(prepared, json.loads(raw)["review"]),
+                )
+                span_args["shared"] = shared_from
+            else:
+                raw = review_once()
+            span_args.update(usage.span_args())
+        saved = json.loads(raw)
+        review = saved["review"]
+        shared = bool(shared_from)
+        if shared:
+            review = shift_lines(review, saved["anchors"], prepared.anchors)
+        elif prepared.uncached_hunks and self._complete_review(prepared, review):
+            with span("hunk_cache.store"):
+                cache = self._get_hunk_cache()
+                store_findings(cache, review, prepared.uncached_hunks)
+                cache.prune()
+        duration = time.perf_counter() - started
+        if not shared:
+            record_review(ReviewRecord(
+                timestamp=time.time(),
+                model=model or "default",
+                profile=prepared.profile_name,
+                diff_chars=len(packed.text),
+                diff_tokens=packed.tokens,
+                file_count=len(prepared.changed_files),
+                duration=claude_seconds,
+                shards=len(prepared.shards),
+                partial=is_partial_review(review),
+                input_tokens=usage.input_tokens,
+                output_tokens=usage.output_tokens,
+                cache_read_tokens=usage.cache_read_tokens,
+                cache_creation_tokens=usage.cache_creation_tokens,
+                cost_usd=usage.cost_usd,
+            ))
+        return ReviewResult(
+            pr_info=prepared.pr_info,
+            repo=prepared.repo,
+            profile_name=prepared.profile_name,
+            model=model or "default",
+            review=self._with_cached_findings(prepared, review),
+            changed_files=prepared.changed_files,
+            diff_tokens=prepared.diff_tokens,
+            packed=packed,
+            duration=duration,
+            shared=shared,
+            shared_from=shared_from,
+            slot_wait=slot_wait,
+            shards=len(prepared.shards),
+            timeout=timeout,
+            cached_hunks=prepared.cached_hunks,
+            parent=prepared.parent,
+            since=prepared.since,
+            usage=usage,
+        )
+
+    def _complete_review(self, prepared: PreparedReview, review: str) -> bool:
+        """Whether review covers the whole diff, so it may be reused later."""
+        assert prepared.packed is not None
+        return (not is_partial_review(review) and not prepared.packed.truncated
+                and not prepared.over_budget)
+
+    def _with_cached_findings(self, prepared: PreparedReview, review: str | None) -> str:
+        """review (None if Claude was not needed) plus findings from the hunk cache."""
+        if review is None:
+            return "\n".join(prepared.cached_findings) or lgtm_review(prepared.profile)
+        if not prepared.cached_findings:
+            return review
+        return (
+            f"{review}\n\nFrom earlier reviews of identical changes "
+            f"({prepared.cached_hunks} hunks):\n" + "\n".join(prepared.cached_findings)
+        )
+
+    def run_profiles(
+        self,
+        prepared: list[PreparedReview],
+        model: str | None = None,
+        timeout: int | None = None,
+        cancel: threading.Event | None = None,
+    ) -> ReviewResult:
+        """Review one PR with several profiles and merge them into one result.
+
+        The diff is fetched once and the profiles run concurrently, each
+        holding a host-wide Claude slot like any other review. Findings an
+        earlier profile already reported (same file, line and message) are
+        dropped from later sections. A profile that fails is noted and the
+        result marked partial; if every profile fails the last error is raised.
+        Cancellation and RateLimitError are raised as they are, not noted.
+        """
+        if len(prepared) == 1:
+            return self.run(prepared[0], model, timeout, cancel)
+
+        first = prepared[0]
+        if first.diff is None:
+            first.diff = self._pr_diff(
+                first.pr, first.repo, first.pr_info, first.parent, first.since,
+            )
+        for other in prepared[1:]:
+            if other.diff is None:
+                other.diff = first.diff  # each profile packs it for its own hunk cache
+        if any(one.max_tokens for one in prepared):
+            for one in prepared:  # a PR over budget is skipped before any profile runs
+                self.fetch_diff(one, model or self.model)
+
+        started = time.perf_counter()
+        outcomes: list[ReviewResult | ReviewError] = []
+        with span("review.profiles", profiles=len(prepared)):
+            with ThreadPoolExecutor(
+                max_workers=len(prepared), thread_name_prefix="parc-ferme-profile",
+            ) as pool:
+                futures = [
+                    pool.submit(
+                        contextvars.copy_context().run,
+                        self._run_profile, one, model, timeout, cancel,
+                    )
+                    for one in prepared
+                ]
+                outcomes = [future.result() for future in futures]
+
+        results = [o for o in outcomes if isinstance(o, ReviewResult)]
+        failed = [o for o in outcomes if isinstance(o, ReviewError)]
+        if not results:
+            raise failed[-1]
+        usage = Usage()
+        for r in results:
+            usage.add(r.usage)
+        sections, duplicates = merge_sections([
+            (one.profile_name, o.review if isinstance(o, ReviewResult)
+             else f"{PARTIAL_REVIEW_MARKER}: this profile could not be reviewed: {o}")
+            for one, o in zip(prepared, outcomes)
+        ])
+        return ReviewResult(
+            pr_info=first.pr_info,
+            repo=first.repo,
+            profile_name=",".join(one.profile_name for one in prepared),
+            model=results[0].model,
+            review=join_sections(sections),
+            changed_files=first.changed_files,
+            diff_tokens=(sum(one.diff_tokens for one in prepared)
+                         if any(one.routed_files for one in prepared) else first.diff_tokens),
+            packed=results[0].packed,
+            duration=time.perf_counter() - started,
+            shared=all(r.shared for r in results),
+            shared_from=(CONCURRENT if any(r.shared_from == CONCURRENT for r in results)
+                         else EARLIER) if all(r.shared for r in results) else "",
+            slot_wait=max(r.slot_wait for r in results),
+            shards=results[0].shards,
+            timeout=max(r.timeout for r in results),
+            sections=sections,
+            duplicates=duplicates,
+            fast_path=(results[0].fast_path
+                       if len(results) == len(prepared) and all(r.fast_path for r in results)
+                       else None),
+            parent=first.parent,
+            since=first.since,
+            usage=usage,
+        )
+
+    def _run_profile(
+        self,
+        prepared: PreparedReview,
+        model: str | None,
+        timeout: int | None,
+        cancel: threading.Event | None,
+    ) -> ReviewResult | ReviewError:
+        try:
+            return self.run(prepared, model, timeout, cancel)
+        except (ReviewCancelledError, RateLimitError):
+            raise  # a rate limit must reach the limiter and fail the attempt, not go partial
+        except ReviewError as e:
+            return e
+
+    def post(
+        self,
+        result: ReviewResult,
+        mode: str | None = None,
+        earlier: str = "",
+        comment_id: int | None = None,
+    ) -> None:
+        """Post the review as a PR comment. Raises GitHubError on failure.
+
+        earlier is the text of previous reviews, shown collapsed below this
+        one. With comment_id, that comment is edited in place instead, and
+        mode is ignored. The comment's URL goes into result.comment_url.
+        """
+        mode = mode or self.comment_mode
+        body = format_comment(
+            result.pr_info, result.review, result.profile_name,
+            sections=result.sections, parent=result.parent,
+            since=result.since, earlier=earlier,
+        )
+        if comment_id is not None:
+            repo = split_pr_ref(result.pr_info.url)[0] or result.repo or ""
+            with span("comment.update", comment_id=comment_id):
+                update_comment(repo, comment_id, body)
+            result.comment_url = f"{result.pr_info.url}#issuecomment-{comment_id}"
+        else:
+            with span("comment.post", mode=mode):
+                result.comment_url = post_comment(
+                    str(result.pr_info.number),
+                    body,
+                    repo=result.repo,
+                    edit_last=(mode == "update"),
+                )
+        result.comment_posted = True
+
+    def review(
+        self,
+        pr: str,
+        repo: str | None = None,
+        profile: str | None = None,
+        model: str | None = None,
+        timeout: int | None = None,
+        comment: bool | None = None,
+        comment_mode: str | None = None,
+        cancel: threading.Event | None = None,
+        max_tokens: int | None = None,
+    ) -> ReviewResult:
+        """Prepare, run and optionally comment on one PR.
+
+        profile may list several profiles separated by commas; they are
+        merged into one result by run_profiles(). comment defaults to the
+        config's comment.enabled. A failed comment is reported in
+        ReviewResult.comment_error rather than raised.
+        """
+        self.check_tools()
+        prepared = self.prepare_profiles(pr, repo, profile, max_tokens=max_tokens)
+        result = self.run_profiles(prepared, model, timeout, cancel)
+        if comment if comment is not None else self.comment_enabled:
+            try:
+                self.post(result, comment_mode)
+            except GitHubError as e:
+                result.comment_error = str(e)
+        return result
+
+    def estimate(
+        self,
+        pr: str,
+        repo: str | None = None,
+        profile: str | None = None,
+        stacked: bool | None = None,
+        max_tokens: int | None = None,
+    ) -> Estimate:
+        """Size up a review of pr without calling Claude.
+
+        The PR is prepared and its diff fetched and split exactly as review()
+        would (profile routing, stacked and since diffs, fast path, hunk
+        cache, shard_budget() and the per-PR token budget), so the shard
+        count and truncation are the ones the review would get.
+        """
+        self.check_tools(claude=False)
+        model = self.model
+        with span("estimate"):
+            prepared = self.prepare_profiles(pr, repo, profile, stacked, max_tokens)
+            first = prepared[0]
+            if first.diff is None:
+                first.diff = self._pr_diff(
+                    first.pr, first.repo, first.pr_info, first.parent, first.since,
+                )
+            for other in prepared[1:]:
+                if other.diff is None:
+                    other.diff = first.diff
+            skipped = None
+            for one in prepared:
+                try:
+                    self.fetch_diff(one, model)
+                except BudgetExceededError as e:
+                    skipped = str(e)
+                    break
+            plans = [
+                PlannedReview(
+                    diff=one.diff or "",
+                    shard_tokens=one.shard_tokens,
+                    shards=(one.shards if one.fast_path is None and not one.cached_only
+                            and skipped is None else []),
+                    packed=one.packed or PackedDiff(text="", tokens=0),
+                    profile=one.profile_name,
+                    over_budget=one.over_budget,
+                )
+                for one in prepared
+            ]
+            return estimate_plans(plans, self.model_name, skipped)
+
+    # --- asyncio API ---
+
+    async def review_pr(self, pr: str, **kwargs: Any) -> ReviewResult:
+        """Async review(). At most max_concurrency reviews run at once.
+
+        Cancelling the awaiting task kills the claude process.
+        """
+        import asyncio  # only asyncio callers pay for importing it
+
+        cancel = kwargs.pop("cancel", None) or threading.Event()
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(
+            self._get_executor(), partial(self.review, pr, cancel=cancel, **kwargs),
+        )
+        try:
+            return await future
+        except asyncio.CancelledError:
+            cancel.set()
+            raise
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_concurrency,
+                    thread_name_prefix="parc-ferme-review",
+                )
+            return self._executor
+
+    def close(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+            cat_files, self._cat_files = list(self._cat_files.values()), {}
+            indexes, self._symbol_indexes = list(self._symbol_indexes.values()), {}
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+        for cat in cat_files:
+            cat.close()
+        for index in indexes:
+            index.close()
+
+    def __enter__(self) -> ReviewSession:
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+    async def __aenter__(self) -> ReviewSession:
+        return self
+
+    async def __aexit__(self, *exc: object) -> None:
+        import asyncio
+
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
+
+
+async def review_pr(
+    pr: str, *, session: ReviewSession | None = None, **kwargs: Any,
+) -> ReviewResult:
+    """Review one PR. Pass a shared session to reuse config across calls."""
+    if session is not None:
+        return await session.review_pr(pr, **kwargs)
+    async with ReviewSession() as own:
+        return await own.review_pr(pr, **kwargs)
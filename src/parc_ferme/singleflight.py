@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from pathlib import Path
+
+from .config import get_cache_dir
+from .timing import span
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, single-flight is disabled
+    fcntl = None  # type: ignore[assignment]
+
+SINGLE_FLIGHT_DIRNAME = "single-flight"
+DEFAULT_TTL = 3600  # seconds a shared result stays reusable
+# Where a result single_flight() did not compute itself came from
+CONCURRENT = "concurrent"  # a run that was in flight when this one started
+EARLIER = "earlier"  # a run that had finished before, within the ttl
+_POLL_INTERVAL = 0.1
+
+
+def flight_key(pr_url: str, fingerprint: str, prompt: str, model: str) -> str:
+    """Hash of everything that makes two reviews interchangeable.
+
+    fingerprint is diff.diff_fingerprint() of the reviewed diff rather than
+    the head SHA, so a rebase that changes no lines keeps the same key.
+    prompt is the whole prompt sent ahead of the diff, so editing a profile
+    or a change in conventions, code context or notices gives a new key.
+    """
+    raw = json.dumps([pr_url, fingerprint, hashlib.sha256(prompt.encode()).hexdigest(), model])
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _flight_dir() -> Path:
+    return get_cache_dir() / SINGLE_FLIGHT_DIRNAME
+
+
+def _read_result(path: Path, ttl: float) -> str | None:
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError):
+        return None
+    if time.time() - data.get("created", 0) > ttl:
+        return None
+    return data.get("result")
+
+
+def _write_result(path: Path, result: str) -> None:
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.stem}-")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"created": time.time(), "result": result}, f)
+        os.replace(tmp, path)
+    except OSError:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+
+
+@contextmanager
+def _exclusive(lock_path: Path, timeout: float) -> Iterator[bool]:
+    """Hold an flock on lock_path. Yields False if it could not be taken in time."""
+    with open(lock_path, "a") as f:
+        with span("single_flight.wait") as span_args:
+            deadline = time.monotonic() + timeout
+            while True:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if time.monotonic() >= deadline:
+                        span_args["timed_out"] = True
+                        break
+                    time.sleep(_POLL_INTERVAL)
+        if span_args.get("timed_out"):
+            yield False
+            return
+        os.utime(lock_path)  # keep prune() away from locks in use
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def single_flight(
+    key: str,
+    fn: Callable[[], str],
+    wait_timeout: float,
+    ttl: float = DEFAULT_TTL,
+    keep: Callable[[str], bool] | None = None,
+) -> tuple[str, str]:
+    """Run fn at most once per key across processes on this machine.
+
+    The first caller takes a file lock and runs fn; concurrent callers block
+    on the lock and then read the result it saved. A result stays reusable
+    for ttl seconds. If the leader fails, or keep rejects its result (e.g. a
+    partial review), nothing is saved, so the next waiter runs fn itself.
+    If the lock cannot be taken within wait_timeout, fn runs without it.
+    Returns (result, shared): shared is "" if fn ran, else CONCURRENT or
+    EARLIER for where the result came from.
+    """
+    if fcntl is None:
+        return fn(), ""
+
+    directory = _flight_dir()
+    result_path = directory / f"{key}.json"
+    cached = _read_result(result_path, ttl)
+    if cached is not None:
+        return cached, EARLIER
+    try:
+        directory.mkdir(parents=True, exist_ok=True)
+    except OSError:
+        return fn(), ""
+
+    with _exclusive(directory / f"{key}.lock", wait_timeout) as locked:
+        if not locked:
+            return fn(), ""
+        cached = _read_result(result_path, ttl)
+        if cached is not None:
+            return cached, CONCURRENT  # saved while this call waited for the lock
+        result = fn()
+        if keep is None or keep(result):
+            _write_result(result_path, result)
+    prune(ttl)
+    return result, ""
+
+
+def prune(ttl: float = DEFAULT_TTL) -> int:
+    """Delete expired results and idle lock files. Returns files removed."""
+    directory = _flight_dir()
+    if fcntl is None or not directory.is_dir():
+        return 0
+    removed = 0
+    cutoff = time.time() - ttl
+    for path in directory.iterdir():
+        try:
+            if path.stat().st_mtime >= cutoff:
+                continue
+            if path.suffix == ".lock":
+                # Only remove a lock that nobody holds right now
+                with _exclusive(path, timeout=0) as locked:
+                    if locked:
+                        path.unlink()
+                        removed += 1
+            elif path.suffix == ".json":
+                path.unlink()
+                removed += 1
+        except OSError:
+            continue
+    return removed
@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import os
+import random
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import IO
+
+from .config import get_runtime_dir
+from .errors import ReviewCancelledError, ReviewError
+from .timing import span
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, concurrency is not limited
+    fcntl = None  # type: ignore[assignment]
+
+SLOTS_DIRNAME = "claude-slots"
+_POLL_INTERVAL = 0.1
+
+
+@dataclass
+class Slot:
+    index: int  # -1 when no limit applies
+    waited: float  # seconds spent queued for the slot
+
+
+def _try_slot(directory: os.PathLike[str] | str, index: int) -> IO[str] | None:
+    f = open(os.path.join(directory, f"slot-{index}.lock"), "a")
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        f.close()
+        return None
+    return f
+
+
+@contextmanager
+def claude_slot(
+    limit: int,
+    timeout: float,
+    cancel: threading.Event | None = None,
+) -> Iterator[Slot]:
+    """Hold one of limit host-wide slots for a claude process.
+
+    Slots are flock'd files in the runtime dir, so the cap holds across every
+    parc-ferme process on the host and a crashed holder frees its slot
+    automatically. Raises ReviewError if no slot frees up within timeout and
+    ReviewCancelledError if cancel is set while queued.
+    """
+    if fcntl is None or limit <= 0:
+        yield Slot(index=-1, waited=0.0)
+        return
+
+    directory = get_runtime_dir() / SLOTS_DIRNAME
+    try:
+        directory.mkdir(parents=True, exist_ok=True)
+    except OSError:
+        yield Slot(index=-1, waited=0.0)
+        return
+
+    started = time.monotonic()
+    held: IO[str] | None = None
+    with span("claude.slot_wait", limit=limit) as span_args:
+        # Start at a random slot so waiters do not all contend for slot 0
+        offset = random.randrange(limit)
+        while held is None:
+            for i in range(limit):
+                index = (offset + i) % limit
+                held = _try_slot(directory, index)
+                if held is not None:
+                    break
+            if held is not None:
+                break
+            waited = time.monotonic() - started
+            if waited >= timeout:
+                span_args["timed_out"] = True
+                raise ReviewError(
+                    f"Timed out after {waited:.0f}s waiting for one of {limit} "
+                    "Claude slots on this host (max_concurrent_reviews)."
+                )
+            if cancel is not None:
+                if cancel.wait(_POLL_INTERVAL):
+                    raise ReviewCancelledError("Cancelled while waiting for a Claude slot")
+            else:
+                time.sleep(_POLL_INTERVAL)
+        waited = time.monotonic() - started
+        span_args["slot"] = index
+        span_args["waited"] = round(waited, 3)
+
+    try:
+        yield Slot(index=index, waited=waited)
+    finally:
+        fcntl.flock(held, fcntl.LOCK_UN)
+        held.close()
@@ -0,0 +1,393 @@
+from __future__ import annotations
+
+import ast
+import hashlib
+import re
+import sqlite3
+import subprocess
+import threading
+from collections import Counter
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path, PurePosixPath
+
+from .config import get_cache_dir
+from .context import CatFile
+from .diff import FileDiff, estimate_tokens
+from .errors import SymbolIndexError
+
+SYMBOLS_DIRNAME = "symbols"
+DEFAULT_SYMBOL_TOKENS = 1_500
+MAX_DEFINITIONS_PER_NAME = 3
+_MAX_SIGNATURE_CHARS = 240
+_GIT_TIMEOUT = 60  # seconds; ls-tree of a very large repo
+
+PYTHON_SUFFIXES = {".py", ".pyi"}
+TS_SUFFIXES = {".ts", ".tsx", ".js", ".jsx", ".mjs", ".cjs"}
+GO_SUFFIXES = {".go"}
+INDEXED_SUFFIXES = PYTHON_SUFFIXES | TS_SUFFIXES | GO_SUFFIXES
+
+SYMBOLS_HEADER = (
+    "REFERENCED DEFINITIONS (signatures of symbols the diff uses, as defined in the "
+    "PR's code; check calls against them):"
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    blob TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS symbols (
+    name      TEXT    NOT NULL,
+    kind      TEXT    NOT NULL,
+    path      TEXT    NOT NULL,
+    line      INTEGER NOT NULL,
+    scope     TEXT    NOT NULL,
+    signature TEXT    NOT NULL
+);
+CREATE INDEX IF NOT EXISTS symbols_name ON symbols (name);
+CREATE INDEX IF NOT EXISTS symbols_path ON symbols (path);
+"""
+
+# Tag-style patterns, one definition per line
+_TS_PATTERNS = [
+    ("function", re.compile(
+        r"^\s*(?:export\s+)?(?:default\s+)?(?:async\s+)?function\s*\*?\s*([A-Za-z_$][\w$]*)\s*[<(]"
+    )),
+    ("class", re.compile(
+        r"^\s*(?:export\s+)?(?:default\s+)?(?:abstract\s+)?class\s+([A-Za-z_$][\w$]*)"
+    )),
+    ("interface", re.compile(r"^\s*(?:export\s+)?(?:declare\s+)?interface\s+([A-Za-z_$][\w$]*)")),
+    ("type", re.compile(
+        r"^\s*(?:export\s+)?(?:declare\s+)?type\s+([A-Za-z_$][\w$]*)\s*(?:<.*>)?\s*="
+    )),
+    ("enum", re.compile(r"^\s*(?:export\s+)?(?:const\s+)?enum\s+([A-Za-z_$][\w$]*)")),
+    ("function", re.compile(
+        r"^\s*(?:export\s+)?(?:const|let|var)\s+([A-Za-z_$][\w$]*)\s*(?::[^=]+)?=\s*(?:async\s+)?"
+        r"(?:function\b|\([^)]*\)\s*(?::[^=]+)?=>|[A-Za-z_$][\w$]*\s*=>)"
+    )),
+    ("method", re.compile(
+        r"^\s+(?:(?:public|private|protected|static|async|readonly|override|abstract|get|set)\s+)*"
+        r"([A-Za-z_$][\w$]*)\s*(?:<[^>]*>)?\s*\([^;]*\)\s*(?::\s*[^{;=]+)?\{\s*$"
+    )),
+]
+_GO_PATTERNS = [
+    ("function", re.compile(r"^func\s+(?:\([^)]*\)\s*)?([A-Za-z_]\w*)\s*[\[(]")),
+    ("type", re.compile(r"^type\s+([A-Za-z_]\w*)\s")),
+]
+_NOT_METHODS = {"if", "for", "while", "switch", "catch", "function", "return", "constructor"}
+
+_DEFINED_RE = re.compile(
+    r"\b(?:def|class|function|func|interface|type|enum)\s+(?:\([^)]*\)\s*)?([A-Za-z_$][\w$]*)"
+)
+_IDENTIFIER_RE = re.compile(r"(?<![\w$])([A-Za-z_$][\w$]*)(\s*\()?")
+_IGNORED_NAMES = {
+    "if", "for", "while", "switch", "return", "function", "def", "class", "print", "len",
+    "str", "int", "float", "bool", "list", "dict", "set", "tuple", "super", "self", "this",
+    "None", "True", "False", "String", "Number", "Boolean", "Object", "Array", "Promise",
+    "Error", "Exception", "Map", "Set", "make", "append", "new", "typeof", "require",
+}
+
+
+@dataclass
+class Symbol:
+    """A definition found in the checkout."""
+
+    name: str
+    kind: str  # function, method, class, interface, type, enum
+    path: str
+    line: int
+    scope: str  # enclosing class, or ""
+    signature: str
+
+    def text(self) -> str:
+        where = f" (in {self.scope})" if self.scope else ""
+        return f"{self.path}:{self.line}  {self.signature}{where}"
+
+
+def _clip(signature: str) -> str:
+    signature = " ".join(signature.split()).rstrip("{").rstrip().rstrip(":")
+    # Signatures split over lines: "( a, b, )" -> "(a, b)"
+    signature = re.sub(r",?\s+([)\]])", r"\1", re.sub(r"([(\[])\s+", r"\1", signature))
+    if len(signature) > _MAX_SIGNATURE_CHARS:
+        signature = signature[:_MAX_SIGNATURE_CHARS - 1] + "…"
+    return signature
+
+
+def _python_header(text: str) -> str:
+    """text up to the colon that ends a def or class header."""
+    depth = 0
+    for i, char in enumerate(text):
+        if char in "([{":
+            depth += 1
+        elif char in ")]}":
+            depth -= 1
+        elif char == ":" and depth == 0:
+            return text[:i]
+    return text
+
+
+def python_symbols(path: str, source: str) -> list[Symbol]:
+    """Functions, methods and classes of a Python module, via ast."""
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return []
+    lines = source.splitlines()
+    found: list[Symbol] = []
+
+    def visit(body: list[ast.stmt], scope: str) -> None:
+        for node in body:
+            if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                continue
+            # The header runs from the def line to, at most, the first body line
+            last = max(node.body[0].lineno, node.lineno) if node.body else node.lineno
+            header = " ".join(line.strip() for line in lines[node.lineno - 1:last])
+            signature = _python_header(header)
+            if isinstance(node, ast.ClassDef):
+                kind = "class"
+            else:
+                kind = "method" if scope else "function"
+            found.append(Symbol(node.name, kind, path, node.lineno, scope, _clip(signature)))
+            if isinstance(node, ast.ClassDef):
+                visit(node.body, node.name)
+
+    visit(tree.body, "")
+    return found
+
+
+def _tag_symbols(
+    path: str, source: str, patterns: list[tuple[str, re.Pattern[str]]],
+) -> list[Symbol]:
+    found: list[Symbol] = []
+    scope = ""
+    for number, line in enumerate(source.splitlines(), 1):
+        if not line.strip() or line.lstrip().startswith(("//", "/*", "*")):
+            continue
+        if not line[0].isspace():
+            scope = ""
+        for kind, regex in patterns:
+            m = regex.match(line)
+            if not m or (kind == "method" and m.group(1) in _NOT_METHODS):
+                continue
+            found.append(Symbol(
+                m.group(1), kind, path, number, scope if kind == "method" else "", _clip(line),
+            ))
+            if kind == "class":
+                scope = m.group(1)
+            break
+    return found
+
+
+def extract_symbols(path: str, source: str) -> list[Symbol]:
+    """Definitions in source, chosen by path's extension."""
+    suffix = PurePosixPath(path).suffix.lower()
+    if suffix in PYTHON_SUFFIXES:
+        return python_symbols(path, source)
+    if suffix in TS_SUFFIXES:
+        return _tag_symbols(path, source, _TS_PATTERNS)
+    if suffix in GO_SUFFIXES:
+        return _tag_symbols(path, source, _GO_PATTERNS)
+    return []
+
+
+def referenced_names(files: list[FileDiff]) -> list[str]:
+    """Names the diff calls or uses as types, most used first.
+
+    Names defined in the diff itself are left out: their definition is
+    already in front of the reviewer.
+    """
+    counts: Counter[str] = Counter()
+    defined: set[str] = set()
+    for f in files:
+        for hunk in f.hunks:
+            for line in hunk.lines:
+                if not line or line[0] not in "+ ":
+                    continue
+                code = line[1:]
+                defined.update(_DEFINED_RE.findall(code))
+                for m in _IDENTIFIER_RE.finditer(code):
+                    name = m.group(1)
+                    if m.group(2) or name[0].isupper():
+                        counts[name] += 1
+    return [
+        name for name, _ in counts.most_common()
+        if name not in defined and name not in _IGNORED_NAMES and len(name) > 1
+    ]
+
+
+def default_index_path(work_tree: Path) -> Path:
+    digest = hashlib.sha256(str(work_tree.resolve()).encode()).hexdigest()[:16]
+    return get_cache_dir() / SYMBOLS_DIRNAME / f"{work_tree.name}-{digest}.sqlite3"
+
+
+def _tree_blobs(work_tree: Path, commit: str) -> dict[str, str]:
+    """{path: blob id} of the indexable files in commit, from one ls-tree."""
+    try:
+        result = subprocess.run(
+            ["git", "-C", str(work_tree), "ls-tree", "-r", "-z", "--full-tree", commit],
+            capture_output=True, timeout=_GIT_TIMEOUT,
+        )
+    except (OSError, subprocess.TimeoutExpired) as e:
+        raise SymbolIndexError(f"Could not list files of {commit[:12]}: {e}")
+    if result.returncode != 0:
+        raise SymbolIndexError(
+            f"Could not list files of {commit[:12]}: {result.stderr.decode().strip()}"
+        )
+    blobs: dict[str, str] = {}
+    for entry in result.stdout.decode("utf-8", errors="replace").split("\0"):
+        meta, _, path = entry.partition("\t")
+        parts = meta.split()
+        if len(parts) == 3 and parts[1] == "blob" and \
+                PurePosixPath(path).suffix.lower() in INDEXED_SUFFIXES:
+            blobs[path] = parts[2]
+    return blobs
+
+
+class SymbolIndex:
+    """Definitions of a checkout in SQLite, updated incrementally by blob id.
+
+    update() lists the commit's files once and re-parses only those whose
+    blob changed since the last indexed commit, reading them through a
+    shared CatFile. Lookups are indexed by name and take milliseconds
+    whatever the size of the repository.
+    """
+
+    def __init__(self, work_tree: Path, path: str | Path | None = None) -> None:
+        self.work_tree = work_tree
+        self.path = Path(path) if path else default_index_path(work_tree)
+        self._lock = threading.RLock()
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(
+                self.path, timeout=30, isolation_level=None, check_same_thread=False,
+            )
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+        except (OSError, sqlite3.Error) as e:
+            raise SymbolIndexError(f"Could not open symbol index {self.path}: {e}")
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def __enter__(self) -> SymbolIndex:
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        try:
+            with self._lock:
+                self._conn.execute("BEGIN IMMEDIATE")
+                try:
+                    yield self._conn
+                except BaseException:
+                    self._conn.execute("ROLLBACK")
+                    raise
+                self._conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            raise SymbolIndexError(f"Symbol index error: {e}")
+
+    def _query(self, sql: str, params: tuple | list = ()) -> list[tuple]:
+        try:
+            with self._lock:
+                return self._conn.execute(sql, params).fetchall()
+        except sqlite3.Error as e:
+            raise SymbolIndexError(f"Symbol index error: {e}")
+
+    @property
+    def commit(self) -> str | None:
+        """The commit the index was last updated to."""
+        rows = self._query("SELECT value FROM meta WHERE key = 'commit'")
+        return rows[0][0] if rows else None
+
+    def update(self, commit: str, cat: CatFile) -> int:
+        """Bring the index to commit. Returns the number of files re-parsed."""
+        if self.commit == commit:
+            return 0
+        blobs = _tree_blobs(self.work_tree, commit)
+        indexed = dict(self._query("SELECT path, blob FROM files"))
+        changed = [path for path, blob in blobs.items() if indexed.get(path) != blob]
+        removed = [path for path in indexed if path not in blobs]
+        parsed: list[tuple[str, str, list[Symbol]]] = []
+        for path in changed:
+            data = cat.read(blobs[path])
+            if data is None:
+                continue
+            source = data.decode("utf-8", errors="replace")
+            parsed.append((path, blobs[path], extract_symbols(path, source)))
+        with self._transaction() as conn:
+            for path in [*removed, *(p for p, _, _ in parsed)]:
+                conn.execute("DELETE FROM symbols WHERE path = ?", (path,))
+                conn.execute("DELETE FROM files WHERE path = ?", (path,))
+            for path, blob, symbols in parsed:
+                conn.execute("INSERT INTO files (path, blob) VALUES (?, ?)", (path, blob))
+                conn.executemany(
+                    "INSERT INTO symbols (name, kind, path, line, scope, signature) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    [(s.name, s.kind, s.path, s.line, s.scope, s.signature) for s in symbols],
+                )
+            conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('commit', ?)", (commit,),
+            )
+        return len(parsed)
+
+    def lookup(self, names: list[str]) -> dict[str, list[Symbol]]:
+        """Definitions of each of names found in the index."""
+        found: dict[str, list[Symbol]] = {}
+        for i in range(0, len(names), 500):  # stay under SQLite's parameter limit
+            chunk = names[i:i + 500]
+            rows = self._query(
+                "SELECT name, kind, path, line, scope, signature FROM symbols "
+                f"WHERE name IN ({', '.join('?' * len(chunk))}) ORDER BY path, line",
+                chunk,
+            )
+            for row in rows:
+                found.setdefault(row[0], []).append(Symbol(*row))
+        return found
+
+    def stats(self) -> tuple[int, int]:
+        """(files, symbols) in the index."""
+        files = self._query("SELECT COUNT(*) FROM files")[0][0]
+        symbols = self._query("SELECT COUNT(*) FROM symbols")[0][0]
+        return files, symbols
+
+
+def render_symbols(
+    index: SymbolIndex, files: list[FileDiff], max_tokens: int = DEFAULT_SYMBOL_TOKENS,
+) -> str:
+    """Signatures of the symbols files reference, within max_tokens.
+
+    Names used most come first; a name defined in the file that uses it is
+    shown with that definition first, and at most MAX_DEFINITIONS_PER_NAME
+    definitions are shown per name. Returns "" when nothing was found.
+    """
+    if max_tokens <= 0:
+        return ""
+    names = referenced_names(files)
+    if not names:
+        return ""
+    found = index.lookup(names)
+    paths = {f.path for f in files}
+    lines: list[str] = []
+    used = estimate_tokens(SYMBOLS_HEADER)
+    for name in names:
+        symbols = sorted(found.get(name, []), key=lambda s: (s.path not in paths, s.path, s.line))
+        for symbol in symbols[:MAX_DEFINITIONS_PER_NAME]:
+            text = symbol.text()
+            tokens = estimate_tokens(text) + 1
+            if used + tokens > max_tokens:
+                continue
+            lines.append(text)
+            used += tokens
+    if not lines:
+        return ""
+    return SYMBOLS_HEADER + "\n" + "\n".join(lines)
@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+import contextvars
+import json
+import os
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any
+
+from . import __version__
+
+
+@dataclass
+class Span:
+    name: str
+    start: float  # seconds since the tracer was created
+    duration: float
+    depth: int
+    thread_id: int
+    args: dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class Counter:
+    name: str
+    time: float  # seconds since the tracer was created
+    values: dict[str, float]
+
+
+class Tracer:
+    """Collect timed phases and export them as a summary or Chrome trace."""
+
+    def __init__(self) -> None:
+        self.start_time = time.time()
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self._depth: contextvars.ContextVar[int] = contextvars.ContextVar(
+            "parc_ferme_span_depth", default=0,
+        )
+        self.spans: list[Span] = []
+        self.counters: list[Counter] = []
+        self.metadata: dict[str, Any] = {}
+
+    @contextmanager
+    def span(self, name: str, **args: Any) -> Iterator[dict[str, Any]]:
+        """Time the enclosed block. Yields the args dict so callers can add to it."""
+        depth = self._depth.get()
+        token = self._depth.set(depth + 1)
+        start = time.perf_counter()
+        try:
+            yield args
+        finally:
+            end = time.perf_counter()
+            self._depth.reset(token)
+            with self._lock:
+                self.spans.append(Span(
+                    name=name,
+                    start=start - self._origin,
+                    duration=end - start,
+                    depth=depth,
+                    thread_id=threading.get_ident(),
+                    args=args,
+                ))
+
+    def counter(self, name: str, **values: float) -> None:
+        """Record the current value of a level that changes over time."""
+        with self._lock:
+            self.counters.append(Counter(name, time.perf_counter() - self._origin, values))
+
+    def format_summary(self) -> str:
+        lines = ["Timings:"]
+        for s in sorted(self.spans, key=lambda s: s.start):
+            label = "  " * s.depth + s.name
+            line = f"  {label:36s} {s.duration * 1000:10.1f} ms"
+            if "output_tokens" in s.args:
+                line += f"  {_usage_note(s.args)}"
+            lines.append(line)
+        series: dict[tuple[str, str], list[float]] = {}
+        for c in self.counters:
+            for key, value in c.values.items():
+                series.setdefault((c.name, key), []).append(value)
+        if series:
+            lines.append("Counters:")
+            for (name, key), values in series.items():
+                label = name if key == "value" else f"{name}.{key}"
+                lines.append(
+                    f"  {label:36s} final {values[-1]:g} "
+                    f"(min {min(values):g}, max {max(values):g}, {len(values) - 1} changes)"
+                )
+        return "\n".join(lines)
+
+    def to_trace_events(self) -> dict[str, Any]:
+        """Return the spans in Chrome trace-event JSON format."""
+        pid = os.getpid()
+        events = [
+            {
+                "name": s.name,
+                "cat": s.name.split(".", 1)[0].split(" ", 1)[0],
+                "ph": "X",
+                "ts": round(s.start * 1_000_000),
+                "dur": round(s.duration * 1_000_000),
+                "pid": pid,
+                "tid": s.thread_id,
+                "args": s.args,
+            }
+            for s in sorted(self.spans, key=lambda s: s.start)
+        ]
+        events += [
+            {
+                "name": c.name,
+                "ph": "C",
+                "ts": round(c.time * 1_000_000),
+                "pid": pid,
+                "args": c.values,
+            }
+            for c in self.counters
+        ]
+        return {
+            "traceEvents": events,
+            "displayTimeUnit": "ms",
+            "otherData": {
+                "parc_ferme_version": __version__,
+                "start_time": self.start_time,
+                **self.metadata,
+            },
+        }
+
+    def write_trace(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_trace_events(), f, default=str)
+            f.write("\n")
+
+
+def _usage_note(args: dict[str, Any]) -> str:
+    """Tokens and cost a span recorded, e.g. for a claude call."""
+    note = (f"{args.get('input_tokens', 0):,} in / {args.get('output_tokens', 0):,} out / "
+            f"{args.get('cached_tokens', 0):,} cached tokens")
+    if args.get("cost_usd"):
+        note += f", ${args['cost_usd']:.4f}"
+    return note
+
+
+_current_tracer: contextvars.ContextVar[Tracer | None] = contextvars.ContextVar(
+    "parc_ferme_tracer", default=None,
+)
+
+
+def current_tracer() -> Tracer | None:
+    return _current_tracer.get()
+
+
+@contextmanager
+def use_tracer(tracer: Tracer) -> Iterator[Tracer]:
+    """Make tracer the target of span() for the enclosed block."""
+    token = _current_tracer.set(tracer)
+    try:
+        yield tracer
+    finally:
+        _current_tracer.reset(token)
+
+
+def counter(name: str, **values: float) -> None:
+    """Record a counter on the active tracer, or do nothing if none."""
+    tracer = _current_tracer.get()
+    if tracer is not None:
+        tracer.counter(name, **values)
+
+
+@contextmanager
+def span(name: str, **args: Any) -> Iterator[dict[str, Any]]:
+    """Time the enclosed block on the active tracer, or do nothing if none."""
+    tracer = _current_tracer.get()
+    if tracer is None:
+        yield args
+        return
+    with tracer.span(name, **args) as span_args:
+        yield span_args
@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import json
+import threading
+from dataclasses import dataclass
+from typing import Any
+
+# Output format passed to claude: JSON events, one per line, ending with a
+# "result" event that carries the usage. Unlike plain "json", the assistant
+# text arrives as it is produced, so a timed-out call still has output.
+CLAUDE_OUTPUT_ARGS = ["--output-format", "stream-json", "--verbose"]
+
+PR_BUDGET_ACTIONS = ("degrade", "skip")
+DEFAULT_DOWNGRADE_AT = 0.8
+
+
+@dataclass
+class Usage:
+    """Tokens, cost and time reported by claude, summed over calls."""
+
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cache_read_tokens: int = 0
+    cache_creation_tokens: int = 0
+    cost_usd: float = 0.0
+    duration: float = 0.0  # seconds claude reported
+    calls: int = 0
+
+    @property
+    def total_tokens(self) -> int:
+        return (self.input_tokens + self.output_tokens
+                + self.cache_read_tokens + self.cache_creation_tokens)
+
+    def add(self, other: Usage) -> None:
+        self.input_tokens += other.input_tokens
+        self.output_tokens += other.output_tokens
+        self.cache_read_tokens += other.cache_read_tokens
+        self.cache_creation_tokens += other.cache_creation_tokens
+        self.cost_usd += other.cost_usd
+        self.duration += other.duration
+        self.calls += other.calls
+
+    def span_args(self) -> dict[str, Any]:
+        return {
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "cached_tokens": self.cache_read_tokens,
+            "cost_usd": round(self.cost_usd, 6),
+        }
+
+    def describe(self) -> str:
+        text = (f"{self.input_tokens + self.cache_creation_tokens:,} input "
+                f"({self.cache_read_tokens:,} cached) / {self.output_tokens:,} output tokens")
+        if self.cost_usd:
+            text += f", ${self.cost_usd:.4f}"
+        return text
+
+
+def _usage(event: dict[str, Any]) -> Usage:
+    raw = event.get("usage") or {}
+    return Usage(
+        input_tokens=int(raw.get("input_tokens") or 0),
+        output_tokens=int(raw.get("output_tokens") or 0),
+        cache_read_tokens=int(raw.get("cache_read_input_tokens") or 0),
+        cache_creation_tokens=int(raw.get("cache_creation_input_tokens") or 0),
+        cost_usd=float(event.get("total_cost_usd") or event.get("cost_usd") or 0.0),
+        duration=float(event.get("duration_ms") or 0) / 1000,
+        calls=1,
+    )
+
+
+def parse_claude_output(stdout: str) -> tuple[str, Usage | None]:
+    """The review text and usage in claude's JSON output.
+
+    Reads both stream-json (one event per line) and a single json result.
+    Without a result event (the call timed out), the text is what the
+    assistant had written so far and the usage is summed from its messages;
+    a last line cut off mid-event is ignored.
+    Output that is not JSON is returned as the text, with no usage.
+    """
+    lines = [line.strip() for line in stdout.splitlines() if line.strip()]
+    events = []
+    for i, line in enumerate(lines):
+        try:
+            event = json.loads(line)
+        except json.JSONDecodeError:
+            event = None
+        if not isinstance(event, dict) or "type" not in event:
+            if events and i == len(lines) - 1:
+                break  # the process was killed mid-line
+            return stdout.strip(), None
+        events.append(event)
+    if not events:
+        return stdout.strip(), None
+    for event in events:
+        if event["type"] == "result":
+            return str(event.get("result") or "").strip(), _usage(event)
+    texts: list[str] = []
+    usage = Usage()
+    for event in events:
+        message = event.get("message") if event["type"] == "assistant" else None
+        if not isinstance(message, dict):
+            continue
+        for block in message.get("content") or []:
+            if isinstance(block, dict) and block.get("type") == "text":
+                texts.append(str(block.get("text", "")))
+        partial = _usage(message)
+        partial.calls = 0
+        usage.add(partial)
+    usage.calls = 1
+    return "".join(texts).strip(), usage
+
+
+class BatchBudget:
+    """Running totals of a batch, against its token and cost caps.
+
+    Shared by every worker. Once spending reaches downgrade_at of a cap,
+    model_for() returns cheaper_model (if set); once a cap is reached,
+    exhausted is set and no further reviews should start.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int | None = None,
+        max_cost: float | None = None,
+        cheaper_model: str | None = None,
+        downgrade_at: float = DEFAULT_DOWNGRADE_AT,
+    ) -> None:
+        self.max_tokens = max_tokens
+        self.max_cost = max_cost
+        self.cheaper_model = cheaper_model
+        self.downgrade_at = downgrade_at
+        self.usage = Usage()
+        self.exhausted = threading.Event()
+        self._lock = threading.Lock()
+
+    def _spent(self) -> float:
+        """The largest fraction of a cap used so far."""
+        fractions = [0.0]
+        if self.max_tokens:
+            fractions.append(self.usage.total_tokens / self.max_tokens)
+        if self.max_cost:
+            fractions.append(self.usage.cost_usd / self.max_cost)
+        return max(fractions)
+
+    def charge(self, usage: Usage) -> None:
+        with self._lock:
+            self.usage.add(usage)
+            if self._spent() >= 1.0:
+                self.exhausted.set()
+
+    def model_for(self, model: str | None) -> str | None:
+        """model, or cheaper_model once spending crossed downgrade_at."""
+        with self._lock:
+            if self.cheaper_model and self._spent() >= self.downgrade_at:
+                return self.cheaper_model
+        return model
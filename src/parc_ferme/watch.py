@@ -0,0 +1,177 @@
+from __future__ import annotations
+
+import threading
+from collections.abc import Callable
+
+from .errors import GitHubError, ParcFermeError
+from .github import comment_id_from_url, get_compare_status, poll_pr
+from .session import ReviewResult, ReviewSession
+from .timing import span
+
+DEFAULT_INTERVAL = 15.0
+DEFAULT_MAX_INTERVAL = 300.0
+# GitHub caps a comment at 65,536 characters; the oldest earlier reviews go first
+MAX_EARLIER_CHARS = 40_000
+
+
+class IdleBackoff:
+    """Delay between polls: doubles while nothing changes, up to maximum."""
+
+    def __init__(self, initial: float, maximum: float, factor: float = 2.0) -> None:
+        self.initial = initial
+        self.maximum = max(maximum, initial)
+        self.factor = factor
+        self.current = initial
+
+    def next(self) -> float:
+        delay = self.current
+        self.current = min(self.current * self.factor, self.maximum)
+        return delay
+
+    def reset(self) -> None:
+        self.current = self.initial
+
+
+class PRWatcher:
+    """Keeps the review of one PR current while its author pushes to it.
+
+    Every poll is a conditional request (If-None-Match on the last ETag), so
+    a PR that has not changed costs a 304 and no rate-limit quota, and the
+    delay between polls doubles while it stays quiet. The first review covers
+    the whole PR; each later one only the commits pushed since the last
+    reviewed head, if the new head descends from it. After a rebase or force
+    push it does not, and the compare diff would also take in the commits
+    the PR was rebased onto, so the whole PR is reviewed again. With
+    comment, the first review is posted per comment_mode and later ones
+    update that comment, found by its id (not the gh user's last comment,
+    which may be a reply posted since), earlier reviews collapsed below the
+    newest.
+    """
+
+    def __init__(
+        self,
+        session: ReviewSession,
+        repo: str,
+        number: int,
+        profile: str | None = None,
+        model: str | None = None,
+        timeout: int | None = None,
+        comment: bool = False,
+        comment_mode: str | None = None,
+        interval: float = DEFAULT_INTERVAL,
+        max_interval: float = DEFAULT_MAX_INTERVAL,
+        on_event: Callable[[str, str], None] | None = None,
+        on_review: Callable[[ReviewResult], None] | None = None,
+    ) -> None:
+        self.session = session
+        self.repo = repo
+        self.number = number
+        self.profile = profile
+        self.model = model
+        self.timeout = timeout
+        self.comment = comment
+        self.comment_mode = comment_mode
+        self.backoff = IdleBackoff(interval, max_interval)
+        self.on_event = on_event
+        self.on_review = on_review
+        self.etag: str | None = None
+        self.state = "open"
+        self.reviewed_sha = ""  # head of the last review
+        self.reviews: list[str] = []  # newest first, each headed by its commits
+        self.comment_id: int | None = None  # the comment later reviews update
+
+    def _notify(self, event: str, detail: str = "") -> None:
+        if self.on_event is not None:
+            self.on_event(event, detail)
+
+    def check(self) -> ReviewResult | None:
+        """Poll once and review if the head moved. Returns the new review, if any."""
+        with span("watch.poll") as span_args:
+            poll = poll_pr(self.repo, self.number, self.etag)
+            span_args["changed"] = poll is not None
+        if poll is None:
+            return None
+        self.etag = poll.etag
+        self.state = poll.state
+        if poll.state != "open" or poll.head_sha == self.reviewed_sha:
+            return None
+        self._notify("pushed", poll.head_sha)
+        try:
+            return self._review(poll.head_sha)
+        except ParcFermeError:
+            self.etag = None  # so the next poll sees the change again and retries
+            raise
+
+    def _review(self, head: str) -> ReviewResult:
+        since = self.reviewed_sha
+        if since and not self._descends(since, head):
+            self._notify("rebased", since)
+            since = ""
+        result = self._run(since)
+        head = result.pr_info.head_sha
+        if self.comment:
+            try:
+                self.session.post(
+                    result, self.comment_mode, earlier=self._earlier(),
+                    comment_id=self.comment_id,
+                )
+                # Without an id to update, the next review posts a new comment
+                self.comment_id = comment_id_from_url(result.comment_url)
+            except GitHubError as e:
+                self._notify("error", f"could not post comment: {e}")
+        commits = f"{since[:7]}..{head[:7]}" if since else f"{head[:7]} (whole PR)"
+        self.reviews.insert(0, f"**{commits}**\n\n{result.review}")
+        self.reviewed_sha = head
+        return result
+
+    def _descends(self, since: str, head: str) -> bool:
+        """Whether head is since plus new commits (False if since is gone)."""
+        with span("watch.ancestry") as span_args:
+            try:
+                status = get_compare_status(self.repo, since, head)
+            except GitHubError:
+                status = "missing"
+            span_args["status"] = status
+        return status == "ahead"
+
+    def _earlier(self) -> str:
+        """The previous reviews, newest first, as many as fit in a comment."""
+        kept: list[str] = []
+        size = 0
+        for review in self.reviews:
+            size += len(review) + 2
+            if size > MAX_EARLIER_CHARS:
+                break
+            kept.append(review)
+        return "\n\n".join(kept)
+
+    def _run(self, since: str) -> ReviewResult:
+        with span("watch.review", since=since[:12]):
+            prepared = self.session.prepare_profiles(
+                str(self.number), repo=self.repo, profile=self.profile, since=since,
+            )
+            return self.session.run_profiles(prepared, self.model, timeout=self.timeout)
+
+    def run(self, stop: threading.Event | None = None) -> int:
+        """Poll until the PR is closed or stop is set. Returns the reviews done.
+
+        Errors are reported through on_event and retried at the next poll.
+        """
+        stop = stop or threading.Event()
+        done = 0
+        while not stop.is_set():
+            try:
+                result = self.check()
+            except ParcFermeError as e:
+                self._notify("error", str(e))
+                result = None
+            if result is not None:
+                done += 1
+                if self.on_review is not None:
+                    self.on_review(result)
+                self.backoff.reset()
+            if self.state != "open":
+                self._notify("closed", self.state)
+                break
+            stop.wait(self.backoff.next())
+        return done
@@ -1,10 +1,51 @@
 from __future__ import annotations
 
+import json
+import os
+from pathlib import Path
+
 import pytest
 
 from parc_ferme.github import PRInfo
 from parc_ferme.profiles import DEFAULT_SEVERITY_LEVELS, Profile
 
+STUBS_DIR = Path(__file__).resolve().parents[1] / "benchmarks" / "stubs"
+
+SAMPLE_DIFF = """\
+diff --git a/src/app.py b/src/app.py
+index 1111111..2222222 100644
+--- a/src/app.py
++++ b/src/app.py
+@@ -10,3 +10,4 @@ def login(user):
+     if user is None:
+-        return False
++        raise ValueError("user required")
++    audit(user)
+     return True
+diff --git a/README.md b/README.md
+index 3333333..4444444 100644
+--- a/README.md
++++ b/README.md
+@@ -1,2 +1,2 @@
+ # Project
+-Old text
++New text
+"""
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache_dir(tmp_path, monkeypatch):
+    """Keep history, caches and lock slots out of the real home and /tmp."""
+    cache = tmp_path / "cache"
+    monkeypatch.setenv("XDG_CACHE_HOME", str(cache))
+    monkeypatch.setenv("PARC_FERME_RUNTIME_DIR", str(tmp_path / "run"))
+    return cache / "parc-ferme"
+
+
+@pytest.fixture
+def sample_diff():
+    return SAMPLE_DIFF
+
 
 @pytest.fixture
 def sample_pr_info():
@@ -27,3 +68,25 @@ def sample_profile():
         checks=["Bugs: Logic errors"],
         severity_levels=DEFAULT_SEVERITY_LEVELS,
     )
+
+
+@pytest.fixture
+def stub_tools(tmp_path, monkeypatch, sample_diff):
+    """Put the benchmark gh/claude stubs on PATH; returns a call-log reader."""
+    diff_path = tmp_path / "pr.diff"
+    diff_path.write_text(sample_diff)
+    log_path = tmp_path / "calls.jsonl"
+    monkeypatch.setenv("PATH", f"{STUBS_DIR}:{os.environ['PATH']}")
+    monkeypatch.setenv("PARC_BENCH_DIFF", str(diff_path))
+    monkeypatch.setenv("PARC_BENCH_LOG", str(log_path))
+
+    def calls(tool=None, args=None):
+        if not log_path.exists():
+            return []
+        records = [json.loads(line) for line in log_path.read_text().splitlines()]
+        return [
+            r for r in records
+            if (tool is None or r["tool"] == tool) and (args is None or r["args"] == args)
+        ]
+
+    return calls
@@ -1,8 +1,22 @@
 from __future__ import annotations
 
+import json
+from unittest.mock import patch
+
 import pytest
 
-from parc_ferme.cli import _has_critical_issues, _print_err, parse_args
+from parc_ferme.cli import (
+    _print_err,
+    batch_main,
+    config_main,
+    jobs_main,
+    main,
+    parse_args,
+    parse_batch_args,
+    parse_config_args,
+)
+from parc_ferme.history import ReviewRecord, record_review
+from parc_ferme.jobs import DONE, JobStore
 
 
 def test_parse_args_pr_number():
@@ -104,23 +118,265 @@ def test_parse_args_strict():
     assert args.strict is True
 
 
-# --- _has_critical_issues ---
+def test_parse_args_config_snapshot():
+    args = parse_args(["123", "--config-snapshot", "snap.json"])
+    assert args.config_snapshot == "snap.json"
+
+
+def test_parse_args_config_and_snapshot_exclusive():
+    with pytest.raises(SystemExit):
+        parse_args(["123", "--config", "a.yml", "--config-snapshot", "snap.json"])
+
+
+def test_parse_args_timings():
+    args = parse_args(["123", "--timings"])
+    assert args.timings is True
+    assert args.trace is None
+
+
+def test_parse_args_trace():
+    args = parse_args(["123", "--trace", "trace.json"])
+    assert args.trace == "trace.json"
+
+
+def test_parse_args_estimate():
+    args = parse_args(["123", "--estimate"])
+    assert args.estimate is True
+
+
+# --- --estimate ---
+
+
+def test_main_estimate_skips_claude(stub_tools, tmp_path, capsys):
+    out = tmp_path / "estimate.json"
+    with patch("parc_ferme.session.load_config", return_value={"claude_model": "sonnet"}), \
+            patch("parc_ferme.session.review_shards") as mock_review:
+        code = main(["123", "--estimate", "--no-color", "-o", str(out)])
+    assert code == 0
+    assert stub_tools("claude") == []
+    mock_review.assert_not_called()
+    output = capsys.readouterr().out
+    assert "Tokens:" in output
+    assert "Model:      sonnet" in output
+    data = json.loads(out.read_text())
+    assert data["file_count"] == 2
+    assert data["truncated"] is False
+
+
+def test_main_multi_profile_review(stub_tools, capsys):
+    assert main(["7", "-p", "security,performance", "--no-color"]) == 0
+    output = capsys.readouterr().out
+    assert "### `security`" in output
+    assert "### `performance`" in output
+    assert len(stub_tools("claude")) == 2
+
+
+def test_main_rejects_unknown_profile_in_list(stub_tools, capsys):
+    assert main(["7", "-p", "security,nope", "--no-color"]) == 1
+    assert stub_tools("claude") == []
+
+
+def test_main_estimate_strict_fails_on_truncation(stub_tools, tmp_path):
+    (tmp_path / "pr.diff").write_text("x" * 200_000)
+    with patch("parc_ferme.session.load_config", return_value={}):
+        code = main(["123", "--estimate", "--strict", "--no-color"])
+    assert code == 1
+
+
+# --- timings / trace ---
+
+
+def test_main_timings_and_trace(tmp_path, capsys):
+    trace_path = tmp_path / "trace.json"
+    with patch("parc_ferme.session.load_config", return_value={}):
+        code = main(["--list-profiles", "--timings", "--trace", str(trace_path)])
+    assert code == 0
+    assert "config.load" in capsys.readouterr().err
+    trace = json.loads(trace_path.read_text())
+    names = [e["name"] for e in trace["traceEvents"]]
+    assert "main" in names
+    assert "config.load" in names
+    assert trace["otherData"]["exit_code"] == 0
+
+
+def test_main_trace_written_on_error(tmp_path):
+    trace_path = tmp_path / "trace.json"
+    with patch("parc_ferme.session.load_config", return_value={}):
+        code = main(["--trace", str(trace_path), "--no-color"])
+    assert code == 1
+    trace = json.loads(trace_path.read_text())
+    assert trace["otherData"]["exit_code"] == 1
 
 
-def test_has_critical_issues_found():
-    assert _has_critical_issues("\U0001f534 CRITICAL - file.py:10 — bug") is True
+# --- config subcommand ---
 
 
-def test_has_critical_issues_not_found():
-    assert _has_critical_issues("\U0001f7e1 WARNING - file.py:10 — minor") is False
+def test_parse_config_args_compile_defaults():
+    args = parse_config_args(["compile"])
+    assert args.action == "compile"
+    assert args.output == ".reviewrc.snapshot.json"
+    assert args.config is None
 
 
-def test_has_critical_issues_lgtm():
-    assert _has_critical_issues("\u2705 LGTM") is False
+def test_config_main_compile_writes_snapshot(tmp_path, capsys):
+    source = tmp_path / ".reviewrc.yml"
+    source.write_text("default_profile: security\n")
+    out = tmp_path / "snap.json"
+    code = config_main(["compile", "--config", str(source), "-o", str(out), "--no-color"])
+    assert code == 0
+    assert out.exists()
+    assert "Config snapshot written" in capsys.readouterr().out
 
 
-def test_has_critical_issues_case_sensitive():
-    assert _has_critical_issues("critical") is False
+def test_config_main_compile_missing_config(tmp_path, capsys):
+    code = config_main(["compile", "--config", str(tmp_path / "nope.yml"), "--no-color"])
+    assert code == 1
+    assert "Config file not found" in capsys.readouterr().err
+
+
+# --- batch / jobs subcommands ---
+
+
+def test_parse_batch_args_defaults():
+    args = parse_batch_args(["1", "2"])
+    assert args.prs == ["1", "2"]
+    assert args.workers is None
+    assert args.fixed_workers is False
+    assert args.retry_failed is False
+
+
+def test_batch_reviews_and_resume_does_not_repeat(stub_tools, tmp_path, capsys):
+    store_path = tmp_path / "jobs.sqlite3"
+    argv = ["1", "2", "https://github.com/other/repo/pull/3", "-R", "owner/repo",
+            "--store", str(store_path), "--config", str(tmp_path / "none.yml"), "--no-color"]
+    # The stub serves one diff for every PR, which the hunk cache would answer
+    (tmp_path / "none.yml").write_text("hunk_cache:\n  enabled: false\n")
+    assert batch_main(argv) == 0
+    assert len(stub_tools("claude")) == 3
+    with JobStore(store_path) as store:
+        assert store.counts()[DONE] == 3
+        assert {j.repo for j in store.list_jobs()} == {"owner/repo", "other/repo"}
+
+    # Same heads again: nothing new is queued or reviewed
+    assert batch_main(argv) == 0
+    assert len(stub_tools("claude")) == 3
+    assert "Queued 0 new jobs (3 already recorded)" in capsys.readouterr().out
+
+
+def test_batch_stops_at_its_token_budget(stub_tools, tmp_path, capsys):
+    (tmp_path / "none.yml").write_text("hunk_cache:\n  enabled: false\n")
+    store_path = tmp_path / "jobs.sqlite3"
+    argv = ["1", "2", "3", "-R", "owner/repo", "-j", "1", "--max-tokens", "10",
+            "--store", str(store_path), "--config", str(tmp_path / "none.yml"), "--no-color"]
+    assert batch_main(argv) == 0
+    assert len(stub_tools("claude")) == 1
+    out = capsys.readouterr().out
+    assert "Batch budget reached; 2 jobs left queued" in out
+    assert "in 1 Claude calls" in out
+    with JobStore(store_path) as store:
+        assert store.counts()[DONE] == 1
+
+
+def test_batch_records_size_and_label_priority(stub_tools, tmp_path, monkeypatch):
+    (tmp_path / "c.yml").write_text("scheduling:\n  label_priority:\n    hotfix: 2\n")
+    monkeypatch.setenv("PARC_BENCH_LABELS", "hotfix,docs")
+    store_path = tmp_path / "jobs.sqlite3"
+    argv = ["1", "-R", "owner/repo", "--order", "fifo",
+            "--store", str(store_path), "--config", str(tmp_path / "c.yml")]
+    assert batch_main(argv) == 0
+    with JobStore(store_path) as store:
+        job = store.get(1)
+    assert job.priority == 2
+    assert job.size > 0
+
+
+def test_batch_uses_current_repo_for_numbers(stub_tools, tmp_path):
+    (tmp_path / "none.yml").write_text("")
+    store_path = tmp_path / "jobs.sqlite3"
+    argv = ["5", "--store", str(store_path), "--config", str(tmp_path / "none.yml")]
+    assert main(["batch", *argv]) == 0
+    with JobStore(store_path) as store:
+        assert store.get(1).repo == "bench/repo"
+
+
+def test_batch_timings_report_concurrency(stub_tools, tmp_path, capsys):
+    (tmp_path / "none.yml").write_text("")
+    argv = ["1", "2", "3", "-R", "owner/repo", "-j", "4", "--timings",
+            "--trace", str(tmp_path / "trace.json"),
+            "--store", str(tmp_path / "jobs.sqlite3"), "--config", str(tmp_path / "none.yml")]
+    assert batch_main(argv) == 0
+    assert "batch.concurrency" in capsys.readouterr().err
+    trace = json.loads((tmp_path / "trace.json").read_text())
+    assert trace["otherData"]["concurrency"]["max"] == 4
+    assert sum(1 for e in trace["traceEvents"] if e["name"] == "job") == 3
+
+
+def test_watch_stops_on_a_closed_pr(stub_tools, monkeypatch, capsys):
+    monkeypatch.setenv("PARC_BENCH_PR_STATE", "closed")
+    assert main(["watch", "7", "-R", "owner/repo", "--interval", "1"]) == 0
+    assert "PR is closed; stopped watching" in capsys.readouterr().err
+    assert stub_tools("claude") == []
+
+
+def test_stats_without_history(capsys):
+    assert main(["stats"]) == 0
+    assert "No review history yet" in capsys.readouterr().out
+
+
+def test_stats_shows_distributions_and_model(capsys):
+    for i in range(12):
+        record_review(ReviewRecord(timestamp=0.0, model="sonnet", profile="default",
+                                   diff_chars=4000 * (i + 1), diff_tokens=1000 * (i + 1),
+                                   file_count=2, duration=5.0 + 10.0 * (i + 1)))
+    assert main(["stats", "--no-color"]) == 0
+    out = capsys.readouterr().out
+    assert "Review history: 12 reviews" in out
+    assert "Latency model (sonnet, 12 calls): 5.0s + 10.00s per 1k tokens" in out
+    assert "Shard size for a 120s call: ~11,500 tokens" in out
+
+    assert main(["stats", "--json"]) == 0
+    data = json.loads(capsys.readouterr().out)
+    assert data["groups"][0]["reviews"] == 12
+    assert data["models"][0]["samples"] == 12
+
+
+def test_jobs_lists_and_shows(tmp_path, capsys):
+    store_path = tmp_path / "jobs.sqlite3"
+    with JobStore(store_path) as store:
+        store.add("o/r", 1, "a" * 40, "default")
+        store.add("o/r", 2, "b" * 40, "default")
+        store.complete(store.claim("w"), "Looks good")
+
+    assert jobs_main(["--store", str(store_path), "--no-color"]) == 0
+    out = capsys.readouterr().out
+    assert "Jobs: 2 total (pending 1, done 1)" in out
+    assert "o/r#2@bbbbbbb" in out
+
+    assert jobs_main(["--store", str(store_path), "--show", "1"]) == 0
+    assert "Looks good" in capsys.readouterr().out
+    assert jobs_main(["--store", str(store_path), "--show", "2", "--no-color"]) == 1
+
+
+def test_index_builds_and_looks_up(tmp_path, capsys):
+    import subprocess
+
+    repo = tmp_path / "clone"
+    repo.mkdir()
+    (repo / "app.py").write_text("def load(item, strict=False):\n    pass\n")
+    for args in (["init", "-q"], ["add", "."], ["-c", "user.name=dev", "-c",
+                 "user.email=dev@example.com", "commit", "-qm", "first"]):
+        subprocess.run(["git", "-C", str(repo), *args], check=True)
+
+    code = main(["index", "--repo-path", str(repo), "--lookup", "load", "--lookup", "nope",
+                 "--no-color"])
+    assert code == 0
+    out = capsys.readouterr().out
+    assert "1 files, 1 symbols (1 files parsed" in out
+    assert "app.py:1  def load(item, strict=False)" in out
+    assert "nope: not found" in out
+
+    assert main(["index", "--repo-path", str(tmp_path), "--no-color"]) == 1
+    assert "Not a git clone" in capsys.readouterr().err
 
 
 # --- _print_err ---
@@ -5,7 +5,13 @@ from unittest.mock import patch
 
 import pytest
 
-from parc_ferme.config import _build_custom_profiles, load_config
+from parc_ferme.config import (
+    _build_custom_profiles,
+    compile_config,
+    load_config,
+    load_config_snapshot,
+    write_config_snapshot,
+)
 from parc_ferme.errors import ConfigError
 
 FIXTURES_DIR = Path(__file__).parent / "fixtures"
@@ -146,6 +152,204 @@ def test_load_config_zero_timeout_raises():
 # --- claude_model validation ---
 
 
+def test_load_config_max_concurrent_reviews(tmp_path):
+    f = tmp_path / "c.yml"
+    f.write_text("max_concurrent_reviews: 2\n")
+    assert load_config(str(f))["max_concurrent_reviews"] == 2
+
+
+@pytest.mark.parametrize("value", ["0", "-1", "many"])
+def test_load_config_invalid_max_concurrent_reviews_raises(tmp_path, value):
+    f = tmp_path / "c.yml"
+    f.write_text(f"max_concurrent_reviews: {value}\n")
+    with pytest.raises(ConfigError, match="max_concurrent_reviews"):
+        load_config(str(f))
+
+
+def test_load_config_single_flight(tmp_path):
+    f = tmp_path / "c.yml"
+    f.write_text("single_flight:\n  enabled: false\n")
+    config = load_config(str(f))
+    assert config["single_flight"] == {"enabled": False, "ttl": 3600, "ignore_whitespace": False}
+
+
+def test_load_config_single_flight_validated(tmp_path):
+    f = tmp_path / "c.yml"
+    f.write_text("single_flight:\n  ttl: '600'\n  ignore_whitespace: 1\n")
+    config = load_config(str(f))
+    assert config["single_flight"] == {"enabled": True, "ttl": 600.0, "ignore_whitespace": True}
+    f.write_text("single_flight:\n  ttl: -5\n")
+    with pytest.raises(ConfigError, match="single_flight.ttl"):
+        load_config(str(f))
+    f.write_text("single_flight:\n  ttl: soon\n")
+    with pytest.raises(ConfigError, match="single_flight.ttl"):
+        load_config(str(f))
+
+
+def test_load_config_retry_and_max_shards(tmp_path):
+    f = tmp_path / "c.yml"
+    f.write_text("max_shards: 4\nretry:\n  attempts: 5\n  backoff: 0.5\n")
+    config = load_config(str(f))
+    assert config["max_shards"] == 4
+    assert config["retry"] == {"attempts": 5, "backoff": 0.5, "max_backoff": 30.0}
+
+
+@pytest.mark.parametrize("text, key", [
+    ("retry:\n  attempts: 0\n", "retry.attempts"),
+    ("retry:\n  backoff: -1\n", "retry.backoff"),
+    ("max_shards: none\n", "max_shards"),
+])
+def test_load_config_invalid_retry_raises(tmp_path, text, key):
+    f = tmp_path / "c.yml"
+    f.write_text(text)
+    with pytest.raises(ConfigError, match=key):
+        load_config(str(f))
+
+
+def test_load_config_latency_model(tmp_path):
+    f = tmp_path / "c.yml"
+    f.write_text("latency_model:\n  percentile: 99\n  target_seconds: 90\n")
+    config = load_config(str(f))["latency_model"]
+    assert (config["percentile"], config["target_seconds"], config["enabled"]) == (99, 90, True)
+
+
+@pytest.mark.parametrize("text", [
+    "latency_model:\n  percentile: 101\n",
+    "latency_model:\n  min_samples: 0\n",
+])
+def test_load_config_invalid_latency_model_raises(tmp_path, text):
+    f = tmp_path / "c.yml"
+    f.write_text(text)
+    with pytest.raises(ConfigError, match="latency_model"):
+        load_config(str(f))
+
+
+def test_load_config_fast_path(tmp_path):
+    f = tmp_path / "c.yml"
+    f.write_text("fast_path:\n  checks: [docs, version_bump]\n")
+    assert load_config(str(f))["fast_path"] == {"enabled": True, "checks": ["docs", "version_bump"]}
+    f.write_text("fast_path:\n  checks: [tests]\n")
+    with pytest.raises(ConfigError, match="fast_path.checks"):
+        load_config(str(f))
+
+
+def test_load_config_hunk_cache(tmp_path):
+    f = tmp_path / "c.yml"
+    f.write_text("hunk_cache:\n  ttl_days: 7\n")
+    assert load_config(str(f))["hunk_cache"] == {"enabled": True, "ttl_days": 7}
+    f.write_text("hunk_cache:\n  ttl_days: -1\n")
+    with pytest.raises(ConfigError, match="hunk_cache.ttl_days"):
+        load_config(str(f))
+
+
+def test_load_config_stacked_prs(tmp_path):
+    f = tmp_path / "c.yml"
+    f.write_text("claude_model: sonnet\n")
+    assert load_config(str(f))["stacked_prs"] == {"enabled": False}
+    f.write_text("stacked_prs:\n  enabled: true\n")
+    assert load_config(str(f))["stacked_prs"] == {"enabled": True}
+
+
+def test_load_config_code_context(tmp_path):
+    f = tmp_path / "c.yml"
+    f.write_text("code_context:\n  repo_path: ~/src/app\n  max_bytes: 4000\n")
+    assert load_config(str(f))["code_context"] == {
+        "enabled": False, "repo_path": "~/src/app", "max_bytes": 4000,
+    }
+    f.write_text("code_context:\n  max_bytes: 500000\n")
+    with pytest.raises(ConfigError, match="code_context.max_bytes"):
+        load_config(str(f))
+
+
+def test_load_config_symbol_index(tmp_path):
+    f = tmp_path / "c.yml"
+    f.write_text("symbol_index:\n  max_tokens: 800\n")
+    assert load_config(str(f))["symbol_index"] == {"enabled": False, "max_tokens": 800}
+    f.write_text("symbol_index:\n  max_tokens: -5\n")
+    with pytest.raises(ConfigError, match="symbol_index.max_tokens"):
+        load_config(str(f))
+    f.write_text("symbol_index:\n  max_tokens: 60000\n")
+    with pytest.raises(ConfigError, match="symbol_index.max_tokens.*at most 25000"):
+        load_config(str(f))
+
+
+def test_load_config_conventions(tmp_path):
+    f = tmp_path / "c.yml"
+    f.write_text("conventions:\n  max_bytes: 1000\n")
+    assert load_config(str(f))["conventions"] == {"enabled": False, "max_bytes": 1000}
+    f.write_text("conventions:\n  max_bytes: 500000\n")
+    with pytest.raises(ConfigError, match="conventions.max_bytes"):
+        load_config(str(f))
+
+
+def test_load_config_budgets(tmp_path):
+    f = tmp_path / "c.yml"
+    f.write_text("budgets:\n  max_tokens_per_pr: 50000\n  max_cost_per_batch: 12.5\n"
+                 "  cheaper_model: haiku\n  on_pr_exceeded: skip\n")
+    budgets = load_config(str(f))["budgets"]
+    assert budgets["max_tokens_per_pr"] == 50000
+    assert budgets["max_cost_per_batch"] == 12.5
+    assert budgets["max_tokens_per_batch"] is None
+    assert (budgets["cheaper_model"], budgets["on_pr_exceeded"]) == ("haiku", "skip")
+    for bad in ("on_pr_exceeded: drop", "downgrade_at: 1.5", "max_tokens_per_pr: 0",
+                "cheaper_model: 'bad model'"):
+        f.write_text(f"budgets:\n  {bad}\n")
+        with pytest.raises(ConfigError, match="budgets."):
+            load_config(str(f))
+
+
+def test_load_config_scheduling(tmp_path):
+    f = tmp_path / "c.yml"
+    f.write_text("scheduling:\n  aging_seconds: 120\n  label_priority:\n    hotfix: 10\n")
+    assert load_config(str(f))["scheduling"] == {
+        "order": "sjf", "aging_seconds": 120, "label_priority": {"hotfix": 10},
+    }
+    for bad in ("order: lifo", "aging_seconds: -1", "label_priority:\n    hotfix: high"):
+        f.write_text(f"scheduling:\n  {bad}\n")
+        with pytest.raises(ConfigError, match="scheduling."):
+            load_config(str(f))
+
+
+def test_load_config_watch(tmp_path):
+    f = tmp_path / "c.yml"
+    f.write_text("watch:\n  interval: 5\n")
+    assert load_config(str(f))["watch"] == {"interval": 5, "max_interval": 300}
+    for bad in ("interval: 0", "max_interval: 2"):
+        f.write_text(f"watch:\n  interval: 5\n  {bad}\n")
+        with pytest.raises(ConfigError, match="watch."):
+            load_config(str(f))
+
+
+def test_load_config_auto_profiles(tmp_path):
+    f = tmp_path / "c.yml"
+    f.write_text(
+        "auto_profiles:\n"
+        "  rules:\n"
+        "    - extensions: [TS, .html]\n"
+        "      content: '@angular/'\n"
+        "      profiles: [angular, security]\n"
+        "  fallback: default\n"
+    )
+    config = load_config(str(f))["auto_profiles"]
+    assert config == {
+        "rules": [{"extensions": [".ts", ".html"], "content": "@angular/",
+                   "profiles": ["angular", "security"]}],
+        "fallback": ["default"],
+    }
+
+
+@pytest.mark.parametrize("text", [
+    "auto_profiles:\n  rules:\n    - extensions: [.ts]\n",
+    "auto_profiles:\n  rules:\n    - content: '('\n      profiles: [angular]\n",
+    "auto_profiles:\n  fallback: [1]\n",
+])
+def test_load_config_invalid_auto_profiles_raises(tmp_path, text):
+    f = tmp_path / "c.yml"
+    f.write_text(text)
+    with pytest.raises(ConfigError, match="auto_profiles"):
+        load_config(str(f))
+
+
 def test_load_config_invalid_model_raises():
     with pytest.raises(ConfigError, match="Invalid claude_model"):
         load_config(str(FIXTURES_DIR / "invalid_model_config.yml"))
@@ -157,3 +361,107 @@ def test_load_config_model_null_is_allowed():
     ):
         config = load_config()
     assert config["claude_model"] is None
+
+
+# --- config snapshot ---
+
+
+def test_compile_config_records_source_hash():
+    snapshot = compile_config(str(FIXTURES_DIR / "valid_config.yml"))
+    assert len(snapshot["sources"]) == 1
+    assert snapshot["sources"][0]["path"].endswith("valid_config.yml")
+    assert len(snapshot["sources"][0]["sha256"]) == 64
+    assert snapshot["config"]["custom_profiles"]["myprofile"]["system_role"] == "test reviewer"
+
+
+def test_snapshot_round_trip(tmp_path):
+    out = tmp_path / "snapshot.json"
+    write_config_snapshot(str(out), str(FIXTURES_DIR / "valid_config.yml"))
+    config = load_config_snapshot(str(out))
+    expected = load_config(str(FIXTURES_DIR / "valid_config.yml"))
+    assert config == expected
+
+
+def test_snapshot_round_trip_extends(tmp_path):
+    out = tmp_path / "snapshot.json"
+    write_config_snapshot(str(out), str(FIXTURES_DIR / "extends_config.yml"))
+    config = load_config_snapshot(str(out))
+    profile = config["custom_profiles"]["extended-default"]
+    assert "docstrings" in profile.extra_instructions
+    assert profile.severity_levels[0].label == "CRITICAL"
+
+
+def test_snapshot_does_not_parse_yaml(tmp_path):
+    out = tmp_path / "snapshot.json"
+    write_config_snapshot(str(out), str(FIXTURES_DIR / "valid_config.yml"))
+    with patch("parc_ferme.config._parse_yaml") as mock_parse:
+        load_config_snapshot(str(out))
+    mock_parse.assert_not_called()
+
+
+def test_snapshot_stale_source_raises(tmp_path):
+    source = tmp_path / ".reviewrc.yml"
+    source.write_text("default_profile: security\n")
+    out = tmp_path / "snapshot.json"
+    write_config_snapshot(str(out), str(source))
+    source.write_text("default_profile: angular\n")
+    with pytest.raises(ConfigError, match="stale"):
+        load_config_snapshot(str(out))
+
+
+def test_snapshot_missing_source_raises(tmp_path):
+    source = tmp_path / ".reviewrc.yml"
+    source.write_text("default_profile: security\n")
+    out = tmp_path / "snapshot.json"
+    write_config_snapshot(str(out), str(source))
+    source.unlink()
+    with pytest.raises(ConfigError, match="stale"):
+        load_config_snapshot(str(out))
+
+
+def test_snapshot_added_project_config_raises(tmp_path, monkeypatch):
+    monkeypatch.setattr("parc_ferme.config.USER_CONFIG_DIR", tmp_path / "user")
+    monkeypatch.setattr("parc_ferme.config._find_git_root", lambda: tmp_path)
+    out = tmp_path / "snapshot.json"
+    snapshot = write_config_snapshot(str(out))
+    assert snapshot["sources"][1] == {"path": ".reviewrc.yml", "sha256": None}
+    load_config_snapshot(str(out))
+    (tmp_path / ".reviewrc.yml").write_text("default_profile: security\n")
+    with pytest.raises(ConfigError, match="stale"):
+        load_config_snapshot(str(out))
+
+
+def test_snapshot_paths_relative_to_repo_root(tmp_path, monkeypatch):
+    checkout = tmp_path / "checkout"
+    checkout.mkdir()
+    (checkout / ".reviewrc.yml").write_text("default_profile: security\n")
+    monkeypatch.setattr("parc_ferme.config.USER_CONFIG_DIR", tmp_path / "user")
+    monkeypatch.setattr("parc_ferme.config._find_git_root", lambda: checkout)
+    out = tmp_path / "snapshot.json"
+    write_config_snapshot(str(out))
+
+    moved = tmp_path / "elsewhere"
+    checkout.rename(moved)
+    monkeypatch.setattr("parc_ferme.config._find_git_root", lambda: moved)
+    assert load_config_snapshot(str(out))["default_profile"] == "security"
+
+
+def test_snapshot_version_mismatch_raises(tmp_path):
+    out = tmp_path / "snapshot.json"
+    write_config_snapshot(str(out), str(FIXTURES_DIR / "valid_config.yml"))
+    data = out.read_text().replace('"parc_ferme_version": "', '"parc_ferme_version": "0.0.0-')
+    out.write_text(data)
+    with pytest.raises(ConfigError, match="Re-run"):
+        load_config_snapshot(str(out))
+
+
+def test_snapshot_not_found_raises():
+    with pytest.raises(ConfigError, match="Config snapshot not found"):
+        load_config_snapshot("/nonexistent/snapshot.json")
+
+
+def test_snapshot_invalid_json_raises(tmp_path):
+    out = tmp_path / "snapshot.json"
+    out.write_text("{not json")
+    with pytest.raises(ConfigError, match="Invalid config snapshot"):
+        load_config_snapshot(str(out))
@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import subprocess
+
+import pytest
+
+from parc_ferme.context import (
+    CONTEXT_HEADER,
+    CatFile,
+    build_context,
+    enclosing_block,
+    find_work_tree,
+    is_definition,
+    merge_base,
+)
+from parc_ferme.diff import parse_diff
+
+BASE_APP = """\
+import os
+
+
+class Auth:
+    @cached
+    def login(
+        self,
+        user,
+    ) -> bool:
+        if user is None:
+            return False
+        return True
+
+    def logout(self):
+        pass
+"""
+
+HEAD_APP = BASE_APP.replace(
+    "            return False\n",
+    "            raise ValueError(\"user required\")\n",
+)
+
+APP_DIFF = """\
+diff --git a/app.py b/app.py
+--- a/app.py
++++ b/app.py
+@@ -10,3 +10,3 @@ class Auth:
+         if user is None:
+-            return False
++            raise ValueError("user required")
+         return True
+"""
+
+
+def _git(cwd, *args):
+    return subprocess.run(
+        ["git", "-C", str(cwd), *args], capture_output=True, text=True, check=True,
+    ).stdout.strip()
+
+
+@pytest.fixture
+def clone(tmp_path):
+    """A repo with app.py at BASE_APP (base) and HEAD_APP (head). Returns (dir, base, head)."""
+    repo = tmp_path / "clone"
+    repo.mkdir()
+    _git(repo, "init", "-q")
+    _git(repo, "config", "user.email", "dev@example.com")
+    _git(repo, "config", "user.name", "dev")
+    (repo / "app.py").write_text(BASE_APP)
+    _git(repo, "add", "app.py")
+    _git(repo, "commit", "-q", "-m", "base")
+    base = _git(repo, "rev-parse", "HEAD")
+    (repo / "app.py").write_text(HEAD_APP)
+    _git(repo, "commit", "-q", "-am", "head")
+    return repo, base, _git(repo, "rev-parse", "HEAD")
+
+
+# --- is_definition / enclosing_block ---
+
+
+@pytest.mark.parametrize("line", [
+    "def load(self):",
+    "    async def load(",
+    "export class FooComponent implements OnInit {",
+    "  private load(): Observable<T> {",
+    "  ngOnInit(): void {",
+    "func (s *Server) Run(ctx context.Context) error {",
+    "public static int parse(String s)",
+    "const handler = async (req) => {",
+])
+def test_is_definition(line):
+    assert is_definition(line)
+
+
+@pytest.mark.parametrize("line", [
+    "    if (user) {",
+    "} else if (x) {",
+    "    raise ValueError(message)",
+    "    Look up the PR (and its files).",
+    "    Returns a class of results",
+    "  describe('login', () => {",
+    "# def commented_out():",
+])
+def test_is_not_definition(line):
+    assert not is_definition(line)
+
+
+def test_enclosing_block_python_method_with_decorator_and_long_signature():
+    lines = HEAD_APP.splitlines()
+    start, end = enclosing_block(lines, 10)
+    assert lines[start] == "    @cached"
+    assert lines[end - 1] == "        return True"
+
+
+def test_enclosing_block_braces():
+    lines = [
+        "export class A {",
+        "  load() {",
+        "    if (x) {",
+        "      y();",
+        "    }",
+        "  }",
+        "}",
+    ]
+    assert enclosing_block(lines, 3) == (1, 6)
+    assert enclosing_block(["void main()", "{", "  int x = 1;", "}"], 2) == (0, 4)
+
+
+def test_enclosing_block_top_level_statement():
+    assert enclosing_block(["import os", "x = 1"], 1) is None
+
+
+# --- CatFile ---
+
+
+def test_cat_file_reads_blobs_through_one_process(clone):
+    repo, base, head = clone
+    cat = CatFile(repo)
+    try:
+        assert cat.read(f"{base}:app.py") == BASE_APP.encode()
+        proc = cat._proc
+        assert cat.read(f"{head}:app.py") == HEAD_APP.encode()
+        assert cat.read(f"{head}:missing.py") is None
+        assert cat.read("0" * 40) is None
+        assert cat._proc is proc
+    finally:
+        cat.close()
+    assert cat._proc is None
+
+
+def test_find_work_tree_and_merge_base(clone, tmp_path):
+    repo, base, head = clone
+    (repo / "src").mkdir()
+    assert find_work_tree(repo / "src") == repo.resolve()
+    assert merge_base(repo, base, head) == base
+    assert merge_base(repo, "0" * 40, head) is None
+
+
+# --- build_context ---
+
+
+def test_build_context_head_and_base(clone):
+    repo, base, head = clone
+    with_base = CatFile(repo)
+    try:
+        context = build_context(parse_diff(APP_DIFF), with_base, head, base)
+    finally:
+        with_base.close()
+    assert context.startswith(CONTEXT_HEADER)
+    assert "app.py:5-12 (head)" in context
+    assert "app.py:5-12 (base)" in context
+    assert '11 |             raise ValueError("user required")' in context
+    assert "def logout" not in context
+
+
+def test_build_context_respects_byte_budget(clone):
+    repo, base, head = clone
+    cat = CatFile(repo)
+    try:
+        files = parse_diff(APP_DIFF)
+        full = build_context(files, cat, head, base)
+        head_only = build_context(files, cat, head, base, max_bytes=len(full.encode()) - 10)
+        assert len(head_only.encode()) <= len(full.encode()) - 10
+        assert "(head)" in head_only and "(base)" not in head_only
+        assert build_context(files, cat, head, base, max_bytes=50) == ""
+    finally:
+        cat.close()
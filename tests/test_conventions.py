@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import subprocess
+
+import pytest
+
+from parc_ferme.context import CatFile
+from parc_ferme.conventions import (
+    CONVENTIONS_HEADER,
+    ConventionCache,
+    build_digest,
+    convention_digest,
+    extract_conventions,
+)
+
+PYPROJECT = """\
+[project]
+name = "app"
+
+[tool.ruff]
+line-length = 99
+target-version = "py310"
+extend-exclude = ["build"]
+
+[tool.ruff.lint]
+select = ["E", "F", "B"]
+
+[tool.pytest.ini_options]
+testpaths = ["tests"]
+"""
+
+CONTRIBUTING = """\
+# Contributing
+
+Thanks for helping out.
+
+## Style
+- Errors subclass AppError.
+1. Tests go in tests/test_<module>.py.
+
+```python
+# not a heading
+```
+"""
+
+
+@pytest.mark.parametrize("path, text, expected", [
+    (".editorconfig", "root = true\n[*]\nend_of_line = lf\n[*.py]\nindent_size = 4\n",
+     ["*: end_of_line=lf", "*.py: indent_size=4"]),
+    ("pyproject.toml", PYPROJECT,
+     ['ruff: line-length=99, target-version=py310', 'ruff.lint: select=["E", "F", "B"]']),
+    ("setup.cfg", "[metadata]\nname = app\n[flake8]\nmax-line-length = 120\n",
+     ["flake8: max-line-length=120"]),
+    (".prettierrc", '{"singleQuote": true, "printWidth": 100, "overrides": []}',
+     ["singleQuote=true, printWidth=100"]),
+    (".eslintrc.yml", "extends: airbnb\nrules:\n  no-console: error\n  semi: [warn, always]\n"
+     "  quotes: 'off'\n", ["extends: airbnb", "rules: no-console (error), semi (warn)"]),
+    ("tsconfig.json", '{"compilerOptions": {"strict": true, "noImplicitAny": false}}',
+     ["compilerOptions: strict"]),
+    (".golangci.yml", "linters:\n  enable: [errcheck, gofmt]\n", ["linters: errcheck, gofmt"]),
+    (".github/CODEOWNERS", "# owners\n/api/   @org/api\n", ["/api/ @org/api"]),
+    ("CONTRIBUTING.md", CONTRIBUTING,
+     ["# Contributing", "## Style", "- Errors subclass AppError.",
+      "1. Tests go in tests/test_<module>.py."]),
+    ("tsconfig.json", "{ // comments are not JSON\n", []),
+])
+def test_extract_conventions(path, text, expected):
+    assert extract_conventions(path, text) == expected
+
+
+def test_build_digest_within_budget():
+    sources = {"pyproject.toml": PYPROJECT, "CONTRIBUTING.md": CONTRIBUTING}
+    digest = build_digest(sources)
+    assert digest.startswith(CONVENTIONS_HEADER + "\npyproject.toml:\n- ruff: line-length=99")
+    assert "- ## Style" in digest
+    small = build_digest(sources, max_bytes=len(CONVENTIONS_HEADER) + 80)
+    assert len(small.encode()) <= len(CONVENTIONS_HEADER) + 80
+    assert "CONTRIBUTING.md" not in small
+    assert build_digest({"README.txt": "hello"}) == ""
+
+
+def _git(cwd, *args):
+    return subprocess.run(
+        ["git", "-C", str(cwd), "-c", "user.name=dev", "-c", "user.email=dev@example.com",
+         *args],
+        capture_output=True, text=True, check=True,
+    ).stdout.strip()
+
+
+def test_digest_is_rebuilt_only_when_sources_change(tmp_path):
+    repo = tmp_path / "clone"
+    repo.mkdir()
+    _git(repo, "init", "-q")
+    (repo / "pyproject.toml").write_text(PYPROJECT)
+    (repo / "app.py").write_text("x = 1\n")
+    _git(repo, "add", ".")
+    _git(repo, "commit", "-qm", "first")
+    first = _git(repo, "rev-parse", "HEAD")
+    (repo / "app.py").write_text("x = 2\n")
+    _git(repo, "commit", "-qam", "code only")
+    second = _git(repo, "rev-parse", "HEAD")
+    (repo / "pyproject.toml").write_text(PYPROJECT.replace("99", "120"))
+    _git(repo, "commit", "-qam", "config")
+    third = _git(repo, "rev-parse", "HEAD")
+
+    cache = ConventionCache(tmp_path / "cache")
+    cat = CatFile(repo)
+    try:
+        digest, built = convention_digest(cat, first, cache)
+        assert built and "line-length=99" in digest
+        assert convention_digest(cat, second, cache) == (digest, False)
+        digest, built = convention_digest(cat, third, cache)
+        assert built and "line-length=120" in digest
+    finally:
+        cat.close()
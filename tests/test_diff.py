@@ -0,0 +1,271 @@
+from __future__ import annotations
+
+import pytest
+
+from parc_ferme.diff import (
+    diff_fingerprint,
+    estimate_tokens,
+    hunk_anchors,
+    pack_diff,
+    parse_diff,
+    path_rank,
+    shard_diff,
+)
+
+
+def _file(path, hunk_sizes):
+    parts = [f"diff --git a/{path} b/{path}", f"--- a/{path}", f"+++ b/{path}"]
+    start = 1
+    for size in hunk_sizes:
+        parts.append(f"@@ -{start},{size} +{start},{size} @@")
+        parts.extend(f"+line {i} of {path}" for i in range(size))
+        start += size + 10
+    return "\n".join(parts)
+
+
+# --- estimate_tokens ---
+
+
+def test_estimate_tokens_empty():
+    assert estimate_tokens("") == 0
+
+
+def test_estimate_tokens_rounds_up():
+    assert estimate_tokens("abcde") == 2
+
+
+def test_estimate_tokens_scales_with_length():
+    assert estimate_tokens("x" * 4000) == 1000
+
+
+# --- parse_diff ---
+
+
+def test_parse_diff_files(sample_diff):
+    files = parse_diff(sample_diff)
+    assert [f.path for f in files] == ["src/app.py", "README.md"]
+
+
+def test_parse_diff_hunks(sample_diff):
+    app = parse_diff(sample_diff)[0]
+    assert len(app.hunks) == 1
+    hunk = app.hunks[0]
+    assert hunk.old_start == 10
+    assert hunk.old_count == 3
+    assert hunk.new_start == 10
+    assert hunk.new_count == 4
+    assert hunk.additions == 2
+    assert hunk.deletions == 1
+
+
+def test_parse_diff_file_stats(sample_diff):
+    readme = parse_diff(sample_diff)[1]
+    assert readme.additions == 1
+    assert readme.deletions == 1
+
+
+def test_parse_diff_round_trip_text(sample_diff):
+    files = parse_diff(sample_diff)
+    assert "\n".join(f.text() for f in files) == sample_diff.rstrip("\n")
+
+
+def test_parse_diff_not_a_diff():
+    assert parse_diff("just some text") == []
+
+
+def test_parse_diff_new_file():
+    diff = (
+        "diff --git a/new.py b/new.py\n"
+        "new file mode 100644\n"
+        "--- /dev/null\n"
+        "+++ b/new.py\n"
+        "@@ -0,0 +1 @@\n"
+        "+print('hi')\n"
+    )
+    files = parse_diff(diff)
+    assert files[0].path == "new.py"
+    assert files[0].hunks[0].new_count == 1
+    assert files[0].additions == 1
+
+
+def test_parse_diff_deleted_file():
+    diff = (
+        "diff --git a/old.py b/old.py\n"
+        "deleted file mode 100644\n"
+        "--- a/old.py\n"
+        "+++ /dev/null\n"
+        "@@ -1 +0,0 @@\n"
+        "-print('bye')\n"
+    )
+    files = parse_diff(diff)
+    assert files[0].path == "old.py"
+    assert files[0].deletions == 1
+
+
+# --- path_rank ---
+
+
+@pytest.mark.parametrize("path,expected", [
+    ("src/app.py", (0, 3)),
+    ("src/auth/login.py", (1, 3)),
+    ("tests/test_app.py", (0, 2)),
+    ("web/app.component.spec.ts", (0, 2)),
+    ("docs/guide.md", (0, 1)),
+    ("package-lock.json", (0, 0)),
+    ("tests/test_auth.py", (1, 2)),
+])
+def test_path_rank(path, expected):
+    assert path_rank(path) == expected
+
+
+# --- pack_diff ---
+
+
+def test_pack_diff_everything_fits(sample_diff):
+    packed = pack_diff(parse_diff(sample_diff), 10_000)
+    assert packed.truncated is False
+    assert packed.text == sample_diff
+
+
+def test_pack_diff_keeps_whole_hunks():
+    diff = _file("src/big.py", [50, 50])
+    files = parse_diff(diff)
+    budget = estimate_tokens(files[0].hunks[0].text()) + 40
+    packed = pack_diff(files, budget)
+    assert packed.partial_files == ["src/big.py"]
+    assert packed.text.count("@@ -") == 1
+    assert packed.tokens <= budget
+    # no line is cut in half
+    for line in packed.text.splitlines():
+        assert line.startswith(("diff", "---", "+++", "@@", "+line"))
+
+
+def test_pack_diff_priority_security_then_source_then_tests():
+    diff = "\n".join([
+        _file("tests/test_app.py", [20]),
+        _file("src/app.py", [20]),
+        _file("src/auth/session.py", [20]),
+        _file("docs/readme.md", [20]),
+    ])
+    files = parse_diff(diff)
+    one_file = estimate_tokens(files[0].text()) + 2
+    packed = pack_diff(files, one_file * 2)
+    assert "src/auth/session.py" not in packed.omitted_files
+    assert "src/app.py" not in packed.omitted_files
+    assert packed.omitted_files == ["tests/test_app.py", "docs/readme.md"]
+
+
+def test_pack_diff_prefers_larger_churn():
+    diff = "\n".join([_file("src/small.py", [5]), _file("src/large.py", [40])])
+    files = parse_diff(diff)
+    packed = pack_diff(files, estimate_tokens(files[1].text()) + 2)
+    assert packed.omitted_files == ["src/small.py"]
+
+
+def test_pack_diff_fills_budget_with_smaller_hunks():
+    diff = "\n".join([_file("src/large.py", [200]), _file("src/small.py", [5])])
+    files = parse_diff(diff)
+    packed = pack_diff(files, estimate_tokens(files[1].text()) + 2)
+    assert packed.omitted_files == ["src/large.py"]
+    assert "src/small.py" in packed.text
+
+
+def test_pack_diff_preserves_original_order():
+    diff = "\n".join([_file("src/a.py", [5]), _file("src/b.py", [40])])
+    packed = pack_diff(parse_diff(diff), 100_000)
+    assert packed.text.index("src/a.py") < packed.text.index("src/b.py")
+
+
+def test_shard_diff_covers_every_hunk_once():
+    diff = "\n".join([_file("src/a.py", [30, 30]), _file("src/b.py", [30]), _file("src/c.py", [30])])
+    files = parse_diff(diff)
+    budget = estimate_tokens(files[0].text()) + 2
+    shards, combined = shard_diff(files, budget, max_shards=10)
+    assert len(shards) > 1
+    assert all(shard.tokens <= budget for shard in shards)
+    assert combined.truncated is False
+    assert sum(shard.text.count("@@ -") for shard in shards) == 4
+    assert combined.tokens == sum(shard.tokens for shard in shards)
+
+
+def test_shard_diff_reports_what_is_left_after_max_shards():
+    diff = "\n".join([_file("src/a.py", [30, 30]), _file("tests/test_a.py", [30])])
+    files = parse_diff(diff)
+    budget = estimate_tokens(_file("src/a.py", [30])) + 10
+    shards, combined = shard_diff(files, budget, max_shards=1)
+    assert len(shards) == 1
+    assert combined.partial_files == ["src/a.py"]
+    assert combined.omitted_files == ["tests/test_a.py"]
+
+
+def test_pack_diff_splits_a_hunk_larger_than_the_budget():
+    # One new file is one hunk; dropping it whole would leave nothing to review
+    diff = _file("src/big.py", [5000])
+    packed = pack_diff(parse_diff(diff), 2_000)
+    assert packed.text and packed.tokens <= 2_000
+    assert packed.partial_files == ["src/big.py"]
+    (f,) = parse_diff(packed.text)
+    assert f.hunks[0].header == f"@@ -1,0 +1,{f.hunks[0].new_count} @@"
+    assert f.hunks[0].lines[0] == "+line 0 of src/big.py"
+    assert f.hunks[0].additions == f.hunks[0].new_count
+
+
+def test_shard_diff_spreads_a_large_hunk_over_shards():
+    files = parse_diff(_file("src/big.py", [5000]))
+    shards, combined = shard_diff(files, 2_000, max_shards=100)
+    assert len(shards) > 1
+    assert combined.truncated is False
+    assert all(shard.tokens <= 2_000 for shard in shards)
+    added = [
+        line for shard in shards for line in shard.text.split("\n") if line.startswith("+l")
+    ]
+    assert added == [f"+line {i} of src/big.py" for i in range(5000)]
+    second = parse_diff(shards[1].text)[0].hunks[0]
+    first = parse_diff(shards[0].text)[0].hunks[0]
+    assert second.new_start == first.new_start + first.new_count
+
+
+# --- diff_fingerprint ---
+
+REBASED_DIFF = """\
+diff --git a/src/app.py b/src/app.py
+index 5555555..6666666 100644
+--- a/src/app.py
++++ b/src/app.py
+@@ -40,3 +42,4 @@ def login(user, remember=False):
+     if user is None:
+-        return False
++        raise ValueError("user required")
++    audit(user)
+     return user.ok
+diff --git a/README.md b/README.md
+index 7777777..8888888 100644
+--- a/README.md
++++ b/README.md
+@@ -5,2 +5,2 @@
+ ## Usage
+-Old text
++New text
+"""
+
+
+def test_fingerprint_ignores_offsets_context_and_index(sample_diff):
+    assert diff_fingerprint(parse_diff(sample_diff)) == diff_fingerprint(parse_diff(REBASED_DIFF))
+
+
+def test_fingerprint_changes_with_content(sample_diff):
+    changed = sample_diff.replace("audit(user)", "audit(user, strict=True)")
+    assert diff_fingerprint(parse_diff(sample_diff)) != diff_fingerprint(parse_diff(changed))
+    renamed = sample_diff.replace("README.md", "NOTES.md")
+    assert diff_fingerprint(parse_diff(sample_diff)) != diff_fingerprint(parse_diff(renamed))
+
+
+def test_fingerprint_can_ignore_whitespace(sample_diff):
+    spaced = sample_diff.replace("audit(user)", "audit( user )")
+    files, spaced_files = parse_diff(sample_diff), parse_diff(spaced)
+    assert diff_fingerprint(files) != diff_fingerprint(spaced_files)
+    assert diff_fingerprint(files, True) == diff_fingerprint(spaced_files, True)
+
+
+def test_hunk_anchors():
+    assert hunk_anchors(parse_diff(REBASED_DIFF)) == {"src/app.py": [42], "README.md": [5]}
@@ -4,10 +4,16 @@ import pytest
 
 from parc_ferme.errors import (
     ParcFermeError,
+    BudgetExceededError,
     ConfigError,
     GitHubError,
+    JobStoreError,
     PRNotFoundError,
+    RateLimitError,
+    ReviewCancelledError,
     ReviewError,
+    ReviewTimeoutError,
+    SymbolIndexError,
     ToolNotFoundError,
 )
 
@@ -17,6 +23,12 @@ ALL_SUBCLASSES = [
     GitHubError,
     ConfigError,
     ReviewError,
+    ReviewCancelledError,
+    ReviewTimeoutError,
+    RateLimitError,
+    JobStoreError,
+    SymbolIndexError,
+    BudgetExceededError,
 ]
 
 
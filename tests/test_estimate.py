@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+from parc_ferme.estimate import estimate_review
+from parc_ferme.history import ReviewRecord, record_review
+from parc_ferme.reviewer import split_for_review
+
+
+def test_estimate_small_diff(sample_diff):
+    est = estimate_review(sample_diff, "sonnet")
+    assert est.file_count == 2
+    assert est.shards == 1
+    assert est.truncated is False
+    assert est.model == "sonnet"
+    assert est.expected_seconds is None
+
+
+def test_estimate_over_budget_is_truncated_to_one_shard():
+    diff = "x" * 4000
+    est = estimate_review(diff, "default", token_budget=300)
+    assert est.tokens == 1000
+    assert est.shards == 1
+    assert est.truncated is True
+
+
+def test_estimate_shards_like_split_for_review(sample_diff):
+    diff = "".join(
+        f"diff --git a/f{i}.py b/f{i}.py\n--- a/f{i}.py\n+++ b/f{i}.py\n"
+        f"@@ -0,0 +1,40 @@\n" + "+x = 1  # some padding for the token count\n" * 40
+        for i in range(6)
+    )
+    shards, _ = split_for_review(diff, 1_000, 4)
+    est = estimate_review(diff, "default", token_budget=1_000, max_shards=4)
+    assert est.shards == len(shards) > 1
+
+
+def test_estimate_uses_history(sample_diff):
+    record_review(ReviewRecord(
+        timestamp=0.0, model="sonnet", profile="default",
+        diff_chars=400, diff_tokens=100, file_count=1, duration=5.0,
+    ))
+    est = estimate_review(sample_diff, "sonnet")
+    assert est.expected_seconds is not None
+    assert est.history_samples == 1
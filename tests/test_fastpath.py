@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import pytest
+
+from parc_ferme.diff import parse_diff
+from parc_ferme.fastpath import classify_trivial, lgtm_review
+from parc_ferme.profiles import BUILTIN_PROFILES
+
+
+def _diff(path, removed, added, context=()):
+    body = (
+        "".join(f" {line}\n" for line in context)
+        + "".join(f"-{line}\n" for line in removed) + "".join(f"+{line}\n" for line in added)
+    )
+    old, new = len(context) + len(removed), len(context) + len(added)
+    return (
+        f"diff --git a/{path} b/{path}\n--- a/{path}\n+++ b/{path}\n"
+        f"@@ -1,{old} +1,{new} @@\n{body}"
+    )
+
+
+def _classify(*diffs, checks=("docs", "whitespace", "comments", "version_bump")):
+    return classify_trivial(parse_diff("".join(diffs)), checks)
+
+
+@pytest.mark.parametrize("diff, kind", [
+    (_diff("docs/guide.md", ["old"], ["new"]), "documentation"),
+    (_diff("src/app.ts", ["if (a){ b(); }"], ["if (a) {", "  b();", "}"]), "whitespace"),
+    (_diff("src/app.py", ["x = 1  "], ["x = 1"]), "whitespace"),
+    (_diff("src/app.py", ["# old note"], ["# new note", ""]), "comment"),
+    (_diff("src/app.ts", [], ["/**", " * Explains things.", " */"]), "comment"),
+    (_diff("package.json", ['  "version": "1.2.3",'], ['  "version": "1.3.0",']), "version bump"),
+    (_diff("pkg/__init__.py", ['__version__ = "0.9"'], ['__version__ = "1.0.0rc1"']),
+     "version bump"),
+    (_diff("Cargo.toml", ['version = "0.3.1"'], ['version = "0.4.0"'],
+           context=["[package]", 'name = "tool"']), "version bump"),
+    (_diff("main.go", ["\t * Applies the discount."], ["\t * Applies the discount once."],
+           context=["\t/*"]), "comment"),
+    # A closed docstring above the change, and backticks inside a comment
+    (_diff("src/app.py", ["# old note"], ["# new note"], context=['"""Module."""', ""]),
+     "comment"),
+    (_diff("src/app.ts", ["// calls `run`"], ["// calls `run()`"]), "comment"),
+])
+def test_trivial_changes(diff, kind):
+    assert _classify(diff).startswith(kind)
+
+
+@pytest.mark.parametrize("diff", [
+    _diff("src/app.py", ["x = 1"], ["x = 2"]),
+    # Re-indenting Python changes which block a line belongs to
+    _diff("src/app.py", ["    return x"], ["return x"]),
+    _diff("src/app.py", ["# note"], ["run()  # note"]),
+    _diff("docs/conf.py", ["a = 1"], ["a = 2"]),
+    _diff("requirements.txt", ["flask==2.0"], ["flask==3.0"]),
+    _diff("package.json", ['  "version": "1.2.3",'], ['  "lodash": "4.17.21",']),
+    _diff("styles.css", ["a {}"], ["* { margin: 0 }"]),
+    # A continuation line outside a block comment is code
+    _diff("order.go", ["\t\t* quantity"], ["\t\t* 0"], context=["\ttotal := price"]),
+    _diff("src/app.ts", ["/* old */ run();"], ["/* new */ skip();"]),
+    # Whitespace inside a string literal is not formatting
+    _diff("deploy.js", ['run("rm -rf " + dir);'], ['run("rm -rf" + dir);']),
+    _diff("src/app.py", ['cmd = "rm -rf " + path'], ['cmd = "rm -rf" + path']),
+    _diff("src/app.ts", ["return x;"], ["returnx;"]),
+    # A dependency's version, not the project's
+    _diff("Cargo.toml", ['version = "0.10.55"'], ['version = "0.10.1"'],
+          context=["[dependencies.openssl]"]),
+    _diff("pyproject.toml", ['version = "1.0"'], ['version = "1.1"']),  # table not shown
+    _diff("package-lock.json", ['      "version": "1.2.3",'], ['      "version": "1.0.0",']),
+    _diff("package.json", ['      "version": "1.2.3",'], ['      "version": "1.0.0",']),
+    _diff("setup.py", ['    version="1.0",'], ['    version="2.0",']),
+    # Lines inside a multi-line string are text, even if they look like comments
+    _diff("src/app.py", ["# Usage"], ["# Usage notes"], context=['HELP = """']),
+    _diff("src/app.py", ["    # old"], ["    # new"], context=["    SQL = '''", "    SELECT 1"]),
+    _diff("src/app.ts", ["// not a comment"], ["// still text"], context=["const s = `"]),
+    # Only the end of a string is shown, so the change may be inside it
+    "diff --git a/src/app.py b/src/app.py\n--- a/src/app.py\n+++ b/src/app.py\n"
+    '@@ -1,1 +1,2 @@\n+# Example\n """\n',
+    # Lint, type and security suppressions and tool directives are not notes
+    _diff("src/app.py", ["# noqa: E501"], []),
+    _diff("src/app.py", ["    # nosec B602"], ["    # safe"]),
+    _diff("src/app.py", [], ["# type: ignore"]),
+    _diff("src/app.py", ["# pylint: disable=eval-used"], ["# pylint: disable=unused-import"]),
+    _diff("src/app.py", ["# -*- coding: utf-8 -*-"], ["# -*- coding: latin-1 -*-"]),
+    _diff("src/app.ts", ["// eslint-disable-next-line no-eval"], []),
+    _diff("src/app.ts", ["// @ts-expect-error"], ["// expected"]),
+    _diff("main.go", [], ["//go:build linux"]),
+    _diff("main.cc", ["// NOLINT(runtime/int)"], ["// ok"]),
+    _diff("run.sh", ["# shellcheck disable=SC2086"], []),
+])
+def test_real_changes_need_review(diff):
+    assert _classify(diff) is None
+
+
+def test_every_file_must_be_trivial():
+    docs = _diff("README.md", ["a"], ["b"])
+    bump = _diff("pyproject.toml", ['version = "1.0"'], ['version = "1.1"'],
+                 context=["[project]", 'name = "app"'])
+    assert _classify(docs, bump) == "documentation and version bump changes only (2 files)"
+    assert _classify(docs, _diff("app.py", ["a = 1"], ["a = 2"])) is None
+
+
+def test_checks_can_be_limited():
+    docs = _diff("README.md", ["a"], ["b"])
+    assert _classify(docs, checks=["whitespace"]) is None
+    assert classify_trivial([]) is None
+
+
+def test_lgtm_review_uses_profile_wording():
+    assert lgtm_review(BUILTIN_PROFILES["performance"]) == "✅ LGTM - No performance issues found"
+    assert lgtm_review(BUILTIN_PROFILES["default"]) == "✅ LGTM"
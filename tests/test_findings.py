@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+import pytest
+
+from parc_ferme.findings import merge_sections, parse_finding, parse_findings, shift_lines
+
+
+@pytest.mark.parametrize("line,expected", [
+    ("🟡 WARNING - src/app.py:12 — possible None dereference",
+     ("WARNING", "src/app.py", 12, "possible None dereference")),
+    ("- [CRITICAL] src/db/query.py:40-44: SQL built from user input",
+     ("CRITICAL", "src/db/query.py", 40, "SQL built from user input")),
+    ("**src/app.py:5** — unused import", ("", "src/app.py", 5, "unused import")),
+    ("Makefile:3 - missing .PHONY", ("", "Makefile", 3, "missing .PHONY")),
+])
+def test_parse_finding(line, expected):
+    finding = parse_finding(line)
+    assert (finding.severity, finding.file, finding.line, finding.message) == expected
+
+
+@pytest.mark.parametrize("line", [
+    "See https://example.com:8080 — docs",
+    "Version 1.2:3 — nothing",
+    "✅ LGTM",
+    "",
+])
+def test_parse_finding_ignores_other_lines(line):
+    assert parse_finding(line) is None
+
+
+def test_parse_findings_keeps_order():
+    review = "Summary\n🔴 CRITICAL - a.py:1 — one\ntext\n🟢 INFO - b.py:2 — two\n"
+    assert [(f.file, f.line) for f in parse_findings(review)] == [("a.py", 1), ("b.py", 2)]
+
+
+def test_same_issue_has_same_key_despite_wording():
+    a = parse_finding("🟡 WARNING - a.py:3 — Possible  None dereference.")
+    b = parse_finding("[CRITICAL] a.py:3: possible none dereference")
+    assert a.key == b.key
+
+
+def test_merge_sections_drops_findings_seen_earlier():
+    security = "🔴 CRITICAL - a.py:3 — token logged\n🟡 WARNING - a.py:9 — slow loop"
+    performance = "Notes:\n🟡 WARNING - a.py:9 — slow loop\n🟡 WARNING - b.py:1 — N+1 query"
+    merged, dropped = merge_sections([("security", security), ("performance", performance)])
+    assert dropped == 1
+    assert merged[0] == ("security", security)
+    assert merged[1] == ("performance", "Notes:\n🟡 WARNING - b.py:1 — N+1 query")
+
+
+def test_merge_sections_notes_empty_section():
+    review = "🟡 WARNING - a.py:9 — slow loop"
+    merged, dropped = merge_sections([("default", review), ("performance", review)])
+    assert dropped == 1
+    assert merged[1] == ("performance", "No additional findings.")
+
+
+def test_shift_lines_follows_each_hunk():
+    review = "🟡 WARNING - a.py:12-14 — slow\nSummary: fine\n[INFO] a.py:55: nit\n[INFO] b.py:3: x"
+    shifted = shift_lines(review, {"a.py": [10, 50], "b.py": [1]}, {"a.py": [20, 51], "b.py": [1, 9]})
+    assert shifted == (
+        "🟡 WARNING - a.py:22-24 — slow\nSummary: fine\n[INFO] a.py:56: nit\n[INFO] b.py:3: x"
+    )
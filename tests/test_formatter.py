@@ -4,10 +4,12 @@ from unittest.mock import patch
 
 import pytest
 
+from parc_ferme.estimate import Estimate
 from parc_ferme.formatter import (
     _escape_md,
     format_changed_files,
     format_comment,
+    format_estimate,
     format_header,
     format_review_end,
     format_review_start,
@@ -108,6 +110,26 @@ def test_format_comment_contains_review_body(sample_pr_info):
     assert "Found 3 issues" in output
 
 
+def test_format_comment_with_profile_sections(sample_pr_info):
+    output = format_comment(
+        sample_pr_info, "ignored", "security,performance",
+        sections=[("security", "Leaked token"), ("performance", "No additional findings.")],
+    )
+    assert "**Profiles**: `security`, `performance`" in output
+    assert "### `security`\n\nLeaked token" in output
+    assert "### `performance`\n\nNo additional findings." in output
+
+
+def test_format_comment_links_stacked_parent(sample_pr_info):
+    from parc_ferme.github import PRInfo
+
+    parent = PRInfo(title="Base", number=41, url="https://github.com/o/r/pull/41",
+                    author="user", base_branch="main")
+    output = format_comment(sample_pr_info, "LGTM", "default", parent=parent)
+    assert "**Stacked on**: [#41](https://github.com/o/r/pull/41)" in output
+    assert "Stacked on" not in format_comment(sample_pr_info, "LGTM", "default")
+
+
 def test_format_comment_escapes_title():
     from parc_ferme.github import PRInfo
 
@@ -120,3 +142,30 @@ def test_format_comment_escapes_title():
     )
     output = format_comment(pr, "LGTM", "default")
     assert "\\*critical\\*" in output
+
+
+# --- format_estimate ---
+
+
+def _estimate(**overrides):
+    values = dict(
+        diff_chars=1000, file_count=2, tokens=250, token_budget=25_000, shards=1,
+        model="sonnet", expected_seconds=None, history_samples=0, truncated=False,
+    )
+    values.update(overrides)
+    return Estimate(**values)
+
+
+def test_format_estimate_no_history():
+    output = format_estimate("42", _estimate(), no_color=True)
+    assert "PR 42" in output
+    assert "unknown" in output
+    assert "Truncation: no" in output
+
+
+def test_format_estimate_truncated_with_history():
+    est = _estimate(tokens=55_000, shards=2, truncated=True, expected_seconds=90.0, history_samples=5)
+    output = format_estimate("42", est, no_color=True)
+    assert "~90s (from 5 past reviews)" in output
+    assert "5,000 tokens over budget" in output
+    assert "Shards:     2" in output
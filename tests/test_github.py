@@ -1,9 +1,25 @@
 from __future__ import annotations
 
+import json
+import subprocess
+
 import pytest
 
+from parc_ferme import github
 from parc_ferme.errors import GitHubError, PRNotFoundError
-from parc_ferme.github import _validate_pr_input, _validate_repo
+from parc_ferme.github import (
+    PRInfo,
+    _validate_pr_input,
+    _validate_repo,
+    comment_id_from_url,
+    get_compare_diff,
+    get_compare_status,
+    list_open_prs,
+    poll_pr,
+    split_pr_ref,
+    stack_parent,
+    update_comment,
+)
 
 
 # --- _validate_pr_input ---
@@ -80,3 +96,151 @@ def test_validate_repo_flag_injection_raises():
 def test_validate_repo_spaces_raises():
     with pytest.raises(GitHubError):
         _validate_repo("owner/repo name")
+
+
+# --- split_pr_ref ---
+
+
+def test_split_pr_ref_number():
+    assert split_pr_ref("42") == (None, 42)
+
+
+def test_split_pr_ref_url():
+    assert split_pr_ref("https://github.com/my-org/my.repo/pull/7") == ("my-org/my.repo", 7)
+
+
+def test_split_pr_ref_invalid_raises():
+    with pytest.raises(PRNotFoundError):
+        split_pr_ref("owner/repo#7")
+
+
+# --- stacked PRs ---
+
+
+def _pr(number, base="main", head="", sha=""):
+    return PRInfo(
+        title=f"PR {number}", number=number, url=f"https://github.com/o/r/pull/{number}",
+        author="dev", base_branch=base, head_sha=sha, head_branch=head,
+    )
+
+
+def test_stack_parent_by_base_branch():
+    parent = _pr(1, head="feature-a", sha="a1")
+    child = _pr(2, base="feature-a", head="feature-b", sha="b1")
+    assert stack_parent(child, [child, parent]) is parent
+    assert stack_parent(parent, [child, parent]) is None
+
+
+def test_stack_parent_by_commits_picks_nearest():
+    lower = _pr(1, head="a", sha="c1")
+    middle = _pr(2, head="b", sha="c2")
+    other = _pr(3, base="release", head="c", sha="c3")
+    child = _pr(4, head="d", sha="c4")
+    open_prs = [child, other, middle, lower]
+    assert stack_parent(child, open_prs) is None
+    assert stack_parent(child, open_prs, ["c1", "c2", "c4"]) is middle
+    assert stack_parent(child, open_prs, ["c9", "c4"]) is None
+
+
+def test_list_open_prs_parses_gh_output(monkeypatch):
+    calls = []
+    data = [{"title": "t", "number": 5, "url": "u", "author": {"login": "dev"},
+             "baseRefName": "main", "headRefName": "feat", "headRefOid": "abc"}]
+
+    def fake_run(cmd):
+        calls.append(cmd)
+        return subprocess.CompletedProcess(cmd, 0, json.dumps(data), "")
+
+    monkeypatch.setattr(github, "_run_gh", fake_run)
+    assert list_open_prs("o/r") == [PRInfo(
+        title="t", number=5, url="u", author="dev", base_branch="main",
+        head_sha="abc", head_branch="feat",
+    )]
+    assert calls[0][:5] == ["gh", "pr", "list", "--state", "open"]
+    assert calls[0][-2:] == ["-R", "o/r"]
+
+
+def test_get_compare_diff(monkeypatch):
+    calls = []
+
+    def fake_run(cmd):
+        calls.append(cmd)
+        return subprocess.CompletedProcess(cmd, 0, "diff --git a/x b/x\n", "")
+
+    monkeypatch.setattr(github, "_run_gh", fake_run)
+    assert get_compare_diff("o/r", "aaa", "bbb") == "diff --git a/x b/x\n"
+    assert calls[0][:3] == ["gh", "api", "repos/o/r/compare/aaa...bbb"]
+    assert "Accept: application/vnd.github.diff" in calls[0]
+
+
+def test_get_compare_diff_failure_raises(monkeypatch):
+    monkeypatch.setattr(
+        github, "_run_gh",
+        lambda cmd: subprocess.CompletedProcess(cmd, 1, "", "Not Found"),
+    )
+    with pytest.raises(GitHubError, match="Not Found"):
+        get_compare_diff("o/r", "aaaaaaaa", "bbbbbbbb")
+
+
+def test_get_compare_status(monkeypatch):
+    calls = []
+
+    def fake_run(cmd):
+        calls.append(cmd)
+        return subprocess.CompletedProcess(cmd, 0, "diverged\n", "")
+
+    monkeypatch.setattr(github, "_run_gh", fake_run)
+    assert get_compare_status("o/r", "aaa", "bbb") == "diverged"
+    assert calls[0] == ["gh", "api", "repos/o/r/compare/aaa...bbb", "--jq", ".status"]
+
+
+def test_comment_id_from_url():
+    assert comment_id_from_url("https://github.com/o/r/pull/1#issuecomment-123") == 123
+    assert comment_id_from_url("https://github.com/o/r/pull/1") is None
+
+
+def test_update_comment_patches_the_comment_by_id(monkeypatch):
+    calls = []
+
+    def fake_run(cmd):
+        body_file = cmd[-1].split("@", 1)[1]
+        with open(body_file) as f:
+            calls.append((cmd, f.read()))
+        return subprocess.CompletedProcess(cmd, 0, "{}", "")
+
+    monkeypatch.setattr(github, "_run_gh", fake_run)
+    update_comment("o/r", 123, "new review")
+    (cmd, body), = calls
+    assert cmd[:5] == ["gh", "api", "-X", "PATCH", "repos/o/r/issues/comments/123"]
+    assert body == "new review"
+
+
+def test_poll_pr_sends_etag_and_reads_304(monkeypatch):
+    calls = []
+    replies = [
+        (0, 'HTTP/2.0 200 OK\r\nEtag: W/"abc"\r\n\r\n{"state": "open", "head": {"sha": "s1"}}'),
+        (1, 'HTTP/2.0 304 Not Modified\r\nEtag: W/"abc"\r\n\r\n'),
+    ]
+
+    def fake_run(cmd):
+        calls.append(cmd)
+        code, out = replies.pop(0)
+        return subprocess.CompletedProcess(cmd, code, out, "")
+
+    monkeypatch.setattr(github, "_run_gh", fake_run)
+    poll = poll_pr("o/r", 5)
+    assert (poll.etag, poll.head_sha, poll.state) == ('W/"abc"', "s1", "open")
+    assert poll_pr("o/r", 5, poll.etag) is None
+    assert calls[0] == ["gh", "api", "-i", "repos/o/r/pulls/5"]
+    assert calls[1][-2:] == ["-H", 'If-None-Match: W/"abc"']
+
+
+def test_poll_pr_failure_raises(monkeypatch):
+    monkeypatch.setattr(
+        github, "_run_gh",
+        lambda cmd: subprocess.CompletedProcess(
+            cmd, 1, "HTTP/2.0 404 Not Found\r\n\r\n{}", "Not Found (HTTP 404)",
+        ),
+    )
+    with pytest.raises(GitHubError, match="HTTP 404"):
+        poll_pr("o/r", 5)
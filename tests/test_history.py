@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import json
+
+from parc_ferme.history import (
+    MIN_AUTO_TIMEOUT,
+    ReviewRecord,
+    auto_timeout,
+    expected_latency,
+    fit_latency_model,
+    history_path,
+    load_history,
+    percentile,
+    record_review,
+    summarize_history,
+)
+
+
+def _record(model="sonnet", tokens=1000, duration=10.0, profile="default", **kwargs):
+    return ReviewRecord(
+        timestamp=0.0,
+        model=model,
+        profile=profile,
+        diff_chars=tokens * 4,
+        diff_tokens=tokens,
+        file_count=3,
+        duration=duration,
+        **kwargs,
+    )
+
+
+def _linear(n=12, intercept=5.0, per_token=0.01, model="sonnet"):
+    return [_record(model=model, tokens=1000 * (i + 1), duration=intercept + per_token * 1000 * (i + 1))
+            for i in range(n)]
+
+
+def test_history_path_uses_cache_dir(isolated_cache_dir):
+    assert history_path().parent == isolated_cache_dir
+
+
+def test_load_history_empty():
+    assert load_history() == []
+
+
+def test_record_and_load_round_trip():
+    record_review(_record())
+    record_review(_record(model="opus"))
+    records = load_history()
+    assert [r.model for r in records] == ["sonnet", "opus"]
+
+
+def test_load_history_skips_corrupt_lines():
+    record_review(_record())
+    with open(history_path(), "a") as f:
+        f.write("not json\n")
+    assert len(load_history()) == 1
+
+
+def test_expected_latency_no_history():
+    assert expected_latency(1000, "sonnet", records=[]) is None
+
+
+def test_expected_latency_same_model():
+    records = [_record(tokens=1000, duration=10.0), _record(model="opus", duration=100.0)]
+    seconds, samples = expected_latency(2000, "sonnet", records=records)
+    assert seconds == 20.0
+    assert samples == 1
+
+
+def test_expected_latency_falls_back_to_all_models():
+    records = [_record(model="opus", tokens=1000, duration=30.0)]
+    seconds, samples = expected_latency(1000, "haiku", records=records)
+    assert seconds == 30.0
+    assert samples == 1
+
+
+def test_load_history_reads_records_without_new_fields():
+    history_path().parent.mkdir(parents=True, exist_ok=True)
+    old = {"timestamp": 0, "model": "sonnet", "profile": "default", "diff_chars": 40,
+           "diff_tokens": 10, "file_count": 1, "duration": 1.0}
+    history_path().write_text(json.dumps(old) + "\n")
+    record = load_history()[0]
+    assert (record.shards, record.partial) == (1, False)
+
+
+def test_percentile():
+    assert percentile([1, 2, 3, 4, 5], 50) == 3
+    assert percentile([10], 95) == 10
+    assert percentile([0, 10], 95) == 9.5
+
+
+def test_fit_latency_model_linear():
+    fitted = fit_latency_model("sonnet", _linear())
+    assert round(fitted.intercept, 3) == 5.0
+    assert round(fitted.seconds_per_token, 5) == 0.01
+    assert round(fitted.predict(2000), 3) == 25.0
+    assert fitted.tokens_for(105) == 10_000
+
+
+def test_fit_latency_model_per_call_for_sharded_reviews():
+    records = [_record(tokens=2000 * (i + 1), duration=20.0 * (i + 1), shards=2) for i in range(3)]
+    fitted = fit_latency_model("sonnet", records)
+    assert round(fitted.predict(1000), 3) == 10.0
+
+
+def test_fit_latency_model_ignores_partial_reviews():
+    records = _linear(n=3) + [_record(tokens=1000, duration=999.0, partial=True)]
+    assert fit_latency_model("sonnet", records).samples == 3
+
+
+def test_auto_timeout_needs_min_samples():
+    assert auto_timeout(5000, "sonnet", min_samples=10, records=_linear(n=5)) is None
+
+
+def test_auto_timeout_uses_percentile_and_headroom():
+    records = _linear()
+    # Every sample is on the line, so p95 is the prediction itself
+    assert auto_timeout(20_000, "sonnet", pct=95, headroom=2, records=records) == 410
+    assert auto_timeout(100, "sonnet", records=records) == MIN_AUTO_TIMEOUT
+
+
+def test_summarize_history_groups_by_model_and_profile():
+    records = _linear(n=4) + [_record(model="opus", profile="security", partial=True)]
+    stats = summarize_history(records)
+    assert [(s.model, s.profile, s.reviews) for s in stats] == [
+        ("sonnet", "default", 4), ("opus", "security", 1),
+    ]
+    assert stats[1].partial == 1
+    assert stats[0].duration["max"] == 45.0
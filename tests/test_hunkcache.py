@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import json
+import os
+import time
+
+from parc_ferme.diff import parse_diff
+from parc_ferme.hunkcache import (
+    CachedHunk,
+    HunkCache,
+    hunk_key,
+    profile_digest,
+    split_cached,
+    store_findings,
+)
+from parc_ferme.profiles import BUILTIN_PROFILES
+
+PATCH = """\
+diff --git a/src/app.py b/src/app.py
+--- a/src/app.py
++++ b/src/app.py
+@@ -{old},2 +{new},3 @@ def login(user):
+ if user is None:
+-    return False
++    raise ValueError("user required")
++audit(user)
+diff --git a/src/db.py b/src/db.py
+--- a/src/db.py
++++ b/src/db.py
+@@ -5 +5 @@
+-query(sql)
++query(sql, timeout=5)
+"""
+
+DIGEST = profile_digest(BUILTIN_PROFILES["default"])
+
+
+def _files(old=10, new=10):
+    return parse_diff(PATCH.format(old=old, new=new))
+
+
+def test_hunk_key_ignores_position_but_not_profile_or_model():
+    hunk = _files()[0].hunks[0]
+    moved = _files(40, 52)[0].hunks[0]
+    assert hunk_key(DIGEST, "sonnet", "src/app.py", hunk) == \
+        hunk_key(DIGEST, "sonnet", "src/app.py", moved)
+    security = profile_digest(BUILTIN_PROFILES["security"])
+    assert hunk_key(DIGEST, "sonnet", "src/app.py", hunk) != \
+        hunk_key(security, "sonnet", "src/app.py", hunk)
+    assert hunk_key(DIGEST, "sonnet", "src/app.py", hunk) != \
+        hunk_key(DIGEST, "opus", "src/app.py", hunk)
+
+
+def test_reviewed_hunks_are_reused_at_their_new_lines(tmp_path):
+    cache = HunkCache(tmp_path)
+    remaining, findings, hits, misses = split_cached(_files(), cache, DIGEST, "sonnet")
+    assert (len(remaining), findings, hits, len(misses)) == (2, [], 0, 2)
+
+    review = "🔴 CRITICAL - src/app.py:12 — audit before check\nOverall fine."
+    assert store_findings(cache, review, misses) == 2
+
+    # The same change cherry-picked onto a branch where it sits 30 lines lower
+    remaining, findings, hits, misses = split_cached(_files(40, 40), cache, DIGEST, "sonnet")
+    assert remaining == [] and misses == []
+    assert hits == 2
+    assert findings == ["🔴 CRITICAL - src/app.py:42 — audit before check"]
+
+
+def test_partly_cached_file_keeps_only_new_hunks(tmp_path):
+    cache = HunkCache(tmp_path)
+    _, _, _, misses = split_cached(_files(), cache, DIGEST, "sonnet")
+    store_findings(cache, "LGTM", misses[:1])
+    remaining, _, hits, misses = split_cached(_files(), cache, DIGEST, "sonnet")
+    assert hits == 1
+    assert [f.path for f in remaining] == ["src/db.py"]
+    assert [path for _, path, _ in misses] == ["src/db.py"]
+
+
+def test_expired_entries_are_ignored_and_pruned(tmp_path):
+    cache = HunkCache(tmp_path, ttl_days=1)
+    cache.put("ab" * 32, CachedHunk(new_start=1, created=time.time() - 2 * 86400))
+    assert cache.get("ab" * 32) is None
+    path = tmp_path / "ab" / f"{'ab' * 32}.json"
+    assert json.loads(path.read_text())["new_start"] == 1
+    old = time.time() - 2 * 86400
+    os.utime(path, (old, old))
+    assert cache.prune() == 1
+    assert not path.exists()
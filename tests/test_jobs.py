@@ -0,0 +1,279 @@
+from __future__ import annotations
+
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from parc_ferme.errors import (
+    BudgetExceededError,
+    RateLimitError,
+    ReviewCancelledError,
+    ReviewError,
+)
+from parc_ferme.jobs import (
+    CANCELLED,
+    DONE,
+    FAILED,
+    PENDING,
+    RUNNING,
+    JobStore,
+    default_store_path,
+    drain,
+)
+from parc_ferme.limiter import AIMDLimiter
+from parc_ferme.scheduling import Scheduler
+
+
+@pytest.fixture
+def store(tmp_path):
+    with JobStore(tmp_path / "jobs.sqlite3") as s:
+        yield s
+
+
+def test_default_store_path_uses_cache_dir(isolated_cache_dir):
+    assert default_store_path().parent == isolated_cache_dir
+
+
+def test_add_is_idempotent(store):
+    job, created = store.add("o/r", 1, "a" * 40, "default")
+    again, created_again = store.add("o/r", 1, "a" * 40, "default")
+    assert created is True
+    assert created_again is False
+    assert again.id == job.id
+    assert job.state == PENDING
+
+
+def test_add_distinguishes_profile_and_sha(store):
+    store.add("o/r", 1, "a", "default")
+    assert store.add("o/r", 1, "a", "security")[1] is True
+    assert store.add("o/r", 1, "b", "default")[1] is True
+
+
+def test_claim_in_order_and_leases(store):
+    store.add("o/r", 1, "a", "default")
+    store.add("o/r", 2, "b", "default")
+    first = store.claim("w1")
+    second = store.claim("w2")
+    assert (first.pr, second.pr) == (1, 2)
+    assert first.state == RUNNING
+    assert first.lease_owner == "w1"
+    assert first.attempts == 1
+    assert store.claim("w3") is None
+
+
+def test_claim_smallest_first_with_priority_and_aging(tmp_path):
+    with JobStore(tmp_path / "jobs.sqlite3", Scheduler(aging_seconds=60)) as store:
+        store.add("o/r", 1, "a", "default", size=10_000)
+        store.add("o/r", 2, "b", "default", size=50)
+        store.add("o/r", 3, "c", "default", size=500, priority=1)
+        store.add("o/r", 4, "d", "default", size=50)
+        assert [store.claim("w").pr for _ in range(2)] == [3, 2]
+        # Re-adding a pending job updates its priority (e.g. a new label)
+        store.add("o/r", 1, "a", "default", size=10_000, priority=1)
+        assert store.claim("w").pr == 1
+        # Eight halvings later a large job outranks a fresh small one
+        large, _ = store.add("o/r", 5, "e", "default", size=10_000)
+        store._conn.execute("UPDATE jobs SET created_at = created_at - 480 WHERE id = ?",
+                            (large.id,))
+        assert store.claim("w").pr == 5
+
+
+def test_old_store_gains_scheduling_columns(tmp_path):
+    path = tmp_path / "jobs.sqlite3"
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE jobs (id INTEGER PRIMARY KEY AUTOINCREMENT, repo TEXT NOT NULL, "
+        "pr INTEGER NOT NULL, head_sha TEXT NOT NULL, profile TEXT NOT NULL, "
+        "state TEXT NOT NULL DEFAULT 'pending', attempts INTEGER NOT NULL DEFAULT 0, "
+        "max_attempts INTEGER NOT NULL DEFAULT 3, lease_owner TEXT, lease_expires REAL, "
+        "result_path TEXT, error TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL, "
+        "UNIQUE (repo, pr, head_sha, profile))"
+    )
+    conn.execute("INSERT INTO jobs (repo, pr, head_sha, profile, created_at, updated_at) "
+                 "VALUES ('o/r', 1, 'a', 'default', 0, 0)")
+    conn.commit()
+    conn.close()
+    with JobStore(path) as store:
+        job = store.claim("w")
+        assert (job.pr, job.size, job.priority) == (1, None, 0)
+
+
+def test_complete_exactly_once(store):
+    store.add("o/r", 1, "a", "default")
+    job = store.claim("w1")
+    assert store.complete(job, "LGTM") is True
+    assert store.complete(job, "again") is False
+    done = store.get(job.id)
+    assert done.state == DONE
+    with open(done.result_path) as f:
+        assert f.read() == "LGTM"
+
+
+def test_expired_lease_is_reclaimed_and_old_owner_cannot_complete(store):
+    store.add("o/r", 1, "a", "default")
+    stale = store.claim("crashed", lease_seconds=-1)
+    fresh = store.claim("w2")
+    assert fresh.id == stale.id
+    assert fresh.attempts == 2
+    assert store.complete(stale, "late") is False
+    assert store.complete(fresh, "ok") is True
+
+
+def test_recover_completes_without_rerun(store):
+    store.add("o/r", 1, "a", "default")
+    job = store.claim("w1")
+    store.result_file(job).parent.mkdir(parents=True, exist_ok=True)
+    store.result_file(job).write_text("saved before crash")
+    assert store.recover(job) is True
+    assert store.get(job.id).state == DONE
+
+
+def test_fail_retries_until_max_attempts(store):
+    store.add("o/r", 1, "a", "default", max_attempts=2)
+    store.fail(store.claim("w"), "boom")
+    assert store.get(1).state == PENDING
+    store.fail(store.claim("w"), "boom")
+    assert store.get(1).state == FAILED
+    assert store.claim("w") is None
+    assert store.retry_failed() == 1
+    assert store.claim("w").attempts == 1
+
+
+def test_dead_worker_on_last_attempt_fails_job(store):
+    store.add("o/r", 1, "a", "default", max_attempts=1)
+    store.claim("crashed", lease_seconds=-1)
+    assert store.claim("w") is None
+    assert store.get(1).state == FAILED
+
+
+def test_release_returns_attempt(store):
+    store.add("o/r", 1, "a", "default")
+    job = store.claim("w")
+    assert store.release(job) is True
+    released = store.get(job.id)
+    assert (released.state, released.attempts) == (PENDING, 0)
+
+
+def test_acquire_same_owner_after_restart(store):
+    store.add("o/r", 1, "a", "default")
+    store.acquire(1, "serve@host:8080")
+    assert store.acquire(1, "someone-else") is None
+    assert store.acquire(1, "serve@host:8080") is not None
+
+
+def test_supersede_cancels_older_pending(store):
+    store.add("o/r", 1, "a", "default")
+    store.add("o/r", 1, "b", "default")
+    assert store.supersede("o/r", 1, "b") == 1
+    assert store.get(1).state == CANCELLED
+    assert store.get(2).state == PENDING
+
+
+def test_add_with_requeue_resets_cancelled_and_failed_jobs(store):
+    store.add("o/r", 1, "a", "default", max_attempts=1)
+    store.fail(store.claim("w"), "boom")
+    store.add("o/r", 1, "b", "default")
+    store.supersede("o/r", 1, "c")
+    store.add("o/r", 1, "d", "default")
+    store.complete(store.acquire(3, "w"), "review")
+    assert store.add("o/r", 1, "a", "default")[0].state == FAILED
+    for job_id, sha in ((1, "a"), (2, "b")):
+        job, created = store.add("o/r", 1, sha, "default", requeue=True)
+        assert (job.id, created) == (job_id, False)
+        assert (job.state, job.attempts, job.error) == (PENDING, 0, None)
+    assert store.add("o/r", 1, "d", "default", requeue=True)[0].state == DONE
+
+
+def test_counts_and_list(store):
+    store.add("o/r", 1, "a", "default")
+    store.add("o/r", 2, "b", "default")
+    store.complete(store.claim("w"), "ok")
+    assert store.counts()[DONE] == 1
+    assert store.counts()[PENDING] == 1
+    assert [j.pr for j in store.list_jobs(PENDING)] == [2]
+
+
+def test_drain_handles_outcomes(store):
+    store.add("o/r", 1, "a", "default")
+    store.add("o/r", 2, "b", "default")
+    store.add("o/r", 3, "c", "default", max_attempts=1)
+
+    def review(job):
+        if job.pr == 2:
+            raise ReviewCancelledError("head moved")
+        if job.pr == 3:
+            raise ReviewError("claude failed")
+        return f"review of {job.pr}"
+
+    events = []
+    completed = drain(store, review, "w", on_event=lambda e, j, d: events.append((e, j.pr)))
+    assert completed == 1
+    assert [store.get(i).state for i in (1, 2, 3)] == [DONE, CANCELLED, FAILED]
+    assert ("done", 1) in events
+
+
+def test_drain_skips_over_budget_jobs_and_stops_when_told(store):
+    for pr in (1, 2, 3):
+        store.add("o/r", pr, "a", "default")
+    stop = threading.Event()
+
+    def review(job):
+        if job.pr == 1:
+            raise BudgetExceededError("needs 90,000 tokens")
+        stop.set()  # e.g. this review spent the batch budget
+        return "ok"
+
+    events = []
+    completed = drain(store, review, "w", stop=stop,
+                      on_event=lambda e, j, d: events.append((e, j.pr)))
+    assert completed == 1
+    assert [store.get(i).state for i in (1, 2, 3)] == [CANCELLED, DONE, PENDING]
+    assert ("skipped", 1) in events
+    assert store.get(1).attempts == 1
+
+
+def test_drain_resumes_after_crash_without_repeating(store, tmp_path):
+    for pr in (1, 2, 3):
+        store.add("o/r", pr, "a", "default")
+    reviewed = []
+
+    def review(job):
+        reviewed.append(job.pr)
+        return "ok"
+
+    # First run reviews PR 1, then "crashes" holding PR 2 with a lease that
+    # expires immediately
+    drain_one = store.claim("run-1")
+    store.complete(drain_one, review(drain_one))
+    store.claim("run-1", lease_seconds=0.2)
+
+    with JobStore(tmp_path / "jobs.sqlite3") as restarted:
+        started = time.monotonic()
+        drain(restarted, review, "run-2", lease_seconds=0.3)
+        assert time.monotonic() - started < 5
+    assert sorted(reviewed) == [1, 2, 3]
+    assert store.counts()[DONE] == 3
+
+
+def test_drain_with_limiter_requeues_throttled_jobs(store):
+    for pr in (1, 2, 3):
+        store.add("o/r", pr, "a", "default", max_attempts=1)
+    throttled = []
+
+    def review(job):
+        if job.pr == 2 and not throttled:
+            throttled.append(job.pr)
+            raise RateLimitError("429")
+        return "ok"
+
+    limiter = AIMDLimiter(initial=4, maximum=4, cooldown=0.01)
+    events = []
+    completed = drain(store, review, "w", limiter=limiter,
+                      on_event=lambda e, j, d: events.append((e, j.pr)))
+    # Retried without using up its only attempt
+    assert completed == 3
+    assert ("throttled", 2) in events
+    assert [level for _, level in limiter.history][:2] == [4, 2]
+    assert limiter.in_flight == 0
@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import threading
+
+from parc_ferme.limiter import AIMDLimiter
+from parc_ferme.timing import Tracer, use_tracer
+
+
+def _succeed(limiter, latency=1.0, times=1):
+    for _ in range(times):
+        permit = limiter.acquire()
+        permit.succeeded(latency)
+        limiter.release(permit)
+
+
+def test_starts_at_initial_within_bounds():
+    assert AIMDLimiter(initial=2, maximum=8).limit == 2
+    assert AIMDLimiter(initial=10, maximum=4).limit == 4
+    assert AIMDLimiter(initial=0, maximum=4).limit == 1
+
+
+def test_additive_increase_one_per_window():
+    limiter = AIMDLimiter(initial=2, maximum=8)
+    _succeed(limiter, times=2)
+    assert limiter.limit == 3
+    _succeed(limiter, times=3)
+    assert limiter.limit == 4
+
+
+def test_increase_stops_at_maximum():
+    limiter = AIMDLimiter(initial=2, maximum=3)
+    _succeed(limiter, times=20)
+    assert limiter.limit == 3
+
+
+def test_slow_latency_holds_the_level():
+    limiter = AIMDLimiter(initial=2, maximum=8)
+    _succeed(limiter, latency=1.0, times=5)
+    assert limiter.limit == 4
+    _succeed(limiter, latency=10.0, times=4)
+    assert limiter.limit == 4
+
+
+def test_overload_halves_the_level_once_per_epoch():
+    limiter = AIMDLimiter(initial=8, maximum=8, cooldown=0)
+    permits = [limiter.acquire() for _ in range(3)]
+    for permit in permits:
+        permit.overloaded()
+        limiter.release(permit)
+    # The other two were granted at the old level, so only one cut applies
+    assert limiter.limit == 4
+    permit = limiter.acquire()
+    permit.overloaded()
+    limiter.release(permit)
+    assert limiter.limit == 2
+
+
+def test_overload_never_goes_below_minimum():
+    limiter = AIMDLimiter(initial=1, maximum=4, cooldown=0)
+    permit = limiter.acquire()
+    permit.overloaded()
+    limiter.release(permit)
+    assert limiter.limit == 1
+
+
+def test_acquire_blocks_at_limit():
+    limiter = AIMDLimiter(initial=1, maximum=4)
+    held = limiter.acquire()
+    assert limiter.acquire(timeout=0.05) is None
+
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(limiter.acquire(timeout=5)))
+    waiter.start()
+    limiter.release(held)
+    waiter.join(5)
+    assert got and got[0] is not None
+
+
+def test_overload_pauses_new_work():
+    limiter = AIMDLimiter(initial=4, maximum=4, cooldown=0.3)
+    permit = limiter.acquire()
+    permit.overloaded()
+    limiter.release(permit)
+    assert limiter.acquire(timeout=0.05) is None
+    assert limiter.acquire(timeout=2) is not None
+
+
+def test_level_changes_are_traced():
+    tracer = Tracer()
+    with use_tracer(tracer):
+        limiter = AIMDLimiter(initial=2, maximum=8, cooldown=0, name="batch.concurrency")
+        _succeed(limiter, times=2)
+        permit = limiter.acquire()
+        permit.overloaded()
+        limiter.release(permit)
+    assert [c.values["value"] for c in tracer.counters] == [2, 3, 1]
+    assert [level for _, level in limiter.history] == [2, 3, 1]
+    assert "batch.concurrency" in tracer.format_summary()
@@ -1,12 +1,47 @@
 from __future__ import annotations
 
+import json
 from unittest.mock import MagicMock, patch
 
 import pytest
 
-from parc_ferme.errors import ReviewError
+from parc_ferme.errors import (
+    RateLimitError,
+    ReviewCancelledError,
+    ReviewError,
+    ReviewTimeoutError,
+)
 from parc_ferme.profiles import DEFAULT_SEVERITY_LEVELS, Profile
-from parc_ferme.reviewer import MAX_DIFF_CHARS, build_prompt, run_review
+from parc_ferme.reviewer import (
+    MAX_DIFF_CHARS,
+    RetryPolicy,
+    build_prompt,
+    fit_diff,
+    format_omitted_notice,
+    is_partial_review,
+    review_shards,
+    run_review,
+    split_for_review,
+)
+from parc_ferme.usage import Usage
+
+NO_WAIT = RetryPolicy(attempts=3, backoff=0)
+
+
+def _fake_proc(returncode=0, stdout="", stderr=""):
+    proc = MagicMock(returncode=returncode)
+    proc.communicate.return_value = (stdout, stderr)
+    return proc
+
+
+def _big_diff(n_files=30, lines=200):
+    parts = []
+    for i in range(n_files):
+        path = f"src/module_{i}.py"
+        parts += [f"diff --git a/{path} b/{path}", f"--- a/{path}", f"+++ b/{path}",
+                  f"@@ -1,{lines} +1,{lines} @@"]
+        parts += [f"+    value_{j} = compute({j})" for j in range(lines)]
+    return "\n".join(parts) + "\n"
 
 
 # --- build_prompt ---
@@ -58,6 +93,15 @@ def test_build_prompt_with_extra_instructions(sample_pr_info):
     assert "Pay attention to SQL injection" in prompt
 
 
+def test_build_prompt_puts_conventions_before_the_pr(sample_pr_info, sample_profile):
+    prompt = build_prompt(sample_pr_info, sample_profile, "CONVENTIONS:\n- line-length=99")
+    lines = prompt.split("\n")
+    assert lines[2:4] == ["CONVENTIONS:", "- line-length=99"]
+    assert lines[5].startswith("PR: #42")
+    assert build_prompt(sample_pr_info, sample_profile, "") == \
+        build_prompt(sample_pr_info, sample_profile)
+
+
 def test_build_prompt_without_extra_instructions(sample_pr_info, sample_profile):
     prompt = build_prompt(sample_pr_info, sample_profile)
     # Should not have trailing blank extra section
@@ -68,54 +112,310 @@ def test_build_prompt_without_extra_instructions(sample_pr_info, sample_profile)
 # --- run_review ---
 
 
-@patch("parc_ferme.reviewer.subprocess.run")
+@patch("parc_ferme.reviewer.subprocess.Popen")
 def test_run_review_short_diff_no_truncation(mock_run):
-    mock_run.return_value = MagicMock(returncode=0, stdout="LGTM", stderr="")
+    mock_run.return_value = _fake_proc(returncode=0, stdout="LGTM", stderr="")
     result = run_review("prompt", "short diff")
     assert result == "LGTM"
     # Check the diff passed to stdin
-    call_kwargs = mock_run.call_args
+    call_kwargs = mock_run.return_value.communicate.call_args
     assert "DIFF TRUNCATED" not in call_kwargs.kwargs.get("input", call_kwargs[1].get("input", ""))
 
 
-@patch("parc_ferme.reviewer.subprocess.run")
+@patch("parc_ferme.reviewer.subprocess.Popen")
 def test_run_review_long_diff_truncated(mock_run):
-    mock_run.return_value = MagicMock(returncode=0, stdout="review", stderr="")
+    mock_run.return_value = _fake_proc(returncode=0, stdout="review", stderr="")
     long_diff = "x" * (MAX_DIFF_CHARS + 1000)
     run_review("prompt", long_diff)
-    call_kwargs = mock_run.call_args
+    call_kwargs = mock_run.return_value.communicate.call_args
     input_text = call_kwargs.kwargs.get("input") or call_kwargs[1].get("input", "")
     assert "DIFF TRUNCATED" in input_text
     assert len(input_text) < len(long_diff)
 
 
-@patch("parc_ferme.reviewer.subprocess.run")
+@patch("parc_ferme.reviewer.subprocess.Popen")
+def test_run_review_packs_structured_diff(mock_run):
+    mock_run.return_value = _fake_proc(returncode=0, stdout="review", stderr="")
+    diff = _big_diff()
+    run_review("prompt", diff, max_diff_tokens=5_000)
+    input_text = mock_run.return_value.communicate.call_args.kwargs["input"]
+    prompt = mock_run.call_args[0][0][2]
+    assert "DIFF TRUNCATED" not in input_text
+    assert input_text.endswith("\n")
+    assert "were NOT reviewed" in prompt
+    assert "src/module_29.py" in prompt or "src/module_0.py" in prompt
+
+
+@patch("parc_ferme.reviewer.subprocess.Popen")
+def test_run_review_reads_usage_from_json_output(mock_run):
+    result = {"type": "result", "result": "LGTM", "total_cost_usd": 0.01,
+              "usage": {"input_tokens": 900, "output_tokens": 40}}
+    mock_run.return_value = _fake_proc(stdout=json.dumps(result) + "\n")
+    usage = Usage()
+    assert run_review("prompt", "diff", usage=usage) == "LGTM"
+    assert "stream-json" in mock_run.call_args[0][0]
+    assert (usage.input_tokens, usage.output_tokens, usage.calls) == (900, 40, 1)
+
+
+# --- fit_diff ---
+
+
+def test_fit_diff_under_budget_unchanged(sample_diff):
+    packed = fit_diff(sample_diff)
+    assert packed.text == sample_diff
+    assert packed.truncated is False
+
+
+def test_fit_diff_over_budget_packs_hunks():
+    packed = fit_diff(_big_diff(), max_diff_tokens=5_000)
+    assert packed.truncated is True
+    assert packed.tokens <= 5_000
+    assert packed.omitted_files
+
+
+def test_fit_diff_one_file_over_budget_is_not_emptied():
+    lines = "".join(f"+value_{i} = compute({i})  # {'x' * 30}\n" for i in range(4000))
+    diff = (
+        "diff --git a/big.py b/big.py\nnew file mode 100644\n--- /dev/null\n+++ b/big.py\n"
+        f"@@ -0,0 +1,4000 @@\n{lines}"
+    )
+    packed = fit_diff(diff, max_diff_tokens=25_000)
+    assert packed.text.startswith("diff --git a/big.py b/big.py")
+    assert 20_000 < packed.tokens <= 25_000
+    assert packed.partial_files == ["big.py"]
+
+
+def test_fit_diff_non_diff_falls_back_to_chars():
+    packed = fit_diff("x" * 50_000, max_diff_tokens=1_000)
+    assert packed.cut_mid_text is True
+    assert "DIFF TRUNCATED" in packed.text
+
+
+def test_format_omitted_notice_empty_when_complete(sample_diff):
+    assert format_omitted_notice(fit_diff(sample_diff)) == ""
+
+
+def test_format_omitted_notice_lists_files():
+    packed = fit_diff(_big_diff(), max_diff_tokens=5_000)
+    notice = format_omitted_notice(packed, 5_000)
+    for path in packed.omitted_files:
+        assert f"- {path}" in notice
+    assert "5,000-token" in notice
+
+
+def test_format_omitted_notice_caps_listed_files():
+    packed = fit_diff(_big_diff(n_files=400, lines=20), max_diff_tokens=500)
+    notice = format_omitted_notice(packed, 500)
+    assert "more files" in notice
+    assert notice.count("\n- ") <= 102
+
+
+@patch("parc_ferme.reviewer.subprocess.Popen")
 def test_run_review_failure_raises(mock_run):
-    mock_run.return_value = MagicMock(returncode=1, stdout="", stderr="error")
+    mock_run.return_value = _fake_proc(returncode=1, stdout="", stderr="error")
     with pytest.raises(ReviewError, match="Claude review failed"):
         run_review("prompt", "diff")
 
 
-@patch("parc_ferme.reviewer.subprocess.run")
+@patch("parc_ferme.reviewer.subprocess.Popen")
+def test_run_review_unstartable_claude_raises_review_error(mock_run):
+    mock_run.side_effect = OSError(7, "Argument list too long")
+    with pytest.raises(ReviewError, match="Could not run claude.*Argument list too long"):
+        run_review("prompt", "diff")
+
+
+@pytest.mark.parametrize("stderr", [
+    "API Error: 429 rate_limit_error",
+    'API Error: 529 {"type":"error","error":{"type":"overloaded_error"}}',
+])
+@patch("parc_ferme.reviewer.subprocess.Popen")
+def test_run_review_rate_limit_raises_rate_limit_error(mock_run, stderr):
+    mock_run.return_value = _fake_proc(returncode=1, stdout="", stderr=stderr)
+    with pytest.raises(RateLimitError, match="rate limited or overloaded"):
+        run_review("prompt", "diff")
+
+
+@patch("parc_ferme.reviewer.subprocess.Popen")
 def test_run_review_passes_model_flag(mock_run):
-    mock_run.return_value = MagicMock(returncode=0, stdout="ok", stderr="")
+    mock_run.return_value = _fake_proc(returncode=0, stdout="ok", stderr="")
     run_review("prompt", "diff", model="opus")
     cmd = mock_run.call_args[0][0]
     assert "--model" in cmd
     assert "opus" in cmd
 
 
-@patch("parc_ferme.reviewer.subprocess.run")
+@patch("parc_ferme.reviewer.subprocess.Popen")
 def test_run_review_no_model_flag(mock_run):
-    mock_run.return_value = MagicMock(returncode=0, stdout="ok", stderr="")
+    mock_run.return_value = _fake_proc(returncode=0, stdout="ok", stderr="")
     run_review("prompt", "diff", model=None)
     cmd = mock_run.call_args[0][0]
     assert "--model" not in cmd
 
 
-@patch("parc_ferme.reviewer.subprocess.run")
+@patch("parc_ferme.reviewer.subprocess.Popen")
 def test_run_review_timeout_raises(mock_run):
     import subprocess as sp
-    mock_run.side_effect = sp.TimeoutExpired(cmd=["claude"], timeout=10)
+    mock_run.return_value = _fake_proc()
+    mock_run.return_value.communicate.side_effect = [
+        sp.TimeoutExpired(cmd=["claude"], timeout=10),
+        ("", ""),
+    ]
     with pytest.raises(ReviewError, match="timed out after 10s"):
         run_review("prompt", "diff", timeout=10)
+    mock_run.return_value.kill.assert_called_once()
+
+
+@patch("parc_ferme.reviewer.subprocess.Popen")
+def test_run_review_cancelled_kills_process(mock_run):
+    import subprocess as sp
+    import threading
+
+    cancel = threading.Event()
+    proc = _fake_proc()
+
+    def communicate(input=None, timeout=None):
+        if timeout is not None:
+            cancel.set()
+            raise sp.TimeoutExpired(cmd=["claude"], timeout=timeout)
+        return ("", "")
+
+    proc.communicate.side_effect = communicate
+    mock_run.return_value = proc
+    with pytest.raises(ReviewCancelledError):
+        run_review("prompt", "diff", cancel=cancel)
+    proc.kill.assert_called_once()
+
+
+@patch("parc_ferme.reviewer.subprocess.Popen")
+def test_run_review_with_cancel_event_completes(mock_run):
+    import threading
+
+    mock_run.return_value = _fake_proc(stdout="LGTM")
+    assert run_review("prompt", "diff", cancel=threading.Event()) == "LGTM"
+
+
+# --- retries and partial output ---
+
+
+@patch("parc_ferme.reviewer.subprocess.Popen")
+def test_run_review_retries_transient_failures(mock_run):
+    mock_run.side_effect = [
+        _fake_proc(returncode=1, stderr="API Error: 529 overloaded"),
+        _fake_proc(returncode=1, stderr="connection reset"),
+        _fake_proc(stdout="LGTM"),
+    ]
+    assert run_review("prompt", "diff", retry=NO_WAIT) == "LGTM"
+    assert mock_run.call_count == 3
+
+
+@patch("parc_ferme.reviewer.subprocess.Popen")
+def test_run_review_gives_up_after_attempts(mock_run):
+    mock_run.side_effect = [_fake_proc(returncode=1, stderr="boom") for _ in range(2)]
+    with pytest.raises(ReviewError, match="boom"):
+        run_review("prompt", "diff", retry=RetryPolicy(attempts=2, backoff=0))
+    assert mock_run.call_count == 2
+
+
+def test_retry_delay_is_jittered_and_capped():
+    policy = RetryPolicy(backoff=2.0, max_backoff=5.0)
+    delays = [policy.delay(10) for _ in range(50)]
+    assert all(0 <= d <= 5.0 for d in delays)
+    assert len(set(delays)) > 1
+
+
+@patch("parc_ferme.reviewer.subprocess.Popen")
+def test_run_review_timeout_salvages_partial_output(mock_run):
+    import subprocess as sp
+    proc = _fake_proc()
+    proc.communicate.side_effect = [
+        sp.TimeoutExpired(cmd=["claude"], timeout=10),
+        ("\U0001f7e1 WARNING - a.py:1 - first finding", ""),
+    ]
+    mock_run.return_value = proc
+    review = run_review("prompt", "diff", timeout=10, retry=NO_WAIT)
+    assert is_partial_review(review)
+    assert "timed out after 10s" in review
+    assert review.endswith("first finding")
+    assert mock_run.call_count == 1
+
+
+@patch("parc_ferme.reviewer.subprocess.Popen")
+def test_run_review_timeout_without_output_is_not_retried(mock_run):
+    import subprocess as sp
+    proc = _fake_proc()
+    proc.communicate.side_effect = [sp.TimeoutExpired(cmd=["claude"], timeout=10), ("", "")]
+    mock_run.return_value = proc
+    with pytest.raises(ReviewTimeoutError):
+        run_review("prompt", "diff", timeout=10, retry=NO_WAIT)
+    assert mock_run.call_count == 1
+
+
+# --- sharded reviews ---
+
+
+def test_split_for_review_one_shard_by_default():
+    shards, combined = split_for_review(_big_diff(), max_diff_tokens=500)
+    assert len(shards) == 1
+    assert combined.truncated
+
+
+def test_split_for_review_shards_large_diff():
+    shards, combined = split_for_review(_big_diff(n_files=4, lines=20), 500, max_shards=8)
+    assert len(shards) > 1
+    assert not combined.truncated
+
+
+@patch("parc_ferme.reviewer.subprocess.Popen")
+def test_review_shards_retries_only_the_failed_shard(mock_run):
+    shards, combined = split_for_review(_big_diff(n_files=3, lines=20), 300, max_shards=3)
+    assert len(shards) == 3
+    mock_run.side_effect = [
+        _fake_proc(stdout="part one"),
+        _fake_proc(returncode=1, stderr="flaky"),
+        _fake_proc(stdout="part two"),
+        _fake_proc(stdout="part three"),
+    ]
+    review = review_shards("prompt", shards, combined, retry=NO_WAIT)
+    assert mock_run.call_count == 4
+    assert "### Part 1/3" in review and "part three" in review
+    assert not is_partial_review(review)
+    prompts = [call[0][0][2] for call in mock_run.call_args_list]
+    assert "part 2 of 3" in prompts[1] and "part 2 of 3" in prompts[2]
+
+
+@patch("parc_ferme.reviewer.subprocess.Popen")
+def test_review_shards_stop_when_the_token_budget_is_spent(mock_run):
+    shards, combined = split_for_review(_big_diff(n_files=3, lines=20), 300, max_shards=3)
+    result = {"type": "result", "result": "findings", "usage": {"input_tokens": 700}}
+    mock_run.return_value = _fake_proc(stdout=json.dumps(result))
+    usage = Usage()
+    review = review_shards("prompt", shards, combined, usage=usage, max_tokens=1_000)
+    assert mock_run.call_count == 2
+    assert usage.input_tokens == 1_400
+    assert is_partial_review(review)
+    assert "1 of 3 parts were not reviewed: the 1,000-token budget was spent" in review
+
+
+@patch("parc_ferme.reviewer.subprocess.Popen")
+def test_review_shards_marks_partial_when_a_shard_fails(mock_run):
+    shards, combined = split_for_review(_big_diff(n_files=2, lines=20), 300, max_shards=2)
+    mock_run.side_effect = [
+        _fake_proc(stdout="part one"),
+        _fake_proc(returncode=1, stderr="still broken"),
+    ]
+    review = review_shards("prompt", shards, combined, retry=RetryPolicy(attempts=1))
+    assert is_partial_review(review)
+    assert "1 of 2 parts could not be reviewed" in review
+    assert "part one" in review
+
+
+@patch("parc_ferme.reviewer.subprocess.Popen")
+def test_review_shards_raises_a_rate_limit_instead_of_going_partial(mock_run):
+    # Salvaged as a partial review it would be marked done and hide the overload
+    shards, combined = split_for_review(_big_diff(n_files=2, lines=20), 300, max_shards=2)
+    mock_run.side_effect = [
+        _fake_proc(stdout="part one"),
+        _fake_proc(returncode=1, stderr="API Error: 429 rate_limit_error"),
+    ]
+    with pytest.raises(RateLimitError):
+        review_shards("prompt", shards, combined, retry=RetryPolicy(attempts=1))
@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+from parc_ferme.diff import parse_diff
+from parc_ferme.routing import (
+    DEFAULT_AUTO_PROFILES,
+    RoutingRule,
+    build_rules,
+    classify_files,
+    route_diff,
+)
+
+MIXED_DIFF = """\
+diff --git a/src/app/user.component.ts b/src/app/user.component.ts
+--- a/src/app/user.component.ts
++++ b/src/app/user.component.ts
+@@ -1,2 +1,3 @@
+ import { Component } from '@angular/core';
++import { OnDestroy } from '@angular/core';
+ export class UserComponent {}
+diff --git a/scripts/build.ts b/scripts/build.ts
+--- a/scripts/build.ts
++++ b/scripts/build.ts
+@@ -1 +1 @@
+-const out = 'dist';
++const out = 'build';
+diff --git a/api/auth.py b/api/auth.py
+--- a/api/auth.py
++++ b/api/auth.py
+@@ -1 +1 @@
+-TOKEN = None
++TOKEN = load()
+"""
+
+
+def test_default_rules_send_angular_files_to_angular():
+    rules, fallback = build_rules(DEFAULT_AUTO_PROFILES)
+    groups = classify_files(parse_diff(MIXED_DIFF), rules, fallback)
+    assert [(g.profiles, g.paths) for g in groups] == [
+        (("angular",), ["src/app/user.component.ts"]),
+        (("default",), ["scripts/build.ts", "api/auth.py"]),
+    ]
+
+
+def test_matching_rules_combine_profiles():
+    rules = [
+        RoutingRule(profiles=["angular"], extensions=[".ts"]),
+        RoutingRule(profiles=["security", "angular"], content=r"TOKEN|auth"),
+    ]
+    groups = classify_files(parse_diff(MIXED_DIFF), rules, ["default"])
+    assert [(g.profiles, g.paths) for g in groups] == [
+        (("angular",), ["src/app/user.component.ts", "scripts/build.ts"]),
+        (("security", "angular"), ["api/auth.py"]),
+    ]
+
+
+def test_route_diff_gives_each_profile_only_its_files():
+    rules = [RoutingRule(profiles=["security"], extensions=[".py"])]
+    routes = route_diff(MIXED_DIFF, rules, ["default"])
+    assert list(routes) == ["default", "security"]
+    paths, text = routes["security"]
+    assert paths == ["api/auth.py"]
+    assert text.startswith("diff --git a/api/auth.py") and "build.ts" not in text
+    assert parse_diff(routes["default"][1])[0].path == "src/app/user.component.ts"
+
+
+def test_route_diff_unparsable_goes_to_fallback_whole():
+    assert route_diff("not a diff", [], ["default", "security"]) == {
+        "default": ([], "not a diff"),
+        "security": ([], "not a diff"),
+    }
@@ -0,0 +1,26 @@
+from __future__ import annotations
+
+from parc_ferme.scheduling import LINES_PER_FILE, Scheduler, estimate_size
+
+
+def test_estimate_size_counts_lines_and_files():
+    assert estimate_size(30, 10, 2) == 40 + 2 * LINES_PER_FILE
+    assert estimate_size(0, 0, 0) == 0
+
+
+def test_smallest_first_with_aging():
+    scheduler = Scheduler(aging_seconds=60)
+    assert scheduler.rank(100, 0, 0) < scheduler.rank(10_000, 0, 0)
+    # 100x larger: it goes first once it has waited seven halvings
+    assert scheduler.rank(10_000, 0, 6 * 60) > scheduler.rank(100, 0, 0)
+    assert scheduler.rank(10_000, 0, 7 * 60) < scheduler.rank(100, 0, 0)
+    assert scheduler.rank(None, 0, 0) == (0, 0.0)
+
+
+def test_fifo_and_label_priority():
+    scheduler = Scheduler(order="fifo", label_priority={"hotfix": 10, "deps": -5})
+    assert scheduler.rank(10_000, 0, 0) == scheduler.rank(1, 0, 0)
+    assert scheduler.priority(["bug", "hotfix", "deps"]) == 10
+    assert scheduler.priority(["deps"]) == -5
+    assert scheduler.priority([]) == 0
+    assert scheduler.rank(10_000, 10, 0) < scheduler.rank(1, 0, 0)
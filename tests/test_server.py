@@ -0,0 +1,353 @@
+from __future__ import annotations
+
+import hashlib
+import hmac
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from functools import partial
+
+import pytest
+
+from parc_ferme.errors import ReviewCancelledError
+from parc_ferme.jobs import CANCELLED, DONE, PENDING, JobStore
+from parc_ferme.scheduling import Scheduler
+from parc_ferme.server import (
+    ReviewJob,
+    ReviewQueue,
+    ReviewServer,
+    make_pr_reviewer,
+    parse_pull_request_event,
+    verify_signature,
+)
+from parc_ferme.session import ReviewSession
+
+
+def _payload(pr=7, sha="a" * 40, action="synchronize", repo="owner/repo", draft=False):
+    return {
+        "action": action,
+        "repository": {"full_name": repo},
+        "pull_request": {"number": pr, "draft": draft, "head": {"sha": sha}},
+    }
+
+
+def send_webhook(url, payload, event="pull_request", secret=None):
+    """Fake GitHub webhook sender."""
+    body = json.dumps(payload).encode()
+    headers = {"Content-Type": "application/json", "X-GitHub-Event": event}
+    if secret:
+        digest = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+        headers["X-Hub-Signature-256"] = f"sha256={digest}"
+    request = urllib.request.Request(url, data=body, headers=headers, method="POST")
+    try:
+        with urllib.request.urlopen(request, timeout=5) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def _wait_for(predicate, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+@pytest.fixture
+def make_server():
+    servers = []
+
+    def factory(review_fn, **kwargs):
+        server = ReviewServer(review_fn, host="127.0.0.1", port=0, **kwargs)
+        server.start()
+        servers.append(server)
+        host, port = server.address
+        return server, f"http://{host}:{port}/"
+
+    yield factory
+    for server in servers:
+        server.shutdown()
+
+
+# --- ReviewQueue ---
+
+
+def test_queue_fifo():
+    queue = ReviewQueue()
+    queue.put(ReviewJob("o/r", 1, "a"))
+    queue.put(ReviewJob("o/r", 2, "b"))
+    assert queue.get(timeout=0).pr == 1
+    assert queue.get(timeout=0).pr == 2
+
+
+def test_queue_smallest_first_and_priority():
+    queue = ReviewQueue(Scheduler(label_priority={"hotfix": 5}))
+    queue.put(ReviewJob("o/r", 1, "a", size=9_000))
+    queue.put(ReviewJob("o/r", 2, "b", size=40))
+    queue.put(ReviewJob("o/r", 3, "c", size=800, priority=5))
+    queue.put(ReviewJob("o/r", 4, "d", size=9_000, enqueued_at=time.time() - 7200))
+    assert [queue.get(timeout=0).pr for _ in range(4)] == [3, 4, 2, 1]
+
+
+def test_queue_coalesces_pending_to_newest_sha():
+    queue = ReviewQueue()
+    assert queue.put(ReviewJob("o/r", 1, "a")) == "queued"
+    assert queue.put(ReviewJob("o/r", 2, "x")) == "queued"
+    assert queue.put(ReviewJob("o/r", 1, "b")) == "coalesced"
+    assert queue.put(ReviewJob("o/r", 1, "c")) == "coalesced"
+    first = queue.get(timeout=0)
+    assert (first.pr, first.head_sha) == (1, "c")
+    assert queue.stats()["pending"] == 1
+
+
+def test_queue_duplicate_delivery_ignored():
+    queue = ReviewQueue()
+    queue.put(ReviewJob("o/r", 1, "a"))
+    assert queue.put(ReviewJob("o/r", 1, "a")) == "duplicate"
+    job = queue.get(timeout=0)
+    assert queue.put(ReviewJob("o/r", 1, "a")) == "duplicate"
+    assert not job.cancel.is_set()
+
+
+def test_queue_cancels_running_superseded_job():
+    queue = ReviewQueue()
+    queue.put(ReviewJob("o/r", 1, "a"))
+    running = queue.get(timeout=0)
+    assert queue.put(ReviewJob("o/r", 1, "b")) == "queued"
+    assert running.cancel.is_set()
+    assert queue.stats()["cancelled"] == 1
+
+
+def test_queue_does_not_run_same_pr_twice_concurrently():
+    queue = ReviewQueue()
+    queue.put(ReviewJob("o/r", 1, "a"))
+    running = queue.get(timeout=0)
+    queue.put(ReviewJob("o/r", 1, "b"))
+    assert queue.get(timeout=0) is None
+    queue.done(running)
+    assert queue.get(timeout=0).head_sha == "b"
+
+
+def test_queue_close_unblocks_and_cancels():
+    queue = ReviewQueue()
+    queue.put(ReviewJob("o/r", 1, "a"))
+    running = queue.get(timeout=0)
+    queue.close()
+    assert running.cancel.is_set()
+    assert queue.get() is None
+
+
+# --- webhook parsing ---
+
+
+def test_verify_signature():
+    body = b'{"a": 1}'
+    digest = hmac.new(b"s3cret", body, hashlib.sha256).hexdigest()
+    assert verify_signature("s3cret", body, f"sha256={digest}") is True
+    assert verify_signature("s3cret", body, "sha256=deadbeef") is False
+    assert verify_signature("s3cret", body, None) is False
+
+
+def test_parse_pull_request_event():
+    job = parse_pull_request_event(_payload(pr=9, sha="f" * 40))
+    assert job.key == ("owner/repo", 9)
+    assert job.head_sha == "f" * 40
+    assert (job.size, job.priority) == (None, 0)
+
+
+def test_parse_pull_request_event_size_and_labels():
+    payload = _payload()
+    payload["pull_request"].update(
+        additions=120, deletions=30, changed_files=3, labels=[{"name": "urgent"}],
+    )
+    job = parse_pull_request_event(payload, Scheduler(label_priority={"urgent": 3}))
+    assert (job.size, job.priority) == (210, 3)
+
+
+@pytest.mark.parametrize("payload", [
+    _payload(action="closed"),
+    _payload(draft=True),
+    {"action": "opened"},
+])
+def test_parse_pull_request_event_ignored(payload):
+    assert parse_pull_request_event(payload) is None
+
+
+# --- HTTP server ---
+
+
+def test_server_enqueues_and_reviews(make_server):
+    reviewed = []
+    server, url = make_server(lambda job: reviewed.append(job.describe()))
+    status, body = send_webhook(url, _payload())
+    assert status == 202
+    assert body["status"] == "queued"
+    assert _wait_for(lambda: reviewed == ["owner/repo#7@aaaaaaa"])
+
+
+def test_server_ignores_other_events(make_server):
+    server, url = make_server(lambda job: None)
+    status, body = send_webhook(url, {"zen": "hi"}, event="ping")
+    assert (status, body["status"]) == (200, "pong")
+    status, body = send_webhook(url, {}, event="push")
+    assert (status, body["status"]) == (202, "ignored")
+
+
+def test_server_rejects_bad_signature(make_server):
+    server, url = make_server(lambda job: None, secret="s3cret")
+    status, _ = send_webhook(url, _payload(), secret="wrong")
+    assert status == 401
+    status, _ = send_webhook(url, _payload(), secret="s3cret")
+    assert status == 202
+
+
+def test_server_cancels_superseded_in_flight_review(make_server):
+    started = threading.Event()
+    release = threading.Event()
+    outcomes = []
+
+    def review(job):
+        started.set()
+        cancelled = job.cancel.wait(timeout=5)
+        release.wait(timeout=5)
+        outcomes.append(("cancelled" if cancelled else "done", job.head_sha))
+
+    server, url = make_server(review, workers=2)
+    send_webhook(url, _payload(sha="a" * 40))
+    assert started.wait(5)
+    send_webhook(url, _payload(sha="b" * 40))
+    send_webhook(url, _payload(sha="c" * 40))
+    release.set()
+    assert _wait_for(lambda: len(outcomes) == 2)
+    assert outcomes[0] == ("cancelled", "a" * 40)
+    # "b" was coalesced into "c" while "a" was still winding down
+    assert outcomes[1] == ("done", "c" * 40)
+
+
+def test_server_records_jobs_in_store(make_server, tmp_path):
+    store = JobStore(tmp_path / "jobs.sqlite3")
+    server, url = make_server(lambda job: f"review {job.head_sha}", store=store)
+    send_webhook(url, _payload(sha="a" * 40))
+    assert _wait_for(lambda: store.counts()[DONE] == 1)
+    assert store.get(1).result_path
+
+    # A redelivery of a reviewed head is not reviewed again
+    status, body = send_webhook(url, _payload(sha="a" * 40))
+    assert (status, body["status"]) == (200, "already reviewed")
+
+
+def test_server_reviews_a_head_delivered_again_after_it_was_cancelled(make_server, tmp_path):
+    path = tmp_path / "jobs.sqlite3"
+    with JobStore(path) as store:
+        store.add("owner/repo", 7, "a" * 40, "default")
+        store.add("owner/repo", 7, "b" * 40, "default")
+        store.supersede("owner/repo", 7, "b" * 40)  # a cancelled ...
+        store.supersede("owner/repo", 7, "a" * 40)  # ... and a force-pushed back over b
+
+    reviewed = []
+    store = JobStore(path)
+    server, url = make_server(lambda job: reviewed.append(job.head_sha) or "ok", store=store)
+    status, body = send_webhook(url, _payload(sha="a" * 40))
+    assert (status, body["status"]) == (202, "queued")
+    assert _wait_for(lambda: store.get(1).state == DONE)
+    assert reviewed == ["a" * 40]
+    assert store.get(1).attempts == 1 and store.get(1).error is None
+
+
+def test_server_resumes_unfinished_jobs(make_server, tmp_path):
+    path = tmp_path / "jobs.sqlite3"
+    with JobStore(path) as store:
+        store.add("owner/repo", 1, "a" * 40, "default")
+        store.add("owner/repo", 2, "b" * 40, "default")
+        store.add("owner/repo", 2, "c" * 40, "default")
+        store.supersede("owner/repo", 2, "c" * 40)
+
+    reviewed = []
+    store = JobStore(path)
+    make_server(lambda job: reviewed.append(job.head_sha) or "ok", store=store)
+    assert _wait_for(lambda: store.counts()[DONE] == 2)
+    assert sorted(reviewed) == ["a" * 40, "c" * 40]
+    assert store.get(2).state == CANCELLED
+
+
+def test_server_shutdown_releases_in_flight_job(tmp_path):
+    store = JobStore(tmp_path / "jobs.sqlite3")
+    started = threading.Event()
+
+    def review(job):
+        started.set()
+        job.cancel.wait(timeout=5)
+        raise ReviewCancelledError("stopped")
+
+    server = ReviewServer(review, host="127.0.0.1", port=0, store=store)
+    server.start()
+    host, port = server.address
+    send_webhook(f"http://{host}:{port}/", _payload())
+    assert started.wait(5)
+    server.shutdown()
+    job = store.get(1)
+    assert (job.state, job.attempts) == (PENDING, 0)
+
+
+# --- end to end with stub gh/claude ---
+
+
+def test_end_to_end_with_stub_tools(make_server, stub_tools, monkeypatch):
+    monkeypatch.setenv("PARC_BENCH_HEAD_SHA", "a" * 40)
+    reviewer = make_pr_reviewer(ReviewSession(config={}), "default", timeout=30, comment=True)
+    server, url = make_server(reviewer)
+    send_webhook(url, _payload(sha="a" * 40))
+    assert _wait_for(lambda: stub_tools("gh", ["pr", "comment"]))
+    assert len(stub_tools("claude")) == 1
+
+
+def test_end_to_end_superseded_push_kills_claude(make_server, stub_tools, monkeypatch):
+    monkeypatch.setenv("PARC_BENCH_HEAD_SHA", "a" * 40)
+    monkeypatch.setenv("PARC_BENCH_CLAUDE_LATENCY", "3")
+    reviewer = make_pr_reviewer(ReviewSession(config={}), "default", timeout=30, comment=True)
+    server, url = make_server(reviewer)
+    send_webhook(url, _payload(sha="a" * 40))
+    assert _wait_for(lambda: stub_tools("gh", ["pr", "diff"]))
+    time.sleep(0.5)  # let claude start
+
+    monkeypatch.setenv("PARC_BENCH_HEAD_SHA", "b" * 40)
+    monkeypatch.setenv("PARC_BENCH_CLAUDE_LATENCY", "0")
+    send_webhook(url, _payload(sha="b" * 40))
+
+    assert _wait_for(lambda: stub_tools("gh", ["pr", "comment"]))
+    time.sleep(0.5)
+    # The first claude process was killed before it could answer
+    assert len(stub_tools("claude")) == 1
+    assert len(stub_tools("gh", ["pr", "comment"])) == 1
+
+
+def test_saved_review_is_not_posted_again_after_a_crash(stub_tools, monkeypatch, tmp_path):
+    monkeypatch.setenv("PARC_BENCH_HEAD_SHA", "a" * 40)
+    store = JobStore(tmp_path / "jobs.sqlite3")
+    store.add("owner/repo", 7, "a" * 40, "default")
+    crashed = store.claim("crashed", lease_seconds=-1)
+    reviewer = make_pr_reviewer(ReviewSession(config={}), "default", timeout=30, comment=True)
+    review = reviewer(ReviewJob(
+        "owner/repo", 7, "a" * 40, save_result=partial(store.save_result, crashed),
+    ))
+    # The worker dies after posting, before complete(): the retry finds the saved review
+    assert store.result_file(crashed).read_text() == review
+    assert store.recover(store.claim("w2")) is True
+    assert len(stub_tools("gh", ["pr", "comment"])) == 1
+
+
+def test_review_is_not_posted_once_the_lease_is_lost(stub_tools, monkeypatch, tmp_path):
+    monkeypatch.setenv("PARC_BENCH_HEAD_SHA", "a" * 40)
+    store = JobStore(tmp_path / "jobs.sqlite3")
+    store.add("owner/repo", 7, "a" * 40, "default")
+    stale = store.claim("stale", lease_seconds=-1)
+    store.claim("w2")
+    reviewer = make_pr_reviewer(ReviewSession(config={}), "default", timeout=30, comment=True)
+    with pytest.raises(ReviewCancelledError, match="lease lost"):
+        reviewer(ReviewJob("owner/repo", 7, "a" * 40, save_result=partial(store.save_result, stale)))
+    assert stub_tools("gh", ["pr", "comment"]) == []
+    assert not store.result_file(stale).exists()
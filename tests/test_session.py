@@ -0,0 +1,559 @@
+from __future__ import annotations
+
+import asyncio
+import subprocess
+import sys
+import time
+from dataclasses import replace
+from unittest.mock import patch
+
+import pytest
+
+from parc_ferme import ReviewResult, ReviewSession, review_pr
+from parc_ferme.context import MAX_CONTEXT_BYTES
+from parc_ferme.errors import (
+    BudgetExceededError,
+    GitHubError,
+    RateLimitError,
+    ReviewError,
+    ToolNotFoundError,
+)
+from parc_ferme.github import PRInfo
+from parc_ferme.history import ReviewRecord, load_history, record_review
+from parc_ferme.profiles import get_profile
+from parc_ferme.reviewer import PARTIAL_REVIEW_MARKER
+from parc_ferme.session import OUTPUT_RESERVE_TOKENS, has_critical_issues
+
+
+@pytest.fixture
+def session():
+    with ReviewSession(config={}) as s:
+        yield s
+
+
+def test_session_loads_config_once(tmp_path):
+    config = tmp_path / ".reviewrc.yml"
+    config.write_text("default_profile: security\nclaude_model: opus\n")
+    session = ReviewSession(config_path=str(config))
+    assert session.default_profile == "security"
+    assert session.model_name == "opus"
+
+
+def test_profile_is_cached(session):
+    assert session.profile("security") is session.profile("security")
+    assert session.profile().name == "default"
+    with pytest.raises(ValueError):
+        session.profile("nope")
+
+
+def test_check_tools_runs_once(session):
+    with patch("parc_ferme.session.check_gh_available") as gh, \
+            patch("parc_ferme.session.check_claude_available") as claude:
+        session.check_tools(claude=False)
+        session.check_tools()
+        session.check_tools()
+    assert gh.call_count == 1
+    assert claude.call_count == 1
+
+
+def test_check_tools_missing(session):
+    with patch("parc_ferme.session.check_gh_available", side_effect=ToolNotFoundError("no gh")):
+        with pytest.raises(ToolNotFoundError):
+            session.check_tools()
+
+
+def test_review_returns_structured_result(session, stub_tools):
+    result = session.review("7", repo="owner/repo")
+    assert isinstance(result, ReviewResult)
+    assert result.pr_info.number == 7
+    assert result.profile_name == "default"
+    assert result.changed_files == ["src/app.py", "README.md"]
+    assert result.review
+    assert result.truncated is False
+    assert result.comment_posted is False
+    assert stub_tools("gh", ["pr", "comment"]) == []
+
+
+def test_review_comment_error_is_reported(session, stub_tools):
+    with patch("parc_ferme.session.post_comment", side_effect=GitHubError("forbidden")):
+        result = session.review("7", comment=True)
+    assert result.comment_posted is False
+    assert result.comment_error == "forbidden"
+
+
+def test_identical_concurrent_reviews_share_one_claude_run(stub_tools, monkeypatch):
+    monkeypatch.setenv("PARC_BENCH_CLAUDE_LATENCY", "0.5")
+
+    async def review_twice():
+        async with ReviewSession(config={}) as session:
+            return await asyncio.gather(session.review_pr("7"), session.review_pr("7"))
+
+    results = asyncio.run(review_twice())
+    assert len(stub_tools("claude")) == 1
+    assert sorted(r.shared_from for r in results) == ["", "concurrent"]
+    assert results[0].review == results[1].review
+
+
+def test_rebase_without_changes_reuses_the_review(stub_tools, tmp_path, monkeypatch):
+    session = ReviewSession(config={"hunk_cache": {"enabled": False}})
+    first = session.review("7")
+    # New head SHA and hunk offsets, same added and removed lines
+    monkeypatch.setenv("PARC_BENCH_HEAD_SHA", "f" * 40)
+    diff = tmp_path / "pr.diff"
+    diff.write_text(diff.read_text().replace("@@ -10,3 +10,4 @@", "@@ -30,3 +32,4 @@"))
+    second = session.review("7")
+    assert len(stub_tools("claude")) == 1
+    assert (second.shared, second.shared_from) == (True, "earlier")
+    assert second.review == first.review
+
+
+def test_edited_profile_does_not_reuse_the_review(stub_tools):
+    first = ReviewSession(config={"hunk_cache": {"enabled": False}}).review("7")
+    profile = replace(get_profile("default"), rules=["Flag every TODO"])
+    edited = ReviewSession(config={
+        "hunk_cache": {"enabled": False}, "custom_profiles": {"default": profile},
+    }).review("7")
+    assert len(stub_tools("claude")) == 2
+    assert not first.shared and not edited.shared
+
+
+def test_single_flight_can_be_disabled(stub_tools):
+    session = ReviewSession(config={
+        "single_flight": {"enabled": False}, "hunk_cache": {"enabled": False},
+    })
+    session.review("7")
+    session.review("7")
+    assert len(stub_tools("claude")) == 2
+
+
+def test_review_pr_runs_concurrently(stub_tools, monkeypatch):
+    monkeypatch.setenv("PARC_BENCH_CLAUDE_LATENCY", "0.5")
+
+    async def review_all():
+        async with ReviewSession(config={}, max_concurrency=8) as session:
+            return await asyncio.gather(*(session.review_pr(str(n)) for n in range(1, 9)))
+
+    started = time.monotonic()
+    results = asyncio.run(review_all())
+    elapsed = time.monotonic() - started
+    assert [r.pr_info.number for r in results] == list(range(1, 9))
+    # Eight 0.5s reviews in well under their 4s serial time
+    assert elapsed < 3.0
+
+
+def test_review_pr_cancellation_kills_claude(stub_tools, monkeypatch):
+    monkeypatch.setenv("PARC_BENCH_CLAUDE_LATENCY", "10")
+
+    async def cancel_midway():
+        async with ReviewSession(config={}) as session:
+            task = asyncio.create_task(session.review_pr("7"))
+            await asyncio.sleep(1.0)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+    started = time.monotonic()
+    asyncio.run(cancel_midway())
+    assert time.monotonic() - started < 5
+    assert stub_tools("claude") == []
+
+
+def test_review_pr_function_with_shared_session(session, stub_tools):
+    result = asyncio.run(review_pr("3", session=session, profile="security"))
+    assert result.profile_name == "security"
+
+
+def test_importing_the_package_loads_the_api_lazily():
+    # A fresh interpreter: this one has imported everything already
+    code = (
+        "import sys, parc_ferme\n"
+        "assert 'parc_ferme.session' not in sys.modules\n"
+        "import parc_ferme.cli\n"
+        "assert not {'asyncio', 'http.server'} & set(sys.modules), sys.modules.keys()\n"
+        "assert parc_ferme.ReviewSession.__module__ == 'parc_ferme.session'\n"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True)
+
+
+def test_profile_names_splits_and_checks(session):
+    assert session.profile_names(None) == ["default"]
+    assert session.profile_names("security, performance,security") == ["security", "performance"]
+    with pytest.raises(ValueError):
+        session.profile_names("security,nope")
+
+
+def test_multi_profile_review_fetches_once_and_merges(session, stub_tools):
+    result = session.review("7", profile="security,performance")
+    assert result.profile_name == "security,performance"
+    assert [name for name, _ in result.sections] == ["security", "performance"]
+    # One --name-only call for the changed files plus one for the diff itself
+    assert len(stub_tools("gh", ["pr", "diff"])) == 2
+    assert len(stub_tools("claude")) == 2
+    # The stub reports the same findings for every profile
+    assert result.duplicates > 0
+    assert result.sections[1][1] == "No additional findings."
+    assert "### `performance`" in result.review
+    assert sorted(r.profile for r in load_history()) == ["performance", "security"]
+
+
+def test_auto_profiles_route_each_file_group(stub_tools):
+    session = ReviewSession(config={"auto_profiles": {
+        "rules": [{"extensions": [".md"], "content": None, "profiles": ["security"]}],
+        "fallback": ["default"],
+    }})
+    assert session.profile_names("auto") == ["auto"]
+    with pytest.raises(ValueError):
+        session.profile_names("auto,security")
+
+    prepared = session.prepare_profiles("7", profile="auto")
+    assert [(p.profile_name, p.routed_files) for p in prepared] == [
+        ("default", ["src/app.py"]), ("security", ["README.md"]),
+    ]
+    assert "README.md" not in prepared[0].diff
+    result = session.run_profiles(prepared)
+    assert result.profile_name == "default,security"
+    # README.md alone is docs-only, so security skips Claude
+    assert len(stub_tools("claude")) == 1
+    assert result.sections[1][1] == "✅ LGTM - No security issues found"
+
+
+def test_auto_profiles_check_rule_profiles_exist():
+    session = ReviewSession(config={"auto_profiles": {
+        "rules": [{"extensions": [".ts"], "content": None, "profiles": ["nope"]}],
+    }})
+    with pytest.raises(ValueError):
+        session.profile_names("auto")
+
+
+DOCS_DIFF = """\
+diff --git a/README.md b/README.md
+--- a/README.md
++++ b/README.md
+@@ -1 +1 @@
+-Old text
++New text
+"""
+
+
+def test_trivial_diff_skips_claude(session, stub_tools, tmp_path):
+    (tmp_path / "pr.diff").write_text(DOCS_DIFF)
+    result = session.review("7")
+    assert result.fast_path == "documentation changes only (1 file)"
+    assert result.review == "✅ LGTM"
+    assert stub_tools("claude") == []
+    assert load_history() == []
+
+
+SERVICE_DIFF = """\
+diff --git a/src/app/module_1/service_1.py b/src/app/module_1/service_1.py
+--- a/src/app/module_1/service_1.py
++++ b/src/app/module_1/service_1.py
+@@ -{start},2 +{start},3 @@
+ def load(item):
+-    return item.value
++    value = item.value
++    return value.strip()
+"""
+
+
+def test_backported_hunks_reuse_cached_findings(stub_tools, tmp_path, monkeypatch):
+    # The stub claude reports service_1.py:1, inside the hunk
+    monkeypatch.setenv("PARC_BENCH_CLAUDE_OUTPUT_BYTES", "10")
+    diff = tmp_path / "pr.diff"
+    diff.write_text(SERVICE_DIFF.format(start=1))
+    session = ReviewSession(config={"single_flight": {"enabled": False}})
+    first = session.review("7")
+    assert "service_1.py:1 " in first.review
+
+    diff.write_text(SERVICE_DIFF.format(start=31))
+    second = session.review("8")
+    assert len(stub_tools("claude")) == 1
+    assert second.cached_hunks == 1
+    assert second.review == first.review.replace("service_1.py:1 ", "service_1.py:31 ")
+
+
+def test_fast_path_can_be_disabled(stub_tools, tmp_path):
+    (tmp_path / "pr.diff").write_text(DOCS_DIFF)
+    session = ReviewSession(config={"fast_path": {"enabled": False}})
+    assert session.review("7").fast_path is None
+    assert len(stub_tools("claude")) == 1
+
+
+PARENT_PR = PRInfo(
+    title="Add loaders", number=6, url="https://github.com/bench/repo/pull/6",
+    author="bench", base_branch="trunk", head_sha="p" * 40, head_branch="main",
+)
+
+
+def test_stacked_pr_is_reviewed_as_its_delta(stub_tools):
+    delta = SERVICE_DIFF.format(start=1)
+    session = ReviewSession(config={"stacked_prs": {"enabled": True}})
+    with patch("parc_ferme.session.list_open_prs", return_value=[PARENT_PR]), \
+            patch("parc_ferme.session.get_compare_diff", return_value=delta) as compare:
+        result = session.review("7")
+    compare.assert_called_once_with("bench/repo", "p" * 40, "0" * 40)
+    assert result.parent == PARENT_PR
+    assert result.changed_files  # still the whole PR's files
+    assert len(stub_tools("gh", ["pr", "diff"])) == 1  # --name-only; the diff came from compare
+    assert result.diff_tokens < session.estimate("7").tokens
+
+
+def test_stacked_pr_prompt_and_comment_link_the_parent(stub_tools):
+    session = ReviewSession(config={})
+    with patch("parc_ferme.session.list_open_prs", return_value=[PARENT_PR]), \
+            patch("parc_ferme.session.get_compare_diff", return_value=""):
+        prepared = session.prepare("7", stacked=True)
+        assert "stacked on PR #6" in prepared.prompt
+        result = session.run(prepared)
+    with patch("parc_ferme.session.post_comment") as post:
+        session.post(result)
+    assert "**Stacked on**: [#6](https://github.com/bench/repo/pull/6)" in post.call_args[0][1]
+
+
+def test_empty_diff_is_not_sent_to_claude(stub_tools):
+    session = ReviewSession(config={"fast_path": {"enabled": False}})
+    with patch("parc_ferme.session.get_compare_diff", return_value=""):
+        result = session.run(session.prepare("7", since="e" * 40))
+    assert result.fast_path == "no changes to review"
+    assert stub_tools("claude") == []
+
+
+def test_review_since_an_earlier_head_covers_only_new_commits(stub_tools):
+    session = ReviewSession(config={})
+    delta = SERVICE_DIFF.format(start=1)
+    with patch("parc_ferme.session.get_compare_diff", return_value=delta) as compare:
+        prepared = session.prepare("7", since="e" * 40)
+        result = session.run(prepared)
+    compare.assert_called_once_with("bench/repo", "e" * 40, "0" * 40)
+    assert "already reviewed at commit eeeeeeeeeeee" in prepared.prompt
+    assert result.since == "e" * 40
+    with patch("parc_ferme.session.post_comment") as post:
+        session.post(result, "update", earlier="**old review**")
+    body = post.call_args[0][1]
+    assert "**New commits**: `eeeeeee..0000000`" in body
+    assert "<details><summary>Earlier reviews</summary>\n\n**old review**" in body
+    assert post.call_args.kwargs["edit_last"] is True
+
+
+def test_stack_detection_failure_reviews_the_whole_pr(stub_tools):
+    session = ReviewSession(config={"stacked_prs": {"enabled": True}})
+    with patch("parc_ferme.session.list_open_prs", side_effect=GitHubError("rate limited")):
+        prepared = session.prepare("7")
+    assert prepared.parent is None
+    with patch("parc_ferme.session.list_open_prs") as list_prs:
+        assert ReviewSession(config={}).prepare("7").parent is None
+    list_prs.assert_not_called()
+
+
+def test_local_clone_context_is_added_to_the_prompt(
+    stub_tools, tmp_path, monkeypatch,
+):
+    import subprocess
+
+    def git(*args):
+        return subprocess.run(["git", "-C", str(tmp_path / "clone"), *args],
+                              capture_output=True, text=True, check=True).stdout.strip()
+
+    (tmp_path / "clone" / "src/app/module_1").mkdir(parents=True)
+    git("init", "-q")
+    source = tmp_path / "clone/src/app/module_1/service_1.py"
+    source.write_text("def load(item):\n    return item.value\n")
+    (tmp_path / "clone/.editorconfig").write_text("[*.py]\nindent_size = 4\n")
+    git("add", ".")
+    git("-c", "user.name=dev", "-c", "user.email=dev@example.com", "commit", "-qm", "base")
+    monkeypatch.setenv("PARC_BENCH_BASE_SHA", git("rev-parse", "HEAD"))
+    source.write_text("def load(item):\n    value = item.value\n    return value.strip()\n")
+    (tmp_path / "clone/src/app/text.py").write_text("def strip_all(text, chars=None):\n    pass\n")
+    git("add", ".")
+    git("-c", "user.name=dev", "-c", "user.email=dev@example.com", "commit", "-qm", "head")
+    monkeypatch.setenv("PARC_BENCH_HEAD_SHA", git("rev-parse", "HEAD"))
+    (tmp_path / "pr.diff").write_text(
+        SERVICE_DIFF.format(start=1).replace("value.strip()", "strip_all(value)"),
+    )
+
+    session = ReviewSession(config={
+        "code_context": {"enabled": True, "repo_path": str(tmp_path / "clone")},
+        "symbol_index": {"enabled": True},
+        "conventions": {"enabled": True},
+    })
+    with session:
+        prepared = session.prepare("7")
+        session.fetch_diff(prepared)
+        # The convention digest of the base commit leads, before anything about the PR
+        role, _, rest = prepared.prompt.partition("\n\n")
+        assert rest.startswith("REPOSITORY CONVENTIONS")
+        assert "- *.py: indent_size=4" in rest.split("PR: #7")[0]
+        assert "src/app/module_1/service_1.py:1-3 (head)" in prepared.prompt
+        assert "3 |     return value.strip()" in prepared.prompt
+        assert prepared.context_bytes > 0
+        assert "src/app/text.py:1  def strip_all(text, chars=None)" in prepared.prompt
+        assert len(session._cat_files) == 1
+    assert session._cat_files == {}
+
+
+def test_conventions_code_context_and_symbols_share_one_size_cap(stub_tools):
+    session = ReviewSession(config={
+        "code_context": {"enabled": True}, "symbol_index": {"enabled": True},
+    })
+    digest = "x" * (MAX_CONTEXT_BYTES - 3000)
+    with patch.object(session, "repo_conventions", return_value=digest), \
+            patch.object(session, "_code_context", return_value="c" * 2000) as context, \
+            patch.object(session, "_symbol_context", return_value="") as symbols:
+        session.fetch_diff(session.prepare("7"))
+    assert context.call_args[0][2] == 3000
+    assert symbols.call_args[0][2] == 1000
+
+
+def test_partial_review_is_not_reused(stub_tools):
+    session = ReviewSession(config={"hunk_cache": {"enabled": False}})
+    partial = f"{PARTIAL_REVIEW_MARKER}: claude timed out after 30s"
+    with patch("parc_ferme.session.review_shards", side_effect=[partial, "LGTM", "unused"]):
+        first = session.review("7", timeout=30)
+        second = session.review("7", timeout=600)
+        third = session.review("7")
+    assert first.partial and not first.shared
+    assert (second.review, second.shared) == ("LGTM", False)
+    assert (third.review, third.shared) == ("LGTM", True)
+
+
+def test_multi_profile_review_survives_one_failure(session, stub_tools):
+    real_run = session.run
+
+    def flaky_run(prepared, *args):
+        if prepared.profile_name == "performance":
+            raise ReviewError("claude exited 1")
+        return real_run(prepared, *args)
+
+    with patch.object(session, "run", side_effect=flaky_run):
+        result = session.review("7", profile="security,performance")
+    assert result.partial
+    assert "claude exited 1" in result.sections[1][1]
+
+    with patch.object(session, "run", side_effect=ReviewError("down")):
+        with pytest.raises(ReviewError):
+            session.review("7", profile="security,performance")
+
+
+def test_multi_profile_review_raises_a_rate_limit(session, stub_tools):
+    real_run = session.run
+
+    def throttled_run(prepared, *args):
+        if prepared.profile_name == "performance":
+            raise RateLimitError("Claude is rate limited or overloaded: 429")
+        return real_run(prepared, *args)
+
+    with patch.object(session, "run", side_effect=throttled_run):
+        with pytest.raises(RateLimitError):
+            session.review("7", profile="security,performance")
+
+
+# --- has_critical_issues ---
+
+
+def _history(n, model="default", tokens=1000, duration=10.0):
+    for _ in range(n):
+        record_review(ReviewRecord(timestamp=0.0, model=model, profile="default",
+                                   diff_chars=tokens * 4, diff_tokens=tokens,
+                                   file_count=1, duration=duration))
+
+
+def test_review_timeout_from_history(session):
+    assert session.review_timeout(1000) == 300
+    _history(10, duration=100.0)
+    assert session.review_timeout(1000) == 150  # p95 x 1.5 headroom
+
+
+def test_review_timeout_fixed_when_latency_model_disabled():
+    _history(10, duration=100.0)
+    session = ReviewSession(config={"review_timeout": 200, "latency_model": {"enabled": False}})
+    assert session.review_timeout(1000) == 200
+
+
+def test_shard_budget_targets_wall_clock_time():
+    _history(10, tokens=1000, duration=10.0)  # 0.01s per token
+    session = ReviewSession(config={"max_shards": 4, "latency_model": {"target_seconds": 60}})
+    assert session.shard_budget(10_000) == 6_000
+    # Never so small that the diff no longer fits into max_shards
+    assert session.shard_budget(40_000) == 10_000
+    assert ReviewSession(config={}).shard_budget(40_000) == 25_000
+
+
+def test_review_records_history(session, stub_tools):
+    result = session.review("7", repo="owner/repo")
+    record = load_history()[-1]
+    assert record.shards == 1
+    assert record.partial is False
+    # Usage from claude's stream-json output
+    assert result.usage.calls == 1
+    assert record.input_tokens == result.usage.input_tokens > 0
+    assert record.output_tokens > 0 and record.cost_usd > 0
+
+
+def _big_diff(files=20, lines=80):
+    parts = []
+    for f in range(files):
+        body = "".join(f"+    value_{i} = compute_{f}({i})\n" for i in range(lines))
+        parts.append(f"diff --git a/src/m{f}.py b/src/m{f}.py\n--- a/src/m{f}.py\n"
+                     f"+++ b/src/m{f}.py\n@@ -0,0 +1,{lines} @@\n{body}")
+    return "".join(parts)
+
+
+def test_review_over_its_token_budget_is_packed_to_fit(stub_tools, tmp_path):
+    (tmp_path / "pr.diff").write_text(_big_diff())
+    session = ReviewSession(config={})
+    prepared = session.prepare("7", max_tokens=8_000)
+    packed = session.fetch_diff(prepared)
+    assert prepared.over_budget > 8_000
+    assert packed.truncated and len(prepared.shards) == 1
+    assert packed.tokens + OUTPUT_RESERVE_TOKENS <= 8_000
+    assert session.run(prepared).usage.calls == 1
+
+
+def test_review_over_its_token_budget_can_be_skipped(stub_tools, tmp_path):
+    (tmp_path / "pr.diff").write_text(_big_diff())
+    session = ReviewSession(config={"budgets": {"on_pr_exceeded": "skip",
+                                                "max_tokens_per_pr": 8_000}})
+    with pytest.raises(BudgetExceededError, match="over its 8,000-token budget"):
+        session.review("7", profile="security,performance")
+    # Too small to pack anything into: skipped either way
+    with pytest.raises(BudgetExceededError):
+        ReviewSession(config={}).review("7", max_tokens=2_500)
+    assert stub_tools("claude") == []
+
+
+def test_estimate_matches_the_review_split(stub_tools, tmp_path):
+    (tmp_path / "pr.diff").write_text(_big_diff(files=40, lines=100))
+    session = ReviewSession(config={"max_shards": 4})
+    estimate = session.estimate("7")
+    assert estimate.shards == session.review("7").shards > 1
+    assert estimate.truncated is False
+
+
+def test_estimate_applies_the_token_budget(stub_tools, tmp_path):
+    (tmp_path / "pr.diff").write_text(_big_diff())
+    degraded = ReviewSession(config={}).estimate("7", max_tokens=8_000)
+    assert degraded.shards == 1 and degraded.truncated
+    assert degraded.over_budget > 8_000 and degraded.skipped is None
+    skipped = ReviewSession(config={"budgets": {"on_pr_exceeded": "skip"}}).estimate(
+        "7", profile="security,performance", max_tokens=8_000,
+    )
+    assert skipped.shards == 0
+    assert "over its 8,000-token budget" in skipped.skipped
+    assert skipped.profiles == ["security", "performance"]
+    assert stub_tools("claude") == []
+
+
+def test_has_critical_issues_found():
+    assert has_critical_issues("\U0001f534 CRITICAL - file.py:10 — bug") is True
+
+
+def test_has_critical_issues_not_found():
+    assert has_critical_issues("\U0001f7e1 WARNING - file.py:10 — minor") is False
+
+
+def test_has_critical_issues_lgtm():
+    assert has_critical_issues("\u2705 LGTM") is False
+
+
+def test_has_critical_issues_case_sensitive():
+    assert has_critical_issues("critical") is False
@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import json
+import multiprocessing
+import os
+import threading
+import time
+
+import pytest
+
+from parc_ferme.singleflight import (
+    CONCURRENT,
+    EARLIER,
+    _flight_dir,
+    flight_key,
+    prune,
+    single_flight,
+)
+
+
+def _slow_review(counter_path):
+    def fn():
+        with open(counter_path, "a") as f:
+            f.write("x")
+        time.sleep(0.5)
+        return "review text"
+    return fn
+
+
+def _worker(cache_home, counter_path, queue):
+    os.environ["XDG_CACHE_HOME"] = cache_home
+    queue.put(single_flight("k", _slow_review(counter_path), wait_timeout=10))
+
+
+def test_flight_key_depends_on_every_part():
+    url = "https://github.com/o/r/pull/1"
+    base = flight_key(url, "a" * 40, "Review this PR diff.", "sonnet")
+    assert base == flight_key(url, "a" * 40, "Review this PR diff.", "sonnet")
+    assert base != flight_key(url[:-1] + "2", "a" * 40, "Review this PR diff.", "sonnet")
+    assert base != flight_key(url, "b" * 40, "Review this PR diff.", "sonnet")
+    assert base != flight_key(url, "a" * 40, "Review this PR diff.\n- new rule", "sonnet")
+    assert base != flight_key(url, "a" * 40, "Review this PR diff.", "opus")
+
+
+def test_concurrent_processes_run_once(tmp_path, isolated_cache_dir):
+    counter = tmp_path / "calls"
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    procs = [
+        ctx.Process(target=_worker, args=(os.environ["XDG_CACHE_HOME"], str(counter), queue))
+        for _ in range(4)
+    ]
+    for p in procs:
+        p.start()
+    results = [queue.get(timeout=30) for _ in procs]
+    for p in procs:
+        p.join(10)
+    assert counter.read_text() == "x"
+    assert {r[0] for r in results} == {"review text"}
+    # A process that only started after the leader had finished reuses it as EARLIER
+    sources = sorted(r[1] for r in results)
+    assert sources[0] == "" and set(sources[1:]) <= {CONCURRENT, EARLIER}
+
+
+def test_waiting_for_a_running_leader_is_concurrent():
+    started = threading.Event()
+
+    def leader():
+        started.set()
+        time.sleep(0.3)
+        return "review text"
+
+    thread = threading.Thread(target=single_flight, args=("k", leader, 5))
+    thread.start()
+    started.wait(5)
+    assert single_flight("k", lambda: "unused", wait_timeout=5) == ("review text", CONCURRENT)
+    thread.join(5)
+
+
+def test_later_call_reuses_result(tmp_path):
+    counter = tmp_path / "calls"
+    assert single_flight("k", _slow_review(counter), wait_timeout=5) == ("review text", "")
+    assert single_flight("k", _slow_review(counter), wait_timeout=5) == ("review text", EARLIER)
+    assert counter.read_text() == "x"
+
+
+def test_expired_result_runs_again(tmp_path):
+    single_flight("k", lambda: "old", wait_timeout=5)
+    assert single_flight("k", lambda: "new", wait_timeout=5, ttl=-1) == ("new", "")
+
+
+def test_failed_leader_saves_nothing():
+    def boom():
+        raise RuntimeError("claude failed")
+
+    with pytest.raises(RuntimeError):
+        single_flight("k", boom, wait_timeout=5)
+    assert single_flight("k", lambda: "ok", wait_timeout=5) == ("ok", "")
+
+
+def _not_partial(result):
+    return not result.startswith("partial")
+
+
+def test_rejected_result_is_not_saved():
+    keep = _not_partial
+    assert single_flight("k", lambda: "partial", wait_timeout=5, keep=keep) == ("partial", "")
+    assert single_flight("k", lambda: "whole", wait_timeout=5, keep=keep) == ("whole", "")
+    assert single_flight("k", lambda: "again", wait_timeout=5, keep=keep) == ("whole", EARLIER)
+
+
+def test_prune_removes_expired_files():
+    single_flight("k", lambda: "ok", wait_timeout=5)
+    assert prune(ttl=-1) == 2
+    assert list(_flight_dir().iterdir()) == []
+
+
+def test_result_file_is_json():
+    single_flight("k", lambda: "ok", wait_timeout=5)
+    data = json.loads((_flight_dir() / "k.json").read_text())
+    assert data["result"] == "ok"
@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from parc_ferme.config import get_runtime_dir
+from parc_ferme.errors import ReviewCancelledError, ReviewError
+from parc_ferme.slots import SLOTS_DIRNAME, claude_slot
+from parc_ferme.timing import Tracer, use_tracer
+
+_HOLD_SLOT = """
+import sys, time
+from parc_ferme.slots import claude_slot
+with claude_slot(1, timeout=5):
+    print("held", flush=True)
+    time.sleep(float(sys.argv[1]))
+"""
+
+
+def test_runtime_dir_override(tmp_path, monkeypatch):
+    monkeypatch.setenv("PARC_FERME_RUNTIME_DIR", str(tmp_path / "shared"))
+    assert get_runtime_dir() == tmp_path / "shared"
+
+
+def test_runtime_dir_xdg(tmp_path, monkeypatch):
+    monkeypatch.delenv("PARC_FERME_RUNTIME_DIR")
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path))
+    assert get_runtime_dir() == tmp_path / "parc-ferme"
+
+
+def test_no_limit_is_a_no_op():
+    with claude_slot(0, timeout=1) as slot:
+        assert slot.index == -1
+    assert not (get_runtime_dir() / SLOTS_DIRNAME).exists()
+
+
+def test_slots_cap_concurrency():
+    active = []
+    peak = []
+    lock = threading.Lock()
+
+    def run():
+        with claude_slot(2, timeout=10):
+            with lock:
+                active.append(1)
+                peak.append(len(active))
+            time.sleep(0.2)
+            with lock:
+                active.pop()
+
+    threads = [threading.Thread(target=run) for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert max(peak) == 2
+
+
+def test_wait_is_reported_in_slot_and_trace():
+    tracer = Tracer()
+    release = threading.Event()
+    holding = threading.Event()
+
+    def hold():
+        with claude_slot(1, timeout=5):
+            holding.set()
+            release.wait(5)
+
+    t = threading.Thread(target=hold)
+    t.start()
+    holding.wait(5)
+    threading.Timer(0.3, release.set).start()
+    with use_tracer(tracer), claude_slot(1, timeout=5) as slot:
+        pass
+    t.join()
+    assert slot.waited >= 0.25
+    (wait_span,) = [s for s in tracer.spans if s.name == "claude.slot_wait"]
+    assert wait_span.args["waited"] >= 0.25
+
+
+def test_timeout_waiting_for_slot():
+    with claude_slot(1, timeout=5):
+        with pytest.raises(ReviewError, match="waiting for one of 1 Claude slots"):
+            with claude_slot(1, timeout=0.2):
+                pass
+
+
+def test_cancel_while_waiting():
+    cancel = threading.Event()
+    with claude_slot(1, timeout=5):
+        threading.Timer(0.2, cancel.set).start()
+        with pytest.raises(ReviewCancelledError):
+            with claude_slot(1, timeout=5, cancel=cancel):
+                pass
+
+
+def test_slot_shared_across_processes_and_freed_on_crash():
+    holder = subprocess.Popen(
+        [sys.executable, "-c", _HOLD_SLOT, "30"], stdout=subprocess.PIPE, text=True,
+    )
+    try:
+        assert holder.stdout.readline().strip() == "held"
+        with pytest.raises(ReviewError):
+            with claude_slot(1, timeout=0.3):
+                pass
+    finally:
+        holder.kill()
+        holder.wait()
+    # The kernel drops the flock with the process
+    with claude_slot(1, timeout=2) as slot:
+        assert slot.index == 0
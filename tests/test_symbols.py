@@ -0,0 +1,168 @@
+from __future__ import annotations
+
+import subprocess
+
+import pytest
+
+from parc_ferme.context import CatFile
+from parc_ferme.diff import parse_diff
+from parc_ferme.errors import SymbolIndexError
+from parc_ferme.symbols import (
+    SYMBOLS_HEADER,
+    SymbolIndex,
+    extract_symbols,
+    referenced_names,
+    render_symbols,
+)
+
+PY_SOURCE = '''\
+import os
+
+
+@cached
+def normalize(
+    value: str,
+    *,
+    strict: bool = False,
+) -> str:
+    """Doc: with a colon."""
+    return value.strip()
+
+
+class Loader(Base):
+    def get(self, key): return key
+
+    async def fetch(self) -> None:
+        pass
+'''
+
+TS_SOURCE = """\
+export class FooService {
+  constructor(private http: HttpClient) {}
+
+  async load(id: string): Promise<Foo> {
+    if (id) {
+      return this.http.get(id);
+    }
+  }
+}
+export function parse<T>(raw: string): T {
+export const handler = async (req: Req): Promise<void> => {
+export interface Foo {
+"""
+
+GO_SOURCE = """\
+func (s *Server) Run(ctx context.Context) error {
+func New(addr string) *Server {
+type Server struct {
+"""
+
+CALLER_DIFF = """\
+diff --git a/app/service.py b/app/service.py
+--- a/app/service.py
++++ b/app/service.py
+@@ -1,2 +1,3 @@
+ def handle(item):
+-    return item
++    loader = Loader()
++    return normalize(item.name, strict=True)
+"""
+
+
+def _signatures(path, source):
+    return [(s.name, s.kind, s.line, s.scope, s.signature) for s in extract_symbols(path, source)]
+
+
+def test_python_symbols():
+    assert _signatures("a.py", PY_SOURCE) == [
+        ("normalize", "function", 5, "",
+         "def normalize(value: str, *, strict: bool = False) -> str"),
+        ("Loader", "class", 14, "", "class Loader(Base)"),
+        ("get", "method", 15, "Loader", "def get(self, key)"),
+        ("fetch", "method", 17, "Loader", "async def fetch(self) -> None"),
+    ]
+    assert extract_symbols("bad.py", "def broken(:\n") == []
+
+
+def test_typescript_and_go_symbols():
+    assert [(name, kind, scope) for name, kind, _, scope, _ in _signatures("a.ts", TS_SOURCE)] == [
+        ("FooService", "class", ""),
+        ("load", "method", "FooService"),
+        ("parse", "function", ""),
+        ("handler", "function", ""),
+        ("Foo", "interface", ""),
+    ]
+    run = _signatures("a.go", GO_SOURCE)[0]
+    assert run[4] == "func (s *Server) Run(ctx context.Context) error"
+    assert [s.name for s in extract_symbols("a.go", GO_SOURCE)] == ["Run", "New", "Server"]
+    assert extract_symbols("README.md", "def not_code():") == []
+
+
+def test_referenced_names_skip_names_defined_in_the_diff():
+    assert referenced_names(parse_diff(CALLER_DIFF)) == ["Loader", "normalize"]
+    diff = CALLER_DIFF.replace("+    loader = Loader()", "+class Loader:")
+    assert referenced_names(parse_diff(diff)) == ["normalize"]
+
+
+def _git(cwd, *args):
+    return subprocess.run(
+        ["git", "-C", str(cwd), "-c", "user.name=dev", "-c", "user.email=dev@example.com",
+         *args],
+        capture_output=True, text=True, check=True,
+    ).stdout.strip()
+
+
+@pytest.fixture
+def clone(tmp_path):
+    repo = tmp_path / "clone"
+    (repo / "app").mkdir(parents=True)
+    _git(repo, "init", "-q")
+    (repo / "app/util.py").write_text(PY_SOURCE)
+    (repo / "app/web.ts").write_text(TS_SOURCE)
+    (repo / "README.md").write_text("# not indexed\n")
+    _git(repo, "add", ".")
+    _git(repo, "commit", "-qm", "first")
+    return repo
+
+
+def test_index_updates_only_changed_files(clone, tmp_path):
+    first = _git(clone, "rev-parse", "HEAD")
+    cat = CatFile(clone)
+    try:
+        with SymbolIndex(clone, tmp_path / "index.sqlite3") as index:
+            assert index.update(first, cat) == 2
+            assert index.update(first, cat) == 0
+            assert index.stats() == (2, 9)
+
+            (clone / "app/util.py").write_text(PY_SOURCE.replace("strict: bool", "mode: str"))
+            (clone / "app/web.ts").unlink()
+            _git(clone, "commit", "-qam", "second")
+            assert index.update(_git(clone, "rev-parse", "HEAD"), cat) == 1
+            assert index.stats() == (1, 4)
+            [normalize] = index.lookup(["normalize", "FooService"])["normalize"]
+            assert "mode: str" in normalize.signature
+            assert index.lookup(["FooService"]) == {}
+
+        # Persisted: a new index on the same file starts where this one stopped
+        with SymbolIndex(clone, tmp_path / "index.sqlite3") as reopened:
+            assert reopened.commit == _git(clone, "rev-parse", "HEAD")
+            with pytest.raises(SymbolIndexError):
+                reopened.update("0" * 40, cat)
+    finally:
+        cat.close()
+
+
+def test_render_symbols_within_token_budget(clone, tmp_path):
+    cat = CatFile(clone)
+    try:
+        with SymbolIndex(clone, tmp_path / "index.sqlite3") as index:
+            index.update(_git(clone, "rev-parse", "HEAD"), cat)
+            files = parse_diff(CALLER_DIFF)
+            text = render_symbols(index, files)
+            assert text.startswith(SYMBOLS_HEADER)
+            assert "app/util.py:14  class Loader(Base)" in text
+            assert "app/util.py:5  def normalize(value: str, *, strict: bool = False) -> str" \
+                in text
+            assert render_symbols(index, files, max_tokens=10) == ""
+    finally:
+        cat.close()
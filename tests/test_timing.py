@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import json
+
+from parc_ferme.timing import Tracer, current_tracer, span, use_tracer
+
+
+def test_span_without_tracer_is_noop():
+    assert current_tracer() is None
+    with span("noop", key="value") as args:
+        args["extra"] = 1
+
+
+def test_tracer_records_span():
+    tracer = Tracer()
+    with tracer.span("phase", pr="42"):
+        pass
+    assert len(tracer.spans) == 1
+    assert tracer.spans[0].name == "phase"
+    assert tracer.spans[0].args == {"pr": "42"}
+    assert tracer.spans[0].duration >= 0
+
+
+def test_use_tracer_routes_module_span():
+    tracer = Tracer()
+    with use_tracer(tracer):
+        assert current_tracer() is tracer
+        with span("outer"):
+            with span("inner") as args:
+                args["returncode"] = 0
+    assert current_tracer() is None
+    by_name = {s.name: s for s in tracer.spans}
+    assert by_name["outer"].depth == 0
+    assert by_name["inner"].depth == 1
+    assert by_name["inner"].args["returncode"] == 0
+
+
+def test_span_recorded_on_exception():
+    tracer = Tracer()
+    try:
+        with tracer.span("failing"):
+            raise RuntimeError("boom")
+    except RuntimeError:
+        pass
+    assert [s.name for s in tracer.spans] == ["failing"]
+
+
+def test_format_summary_lists_spans_in_order():
+    tracer = Tracer()
+    with tracer.span("first"):
+        pass
+    with tracer.span("second"):
+        pass
+    summary = tracer.format_summary()
+    assert summary.startswith("Timings:")
+    assert summary.index("first") < summary.index("second")
+    assert "ms" in summary
+
+
+def test_format_summary_shows_token_usage():
+    tracer = Tracer()
+    with tracer.span("claude", input_tokens=1200, output_tokens=80, cached_tokens=0,
+                     cost_usd=0.0048):
+        pass
+    assert "1,200 in / 80 out / 0 cached tokens, $0.0048" in tracer.format_summary()
+
+
+def test_to_trace_events_chrome_format():
+    tracer = Tracer()
+    tracer.metadata["pr"] = "42"
+    with tracer.span("gh pr view"):
+        pass
+    trace = tracer.to_trace_events()
+    event = trace["traceEvents"][0]
+    assert event["ph"] == "X"
+    assert event["name"] == "gh pr view"
+    assert event["cat"] == "gh"
+    assert isinstance(event["ts"], int)
+    assert isinstance(event["dur"], int)
+    assert trace["otherData"]["pr"] == "42"
+
+
+def test_write_trace(tmp_path):
+    tracer = Tracer()
+    with tracer.span("config.load"):
+        pass
+    out = tmp_path / "trace.json"
+    tracer.write_trace(str(out))
+    data = json.loads(out.read_text())
+    assert data["traceEvents"][0]["cat"] == "config"
+
+
+def test_counters_in_summary_and_trace():
+    tracer = Tracer()
+    tracer.counter("batch.concurrency", value=2)
+    tracer.counter("batch.concurrency", value=3)
+    assert "batch.concurrency" in tracer.format_summary()
+    assert "final 3 (min 2, max 3, 1 changes)" in tracer.format_summary()
+    event = tracer.to_trace_events()["traceEvents"][-1]
+    assert (event["ph"], event["args"]) == ("C", {"value": 3})
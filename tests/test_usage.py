@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import json
+
+from parc_ferme.usage import BatchBudget, Usage, parse_claude_output
+
+USAGE = {
+    "input_tokens": 1200,
+    "output_tokens": 300,
+    "cache_read_input_tokens": 5000,
+    "cache_creation_input_tokens": 800,
+}
+
+
+def _stream(*events):
+    return "".join(json.dumps(event) + "\n" for event in events)
+
+
+def _assistant(text, **usage):
+    return {"type": "assistant",
+            "message": {"content": [{"type": "text", "text": text}], "usage": usage}}
+
+
+def test_parse_stream_json_result():
+    stdout = _stream(
+        {"type": "system", "subtype": "init"},
+        _assistant("LGTM", output_tokens=300),
+        {"type": "result", "result": "LGTM\n", "usage": USAGE,
+         "total_cost_usd": 0.0123, "duration_ms": 4500},
+    )
+    text, usage = parse_claude_output(stdout)
+    assert text == "LGTM"
+    assert usage == Usage(input_tokens=1200, output_tokens=300, cache_read_tokens=5000,
+                          cache_creation_tokens=800, cost_usd=0.0123, duration=4.5, calls=1)
+    assert usage.total_tokens == 7300
+    assert usage.describe() == "2,000 input (5,000 cached) / 300 output tokens, $0.0123"
+
+
+def test_parse_single_json_result():
+    stdout = json.dumps({"type": "result", "result": "ok", "usage": USAGE})
+    assert parse_claude_output(stdout)[1].input_tokens == 1200
+
+
+def test_parse_stream_cut_off_by_timeout():
+    stdout = _stream(_assistant("first ", output_tokens=10), _assistant("second", input_tokens=5))
+    stdout += '{"type": "assist'  # killed mid-line
+    text, usage = parse_claude_output(stdout)
+    assert text == "first second"
+    assert (usage.output_tokens, usage.input_tokens, usage.calls) == (10, 5, 1)
+
+
+def test_parse_plain_text():
+    assert parse_claude_output("LGTM\n") == ("LGTM", None)
+    assert parse_claude_output("") == ("", None)
+
+
+def test_batch_budget_downgrades_then_stops():
+    budget = BatchBudget(max_tokens=1000, max_cost=1.0, cheaper_model="haiku")
+    assert budget.model_for("opus") == "opus"
+    budget.charge(Usage(input_tokens=500, cost_usd=0.9, calls=1))
+    assert budget.model_for("opus") == "haiku"  # 90% of the cost cap
+    assert not budget.exhausted.is_set()
+    budget.charge(Usage(input_tokens=500, calls=1))
+    assert budget.exhausted.is_set()
+    assert budget.usage.calls == 2
+
+    unlimited = BatchBudget(cheaper_model="haiku")
+    unlimited.charge(Usage(input_tokens=10**9))
+    assert unlimited.model_for(None) is None
+    assert not unlimited.exhausted.is_set()
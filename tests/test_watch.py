@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import threading
+
+from parc_ferme.session import ReviewSession
+from parc_ferme.watch import IdleBackoff, PRWatcher
+
+
+def test_idle_backoff_doubles_up_to_maximum_and_resets():
+    backoff = IdleBackoff(10, 45)
+    assert [backoff.next() for _ in range(4)] == [10, 20, 40, 45]
+    backoff.reset()
+    assert backoff.next() == 10
+
+
+def test_watcher_reviews_new_pushes_and_skips_unchanged_polls(stub_tools, monkeypatch):
+    # The stub serves the same diff for the PR and the compare, which caches would answer
+    session = ReviewSession(
+        config={"hunk_cache": {"enabled": False}, "single_flight": {"enabled": False}},
+    )
+    posted = []
+
+    def post_comment(pr, body, repo=None, edit_last=False):
+        posted.append((body, edit_last))
+        return "https://github.com/bench/repo/pull/7#issuecomment-41"
+
+    monkeypatch.setattr("parc_ferme.session.post_comment", post_comment)
+    monkeypatch.setattr(
+        "parc_ferme.session.update_comment",
+        lambda repo, comment_id, body: posted.append((body, (repo, comment_id))),
+    )
+    watcher = PRWatcher(session, "bench/repo", 7, comment=True)
+    first = watcher.check()
+    assert first.since == ""
+    assert watcher.reviewed_sha == "0" * 40
+    assert len(stub_tools("claude")) == 1
+
+    # Unchanged: a 304, no review
+    assert watcher.check() is None
+    assert len(stub_tools("claude")) == 1
+
+    monkeypatch.setenv("PARC_BENCH_HEAD_SHA", "1" * 40)
+    second = watcher.check()
+    assert second.since == "0" * 40
+    compare = f"repos/bench/repo/compare/{'0' * 40}...{'1' * 40}"
+    # The ancestry check, then the diff of the new commits
+    assert len(stub_tools("gh", ["api", compare])) == 2
+    assert len(stub_tools("claude")) == 2
+    assert watcher.reviews[0].startswith("**0000000..1111111**")
+    assert watcher.reviews[1].startswith("**0000000 (whole PR)**")
+    # The second review edits the comment the first one posted, by its id rather than
+    # as the last comment of the gh user, keeping the first below
+    assert [how for _, how in posted] == [False, ("bench/repo", 41)]
+    assert "**0000000 (whole PR)**" in posted[1][0].split("Earlier reviews")[1]
+
+
+def test_watcher_stops_when_the_pr_closes(stub_tools, monkeypatch):
+    events = []
+    stop = threading.Event()
+
+    def on_review(result):
+        monkeypatch.setenv("PARC_BENCH_PR_STATE", "closed")
+
+    watcher = PRWatcher(
+        ReviewSession(config={}), "bench/repo", 7, interval=0.01, max_interval=0.02,
+        on_event=lambda event, detail: events.append(event), on_review=on_review,
+    )
+    assert watcher.run(stop) == 1
+    assert events == ["pushed", "closed"]
+
+
+def test_watcher_reviews_the_whole_pr_after_a_rebase(stub_tools, monkeypatch):
+    session = ReviewSession(
+        config={"hunk_cache": {"enabled": False}, "single_flight": {"enabled": False}},
+    )
+    events = []
+    watcher = PRWatcher(
+        session, "bench/repo", 7, on_event=lambda event, detail: events.append(event),
+    )
+    watcher.check()
+
+    # The old head still exists, but the new one does not descend from it
+    monkeypatch.setenv("PARC_BENCH_HEAD_SHA", "1" * 40)
+    monkeypatch.setenv("PARC_BENCH_COMPARE_STATUS", "diverged")
+    second = watcher.check()
+    assert second.since == ""
+    assert events == ["pushed", "pushed", "rebased"]
+    compare = f"repos/bench/repo/compare/{'0' * 40}...{'1' * 40}"
+    # Only the ancestry check, not the three-dot diff, which would include the new base
+    calls = stub_tools("gh", ["api", compare])
+    assert [call["stdout_bytes"] for call in calls] == [len("diverged\n")]
+    assert watcher.reviews[0].startswith("**1111111 (whole PR)**")
+
+
+def test_watcher_updates_its_own_comment_after_a_reply(stub_tools, monkeypatch):
+    # `gh pr comment --edit-last` would overwrite a reply the developer posted
+    # under the same gh login between two pushes
+    session = ReviewSession(
+        config={"hunk_cache": {"enabled": False}, "single_flight": {"enabled": False}},
+    )
+    comments = {}
+
+    def post_comment(pr, body, repo=None, edit_last=False):
+        if edit_last:
+            comments[max(comments)] = body
+        else:
+            comments[len(comments) + 1] = body
+        return f"https://github.com/bench/repo/pull/7#issuecomment-{max(comments)}"
+
+    def update_comment(repo, comment_id, body):
+        comments[comment_id] = body
+
+    monkeypatch.setattr("parc_ferme.session.post_comment", post_comment)
+    monkeypatch.setattr("parc_ferme.session.update_comment", update_comment)
+    watcher = PRWatcher(session, "bench/repo", 7, comment=True, comment_mode="create")
+    watcher.check()
+    comments[2] = "Thanks, fixing this now"  # the developer's reply
+    monkeypatch.setenv("PARC_BENCH_HEAD_SHA", "1" * 40)
+    watcher.check()
+    assert comments[2] == "Thanks, fixing this now"
+    assert "0000000..1111111" in comments[1]